@@ -0,0 +1,5 @@
+# src/rag_app/benchmarks/__init__.py
+
+# Ferramentas de benchmark do sistema RAG.
+# Execute os módulos a partir da raiz do projeto, por exemplo:
+#   python -m src.rag_app.benchmarks.keyword_matching
@@ -0,0 +1,155 @@
+# src/rag_app/benchmarks/corpus.py
+"""
+Gerador de corpus sintético (PDF e Markdown) para os benchmarks.
+
+O conteúdo é determinístico para uma mesma semente: frases montadas a partir de
+um vocabulário de editais, com um termo exclusivo por documento, de modo que as
+perguntas geradas tenham um documento de origem conhecido.
+
+Uso (a partir da raiz do projeto):
+    python -m src.rag_app.benchmarks.corpus --output /tmp/corpus --documents 20 --pages 5
+"""
+
+import argparse
+import json
+import os
+import random
+from typing import Dict, List
+
+VOCABULARY = [
+    "edital", "inscrição", "matrícula", "prazo", "candidato", "candidata", "documentação",
+    "cota", "renda", "escola", "pública", "ensino", "fundamental", "médio", "curso",
+    "técnico", "integrado", "subsequente", "campus", "vaga", "reserva", "comprovante",
+    "histórico", "laudo", "médico", "deficiência", "heteroidentificação", "comissão",
+    "recurso", "resultado", "classificação", "prova", "objetiva", "redação", "taxa",
+    "isenção", "declaração", "responsável", "família", "salário", "mínimo",
+    "cadastro", "único", "entrevista", "chamada", "convocação", "cronograma", "etapa",
+    "requisito", "modalidade", "ampla", "concorrência", "período", "data", "horário",
+]
+CONNECTORS = ["de", "da", "do", "para", "com", "sem", "e", "ou", "no", "na", "pelo", "pela"]
+
+
+def _sentence(rng: random.Random, topic: str) -> str:
+    words = [rng.choice(VOCABULARY if i % 2 == 0 else CONNECTORS) for i in range(rng.randint(8, 18))]
+    words.insert(rng.randint(0, len(words)), topic)
+    return " ".join(words).capitalize() + "."
+
+
+def _page_text(rng: random.Random, topic: str, words_per_page: int) -> str:
+    sentences, count = [], 0
+    while count < words_per_page:
+        sentence = _sentence(rng, topic)
+        sentences.append(sentence)
+        count += len(sentence.split())
+    return " ".join(sentences)
+
+
+# Tamanhos de fonte tentados em ordem quando o texto não cabe na página
+PDF_FONT_SIZES = (8, 7, 6, 5)
+
+
+def _insert_page(doc, text: str):
+    """
+    Escreve o texto em uma nova página, reduzindo a fonte até caber. Se nem a menor
+    fonte comporta o texto, ele é dividido entre frases e continua em outra página
+    (insert_textbox não escreve nada quando o texto transborda).
+    """
+    import fitz
+    page = doc.new_page()
+    rect = fitz.Rect(36, 36, page.rect.width - 36, page.rect.height - 36)
+    for fontsize in PDF_FONT_SIZES:
+        if page.insert_textbox(rect, text, fontsize=fontsize) >= 0:
+            return
+    sentences = text.split(". ")
+    if len(sentences) < 2:
+        raise ValueError(f"Texto não cabe em uma página do PDF ({len(text)} caracteres)")
+    doc.delete_page(page.number)
+    middle = len(sentences) // 2
+    _insert_page(doc, ". ".join(sentences[:middle]) + ".")
+    _insert_page(doc, ". ".join(sentences[middle:]))
+
+
+def _write_pdf(path: str, pages: List[str]):
+    import fitz
+    doc = fitz.open()
+    try:
+        for text in pages:
+            _insert_page(doc, text)
+        doc.save(path)
+    finally:
+        doc.close()
+
+
+def _write_markdown(path: str, name: str, pages: List[str]):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(f"# {name}\n\n")
+        for i, text in enumerate(pages, 1):
+            f.write(f"## Seção {i}\n\n{text}\n\n")
+
+
+def generate_corpus(output_folder: str, documents: int = 20, pages_per_document: int = 5,
+                    words_per_page: int = 300, pdf_fraction: float = 0.5, queries: int = 50,
+                    seed: int = 42) -> Dict:
+    """
+    Gera o corpus em `output_folder` e retorna a descrição com as perguntas.
+
+    Returns:
+        {"documents": [...], "queries": [{"query", "source"}], "total_words", "parameters"}
+    """
+    rng = random.Random(seed)
+    os.makedirs(output_folder, exist_ok=True)
+    described, texts, total_words = [], {}, 0
+    pdf_count = int(round(documents * pdf_fraction))
+
+    for index in range(documents):
+        topic = f"tema{index:04d}"
+        pages = [_page_text(rng, topic, words_per_page) for _ in range(pages_per_document)]
+        is_pdf = index < pdf_count
+        filename = f"doc_{index:04d}.{'pdf' if is_pdf else 'md'}"
+        path = os.path.join(output_folder, filename)
+        if is_pdf:
+            _write_pdf(path, pages)
+        else:
+            _write_markdown(path, filename, pages)
+        texts[filename] = pages
+        words = sum(len(page.split()) for page in pages)
+        total_words += words
+        described.append({"filename": filename, "pages": pages_per_document,
+                          "words": words, "bytes": os.path.getsize(path)})
+
+    # Perguntas: trecho de uma frase do documento de origem, com o termo exclusivo
+    generated_queries = []
+    for _ in range(queries):
+        source = rng.choice(described)["filename"]
+        sentence = rng.choice(rng.choice(texts[source]).split(". "))
+        generated_queries.append({"query": f"O que o edital diz sobre {sentence.lower().rstrip('.')}?",
+                                  "source": source})
+
+    return {
+        "documents": described,
+        "queries": generated_queries,
+        "total_words": total_words,
+        "parameters": {"documents": documents, "pages_per_document": pages_per_document,
+                       "words_per_page": words_per_page, "pdf_fraction": pdf_fraction,
+                       "queries": queries, "seed": seed},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Gera um corpus sintético de PDFs e Markdown.")
+    parser.add_argument("--output", required=True, help="Pasta de saída.")
+    parser.add_argument("--documents", type=int, default=20)
+    parser.add_argument("--pages", type=int, default=5, help="Páginas (ou seções) por documento.")
+    parser.add_argument("--words-per-page", type=int, default=300)
+    parser.add_argument("--pdf-fraction", type=float, default=0.5)
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    corpus = generate_corpus(args.output, args.documents, args.pages, args.words_per_page,
+                             args.pdf_fraction, args.queries, args.seed)
+    print(json.dumps({k: v for k, v in corpus.items() if k != "queries"}, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
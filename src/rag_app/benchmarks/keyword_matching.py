@@ -0,0 +1,97 @@
+# src/rag_app/benchmarks/keyword_matching.py
+"""
+Benchmark da classificação de perguntas por palavras-chave.
+
+Compara a varredura linear (`any(k in texto for k in lista)`, uma vez por lista)
+com o autômato Aho-Corasick de `keyword_matcher`, para listas sintéticas de
+tamanhos crescentes. O custo por pergunta do autômato deve permanecer
+praticamente constante, enquanto o da varredura cresce com as listas.
+
+Uso (a partir da raiz do projeto):
+    python -m src.rag_app.benchmarks.keyword_matching --sizes 10 100 1000 10000
+"""
+
+import argparse
+import json
+import random
+import string
+import time
+from typing import Dict, List
+
+from ..keyword_matcher import KeywordMatcher
+
+SAMPLE_QUERIES = [
+    "O que significa renda per capita conforme o edital do IFMT?",
+    "Qual o prazo para enviar o laudo médico da cota PcD?",
+    "Explique como funciona a verificação de heteroidentificação.",
+    "Posso corrigir a modalidade de cota depois de pagar a taxa de inscrição?",
+]
+
+
+def _synthetic_keywords(count: int, rng: random.Random) -> List[str]:
+    return ["".join(rng.choices(string.ascii_lowercase, k=rng.randint(4, 14))) for _ in range(count)]
+
+
+def _linear_scan(categories: Dict[str, List[str]], query: str) -> Dict[str, bool]:
+    query_lower = query.lower()
+    return {category: any(keyword in query_lower for keyword in keywords)
+            for category, keywords in categories.items()}
+
+
+def _time_per_query(fn, queries: List[str], repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for query in queries:
+            fn(query)
+    return (time.perf_counter() - start) / (repeat * len(queries))
+
+
+def run(sizes: List[int], repeat: int = 200, seed: int = 42) -> List[Dict]:
+    rng = random.Random(seed)
+    results = []
+    for size in sizes:
+        categories = {
+            "conceptual": _synthetic_keywords(size, rng) + ["o que é", "o que significa", "explique"],
+            "specific_context": _synthetic_keywords(size, rng) + ["ifmt", "edital", "prazo"],
+            "external_usage": _synthetic_keywords(size, rng) + ["significa", "geralmente"],
+        }
+        build_start = time.perf_counter()
+        matcher = KeywordMatcher(categories)
+        build_seconds = time.perf_counter() - build_start
+
+        # Sanidade: ambos os métodos devem concordar
+        for query in SAMPLE_QUERIES:
+            matched = matcher.match(query)
+            expected = _linear_scan(categories, query)
+            assert all(bool(matched.get(c)) == expected[c] for c in categories), query
+
+        results.append({
+            "keywords_per_list": size,
+            "total_keywords": matcher.keyword_count,
+            "build_seconds": round(build_seconds, 4),
+            "linear_scan_us_per_query": round(_time_per_query(lambda q: _linear_scan(categories, q), SAMPLE_QUERIES, repeat) * 1e6, 2),
+            "aho_corasick_us_per_query": round(_time_per_query(matcher.match, SAMPLE_QUERIES, repeat) * 1e6, 2),
+        })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark da classificação de perguntas por palavras-chave.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000, 10000],
+                        help="Quantidade de palavras-chave sintéticas por lista.")
+    parser.add_argument("--repeat", type=int, default=200, help="Repetições por pergunta de exemplo.")
+    parser.add_argument("--json", action="store_true", help="Imprime o resultado em JSON.")
+    args = parser.parse_args()
+
+    results = run(args.sizes, args.repeat)
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"{'palavras/lista':>15} {'varredura (µs)':>15} {'aho-corasick (µs)':>18} {'construção (s)':>15}")
+    for row in results:
+        print(f"{row['keywords_per_list']:>15} {row['linear_scan_us_per_query']:>15} "
+              f"{row['aho_corasick_us_per_query']:>18} {row['build_seconds']:>15}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,549 @@
+# src/rag_app/benchmarks/load_generator.py
+"""
+Teste de carga: N usuários virtuais simultâneos sobre um RAGCore ou o serviço HTTP.
+
+Reproduz uma mistura de perguntas (perguntas.txt, uma por linha, ou um trace JSONL
+como a saída do rag_batch) e mede quantos usuários simultâneos uma instância
+suporta antes que a latência p99 fique inaceitável.
+
+Alvos:
+  - core: RAGCore no próprio processo. Por padrão o LLM é o endpoint "mock" do
+    roteador (determinístico, latência configurável, sem rede); --llm configured
+    usa os endpoints de config.LLM_ENDPOINTS (ex.: um Ollama local).
+  - http: rag_server em execução (POST /answer); respostas 429 contam como rejeitadas.
+
+Modelos de chegada:
+  - fechado (padrão): cada usuário envia a próxima pergunta ao receber a resposta,
+    após um tempo de reflexão (--think-time, exponencial com essa média);
+  - aberto (--rate R): chegadas de Poisson com R requisições/s atendidas pelos N
+    usuários; a latência conta desde a chegada agendada, incluindo a espera por um
+    usuário livre (sem omissão coordenada);
+  - trace (--replay-timing): as chegadas seguem os instantes gravados no trace
+    (started_at), acelerados por --speedup.
+
+Com listas em --users ou --rate (ex.: --users 1,2,4,8,16) cada valor é um nível
+executado em sequência; com --slo-p99-ms o relatório indica o maior nível dentro
+do SLO. Por nível: vazão, latência p50/p90/p95/p99, taxa de erro, latência e
+ocupação por etapa (retrieval, generation, external_wait, queue_wait), CPU do
+processo e memória (RSS) e os contadores do RAGCore ao final do nível.
+
+Uso (a partir da raiz do projeto):
+    python -m src.rag_app.benchmarks.load_generator --questions perguntas.txt --users 1,4,8,16 \\
+        --duration 60 --mock-latency 0.8 --mock-jitter 0.6 --slo-p99-ms 5000 --output carga.json
+    python -m src.rag_app.benchmarks.load_generator --synthetic 20 --rate 2,4,8 --users 16 --duration 30
+    python -m src.rag_app.benchmarks.load_generator --target http --url http://127.0.0.1:8080 \\
+        --questions perguntas.txt --users 8 --duration 120
+"""
+
+import argparse
+import http.client
+import json
+import logging
+import os
+import queue
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+from urllib.parse import urlparse
+
+import numpy as np
+
+from .. import config
+
+logger = logging.getLogger(__name__)
+
+STAGES = ("retrieval", "generation", "external_wait", "queue_wait")
+
+
+def load_questions(path: str) -> List[Dict[str, Any]]:
+    """
+    Lê a mistura de perguntas.
+
+    Returns:
+        [{"query": ..., "offset": segundos desde a primeira pergunta ou None}]
+        (offset só existe em traces JSONL com started_at, timestamp ou offset_seconds)
+    """
+    questions = []
+    with open(path, "r", encoding="utf-8") as f:
+        if not path.endswith((".jsonl", ".ndjson")):
+            return [{"query": line.strip(), "offset": None} for line in f if line.strip()]
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            query = record.get("question") or record.get("query")
+            if not query:
+                continue
+            if record.get("offset_seconds") is not None:
+                moment = float(record["offset_seconds"])
+            elif record.get("started_at"):
+                moment = datetime.fromisoformat(record["started_at"]).timestamp()
+            elif record.get("timestamp") is not None:
+                moment = float(record["timestamp"])
+            else:
+                moment = None
+            questions.append({"query": query, "offset": moment})
+    moments = [q["offset"] for q in questions if q["offset"] is not None]
+    if moments and len(moments) == len(questions):
+        first = min(moments)
+        for question in questions:
+            question["offset"] -= first
+    else:
+        for question in questions:
+            question["offset"] = None
+    return questions
+
+
+def _summary_ms(samples: List[float]) -> Dict[str, Any]:
+    if not samples:
+        return {"count": 0}
+    values = np.array(samples) * 1000.0
+    return {
+        "count": len(samples),
+        "p50_ms": round(float(np.percentile(values, 50)), 2),
+        "p90_ms": round(float(np.percentile(values, 90)), 2),
+        "p95_ms": round(float(np.percentile(values, 95)), 2),
+        "p99_ms": round(float(np.percentile(values, 99)), 2),
+        "max_ms": round(float(values.max()), 2),
+        "mean_ms": round(float(values.mean()), 2),
+    }
+
+
+class RejectedError(Exception):
+    """O alvo recusou a requisição por sobrecarga (HTTP 429)."""
+
+
+class CoreTarget:
+    """RAGCore no próprio processo."""
+
+    name = "core"
+
+    def __init__(self, rag_core):
+        self.rag_core = rag_core
+
+    def answer(self, query: str) -> Dict[str, Any]:
+        return self.rag_core.answer_query_with_details(query)
+
+    def stats(self) -> Dict[str, Any]:
+        return self.rag_core.get_stats()
+
+    def close(self):
+        self.rag_core.close()
+
+
+class HTTPTarget:
+    """rag_server (POST /answer), com uma conexão keep-alive por usuário virtual."""
+
+    name = "http"
+
+    def __init__(self, url: str, timeout: float = 120.0, priority: str = "interactive"):
+        parsed = urlparse(url)
+        self.host, self.port = parsed.hostname, parsed.port or 80
+        self.timeout = timeout
+        self.priority = priority
+        self._local = threading.local()
+
+    def _request(self, method: str, path: str, payload: Optional[Dict[str, Any]] = None):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+        body = json.dumps(payload).encode("utf-8") if payload is not None else None
+        try:
+            conn.request(method, path, body=body, headers={"Content-Type": "application/json"})
+            response = conn.getresponse()
+            data = response.read()
+        except (OSError, http.client.HTTPException):
+            conn.close()
+            self._local.conn = None
+            raise
+        if response.getheader("Connection", "").lower() == "close":
+            conn.close()
+            self._local.conn = None
+        return response.status, data
+
+    def answer(self, query: str) -> Dict[str, Any]:
+        status, data = self._request("POST", "/answer", {"query": query, "priority": self.priority})
+        if status == 429:
+            raise RejectedError("HTTP 429")
+        if status != 200:
+            raise RuntimeError(f"HTTP {status}: {data[:200].decode('utf-8', 'replace')}")
+        details = json.loads(data.decode("utf-8"))
+        if details.get("queue_wait_seconds") is not None:
+            details.setdefault("timings", {})["queue_wait"] = details["queue_wait_seconds"]
+        return details
+
+    def stats(self) -> Dict[str, Any]:
+        try:
+            status, data = self._request("GET", "/metrics")
+            return json.loads(data.decode("utf-8")) if status == 200 else {"error": f"HTTP {status}"}
+        except Exception as e:
+            return {"error": str(e)}
+
+    def close(self):
+        pass
+
+
+class ResourceSampler(threading.Thread):
+    """Amostra periodicamente a CPU (todas as threads) e a memória residente do processo."""
+
+    def __init__(self, interval: float = 0.5):
+        super().__init__(daemon=True, name="load-test-sampler")
+        self.interval = interval
+        self.cpu_percent: List[float] = []
+        self.rss_mb: List[float] = []
+        self._stop_event = threading.Event()
+
+    @staticmethod
+    def _rss_mb() -> Optional[float]:
+        try:
+            with open("/proc/self/statm") as f:
+                return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+        except (OSError, ValueError, AttributeError):
+            return None  # Fora do Linux: só a CPU é amostrada
+
+    def run(self):
+        last_wall, last_cpu = time.perf_counter(), sum(os.times()[:2])
+        while not self._stop_event.wait(self.interval):
+            wall, cpu = time.perf_counter(), sum(os.times()[:2])
+            self.cpu_percent.append(100.0 * (cpu - last_cpu) / max(wall - last_wall, 1e-9))
+            last_wall, last_cpu = wall, cpu
+            rss = self._rss_mb()
+            if rss is not None:
+                self.rss_mb.append(rss)
+
+    def stop(self) -> Dict[str, Any]:
+        self._stop_event.set()
+        self.join()
+        return {
+            "cpu_percent_mean": round(float(np.mean(self.cpu_percent)), 1) if self.cpu_percent else None,
+            "cpu_percent_max": round(float(np.max(self.cpu_percent)), 1) if self.cpu_percent else None,
+            "cpu_count": os.cpu_count(),
+            "rss_mb_max": round(max(self.rss_mb), 1) if self.rss_mb else None,
+        }
+
+
+class LoadLevel:
+    """Uma execução de carga (um nível de usuários/taxa)."""
+
+    def __init__(self, target, questions: List[Dict[str, Any]], users: int, rate: Optional[float] = None,
+                 duration: float = 30.0, max_requests: Optional[int] = None, think_time: float = 0.0,
+                 replay_timing: bool = False, speedup: float = 1.0, shuffle: bool = False, seed: int = 42):
+        self.target = target
+        self.questions = questions
+        self.users = users
+        self.rate = rate
+        self.duration = duration
+        self.max_requests = max_requests
+        self.think_time = think_time
+        self.replay_timing = replay_timing
+        self.speedup = speedup
+        self.seed = seed
+        self.order = list(range(len(questions)))
+        if shuffle:
+            random.Random(seed).shuffle(self.order)
+        self._lock = threading.Lock()
+        self._next = 0
+        self._samples: List[Dict[str, Any]] = []
+        self._max_backlog = 0
+
+    def _take(self) -> Optional[Dict[str, Any]]:
+        """Próxima pergunta da mistura (circular), ou None quando o limite de requisições acaba."""
+        with self._lock:
+            if self.max_requests is not None and self._next >= self.max_requests:
+                return None
+            if self.replay_timing and self._next >= len(self.order):
+                return None
+            question = self.questions[self.order[self._next % len(self.order)]]
+            self._next += 1
+            return question
+
+    def _execute(self, query: str, scheduled: float):
+        start = time.perf_counter()
+        cpu_start = time.thread_time()
+        sample = {"scheduled": scheduled, "start": start, "ok": False, "rejected": False, "error": None}
+        try:
+            details = self.target.answer(query)
+            sample.update(ok=True, timings=details.get("timings", {}), path=details.get("path"),
+                          coalesced=details.get("coalesced", False),
+                          model_route=(details.get("model_route") or {}).get("route"))
+        except RejectedError as e:
+            sample.update(rejected=True, error=str(e))
+        except Exception as e:
+            sample["error"] = f"{type(e).__name__}: {e}"
+        sample["end"] = time.perf_counter()
+        # CPU da thread do usuário (no alvo core inclui a recuperação executada nesta thread)
+        sample["cpu_seconds"] = time.thread_time() - cpu_start
+        with self._lock:
+            self._samples.append(sample)
+
+    def _closed_user(self, user: int, deadline: float):
+        rng = random.Random(self.seed * 1000 + user)
+        while time.perf_counter() < deadline:
+            question = self._take()
+            if question is None:
+                return
+            now = time.perf_counter()
+            self._execute(question["query"], now)
+            if self.think_time > 0:
+                time.sleep(min(rng.expovariate(1.0 / self.think_time), max(0.0, deadline - time.perf_counter())))
+
+    def _open_user(self, arrivals: "queue.Queue"):
+        while True:
+            item = arrivals.get()
+            if item is None:
+                return
+            scheduled, question = item
+            self._execute(question["query"], scheduled)
+
+    def _dispatch(self, arrivals: "queue.Queue", started: float, deadline: float):
+        """Agenda as chegadas (Poisson ou instantes do trace) para os usuários abertos."""
+        rng = random.Random(self.seed)
+        next_arrival = started
+        while True:
+            question = self._take()
+            if question is None:
+                break
+            if self.replay_timing:
+                next_arrival = started + question["offset"] / self.speedup
+            if next_arrival >= deadline:
+                break
+            delay = next_arrival - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            arrivals.put((next_arrival, question))
+            self._max_backlog = max(self._max_backlog, arrivals.qsize())
+            if not self.replay_timing:
+                next_arrival += rng.expovariate(self.rate)
+        for _ in range(self.users):
+            arrivals.put(None)
+
+    def run(self) -> Dict[str, Any]:
+        open_loop = self.rate is not None or self.replay_timing
+        mode = "trace" if self.replay_timing else ("open" if self.rate is not None else "closed")
+        logger.info(f"Nível: {self.users} usuário(s), modo {mode}"
+                    f"{f', {self.rate} req/s' if self.rate is not None else ''}, até {self.duration}s.")
+        sampler = ResourceSampler()
+        process_cpu_start = sum(os.times()[:2])
+        sampler.start()
+        started = time.perf_counter()
+        deadline = started + self.duration
+        if open_loop:
+            arrivals: "queue.Queue" = queue.Queue()
+            threads = [threading.Thread(target=self._open_user, args=(arrivals,), daemon=True)
+                       for _ in range(self.users)]
+            for thread in threads:
+                thread.start()
+            self._dispatch(arrivals, started, deadline)
+        else:
+            threads = [threading.Thread(target=self._closed_user, args=(user, deadline), daemon=True)
+                       for user in range(self.users)]
+            for thread in threads:
+                thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+        resources = sampler.stop()
+        resources["process_cpu_seconds"] = round(sum(os.times()[:2]) - process_cpu_start, 3)
+        return self._report(mode, elapsed, resources)
+
+    def _report(self, mode: str, elapsed: float, resources: Dict[str, Any]) -> Dict[str, Any]:
+        samples = self._samples
+        ok = [s for s in samples if s["ok"]]
+        rejected = sum(1 for s in samples if s["rejected"])
+        errors = Counter(s["error"] for s in samples if s["error"] and not s["rejected"])
+        # Respostas coalescidas repetem os tempos da execução original: ficam fora das etapas
+        executed = [s for s in ok if not s["coalesced"]]
+        stages = {}
+        for stage in STAGES:
+            values = [s["timings"][stage] for s in executed if s["timings"].get(stage) is not None]
+            if values:
+                # Ocupação: número médio de consultas nesta etapa ao mesmo tempo
+                stages[stage] = dict(_summary_ms(values), busy_seconds=round(sum(values), 3),
+                                     occupancy=round(sum(values) / elapsed, 3))
+        completed = len(ok)
+        if completed:
+            resources["cpu_ms_per_request"] = round(1000.0 * resources["process_cpu_seconds"] / completed, 2)
+            resources["user_thread_cpu_ms_mean"] = round(
+                1000.0 * float(np.mean([s["cpu_seconds"] for s in ok])), 2)
+        return {
+            "users": self.users,
+            "mode": mode,
+            "offered_rate_rps": self.rate,
+            "seconds": round(elapsed, 3),
+            "requests": len(samples),
+            "completed": completed,
+            "rejected": rejected,
+            "errors": sum(errors.values()),
+            "error_rate": round((len(samples) - completed) / len(samples), 4) if samples else 0.0,
+            "error_types": dict(errors.most_common(10)),
+            "throughput_rps": round(completed / elapsed, 3) if elapsed > 0 else 0.0,
+            # Desde a chegada (inclui a espera por um usuário livre nos modos aberto/trace)
+            "latency": _summary_ms([s["end"] - s["scheduled"] for s in ok]),
+            "service_latency": _summary_ms([s["end"] - s["start"] for s in ok]),
+            "max_backlog": self._max_backlog,
+            "stages": stages,
+            "paths": dict(Counter(s["path"] for s in ok)),
+            "model_routes": dict(Counter(s["model_route"] for s in ok if s["model_route"])),
+            "coalesced": sum(1 for s in ok if s["coalesced"]),
+            "resources": resources,
+            "target_stats": self.target.stats(),
+        }
+
+
+def _parse_levels(values: Optional[str], cast) -> List[Any]:
+    return [cast(value) for value in values.split(",") if value.strip()] if values else []
+
+
+def run(target, questions: List[Dict[str, Any]], users: List[int], rates: List[Optional[float]],
+        duration: float = 30.0, max_requests: Optional[int] = None, think_time: float = 0.0,
+        replay_timing: bool = False, speedup: float = 1.0, shuffle: bool = False, warmup: int = 3,
+        slo_p99_ms: Optional[float] = None, seed: int = 42) -> Dict[str, Any]:
+    """Executa os níveis de carga (pares usuários x taxa) e retorna o relatório."""
+    if len(users) > 1 and len(rates) > 1 and len(users) != len(rates):
+        raise ValueError("--users e --rate com vários valores devem ter o mesmo tamanho")
+    count = max(len(users), len(rates))
+    levels = [(users[i] if len(users) > 1 else users[0], rates[i] if len(rates) > 1 else rates[0])
+              for i in range(count)]
+
+    # Aquecimento fora da medição (modelos, caches, conexões)
+    for question in questions[:warmup]:
+        try:
+            target.answer(question["query"])
+        except Exception as e:
+            logger.warning(f"Erro no aquecimento: {e}")
+
+    results = []
+    for level_users, level_rate in levels:
+        level = LoadLevel(target, questions, level_users, level_rate, duration, max_requests, think_time,
+                          replay_timing, speedup, shuffle, seed)
+        result = level.run()
+        if slo_p99_ms is not None:
+            p99 = result["latency"].get("p99_ms")
+            result["within_slo"] = p99 is not None and p99 <= slo_p99_ms and result["error_rate"] == 0.0
+        results.append(result)
+
+    report = {
+        "metadata": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "target": target.name,
+            "questions": len(questions),
+            "duration_seconds": duration,
+            "max_requests": max_requests,
+            "think_time_seconds": think_time,
+            "replay_timing": replay_timing,
+            "speedup": speedup,
+            "slo_p99_ms": slo_p99_ms,
+            "seed": seed,
+        },
+        "levels": results,
+    }
+    if slo_p99_ms is not None:
+        passing = [r for r in results if r["within_slo"]]
+        report["max_within_slo"] = (
+            {"users": passing[-1]["users"], "offered_rate_rps": passing[-1]["offered_rate_rps"],
+             "throughput_rps": passing[-1]["throughput_rps"]} if passing else None)
+    return report
+
+
+def _print_table(report: Dict[str, Any]):
+    print(f"{'usuários':>8} {'taxa':>6} {'vazão/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} "
+          f"{'erros':>7} {'CPU %':>6} {'SLO':>4}", file=sys.stderr)
+    for level in report["levels"]:
+        latency = level["latency"]
+        slo = {True: "ok", False: "X", None: "-"}[level.get("within_slo")]
+        rate = level["offered_rate_rps"] if level["offered_rate_rps"] is not None else "-"
+        print(f"{level['users']:>8} {rate:>6} {level['throughput_rps']:>8} {latency.get('p50_ms', '-'):>9} "
+              f"{latency.get('p95_ms', '-'):>9} {latency.get('p99_ms', '-'):>9} {level['error_rate']:>7.1%} "
+              f"{level['resources']['cpu_percent_mean'] or '-':>6} {slo:>4}", file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Teste de carga com usuários virtuais simultâneos.")
+    parser.add_argument("--target", choices=["core", "http"], default="core")
+    parser.add_argument("--url", default=f"http://{config.SERVER_CONFIG['host']}:{config.SERVER_CONFIG['port']}",
+                        help="Endereço do rag_server (--target http).")
+    parser.add_argument("--questions", help="Perguntas (.txt, uma por linha) ou trace JSONL (ex.: saída do rag_batch).")
+    parser.add_argument("--synthetic", type=int, default=0,
+                        help="Indexa um corpus sintético com N documentos (benchmarks/corpus.py) em pasta temporária.")
+    parser.add_argument("--users", default="4", help="Usuários virtuais; lista separada por vírgulas = níveis.")
+    parser.add_argument("--rate", default=None,
+                        help="Chegadas por segundo (modelo aberto); lista separada por vírgulas = níveis.")
+    parser.add_argument("--duration", type=float, default=30.0, help="Duração de cada nível (s).")
+    parser.add_argument("--max-requests", type=int, default=None, help="Limite de requisições por nível.")
+    parser.add_argument("--think-time", type=float, default=0.0, help="Tempo médio de reflexão (modelo fechado).")
+    parser.add_argument("--replay-timing", action="store_true",
+                        help="Reproduz os instantes de chegada do trace (started_at).")
+    parser.add_argument("--speedup", type=float, default=1.0, help="Aceleração do trace com --replay-timing.")
+    parser.add_argument("--shuffle", action="store_true", help="Embaralha a mistura de perguntas.")
+    parser.add_argument("--warmup", type=int, default=3, help="Perguntas executadas antes da medição.")
+    parser.add_argument("--slo-p99-ms", type=float, default=None, help="SLO de latência p99 para os níveis.")
+    parser.add_argument("--llm", choices=["mock", "configured"], default="mock",
+                        help="core: LLM simulado (padrão) ou os endpoints de config.LLM_ENDPOINTS.")
+    parser.add_argument("--mock-latency", type=float, default=0.5, help="Latência base do LLM simulado (s).")
+    parser.add_argument("--mock-jitter", type=float, default=0.0,
+                        help="Variação determinística (por prompt) somada à latência do LLM simulado (s).")
+    parser.add_argument("--data-folder", default=config.DEFAULT_DATA_FOLDER)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="Grava o relatório JSON neste arquivo.")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    logger.setLevel(logging.INFO)
+    users = _parse_levels(args.users, int)
+    rates = _parse_levels(args.rate, float) or [None]
+    if args.replay_timing and args.rate:
+        parser.error("--replay-timing e --rate são mutuamente exclusivos")
+    if args.target == "http" and args.synthetic:
+        parser.error("--synthetic só se aplica a --target core")
+
+    work_dir = None
+    questions: List[Dict[str, Any]] = load_questions(args.questions) if args.questions else []
+    if args.replay_timing and not all(q["offset"] is not None for q in questions):
+        parser.error("--replay-timing exige um trace JSONL com started_at, timestamp ou offset_seconds")
+
+    if args.target == "http":
+        target = HTTPTarget(args.url)
+    else:
+        from ..rag_core import RAGCore
+        if args.llm == "mock":
+            config.LLM_ENDPOINTS = [{"name": "mock", "provider": "mock", "latency_seconds": args.mock_latency,
+                                     "latency_jitter_seconds": args.mock_jitter}]
+            config.ALLOW_EXTERNAL_KNOWLEDGE = False
+        data_folder, rag_kwargs = args.data_folder, {}
+        if args.synthetic:
+            from .corpus import generate_corpus
+            work_dir = tempfile.mkdtemp(prefix="rag_load_")
+            data_folder = os.path.join(work_dir, "data")
+            corpus = generate_corpus(data_folder, documents=args.synthetic, seed=args.seed)
+            if not questions:
+                questions = [{"query": item["query"], "offset": None} for item in corpus["queries"]]
+            rag_kwargs = {"chroma_db_path": os.path.join(work_dir, "chroma"), "collection_name": "load_generator"}
+        target = CoreTarget(RAGCore(data_folder=data_folder, **rag_kwargs))
+
+    if not questions:
+        parser.error("Informe --questions (ou --synthetic para gerar as perguntas)")
+
+    try:
+        report = run(target, questions, users, rates, args.duration, args.max_requests, args.think_time,
+                     args.replay_timing, args.speedup, args.shuffle, args.warmup, args.slo_p99_ms, args.seed)
+    finally:
+        target.close()
+        if work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    output = json.dumps(report, indent=2, ensure_ascii=False, default=str)
+    print(output)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output)
+    _print_table(report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,218 @@
+# src/rag_app/benchmarks/parameter_sweep.py
+"""
+Varredura de parâmetros: qualidade de recuperação x latência.
+
+Para cada combinação de modelo de embedding, tamanho de chunk e sobreposição, o
+corpus local é indexado em um ChromaDB próprio (reaproveitado entre execuções
+quando --work-dir é mantido: arquivos inalterados não são reprocessados). Cada
+índice é avaliado para todos os valores de k, sem reconstrução.
+
+A evidência rotulada vem de respostas.txt: as citações "arquivo, Página N" de
+cada resposta (linhas "Fonte: ..." e menções como "página 17 do edital.pdf").
+Métricas por configuração:
+  - recall@k (página): fração das evidências (arquivo, página) entre os k chunks
+  - recall@k (arquivo): idem, considerando apenas o arquivo
+  - tamanho do índice (chunks e bytes em disco), tempo de construção
+  - latência de consulta p50/p95
+
+A tabela final marca as configurações da fronteira de Pareto (maior recall de
+página e menor latência p50).
+
+Uso (a partir da raiz do projeto):
+    python -m src.rag_app.benchmarks.parameter_sweep --chunk-sizes 384 768 1024 \\
+        --overlaps 50 100 --ks 3 5 8 --work-dir sweep_indices --output sweep.json
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+import re
+import sys
+import time
+from typing import Any, Dict, List, Set, Tuple
+
+import numpy as np
+
+from .. import config
+
+_FILE_PATTERN = r"([\w\-.]+\.(?:pdf|md|markdown))"
+# "cotas.md, Página 1", "edital.pdf, Página: 17", "fonte "cotas.md", Página: 1"
+_FILE_THEN_PAGE = re.compile(_FILE_PATTERN + r"\"?\s*,\s*[Pp]ágina:?\s*(\d+)")
+# "página 17 do edital-0902025.pdf", "página 15 de todos-os-anexos.pdf"
+_PAGE_THEN_FILE = re.compile(r"[Pp]ágina\s+(\d+)\s+(?:do|de|da)\s+" + _FILE_PATTERN)
+
+
+def parse_labeled_answers(answers_path: str) -> List[Dict[str, Any]]:
+    """
+    Lê respostas.txt e retorna [{"question", "evidence": [(arquivo, página), ...]}].
+    """
+    with open(answers_path, "r", encoding="utf-8") as f:
+        content = f.read()
+
+    labeled = []
+    for block in re.split(r"^Pergunta \d+:\s*$", content, flags=re.MULTILINE)[1:]:
+        question_match = re.search(r"^P:\s*(?:\d+\.\s*)?(.+)$", block, flags=re.MULTILINE)
+        if not question_match:
+            continue
+        evidence: Set[Tuple[str, int]] = set()
+        for filename, page in _FILE_THEN_PAGE.findall(block):
+            evidence.add((filename, int(page)))
+        for page, filename in _PAGE_THEN_FILE.findall(block):
+            evidence.add((filename, int(page)))
+        labeled.append({"question": question_match.group(1).strip(), "evidence": sorted(evidence)})
+    return labeled
+
+
+def _directory_bytes(path: str) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        total += sum(os.path.getsize(os.path.join(root, name)) for name in files)
+    return total
+
+
+def _pareto_front(rows: List[Dict[str, Any]]) -> None:
+    """Marca rows[i]["pareto"]: nenhuma outra linha tem recall >= e latência <= (com uma estrita)."""
+    for row in rows:
+        row["pareto"] = not any(
+            other["recall_page"] >= row["recall_page"] and other["query_p50_ms"] <= row["query_p50_ms"]
+            and (other["recall_page"] > row["recall_page"] or other["query_p50_ms"] < row["query_p50_ms"])
+            for other in rows if other is not row)
+
+
+def evaluate_index(rag, labeled: List[Dict[str, Any]], k: int) -> Dict[str, float]:
+    page_recalls, file_recalls, latencies = [], [], []
+    for item in labeled:
+        start = time.perf_counter()
+        retrieved = rag.retrieve_relevant_chunks(item["question"], k)
+        latencies.append(time.perf_counter() - start)
+
+        retrieved_pages = set()
+        retrieved_files = set()
+        for chunk in retrieved:
+            metadata = chunk.get("metadata") or {}
+            retrieved_files.add(metadata.get("source"))
+            retrieved_pages.add((metadata.get("source"), str(metadata.get("page_number"))))
+        evidence = item["evidence"]
+        page_recalls.append(sum((f, str(p)) in retrieved_pages for f, p in evidence) / len(evidence))
+        file_recalls.append(sum(f in retrieved_files for f, _ in evidence) / len(evidence))
+
+    latencies_ms = np.array(latencies) * 1000.0
+    return {
+        "recall_page": round(float(np.mean(page_recalls)), 4),
+        "recall_file": round(float(np.mean(file_recalls)), 4),
+        "query_p50_ms": round(float(np.percentile(latencies_ms, 50)), 3),
+        "query_p95_ms": round(float(np.percentile(latencies_ms, 95)), 3),
+    }
+
+
+def _evaluate_configuration(data_folder: str, evaluated: List[Dict[str, Any]], model: str,
+                            chunk_size: int, overlap: int, ks: List[int], work_dir: str) -> List[Dict[str, Any]]:
+    """Constrói (ou reutiliza) o índice de uma configuração e o avalia para cada k."""
+    from ..rag_core import RAGCore
+
+    # Um índice por (modelo, chunk, overlap); k não exige reconstrução
+    index_key = hashlib.sha1(f"{model}|{chunk_size}|{overlap}".encode("utf-8")).hexdigest()[:12]
+    index_dir = os.path.join(work_dir, index_key)
+    manifest_path = os.path.join(index_dir, "manifest.sqlite3")
+    reused = os.path.exists(manifest_path)
+
+    start = time.perf_counter()
+    rag = RAGCore(data_folder=data_folder, model_name=model,
+                  chroma_db_path=os.path.join(index_dir, "chroma"),
+                  collection_name="sweep", manifest_path=manifest_path,
+                  chunk_size=chunk_size, chunk_overlap=overlap)
+    # Fecha cada índice após avaliá-lo (pools de codificação, manifesto e modelo do registro)
+    try:
+        build_seconds = time.perf_counter() - start
+        chunks = rag.count_chunks()
+        index_bytes = _directory_bytes(os.path.join(index_dir, "chroma"))
+
+        rag.retrieve_relevant_chunks(evaluated[0]["question"], min(ks))  # Aquecimento
+        rows = []
+        for k in ks:
+            row = {"model": model, "chunk_size": chunk_size, "chunk_overlap": overlap, "k": k,
+                   "chunks": chunks, "index_bytes": index_bytes,
+                   "build_seconds": round(build_seconds, 3), "index_reused": reused}
+            row.update(evaluate_index(rag, evaluated, k))
+            rows.append(row)
+            print(f"{model} chunk={chunk_size} overlap={overlap} k={k}: "
+                  f"recall={row['recall_page']:.3f} p50={row['query_p50_ms']:.1f}ms", file=sys.stderr)
+        return rows
+    finally:
+        rag.close()
+
+
+def run(data_folder: str, answers_path: str, models: List[str], chunk_sizes: List[int],
+        overlaps: List[int], ks: List[int], work_dir: str) -> Dict[str, Any]:
+    # Sem conhecimento externo remoto durante a varredura (restaurado ao final)
+    saved_external = config.ALLOW_EXTERNAL_KNOWLEDGE
+    config.ALLOW_EXTERNAL_KNOWLEDGE = False
+    try:
+        labeled = parse_labeled_answers(answers_path)
+        evaluated = [item for item in labeled if item["evidence"]]
+        if not evaluated:
+            raise ValueError(f"Nenhuma evidência rotulada encontrada em '{answers_path}'")
+
+        rows = []
+        for model in models:
+            for chunk_size in chunk_sizes:
+                for overlap in overlaps:
+                    if overlap >= chunk_size:
+                        continue
+                    rows.extend(_evaluate_configuration(data_folder, evaluated, model, chunk_size,
+                                                        overlap, ks, work_dir))
+    finally:
+        config.ALLOW_EXTERNAL_KNOWLEDGE = saved_external
+
+    _pareto_front(rows)
+    rows.sort(key=lambda r: (-r["recall_page"], r["query_p50_ms"]))
+    return {
+        "questions": len(labeled),
+        "questions_with_evidence": len(evaluated),
+        "data_folder": data_folder,
+        "results": rows,
+    }
+
+
+def format_table(rows: List[Dict[str, Any]]) -> str:
+    header = (f"{'pareto':>6} {'modelo':<24} {'chunk':>6} {'overlap':>7} {'k':>3} "
+              f"{'recall pág.':>11} {'recall arq.':>11} {'p50 ms':>8} {'p95 ms':>8} "
+              f"{'chunks':>7} {'MB':>7} {'build s':>8}")
+    lines = [header, "-" * len(header)]
+    for row in rows:
+        lines.append(
+            f"{'*' if row['pareto'] else '':>6} {os.path.basename(row['model'])[:24]:<24} "
+            f"{row['chunk_size']:>6} {row['chunk_overlap']:>7} {row['k']:>3} "
+            f"{row['recall_page']:>11.3f} {row['recall_file']:>11.3f} {row['query_p50_ms']:>8.2f} "
+            f"{row['query_p95_ms']:>8.2f} {row['chunks']:>7} {row['index_bytes'] / 1e6:>7.2f} "
+            f"{row['build_seconds']:>8.2f}{' (reuso)' if row['index_reused'] else ''}")
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Varredura de chunk/overlap/k/modelo com recall@k e latência.")
+    parser.add_argument("--data-folder", default=config.DEFAULT_DATA_FOLDER)
+    parser.add_argument("--answers", default="respostas.txt", help="Respostas rotuladas (com citações de fonte).")
+    parser.add_argument("--models", nargs="+", default=[config.DEFAULT_EMBEDDING_MODEL])
+    parser.add_argument("--chunk-sizes", type=int, nargs="+", default=[384, config.DEFAULT_CHUNK_SIZE, 1024])
+    parser.add_argument("--overlaps", type=int, nargs="+", default=[50, config.DEFAULT_CHUNK_OVERLAP])
+    parser.add_argument("--ks", type=int, nargs="+", default=[3, config.DEFAULT_RETRIEVAL_K, 8])
+    parser.add_argument("--work-dir", default="sweep_indices",
+                        help="Pasta dos índices por configuração (mantida para reuso).")
+    parser.add_argument("--output", help="Grava o resultado JSON neste arquivo.")
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)
+    result = run(args.data_folder, args.answers, args.models, args.chunk_sizes,
+                 args.overlaps, args.ks, args.work_dir)
+    print(f"Perguntas avaliadas: {result['questions_with_evidence']} de {result['questions']}")
+    print(format_table(result["results"]))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    main()
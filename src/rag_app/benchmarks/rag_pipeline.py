@@ -0,0 +1,226 @@
+# src/rag_app/benchmarks/rag_pipeline.py
+"""
+Benchmark reproduzível do pipeline RAG: ingestão, recuperação e resposta completa.
+
+Gera um corpus sintético (benchmarks/corpus.py) em uma pasta temporária, indexa-o
+em um ChromaDB isolado e mede:
+  - ingestão: documentos, páginas, chunks e MB por segundo
+  - recuperação: latência p50/p99 de retrieve_relevant_chunks
+  - resposta: latência p50/p99 de answer_query com um LLM simulado determinístico
+    (endpoint "mock" do roteador, latência fixa e sem rede)
+
+O resultado é JSON. Com --baseline, cada métrica é comparada ao arquivo salvo
+anteriormente (--save-baseline) e pioras acima da tolerância são sinalizadas
+(código de saída 1).
+
+Uso (a partir da raiz do projeto):
+    python -m src.rag_app.benchmarks.rag_pipeline --documents 20 --save-baseline benchmark_baseline.json
+    python -m src.rag_app.benchmarks.rag_pipeline --documents 20 --baseline benchmark_baseline.json
+"""
+
+import argparse
+import json
+import logging
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from .. import config
+from .corpus import generate_corpus
+
+# Sentido de cada métrica: True = maior é melhor
+METRIC_HIGHER_IS_BETTER = {
+    "ingestion.documents_per_second": True,
+    "ingestion.pages_per_second": True,
+    "ingestion.chunks_per_second": True,
+    "ingestion.mb_per_second": True,
+    "retrieval.p50_ms": False,
+    "retrieval.p99_ms": False,
+    "answer.p50_ms": False,
+    "answer.p99_ms": False,
+}
+
+
+def _latency_summary(samples: List[float]) -> Dict[str, float]:
+    values = np.array(samples) * 1000.0
+    return {
+        "p50_ms": round(float(np.percentile(values, 50)), 3),
+        "p99_ms": round(float(np.percentile(values, 99)), 3),
+        "mean_ms": round(float(values.mean()), 3),
+        "count": len(samples),
+    }
+
+
+def run(documents: int = 20, pages_per_document: int = 5, words_per_page: int = 300,
+        pdf_fraction: float = 0.5, queries: int = 50, retrieval_repeat: int = 3,
+        mock_latency_seconds: float = 0.0, embedding_model: str = config.DEFAULT_EMBEDDING_MODEL,
+        k: int = config.DEFAULT_RETRIEVAL_K, seed: int = 42, work_dir: Optional[str] = None) -> Dict[str, Any]:
+    """Executa o benchmark completo e retorna o resultado (metadados + métricas)."""
+    from ..rag_core import RAGCore
+
+    base_dir = work_dir or tempfile.mkdtemp(prefix="rag_bench_")
+    data_folder = os.path.join(base_dir, "data")
+
+    # Sem rede: LLM simulado e sem conhecimento externo remoto (restaurados ao final)
+    saved_settings = (config.LLM_ENDPOINTS, config.ALLOW_EXTERNAL_KNOWLEDGE)
+    config.LLM_ENDPOINTS = [{"name": "mock", "provider": "mock", "latency_seconds": mock_latency_seconds}]
+    config.ALLOW_EXTERNAL_KNOWLEDGE = False
+    rag = None
+    try:
+        corpus = generate_corpus(data_folder, documents, pages_per_document, words_per_page,
+                                 pdf_fraction, queries, seed)
+
+        # O RAGCore é criado com a pasta vazia para separar o carregamento do modelo da ingestão
+        empty_folder = os.path.join(base_dir, "empty")
+        os.makedirs(empty_folder, exist_ok=True)
+        rag = RAGCore(data_folder=empty_folder, model_name=embedding_model,
+                      chroma_db_path=os.path.join(base_dir, "chroma"),
+                      collection_name="benchmark")
+        rag.data_folder = data_folder
+
+        start = time.perf_counter()
+        rag._load_or_process_documents()
+        ingestion_seconds = time.perf_counter() - start
+        chunk_count = rag.count_chunks()
+        total_pages = documents * pages_per_document
+        total_mb = sum(doc["bytes"] for doc in corpus["documents"]) / (1024 * 1024)
+
+        query_texts = [item["query"] for item in corpus["queries"]]
+        rag.retrieve_relevant_chunks(query_texts[0], k)  # Aquecimento
+
+        retrieval_samples, hits = [], 0
+        for _ in range(retrieval_repeat):
+            for item in corpus["queries"]:
+                start = time.perf_counter()
+                retrieved = rag.retrieve_relevant_chunks(item["query"], k)
+                retrieval_samples.append(time.perf_counter() - start)
+                hits += any(r["metadata"] and r["metadata"].get("source") == item["source"] for r in retrieved)
+
+        answer_samples, paths = [], {}
+        for query in query_texts:
+            start = time.perf_counter()
+            details = rag.answer_query_with_details(query)
+            answer_samples.append(time.perf_counter() - start)
+            paths[details["path"]] = paths.get(details["path"], 0) + 1
+
+        retrieval = _latency_summary(retrieval_samples)
+        answer = _latency_summary(answer_samples)
+        metrics = {
+            "ingestion.seconds": round(ingestion_seconds, 3),
+            "ingestion.documents_per_second": round(documents / ingestion_seconds, 3),
+            "ingestion.pages_per_second": round(total_pages / ingestion_seconds, 3),
+            "ingestion.chunks_per_second": round(chunk_count / ingestion_seconds, 3),
+            "ingestion.mb_per_second": round(total_mb / ingestion_seconds, 4),
+            "retrieval.p50_ms": retrieval["p50_ms"],
+            "retrieval.p99_ms": retrieval["p99_ms"],
+            "retrieval.mean_ms": retrieval["mean_ms"],
+            "answer.p50_ms": answer["p50_ms"],
+            "answer.p99_ms": answer["p99_ms"],
+            "answer.mean_ms": answer["mean_ms"],
+        }
+        return {
+            "metadata": {
+                "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "python": sys.version.split()[0],
+                "platform": platform.platform(),
+                "embedding_model": embedding_model,
+                "chunk_size": config.DEFAULT_CHUNK_SIZE,
+                "chunk_overlap": config.DEFAULT_CHUNK_OVERLAP,
+                "retrieval_k": k,
+                "mock_latency_seconds": mock_latency_seconds,
+                "retrieval_repeat": retrieval_repeat,
+                "corpus": corpus["parameters"],
+            },
+            "metrics": metrics,
+            "details": {
+                "chunks": chunk_count,
+                "total_words": corpus["total_words"],
+                "corpus_mb": round(total_mb, 3),
+                "retrieval_source_hit_rate": round(hits / len(retrieval_samples), 3),
+                "answer_paths": paths,
+            },
+        }
+    finally:
+        config.LLM_ENDPOINTS, config.ALLOW_EXTERNAL_KNOWLEDGE = saved_settings
+        # Fecha o ChromaDB, o manifesto e os pools antes de apagar o diretório
+        if rag is not None:
+            rag.close()
+        if work_dir is None:
+            shutil.rmtree(base_dir, ignore_errors=True)
+
+
+def compare_to_baseline(result: Dict[str, Any], baseline: Dict[str, Any],
+                        tolerance: float = 0.10) -> List[Dict[str, Any]]:
+    """
+    Compara as métricas com a linha de base.
+
+    Uma métrica regride quando piora mais que `tolerance` (fração relativa) no seu sentido.
+    """
+    rows = []
+    for metric, higher_is_better in METRIC_HIGHER_IS_BETTER.items():
+        current = result["metrics"].get(metric)
+        previous = baseline.get("metrics", {}).get(metric)
+        if current is None or not previous:
+            continue
+        change = (current - previous) / previous
+        worse = -change if higher_is_better else change
+        rows.append({"metric": metric, "baseline": previous, "current": current,
+                     "change": round(change, 4), "regression": worse > tolerance})
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de ingestão, recuperação e resposta do RAG.")
+    parser.add_argument("--documents", type=int, default=20)
+    parser.add_argument("--pages", type=int, default=5, help="Páginas (ou seções) por documento.")
+    parser.add_argument("--words-per-page", type=int, default=300)
+    parser.add_argument("--pdf-fraction", type=float, default=0.5)
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--retrieval-repeat", type=int, default=3)
+    parser.add_argument("--mock-latency", type=float, default=0.0, help="Latência do LLM simulado (s).")
+    parser.add_argument("--embedding-model", default=config.DEFAULT_EMBEDDING_MODEL)
+    parser.add_argument("--k", type=int, default=config.DEFAULT_RETRIEVAL_K)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="Grava o resultado JSON neste arquivo.")
+    parser.add_argument("--baseline", help="Arquivo JSON de linha de base para comparação.")
+    parser.add_argument("--save-baseline", help="Grava o resultado como nova linha de base.")
+    parser.add_argument("--tolerance", type=float, default=0.10,
+                        help="Piora relativa tolerada antes de sinalizar regressão (padrão: 0.10).")
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)
+    result = run(args.documents, args.pages, args.words_per_page, args.pdf_fraction, args.queries,
+                 args.retrieval_repeat, args.mock_latency, args.embedding_model, args.k, args.seed)
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline.get("metadata", {}).get("corpus") != result["metadata"]["corpus"]:
+            print("Aviso: a linha de base foi gerada com outro corpus; a comparação pode não ser válida.",
+                  file=sys.stderr)
+        result["comparison"] = compare_to_baseline(result, baseline, args.tolerance)
+        regressions = [row for row in result["comparison"] if row["regression"]]
+
+    output = json.dumps(result, indent=2, ensure_ascii=False)
+    print(output)
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(output)
+
+    if regressions:
+        for row in regressions:
+            print(f"REGRESSÃO: {row['metric']} {row['baseline']} -> {row['current']} "
+                  f"({row['change']:+.1%})", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+# src/rag_app/chunk_dedup.py
+"""
+Detecção de chunks quase duplicados na ingestão (MinHash + LSH).
+
+Editais de anos e campi diferentes repetem blocos inteiros de texto. Cada cópia
+ocuparia um vetor no ChromaDB e disputaria as posições do top-k com as demais.
+Na ingestão, cada chunk recebe uma assinatura MinHash dos seus shingles (sequências
+de `shingle_words` palavras normalizadas). O índice LSH divide as assinaturas em
+faixas (bands) e devolve como candidatos apenas os chunks que coincidem em alguma
+faixa; a similaridade de Jaccard estimada pela assinatura decide se o chunk é uma
+quase duplicata (>= `threshold`).
+
+Textos que diferem só em datas e valores ("inscrições até 10/03/2024 ... R$ 85,00"
+e "... 17/04/2025 ... R$ 95,00") têm similaridade alta, mas não são cópias: a
+assinatura termina com uma impressão do multiconjunto de números do texto, e só
+chunks com exatamente os mesmos números são considerados quase duplicatas.
+
+Uma quase duplicata não é gravada no ChromaDB: o chunk canônico passa a listar as
+fontes e páginas de todas as cópias (metadados duplicate_sources/duplicate_locations).
+O texto das duplicatas fica no manifesto, para que uma delas seja promovida a
+canônica se o arquivo do chunk canônico for alterado ou removido.
+"""
+
+import re
+import zlib
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+import numpy as np
+
+# Primo de Mersenne 2^31 - 1: (a * x + b) cabe em uint64 com x de 32 bits e a, b < 2^31
+_PRIME = np.uint64((1 << 31) - 1)
+# Marcadores inseridos pela extração, que variam entre cópias do mesmo texto
+_MARKERS = re.compile(r"\[(?:Página \d+|Arquivo Markdown: [^\]]*)\]")
+_WORDS = re.compile(r"\w+")
+_NUMBERS = re.compile(r"\d+")
+
+
+def dedup_config_key(dedup_config: Dict[str, Any]) -> Optional[str]:
+    """Identifica os parâmetros da deduplicação (gravado por arquivo no manifesto); None se desativada."""
+    if not dedup_config.get("enabled", False):
+        return None
+    return f"minhash2-{dedup_config['num_perm']}x{dedup_config['shingle_words']}@{dedup_config['threshold']}"
+
+
+def number_fingerprint(text: str) -> int:
+    """Impressão (CRC32) do multiconjunto de números do texto (datas, valores, prazos)."""
+    numbers = sorted(_NUMBERS.findall(_MARKERS.sub(" ", text)))
+    return zlib.crc32(" ".join(numbers).encode("ascii"))
+
+
+class MinHasher:
+    """
+    Assinaturas MinHash determinísticas (iguais entre execuções e processos): `num_perm`
+    posições seguidas da impressão dos números do texto (signature_length no total).
+    """
+
+    def __init__(self, num_perm: int = 128, shingle_words: int = 5, seed: int = 1):
+        self.num_perm = num_perm
+        self.signature_length = num_perm + 1
+        self.shingle_words = shingle_words
+        rng = np.random.RandomState(seed)
+        self._a = rng.randint(1, int(_PRIME), size=num_perm).astype(np.uint64)
+        self._b = rng.randint(0, int(_PRIME), size=num_perm).astype(np.uint64)
+
+    def _shingle_hashes(self, text: str) -> np.ndarray:
+        words = _WORDS.findall(_MARKERS.sub(" ", text).lower())
+        if len(words) <= self.shingle_words:
+            shingles = {" ".join(words)}
+        else:
+            shingles = {" ".join(words[i:i + self.shingle_words])
+                        for i in range(len(words) - self.shingle_words + 1)}
+        return np.fromiter((zlib.crc32(shingle.encode("utf-8")) for shingle in shingles),
+                           dtype=np.uint64, count=len(shingles))
+
+    def signature(self, text: str) -> np.ndarray:
+        hashes = self._shingle_hashes(text)
+        # (num_shingles, num_perm): permutações universais (a * x + b) mod p
+        permuted = (np.outer(hashes % _PRIME, self._a) + self._b) % _PRIME
+        return np.append(permuted.min(axis=0), number_fingerprint(text)).astype(np.uint32)
+
+    @staticmethod
+    def to_bytes(signature: np.ndarray) -> bytes:
+        return signature.astype("<u4").tobytes()
+
+    @staticmethod
+    def from_bytes(data: bytes) -> np.ndarray:
+        return np.frombuffer(data, dtype="<u4").astype(np.uint32)
+
+
+def estimated_similarity(a: np.ndarray, b: np.ndarray) -> float:
+    """Similaridade de Jaccard estimada: fração de posições iguais nas assinaturas."""
+    return float(np.count_nonzero(a == b)) / len(a)
+
+
+class NearDuplicateIndex:
+    """Índice LSH das assinaturas dos chunks canônicos de um shard."""
+
+    def __init__(self, num_perm: int, bands: int, threshold: float):
+        if num_perm % bands:
+            raise ValueError(f"num_perm ({num_perm}) deve ser múltiplo de lsh_bands ({bands})")
+        self.num_perm = num_perm
+        self.rows = num_perm // bands
+        self.bands = bands
+        self.threshold = threshold
+        self._buckets: List[Dict[bytes, Set[str]]] = [{} for _ in range(bands)]
+        self._signatures: Dict[str, np.ndarray] = {}
+
+    def __len__(self) -> int:
+        return len(self._signatures)
+
+    def __contains__(self, chunk_id: str) -> bool:
+        return chunk_id in self._signatures
+
+    def _band_keys(self, signature: np.ndarray) -> List[bytes]:
+        return [signature[band * self.rows:(band + 1) * self.rows].tobytes() for band in range(self.bands)]
+
+    def add(self, chunk_id: str, signature: np.ndarray):
+        self._signatures[chunk_id] = signature
+        for band, key in enumerate(self._band_keys(signature)):
+            self._buckets[band].setdefault(key, set()).add(chunk_id)
+
+    def remove(self, chunk_id: str):
+        signature = self._signatures.pop(chunk_id, None)
+        if signature is None:
+            return
+        for band, key in enumerate(self._band_keys(signature)):
+            bucket = self._buckets[band].get(key)
+            if bucket is not None:
+                bucket.discard(chunk_id)
+                if not bucket:
+                    del self._buckets[band][key]
+
+    def find(self, signature: np.ndarray) -> Optional[Tuple[str, float]]:
+        """Chunk canônico mais parecido, com os mesmos números e similaridade >= threshold, ou None."""
+        candidates: Set[str] = set()
+        for band, key in enumerate(self._band_keys(signature)):
+            candidates.update(self._buckets[band].get(key, ()))
+        best = None
+        for chunk_id in candidates:
+            other = self._signatures[chunk_id]
+            if other[self.num_perm] != signature[self.num_perm]:
+                continue  # Datas, valores ou prazos diferentes: não é uma cópia
+            similarity = estimated_similarity(signature[:self.num_perm], other[:self.num_perm])
+            if similarity >= self.threshold and (best is None or similarity > best[1]
+                                                 or (similarity == best[1] and chunk_id < best[0])):
+                best = (chunk_id, similarity)
+        return best
@@ -0,0 +1,92 @@
+# src/rag_app/concept_store.py
+"""
+Base de conceitos educacionais indexada.
+
+Os conceitos são carregados de um arquivo JSON externo (config.EDUCATIONAL_CONCEPTS_FILE)
+e indexados por nome/sinônimo em um autômato Aho-Corasick, de modo que localizar
+o conceito citado em uma pergunta custa uma única passada pelo texto, mesmo com
+milhares de entradas.
+
+Formato do arquivo:
+    {"version": 1,
+     "concepts": [{"concept": "renda per capita", "aliases": ["renda por pessoa"],
+                   "information": {"definition": "...", "source": "..."}}]}
+"""
+
+import json
+import logging
+import os
+from typing import Any, Dict, List, Optional
+
+from . import config
+from .keyword_matcher import KeywordMatcher
+
+logger = logging.getLogger(__name__)
+
+
+class ConceptStore:
+    """Armazena conceitos por nome normalizado e os localiza em textos livres."""
+
+    def __init__(self, concepts: Optional[List[Dict[str, Any]]] = None):
+        self._entries: List[Dict[str, Any]] = []
+        self._by_name: Dict[str, int] = {}
+        self._matcher = KeywordMatcher()
+        for entry in concepts or []:
+            self.add(entry)
+        self._matcher.build()
+
+    @classmethod
+    def from_file(cls, path: Optional[str] = None) -> "ConceptStore":
+        """Carrega a base de um arquivo JSON. Arquivo ausente ou inválido gera base vazia."""
+        path = path or config.EDUCATIONAL_CONCEPTS_FILE
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            logger.warning(f"Base de conceitos não encontrada em '{path}'. Usando base vazia.")
+            return cls()
+        except (OSError, json.JSONDecodeError) as e:
+            logger.error(f"Erro ao carregar base de conceitos '{path}': {e}")
+            return cls()
+
+        concepts = data.get("concepts", []) if isinstance(data, dict) else data
+        store = cls(concepts)
+        logger.info(f"Base de conceitos carregada: {len(store)} conceitos de '{path}'")
+        return store
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def add(self, entry: Dict[str, Any]):
+        """Adiciona um conceito (exige build implícito na próxima busca)."""
+        name = entry.get("concept", "").strip().lower()
+        if not name or "information" not in entry:
+            logger.warning(f"Entrada de conceito ignorada (sem 'concept' ou 'information'): {entry}")
+            return
+        index = self._by_name.get(name)
+        if index is None:
+            index = len(self._entries)
+            self._entries.append(entry)
+            self._by_name[name] = index
+        else:
+            self._entries[index] = entry
+        for term in [name] + [alias.lower() for alias in entry.get("aliases", [])]:
+            self._matcher.add(term, str(index))
+
+    def get(self, name: str) -> Optional[Dict[str, Any]]:
+        index = self._by_name.get(name.strip().lower())
+        return self._entries[index] if index is not None else None
+
+    def find_in_text(self, text: str) -> Optional[Dict[str, Any]]:
+        """
+        Retorna o conceito mencionado no texto. Havendo vários, prevalece o termo
+        mais longo (mais específico) e, em empate, o que aparece primeiro no arquivo.
+        """
+        best = None
+        for _, term, category in self._matcher.iter_matches(text):
+            candidate = (-len(term), int(category))
+            if best is None or candidate < best:
+                best = candidate
+        if best is None:
+            return None
+        return self._entries[best[1]]
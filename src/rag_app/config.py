@@ -1,7 +1,7 @@
 # src/rag_app/config.py
 
 import os
-from typing import List
+from typing import Dict, List, Optional
 from dotenv import load_dotenv
 
 # Carrega variáveis de ambiente do arquivo .env (se existir)
@@ -65,6 +65,18 @@ GEMINI_MAX_TOKENS: int = 4096    # Número máximo de tokens na resposta
 
 # --- Configurações Gerais ---
 DEFAULT_EMBEDDING_MODEL: str = "all-MiniLM-L6-v2"
+# Backend e dispositivo dos modelos de embedding. Os modelos são carregados uma única vez por
+# processo (registro compartilhado em embedding_models.py) e reutilizados por todos os RAGCore.
+EMBEDDING_MODEL_BACKEND: str = "torch"           # "torch", "onnx" ou "openvino" (sentence-transformers)
+EMBEDDING_MODEL_DEVICE: Optional[str] = None      # None = automático ("cpu", "cuda", ...)
+# Micro-batching das consultas (query_batcher.py): consultas simultâneas são codificadas
+# numa única passada do modelo. A janela só é aplicada quando há concorrência; uma consulta
+# isolada é codificada imediatamente.
+QUERY_EMBEDDING_BATCH_CONFIG = {
+    "enabled": True,
+    "max_batch_size": 32,   # Consultas por passada
+    "max_wait_ms": 3.0,     # Espera máxima do líder para completar o lote
+}
 
 # Pasta padrão para os dados (arquivos PDF)
 DEFAULT_DATA_FOLDER: str = "data"
@@ -73,9 +85,90 @@ DEFAULT_DATA_FOLDER: str = "data"
 CHROMA_DB_PATH: str = "./chroma_db_store"
 CHROMA_COLLECTION_NAME: str = "rag_documents"
 
-# Arquivo para rastrear o estado dos arquivos PDF processados
+# Arquivo de status legado (mtime/tamanho por arquivo). Substituído pelo manifesto do
+# índice (INDEX_MANIFEST_CONFIG); se existir, é importado uma única vez na primeira execução.
 PROCESSED_FILES_STATUS_JSON: str = "processed_files_status.json"
 
+# --- Manifesto do índice e migração de modelo de embedding ---
+# O manifesto (SQLite) registra o modelo de embedding de cada coleção, os parâmetros do
+# chunker, os hashes de arquivos e chunks e a versão do índice. Caminho padrão (path=None):
+# "<CHROMA_DB_PATH>/<CHROMA_COLLECTION_NAME>_manifest.sqlite3".
+# on_model_change define o que fazer quando DEFAULT_EMBEDDING_MODEL difere do modelo do índice:
+#   "migrate": reindexa em segundo plano numa nova coleção e troca de forma atômica ao final;
+#              enquanto isso as consultas seguem na coleção antiga, com o modelo antigo
+#   "rebuild": descarta a coleção e reprocessa os documentos na inicialização
+#   "keep":    continua usando o modelo antigo para as consultas desse índice
+INDEX_MANIFEST_CONFIG = {
+    "path": None,
+    "on_model_change": "migrate",
+    "migration_batch_size": 2048,         # Chunks lidos e reembedados por lote (ver EMBEDDING_ENCODER_CONFIG)
+    "old_collection_grace_seconds": 30.0,  # Espera antes de apagar a coleção antiga (consultas em curso)
+    # Uma migração em andamento renova seu sinal de vida no manifesto a cada heartbeat; sem sinal
+    # por stale_seconds (ou com o processo dono encerrado) ela é considerada interrompida
+    "migration_heartbeat_seconds": 10.0,
+    "migration_stale_seconds": 120.0,
+}
+
+# --- Índice particionado (shards) ---
+# "single": apenas os arquivos da raiz de DEFAULT_DATA_FOLDER, na coleção CHROMA_COLLECTION_NAME.
+# "subfolder": cada subpasta de DEFAULT_DATA_FOLDER (ex.: data/campus_cuiaba/, data/2025/) é
+# um shard com coleção própria ("<CHROMA_COLLECTION_NAME>__<subpasta>"); os arquivos da raiz
+# continuam na coleção principal. As consultas são feitas em paralelo nos shards selecionados
+# e combinadas por distância.
+INDEX_SHARDING_CONFIG = {
+    "mode": "single",
+    "max_parallel_queries": 8,  # Threads para consultar os shards em paralelo
+}
+
+# --- Snapshots do índice (réplicas) ---
+# Um snapshot (python -m src.rag_app.index_admin export <arquivo>) contém vetores, documentos,
+# metadados e manifesto num único arquivo. Com replica_path definido (ou a variável de ambiente
+# RAG_INDEX_SNAPSHOT), o RAGCore abre o snapshot em modo réplica somente leitura: sem ChromaDB
+# nem ingestão, com os vetores mapeados em memória e compartilhados entre processos.
+INDEX_SNAPSHOT_CONFIG = {
+    "replica_path": os.getenv("RAG_INDEX_SNAPSHOT") or None,
+    "verify_checksum": False,  # Confere o SHA-256 dos vetores ao abrir (lê o arquivo inteiro)
+}
+
+# --- Codificação de embeddings na ingestão ---
+# Os chunks de vários arquivos são acumulados (até flush_chunks), ordenados pelo comprimento
+# em tokens e codificados em lotes de tamanho batch_size distribuídos entre `workers`
+# processos (0 = todos os núcleos). Abaixo de min_chunks_for_pool (ex.: atualização de um
+# único arquivo) a codificação roda no próprio processo, sem o custo de subir o pool.
+EMBEDDING_ENCODER_CONFIG = {
+    "workers": 0,
+    "batch_size": 64,
+    "min_chunks_for_pool": 512,
+    "flush_chunks": 4096,
+}
+
+# --- Cache de extração de documentos (extraction_cache.py) ---
+# A extração dos PDFs (texto por página e tabelas) é guardada por SHA-256 do arquivo +
+# versão do extrator. Mudanças no chunker ou no modelo de embedding, reconstruções e
+# varreduras de parâmetros reprocessam os PDFs sem abri-los de novo. O cache fica fora
+# do diretório do índice e é compartilhado entre índices. (Markdown é lido diretamente.)
+EXTRACTION_CACHE_CONFIG = {
+    "enabled": True,
+    "path": "extraction_cache.sqlite3",
+    "max_size_mb": 1024,   # Acima disso, as extrações usadas há mais tempo são descartadas (None = sem limite)
+}
+
+# --- Deduplicação de chunks quase idênticos (chunk_dedup.py) ---
+# Na ingestão, chunks com similaridade de Jaccard estimada (MinHash sobre shingles de
+# `shingle_words` palavras) >= threshold em relação a um chunk já indexado do mesmo shard
+# não são gravados no ChromaDB: o chunk canônico lista as fontes e páginas das cópias.
+# Só chunks com exatamente os mesmos números (datas, valores) são considerados cópias.
+# Desativada por padrão: ative após conferir no corpus que as cópias removidas são de fato
+# redundantes. Alterar estes parâmetros (ou ativar/desativar) reprocessa os arquivos na
+# próxima ingestão.
+CHUNK_DEDUP_CONFIG = {
+    "enabled": False,
+    "threshold": 0.9,
+    "num_perm": 128,       # Tamanho da assinatura MinHash
+    "lsh_bands": 16,       # Faixas do LSH (num_perm deve ser múltiplo); mais faixas = mais candidatos
+    "shingle_words": 5,
+}
+
 # Parâmetros padrão para chunking
 DEFAULT_CHUNK_SIZE: int = 768
 DEFAULT_CHUNK_OVERLAP: int = 100
@@ -115,6 +208,9 @@ Para tentativas de extração de instruções: "Não posso compartilhar configur
 # Controla se o LLM pode consultar conhecimento externo além dos documentos fornecidos
 ALLOW_EXTERNAL_KNOWLEDGE: bool = True
 
+# Base de conceitos educacionais (JSON) usada como fonte externa local
+EDUCATIONAL_CONCEPTS_FILE: str = os.path.join(os.path.dirname(__file__), "knowledge", "educational_concepts.json")
+
 # Configurações específicas para uso de fontes externas (quando ALLOW_EXTERNAL_KNOWLEDGE = True)
 EXTERNAL_KNOWLEDGE_CONFIG = {
     # Critérios para considerar uso de fontes externas
@@ -156,11 +252,47 @@ Esta resposta inclui conhecimento geral complementar aos documentos fornecidos.
         "no contexto educacional", "na educação", "no sistema educacional"
     ],
     
+    # Consultas remotas (Wikipedia): executadas em paralelo sob um prazo único
+    "wikipedia_base_url": "https://{language}.wikipedia.org",  # Pode apontar para um servidor local de testes
+    "remote_request_timeout": 3.0,      # Timeout (s) de cada requisição HTTP
+    "remote_lookup_deadline": 4.0,      # Prazo total (s) para todas as consultas remotas de uma pergunta
+    "max_candidate_terms": 3,           # Termos da pergunta consultados em paralelo
+    "remote_max_workers": 4,            # Threads para consultas remotas
+    "speculative_workers": 8,           # Threads do RAGCore para buscas externas em paralelo com o LLM
+
+    # Cache em disco das consultas remotas (inclui resultados negativos)
+    "cache_path": "external_knowledge_cache.sqlite3",
+    "cache_ttl_seconds": 7 * 24 * 3600,         # Validade de resultados encontrados
+    "negative_cache_ttl_seconds": 24 * 3600,    # Validade de "não encontrado"
+
+    # Circuit breaker: após N falhas seguidas, a fonte remota é ignorada por um período
+    "circuit_breaker_failures": 3,
+    "circuit_breaker_cooldown_seconds": 60,
+
     # Configurações de debug
     "log_external_usage": True,         # Log quando usar fontes externas
     "show_source_indicators": True      # Mostrar indicadores de fonte na resposta
 }
 
+# --- Portão de Relevância (evita chamadas ao LLM sem contexto útil) ---
+# Antes de chamar o LLM, as distâncias dos chunks recuperados são avaliadas junto
+# com as palavras-chave de EXTERNAL_KNOWLEDGE_CONFIG. Quando os documentos
+# claramente não contêm a resposta, o fallback correspondente é devolvido
+# imediatamente (com conhecimento externo local, sem consultas remotas).
+# Distâncias seguem a métrica padrão do ChromaDB (L2 ao quadrado; 0 = idêntico).
+# Os limiares abaixo foram calibrados para "all-MiniLM-L6-v2" (vetores normalizados,
+# distâncias entre 0 e 4); ao trocar DEFAULT_EMBEDDING_MODEL, recalibre-os.
+RETRIEVAL_GATE_CONFIG = {
+    "enabled": True,
+    # Se até o melhor chunk estiver acima desta distância -> fallback "low_relevance"
+    "low_relevance_distance": 1.45,
+    # Perguntas conceituais (sem contexto específico) em que nenhum chunk fica abaixo
+    # desta distância e menos de "min_chunks_threshold" chunks próximos -> "insufficient_context"
+    "insufficient_context_distance": 1.2,
+    # Registra cada decisão do portão no log (nível DEBUG)
+    "log_decisions": False,
+}
+
 # Diretiva específica para uso de fontes externas (incorporada no prompt quando ALLOW_EXTERNAL_KNOWLEDGE = True)
 EXTERNAL_KNOWLEDGE_DIRECTIVE: str = """
 DIRETIVA DE FONTES EXTERNAS:
@@ -181,4 +313,143 @@ FORMATO DA RESPOSTA (quando usar fontes externas):
 📋 **Baseado nos documentos fornecidos:** [informação específica]
 💡 **Contexto geral:** [conhecimento complementar]
 ⚠️ **Importante:** Sempre consulte os documentos oficiais para informações específicas.
-"""
\ No newline at end of file
+"""
+# --- Escalonador de chamadas ao LLM ---
+# Todas as chamadas ao LLM passam pelo escalonador (llm_scheduler.py), compartilhado
+# pelo processo: limite de requisições simultâneas por provedor, fila limitada com
+# prioridade ("interactive" antes de "batch") e tempo máximo de espera.
+# Limite: processos diferentes (rag_batch e rag_web, por exemplo) têm escalonadores
+# independentes e não enxergam as filas uns dos outros. Para que a prioridade valha
+# entre eles, envie o lote pelo rag_server ("priority": "batch" no POST /answer).
+LLM_SCHEDULER_CONFIG = {
+    "max_in_flight": {"ollama": 2, "gemini": 8, "default": 4},
+    "max_queue": 100,
+    "queue_timeout_seconds": {"interactive": 120.0, "batch": 1800.0},
+}
+
+# --- Roteador de múltiplos endpoints LLM ---
+# Endpoints disponíveis para o roteador (llm_router.py). Lista vazia = apenas o
+# provedor definido em LLM_PROVIDER (OLLAMA_HOST ou GEMINI_MODEL).
+# Cada endpoint tem sua própria fila no escalonador; o limite de concorrência vem
+# de LLM_SCHEDULER_CONFIG["max_in_flight"][name] ou, na falta, do tipo do provedor.
+LLM_ENDPOINTS: List[Dict] = [
+    # {"name": "ollama-local", "provider": "ollama", "host": "http://localhost:11434", "model": "llama3:latest"},
+    # {"name": "ollama-gpu", "provider": "ollama", "host": "http://192.168.64.2:11434"},
+    # {"name": "gemini", "provider": "gemini", "model": "gemini-2.5-flash"},
+]
+LLM_ROUTER_CONFIG = {
+    "failure_threshold": 2,           # Falhas consecutivas para tirar o endpoint de rotação
+    "cooldown_seconds": 30.0,         # Tempo fora de rotação antes de nova tentativa
+    "request_timeout_seconds": 120.0, # Timeout HTTP das chamadas ao Ollama
+    "latency_window": 200,            # Latências recentes mantidas por endpoint
+    "hedging_enabled": False,         # Dispara uma segunda requisição em outro endpoint se a primeira demorar
+    "hedge_percentile": 95,           # ... além deste percentil de latência do endpoint
+    "hedge_min_samples": 20,          # Amostras mínimas antes de usar hedging
+    "hedge_min_delay_seconds": 1.0,   # Espera mínima antes do hedge
+    "max_parallel_attempts": 32,      # Threads do roteador para tentativas simultâneas
+}
+
+# --- Prazo de ponta a ponta por consulta (deadline.py) ---
+# Cada answer_query recebe um prazo total, repassado à recuperação, ao conhecimento
+# externo e à geração: cada etapa usa só o tempo restante e o trabalho que passa do
+# prazo é cancelado. Esgotado o prazo, a resposta degrada para o texto parcial do
+# LLM, os trechos mais relevantes recuperados ou uma mensagem de fallback.
+# O prazo também pode ser passado por consulta (answer_query(..., timeout_seconds=30)).
+QUERY_DEADLINE_CONFIG = {
+    "enabled": True,
+    "default_seconds": {"interactive": 90.0, "batch": 600.0},  # Por classe de prioridade (None = sem prazo)
+    "min_generation_seconds": 2.0,  # Com menos tempo restante, a geração nem é iniciada
+    "cancel_grace_seconds": 0.5,    # Espera pelo texto parcial após cancelar a geração
+    "partial_excerpts": 3,          # Trechos recuperados exibidos na resposta degradada
+}
+
+# --- Roteamento de modelo por complexidade da consulta (model_routing.py) ---
+# Antes da geração, a pergunta e os chunks recuperados são classificados com
+# critérios baratos (tamanho, palavras-chave, perfil de distâncias): consultas
+# simples vão para um modelo pequeno e rápido ("small"), as demais para o modelo
+# grande ("large"). Modelos por tipo de provedor; vazio = modelo do endpoint.
+# A rota pode ser forçada por consulta (answer_query(..., model_route="large")).
+LLM_MODEL_ROUTING_CONFIG = {
+    "enabled": False,
+    "models": {
+        "small": {"ollama": "llama3.2:3b", "gemini": "gemini-2.5-flash-lite"},
+        "large": {},
+    },
+    "small_max_query_words": 16,       # Perguntas mais longas vão para "large"...
+    "small_max_context_chars": 3000,   # ... assim como contextos maiores que isto
+    "small_max_best_distance": 1.0,    # Evidência fraca (melhor chunk distante) -> "large"
+    "close_distance_margin": 0.15,     # Chunks até esta distância do melhor contam como "próximos"
+    "small_max_close_sources": 1,      # Próximos vindos de mais documentos -> síntese -> "large"
+    # Perguntas factuais pontuais: dispensam o limite de palavras
+    "simple_keywords": [
+        "qual a data", "qual o prazo", "quando", "quantas vagas", "quantos", "qual o valor",
+        "qual o horário", "onde fica", "qual o endereço", "qual o telefone", "qual o e-mail",
+    ],
+    # Pedidos de raciocínio, comparação ou síntese: sempre "large"
+    "complex_keywords": [
+        "compare", "comparação", "diferença entre", "por que", "porque", "explique",
+        "justifique", "analise", "vantagens", "desvantagens", "passo a passo",
+        "liste todos", "resuma", "resumo", "relação entre",
+    ],
+    "latency_window": 200,             # Latências recentes mantidas por rota
+    "log_decisions": True,
+}
+
+# --- Coalescência de consultas idênticas ---
+# Chamadas simultâneas com a mesma pergunta (normalizada), a mesma versão do índice e a
+# mesma classe de prioridade compartilham uma única execução de embedding, recuperação e geração.
+QUERY_COALESCING_ENABLED: bool = True
+
+# --- Serviço HTTP/JSON (rag_server.py) ---
+# Serviço leve (asyncio, biblioteca padrão) sobre um único RAGCore compartilhado.
+SERVER_CONFIG = {
+    "host": "127.0.0.1",
+    "port": 8080,
+    "max_concurrency": 8,           # Consultas executando ao mesmo tempo (threads de trabalho)
+    "max_queue": 64,                # Consultas aguardando vaga; acima disso -> HTTP 429
+    "queue_timeout_seconds": 30.0,  # Espera máxima na fila antes de responder 429
+    "max_body_bytes": 64 * 1024,    # Tamanho máximo do corpo da requisição
+    "keep_alive_timeout_seconds": 15.0,
+    "shutdown_grace_seconds": 30.0, # Tempo para concluir consultas em andamento ao encerrar
+}
+
+# --- Worker de recuperação compartilhado (retrieval_worker.py) ---
+# Um processo de longa duração mantém o modelo de embedding e o índice e atende
+# embed / retrieve / batch-retrieve num socket Unix (ou TCP) com protocolo binário.
+# Com "address" definido (ou RAG_RETRIEVAL_WORKER), os RAGCore dos front-ends viram
+# clientes: não carregam o modelo nem abrem o ChromaDB. O protocolo não tem
+# autenticação: em TCP, escute apenas em endereços de rede confiáveis.
+RETRIEVAL_WORKER_CONFIG = {
+    "address": os.getenv("RAG_RETRIEVAL_WORKER") or None,  # Modo cliente: "unix:/caminho.sock" ou "tcp:host:porta"
+    "listen": "unix:./rag_retrieval_worker.sock",          # Endereço padrão do worker
+    "max_concurrency": 8,               # Requisições executando ao mesmo tempo no worker
+    "max_frame_bytes": 64 * 1024 * 1024,
+    "connect_timeout_seconds": 5.0,
+    "request_timeout_seconds": 60.0,    # Sem prazo da consulta (QUERY_DEADLINE_CONFIG)
+    "pool_size": 8,                     # Conexões ociosas mantidas por cliente
+    "shutdown_grace_seconds": 10.0,
+}
+
+# --- Consultas em lote (rag_batch.py) ---
+# A saída é gravada pergunta a pergunta (JSONL: um registro por linha, com tempos por
+# etapa e ids/distâncias dos chunks recuperados); com --resume as perguntas já
+# respondidas no arquivo de saída são puladas.
+BATCH_CONFIG = {
+    "output_format": "jsonl",  # "jsonl" ou "text" (formato legado, sem --resume)
+    "fsync_every": 25,         # Registros entre sincronizações com o disco (checkpoint)
+}
+
+# --- Perfilamento sob demanda (profiling.py) ---
+# Envolve answer_query / ingestão em cProfile + tracemalloc e grava, por execução,
+# um .prof e um resumo .txt em output_dir. Também pode ser pedido por chamada
+# (answer_query(..., profile=True), _load_or_process_documents(profile=True)).
+# Desligado, não há custo adicional.
+PROFILING_CONFIG = {
+    "queries": False,          # Perfilar todas as consultas
+    "ingestion": False,        # Perfilar a ingestão (inclui pico de memória por documento)
+    "output_dir": "profiles",
+    "sort_by": "cumulative",   # Ordenação do relatório de CPU (pstats)
+    "top_functions": 30,
+    "top_allocations": 15,
+    "tracemalloc_frames": 10,
+}
@@ -0,0 +1,66 @@
+# src/rag_app/deadline.py
+"""
+Prazo de ponta a ponta de uma consulta.
+
+Um Deadline é criado quando a consulta chega (answer_query) e repassado a cada
+etapa: recuperação, conhecimento externo e geração. Cada etapa usa apenas o
+tempo que resta (remaining / budget), e o trabalho que passa do prazo é
+cancelado: as buscas na Wikipedia são abandonadas, a espera na fila do
+escalonador é encurtada e a geração em andamento é interrompida pelo evento
+de cancelamento (o Ollama é chamado em streaming e a conexão é fechada).
+
+Quando o prazo acaba, a consulta degrada: a resposta parcial já gerada pelo
+LLM, os trechos mais relevantes recuperados ou a resposta de fallback.
+"""
+
+import threading
+import time
+from typing import Optional
+
+
+class DeadlineExceeded(Exception):
+    """O prazo da consulta acabou durante uma etapa."""
+
+    def __init__(self, stage: str, partial: Optional[str] = None):
+        super().__init__(f"prazo da consulta esgotado na etapa '{stage}'")
+        self.stage = stage
+        self.partial = partial
+
+
+class Deadline:
+    """Instante limite (relógio monotônico) e evento de cancelamento de uma consulta."""
+
+    def __init__(self, seconds: Optional[float] = None):
+        self.seconds = seconds
+        self.expires_at = time.monotonic() + seconds if seconds is not None else None
+        self.cancel_event = threading.Event()
+
+    @classmethod
+    def none(cls) -> "Deadline":
+        """Sem prazo (o comportamento anterior)."""
+        return cls(None)
+
+    def remaining(self) -> Optional[float]:
+        """Segundos restantes (>= 0), ou None sem prazo."""
+        if self.expires_at is None:
+            return None
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def budget(self, cap: Optional[float] = None) -> Optional[float]:
+        """Tempo para uma etapa: o menor entre `cap` (limite próprio da etapa) e o restante."""
+        remaining = self.remaining()
+        if remaining is None:
+            return cap
+        return remaining if cap is None else min(cap, remaining)
+
+    def expired(self) -> bool:
+        return self.cancel_event.is_set() or (self.expires_at is not None and time.monotonic() >= self.expires_at)
+
+    def check(self, stage: str):
+        """Levanta DeadlineExceeded se o prazo já acabou."""
+        if self.expired():
+            raise DeadlineExceeded(stage)
+
+    def cancel(self):
+        """Sinaliza o cancelamento ao trabalho em andamento (ex.: geração no LLM)."""
+        self.cancel_event.set()
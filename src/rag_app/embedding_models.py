@@ -0,0 +1,147 @@
+# src/rag_app/embedding_models.py
+"""
+Registro de modelos de embedding compartilhado pelo processo.
+
+Cada RAGCore (front-ends, scripts, benchmarks, várias coleções no mesmo processo)
+pede o modelo ao registro em vez de instanciar o próprio SentenceTransformer.
+Modelos iguais (mesmo nome, backend e dispositivo) são carregados uma única vez
+e liberados quando a última referência é devolvida (release).
+
+A codificação é serializada por modelo: o tokenizador "fast" do HuggingFace não
+pode ser usado por várias threads ao mesmo tempo ("Already borrowed"), e na CPU
+o torch já paraleliza cada chamada entre os núcleos.
+"""
+
+import logging
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+
+from . import config
+from .query_batcher import QueryEmbeddingBatcher
+
+logger = logging.getLogger(__name__)
+
+ModelKey = Tuple[str, str, str]
+
+
+def _model_memory_bytes(model) -> int:
+    """Memória dos pesos e buffers do modelo (torch), em bytes."""
+    try:
+        tensors = list(model.parameters()) + list(model.buffers())
+        return sum(t.numel() * t.element_size() for t in tensors)
+    except Exception:
+        return 0
+
+
+class SharedEmbeddingModel:
+    """
+    Modelo compartilhado. Expõe a interface do SentenceTransformer (atributos são
+    repassados ao modelo), com encode protegido por um lock do próprio modelo.
+    """
+
+    def __init__(self, key: ModelKey, model):
+        self.key = key
+        self.model_name, self.backend, self.device_name = key
+        self.model = model
+        self.lock = threading.Lock()
+        self.refcount = 0
+        self.encode_calls = 0
+        self.loaded_at = time.time()
+        self.load_seconds = 0.0
+        self.memory_bytes = _model_memory_bytes(model)
+        self._query_batcher: Optional[QueryEmbeddingBatcher] = None
+
+    def encode(self, sentences, **kwargs):
+        with self.lock:
+            self.encode_calls += 1
+            return self.model.encode(sentences, **kwargs)
+
+    def encode_query(self, query: str) -> np.ndarray:
+        """Vetor de uma consulta, agrupada com as consultas simultâneas (QUERY_EMBEDDING_BATCH_CONFIG)."""
+        if not config.QUERY_EMBEDDING_BATCH_CONFIG["enabled"]:
+            return self.encode([query], show_progress_bar=False, convert_to_numpy=True)[0]
+        if self._query_batcher is None:
+            with self.lock:
+                if self._query_batcher is None:
+                    self._query_batcher = QueryEmbeddingBatcher(self)
+        return self._query_batcher.encode(query)
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.model, name)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "model": self.model_name,
+            "backend": self.backend,
+            "device": str(self.model.device),
+            "references": self.refcount,
+            "memory_mb": round(self.memory_bytes / (1024 * 1024), 2),
+            "encode_calls": self.encode_calls,
+            "load_seconds": round(self.load_seconds, 3),
+            "loaded_at": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(self.loaded_at)),
+            "query_batching": self._query_batcher.get_stats() if self._query_batcher else None,
+        }
+
+
+class EmbeddingModelRegistry:
+    """Modelos carregados, por (nome, backend, dispositivo), com contagem de referências."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._models: Dict[ModelKey, SharedEmbeddingModel] = {}
+        # Um lock por chave: dois pedidos do mesmo modelo carregam os pesos uma única vez,
+        # sem bloquear o acesso aos modelos já carregados
+        self._load_locks: Dict[ModelKey, threading.Lock] = {}
+
+    def acquire(self, model_name: str, backend: str = "torch", device: Optional[str] = None) -> SharedEmbeddingModel:
+        """Retorna o modelo (carregando-o se necessário) e incrementa suas referências."""
+        key = (model_name, backend, device or "auto")
+        with self._lock:
+            load_lock = self._load_locks.setdefault(key, threading.Lock())
+        with load_lock:
+            with self._lock:
+                shared = self._models.get(key)
+                if shared is not None:
+                    shared.refcount += 1
+                    return shared
+            from sentence_transformers import SentenceTransformer
+            start = time.perf_counter()
+            kwargs = {} if backend == "torch" else {"backend": backend}
+            model = SentenceTransformer(model_name, device=device, **kwargs)
+            shared = SharedEmbeddingModel(key, model)
+            shared.load_seconds = time.perf_counter() - start
+            with self._lock:
+                shared.refcount = 1
+                self._models[key] = shared
+            logger.info(f"Modelo de embedding '{model_name}' carregado no registro "
+                        f"({shared.stats()['memory_mb']} MB, {shared.load_seconds:.1f}s).")
+            return shared
+
+    def release(self, shared: SharedEmbeddingModel):
+        """Devolve uma referência; o modelo é descarregado quando não há mais nenhuma."""
+        with self._lock:
+            shared.refcount -= 1
+            if shared.refcount <= 0 and self._models.get(shared.key) is shared:
+                del self._models[shared.key]
+                logger.info(f"Modelo de embedding '{shared.model_name}' descarregado (sem referências).")
+
+    def get_stats(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            models = list(self._models.values())
+        return {f"{m.model_name} [{m.backend}/{m.device_name}]": m.stats() for m in models}
+
+
+_shared_registry: Optional[EmbeddingModelRegistry] = None
+_shared_registry_lock = threading.Lock()
+
+
+def get_embedding_model_registry() -> EmbeddingModelRegistry:
+    """Retorna o registro de modelos compartilhado pelo processo."""
+    global _shared_registry
+    with _shared_registry_lock:
+        if _shared_registry is None:
+            _shared_registry = EmbeddingModelRegistry()
+        return _shared_registry
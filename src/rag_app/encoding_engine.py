@@ -0,0 +1,120 @@
+# src/rag_app/encoding_engine.py
+"""
+Motor de codificação de embeddings para a ingestão.
+
+O SentenceTransformer.encode é chamado uma vez por lote de chunks acumulado
+entre vários arquivos (e não arquivo a arquivo). Os textos são ordenados pelo
+comprimento em tokens e divididos em lotes de comprimento semelhante, o que
+reduz o preenchimento (padding) quando linhas curtas de tabela e parágrafos
+longos são codificados juntos. Os lotes são distribuídos entre processos de
+um pool (um modelo por processo, com as threads do torch repartidas entre
+eles) e os vetores voltam na ordem original dos textos.
+
+Lotes pequenos, GPU ou workers=1 codificam no próprio processo, sem pool.
+"""
+
+import logging
+import os
+from contextlib import nullcontext
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from . import config
+
+logger = logging.getLogger(__name__)
+
+# Modelo carregado em cada processo do pool (ver _init_worker)
+_worker_model = None
+
+
+def _init_worker(model_name: str, backend: str, torch_threads: int):
+    global _worker_model
+    import torch
+    from sentence_transformers import SentenceTransformer
+    torch.set_num_threads(torch_threads)
+    kwargs = {} if backend == "torch" else {"backend": backend}
+    _worker_model = SentenceTransformer(model_name, device="cpu", **kwargs)
+
+
+def _encode_in_worker(texts: List[str]) -> np.ndarray:
+    return _worker_model.encode(texts, batch_size=len(texts), show_progress_bar=False,
+                                convert_to_numpy=True)
+
+
+class EncodingEngine:
+    """Codificação em lotes por comprimento, opcionalmente em vários processos."""
+
+    def __init__(self, model, model_name: str, encoder_config: Optional[Dict[str, Any]] = None):
+        self.model = model
+        self.model_name = model_name
+        # Os processos do pool carregam o modelo com o mesmo backend (torch, onnx, openvino)
+        self.backend = getattr(model, "backend", None) or config.EMBEDDING_MODEL_BACKEND
+        self.cfg = encoder_config or config.EMBEDDING_ENCODER_CONFIG
+        self.workers = self.cfg["workers"] or os.cpu_count() or 1
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    def _token_lengths(self, texts: List[str]) -> List[int]:
+        tokenizer = getattr(self.model, "tokenizer", None)
+        if tokenizer is None:
+            return [len(text) for text in texts]
+        # O modelo trunca em max_seq_length; acima disso o comprimento efetivo é o mesmo.
+        # O tokenizador não pode ser usado por duas threads ao mesmo tempo (ver embedding_models.py)
+        with getattr(self.model, "lock", nullcontext()):
+            encoded = tokenizer(texts, add_special_tokens=False, truncation=True,
+                                max_length=self.model.max_seq_length)["input_ids"]
+        return [len(ids) for ids in encoded]
+
+    def _use_pool(self, count: int) -> bool:
+        if self.workers <= 1 or count < self.cfg["min_chunks_for_pool"]:
+            return False
+        return str(getattr(self.model, "device", "cpu")).startswith("cpu")
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            torch_threads = max(1, (os.cpu_count() or 1) // self.workers)
+            logger.info(f"Iniciando pool de codificação: {self.workers} processos x {torch_threads} thread(s) "
+                        f"(modelo '{self.model_name}', backend '{self.backend}')")
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker, initargs=(self.model_name, self.backend, torch_threads))
+        return self._pool
+
+    def close_pool(self):
+        """Encerra o pool (libera a memória dos modelos carregados nos processos)."""
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
+            self._pool = None
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        """Codifica `texts` e retorna os vetores na mesma ordem."""
+        if not texts:
+            return np.empty((0, 0), dtype=np.float32)
+        lengths = self._token_lengths(texts)
+        order = sorted(range(len(texts)), key=lambda i: lengths[i])
+        batch_size = self.cfg["batch_size"]
+        batches = [order[start:start + batch_size] for start in range(0, len(order), batch_size)]
+
+        results = None
+        if self._use_pool(len(texts)):
+            try:
+                pool = self._get_pool()
+                futures = [pool.submit(_encode_in_worker, [texts[i] for i in batch]) for batch in batches]
+                results = [future.result() for future in futures]
+            except Exception as e:
+                # Ex.: processo do pool encerrado (memória) ou script principal sem
+                # "if __name__ == '__main__'": segue no próprio processo
+                logger.warning(f"Pool de codificação indisponível ({e}); codificando no próprio processo.")
+                self.close_pool()
+                self.workers = 1
+        if results is None:
+            results = [self.model.encode([texts[i] for i in batch], batch_size=len(batch),
+                                         show_progress_bar=False, convert_to_numpy=True)
+                       for batch in batches]
+
+        embeddings = np.empty((len(texts), results[0].shape[1]), dtype=results[0].dtype)
+        for batch, vectors in zip(batches, results):
+            embeddings[batch] = vectors
+        return embeddings
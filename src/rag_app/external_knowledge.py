@@ -6,20 +6,172 @@ Permite buscar informações complementares quando os documentos locais são ins
 
 import requests
 import logging
+import json
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from urllib.parse import quote
 from typing import Dict, List, Optional, Tuple
 from .config import EXTERNAL_KNOWLEDGE_CONFIG
+from .concept_store import ConceptStore
+from .deadline import Deadline
+from .keyword_matcher import KeywordMatcher, build_external_knowledge_matcher
 
 logger = logging.getLogger(__name__)
 
+
+class RemoteSourceError(Exception):
+    """Falha transitória de uma fonte remota (timeout, erro de rede, HTTP 5xx/429)."""
+
+
+class ExternalLookupCache:
+    """
+    Cache persistente (SQLite) das consultas remotas.
+
+    Resultados negativos ("não encontrado") também são guardados, com validade
+    própria, para que termos sem página não sejam consultados a cada pergunta.
+    """
+
+    def __init__(self, path: str, ttl_seconds: float, negative_ttl_seconds: float):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.negative_ttl_seconds = negative_ttl_seconds
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS lookups ("
+                "key TEXT PRIMARY KEY, value TEXT, expires_at REAL NOT NULL)"
+            )
+
+    def get(self, key: str) -> Tuple[bool, Optional[Dict]]:
+        """Retorna (encontrado no cache, valor). O valor pode ser None (resultado negativo)."""
+        try:
+            with self._lock:
+                row = self._conn.execute(
+                    "SELECT value, expires_at FROM lookups WHERE key = ?", (key,)
+                ).fetchone()
+        except sqlite3.Error as e:
+            logger.warning(f"Erro ao ler cache de conhecimento externo: {e}")
+            return False, None
+        if row is None or row[1] < time.time():
+            return False, None
+        return True, (json.loads(row[0]) if row[0] is not None else None)
+
+    def set(self, key: str, value: Optional[Dict]):
+        ttl = self.ttl_seconds if value is not None else self.negative_ttl_seconds
+        try:
+            with self._lock, self._conn:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO lookups (key, value, expires_at) VALUES (?, ?, ?)",
+                    (key, json.dumps(value, ensure_ascii=False) if value is not None else None,
+                     time.time() + ttl)
+                )
+        except sqlite3.Error as e:
+            logger.warning(f"Erro ao gravar cache de conhecimento externo: {e}")
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker simples para fontes remotas.
+
+    Após `failure_threshold` falhas consecutivas o circuito abre e as chamadas são
+    ignoradas durante `cooldown_seconds`. Depois disso, uma única chamada de teste
+    é liberada (meio-aberto): sucesso fecha o circuito, falha o reabre.
+    """
+
+    def __init__(self, failure_threshold: int, cooldown_seconds: float):
+        self.failure_threshold = max(1, failure_threshold)
+        self.cooldown_seconds = cooldown_seconds
+        self._lock = threading.Lock()
+        self._consecutive_failures = 0
+        self._opened_until = 0.0
+        self._trial_in_flight = False
+
+    @property
+    def is_open(self) -> bool:
+        with self._lock:
+            return self._consecutive_failures >= self.failure_threshold and \
+                time.monotonic() < self._opened_until
+
+    def allow_request(self) -> bool:
+        with self._lock:
+            if self._consecutive_failures < self.failure_threshold:
+                return True
+            if time.monotonic() < self._opened_until or self._trial_in_flight:
+                return False
+            self._trial_in_flight = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self._consecutive_failures = 0
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._consecutive_failures += 1
+            self._trial_in_flight = False
+            if self._consecutive_failures >= self.failure_threshold:
+                self._opened_until = time.monotonic() + self.cooldown_seconds
+
+
 class ExternalKnowledgeProvider:
     """Provedor de conhecimento externo para complementar informações dos documentos locais."""
     
-    def __init__(self):
+    def __init__(self, cache_path: Optional[str] = None, wikipedia_base_url: Optional[str] = None,
+                 keyword_matcher: Optional[KeywordMatcher] = None,
+                 concept_store: Optional[ConceptStore] = None):
+        """
+        Args:
+            cache_path: Caminho do cache SQLite (":memory:" para não persistir);
+                padrão em EXTERNAL_KNOWLEDGE_CONFIG["cache_path"]
+            wikipedia_base_url: URL base da API (ex.: servidor HTTP local de testes);
+                padrão em EXTERNAL_KNOWLEDGE_CONFIG["wikipedia_base_url"]
+            keyword_matcher: Autômato já compilado com as listas de palavras-chave
+                (compartilhado com o RAGCore); compilado aqui se omitido
+            concept_store: Base de conceitos; carregada de EDUCATIONAL_CONCEPTS_FILE se omitida
+        """
         self.config = EXTERNAL_KNOWLEDGE_CONFIG
-        self.session = requests.Session()
-        self.session.headers.update({
-            'User-Agent': 'RAG-System/1.0 (Educational Research)'
-        })
+        self.keyword_matcher = keyword_matcher or build_external_knowledge_matcher(self.config)
+        self.concept_store = concept_store if concept_store is not None else ConceptStore.from_file()
+        self.wikipedia_base_url = wikipedia_base_url or self.config["wikipedia_base_url"]
+        self._thread_local = threading.local()
+        self.cache = ExternalLookupCache(
+            cache_path or self.config["cache_path"],
+            self.config["cache_ttl_seconds"],
+            self.config["negative_cache_ttl_seconds"],
+        )
+        self.circuit_breaker = CircuitBreaker(
+            self.config["circuit_breaker_failures"],
+            self.config["circuit_breaker_cooldown_seconds"],
+        )
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.config["remote_max_workers"],
+            thread_name_prefix="external-knowledge",
+        )
+
+    @property
+    def session(self) -> requests.Session:
+        """Sessão HTTP por thread (requests.Session não é garantidamente thread-safe)."""
+        session = getattr(self._thread_local, "session", None)
+        if session is None:
+            session = requests.Session()
+            session.headers.update({
+                'User-Agent': 'RAG-System/1.0 (Educational Research)'
+            })
+            self._thread_local.session = session
+        return session
+
+    def close(self):
+        """Libera as threads de consulta e o cache."""
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self.cache.close()
     
     def should_use_external_knowledge(self, query: str, local_chunks: List[Dict], 
                                     confidence_scores: List[float]) -> bool:
@@ -34,12 +186,13 @@ class ExternalKnowledgeProvider:
         Returns:
             True se deve buscar conhecimento externo, False caso contrário
         """
+        # Classificar a pergunta em uma única passada por todas as listas de palavras-chave
+        keyword_classes = self.keyword_matcher.match(query)
+
         # Verificar se há palavras-chave que impedem uso externo
-        query_lower = query.lower()
-        for keyword in self.config["specific_context_keywords"]:
-            if keyword in query_lower:
-                logger.info(f"Uso externo bloqueado por palavra-chave específica: {keyword}")
-                return False
+        if keyword_classes.get("specific_context"):
+            logger.info(f"Uso externo bloqueado por palavra-chave específica: {keyword_classes['specific_context'][0]}")
+            return False
         
         # Verificar se há chunks suficientes e com boa qualidade
         if len(local_chunks) >= self.config["min_chunks_threshold"]:
@@ -49,10 +202,9 @@ class ExternalKnowledgeProvider:
                 return False
         
         # Verificar se é pergunta conceitual
-        for keyword in self.config["conceptual_keywords"]:
-            if keyword in query_lower:
-                logger.info(f"Pergunta conceitual detectada: {keyword}")
-                return True
+        if keyword_classes.get("conceptual"):
+            logger.info(f"Pergunta conceitual detectada: {keyword_classes['conceptual'][0]}")
+            return True
                 
         # Se poucos chunks ou baixa confiança, considerar uso externo
         if len(local_chunks) < self.config["min_chunks_threshold"]:
@@ -61,41 +213,154 @@ class ExternalKnowledgeProvider:
             
         return False
     
-    def search_wikipedia(self, query: str, language: str = "pt") -> Optional[Dict]:
+    def search_wikipedia(self, query: str, language: str = "pt",
+                         timeout: Optional[float] = None) -> Optional[Dict]:
         """
-        Busca informações na Wikipedia.
+        Busca informações na Wikipedia, usando o cache em disco e o circuit breaker.
         
         Args:
             query: Termo a ser pesquisado
             language: Idioma da Wikipedia (pt, en)
+            timeout: Timeout da requisição HTTP (padrão: remote_request_timeout)
             
         Returns:
             Dicionário com título, resumo e URL ou None se não encontrar
         """
+        cache_key = f"wikipedia:{language}:{query.lower()}"
+        cached, value = self.cache.get(cache_key)
+        if cached:
+            return value
+
+        if not self.circuit_breaker.allow_request():
+            logger.info(f"Wikipedia ignorada (circuit breaker aberto) para termo: '{query}'")
+            return None
+
         try:
-            # API da Wikipedia para busca
-            search_url = f"https://{language}.wikipedia.org/api/rest_v1/page/summary/{query}"
-            
-            response = self.session.get(search_url, timeout=5)
-            if response.status_code == 200:
-                data = response.json()
-                
-                if 'extract' in data and len(data['extract']) > 50:
-                    return {
-                        'title': data.get('title', ''),
-                        'summary': data.get('extract', ''),
-                        'url': data.get('content_urls', {}).get('desktop', {}).get('page', ''),
-                        'source': 'Wikipedia'
-                    }
-            
-        except Exception as e:
+            result = self._fetch_wikipedia_summary(
+                query, language, timeout or self.config["remote_request_timeout"])
+        except RemoteSourceError as e:
+            self.circuit_breaker.record_failure()
             logger.error(f"Erro ao buscar na Wikipedia: {e}")
-            
+            return None
+        except Exception as e:
+            # A fonte respondeu (ex.: JSON inválido com HTTP 200): não é falha de
+            # disponibilidade, então não abre o circuito, mas também não é cacheado
+            self.circuit_breaker.record_success()
+            logger.error(f"Resposta inválida da Wikipedia para '{query}': {e}")
+            return None
+
+        self.circuit_breaker.record_success()
+        self.cache.set(cache_key, result)
+        return result
+
+    def _fetch_wikipedia_summary(self, term: str, language: str, timeout: float) -> Optional[Dict]:
+        """
+        Consulta a API de resumo da Wikipedia.
+
+        Returns:
+            O resumo encontrado ou None (resultado negativo, pode ser cacheado)
+
+        Raises:
+            RemoteSourceError: em falhas transitórias (não devem ser cacheadas)
+        """
+        base_url = self.wikipedia_base_url.format(language=language).rstrip('/')
+        search_url = f"{base_url}/api/rest_v1/page/summary/{quote(term, safe='')}"
+
+        try:
+            response = self.session.get(search_url, timeout=timeout)
+        except requests.RequestException as e:
+            raise RemoteSourceError(str(e)) from e
+
+        if response.status_code == 429 or response.status_code >= 500:
+            raise RemoteSourceError(f"HTTP {response.status_code} em {search_url}")
+        if response.status_code != 200:
+            return None
+
+        data = response.json()
+        if 'extract' in data and len(data['extract']) > 50:
+            return {
+                'title': data.get('title', ''),
+                'summary': data.get('extract', ''),
+                'url': data.get('content_urls', {}).get('desktop', {}).get('page', ''),
+                'source': 'Wikipedia'
+            }
+        return None
+
+    def _candidate_terms(self, query: str) -> List[str]:
+        """Extrai da pergunta os termos candidatos para consulta remota."""
+        key_terms = []
+        for word in query.split():
+            term = word.strip('?!.,;:"\'()[]')
+            if len(term) > 3 and term.lower() not in ['como', 'para', 'qual', 'onde', 'quando'] \
+                    and term not in key_terms:
+                key_terms.append(term)
+        return key_terms[:self.config["max_candidate_terms"]]
+
+    def _lookup_wikipedia_terms(self, terms: List[str],
+                                cancel_event: Optional[threading.Event] = None,
+                                query_deadline: Optional[Deadline] = None) -> Optional[Dict]:
+        """
+        Consulta vários termos em paralelo sob um prazo único.
+
+        Retorna o resumo do termo de maior prioridade (ordem da pergunta) que tenha
+        conteúdo suficiente, assim que os termos anteriores a ele estiverem resolvidos.
+        Consultas que ultrapassam o prazo, ou cuja busca foi cancelada via
+        `cancel_event`, são abandonadas (continuam apenas para alimentar o cache).
+        O prazo é remote_lookup_deadline ou o que resta do prazo da consulta, o menor.
+        """
+        if not terms:
+            return None
+        if self.circuit_breaker.is_open:
+            logger.info("Consulta à Wikipedia ignorada: circuit breaker aberto")
+            return None
+
+        lookup_seconds = self.config["remote_lookup_deadline"]
+        if query_deadline is not None:
+            lookup_seconds = query_deadline.budget(lookup_seconds)
+            if lookup_seconds <= 0:
+                return None
+        deadline = time.monotonic() + lookup_seconds
+        request_timeout = min(self.config["remote_request_timeout"], lookup_seconds)
+        futures = [self._executor.submit(self.search_wikipedia, term, "pt", request_timeout) for term in terms]
+        pending = set(futures)
+
+        while True:
+            for future in futures:
+                if not future.done():
+                    break
+                wiki_info = future.result()
+                if wiki_info and len(wiki_info['summary']) > 100:
+                    return wiki_info
+            else:
+                return None  # Todos os termos resolvidos sem resultado útil
+
+            if (cancel_event is not None and cancel_event.is_set()) or \
+                    (query_deadline is not None and query_deadline.cancel_event.is_set()):
+                logger.debug("Consulta à Wikipedia cancelada")
+                for future in pending:
+                    future.cancel()
+                return None
+
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or not pending:
+                break
+            # Espera em fatias curtas para observar o cancelamento
+            _, pending = wait(pending, timeout=min(remaining, 0.1), return_when=FIRST_COMPLETED)
+
+        # Prazo esgotado: usa o melhor resultado já disponível, na ordem de prioridade
+        logger.warning(f"Prazo de {lookup_seconds:.1f}s esgotado nas consultas à Wikipedia")
+        for future in futures:
+            if future.done():
+                wiki_info = future.result()
+                if wiki_info and len(wiki_info['summary']) > 100:
+                    return wiki_info
+            else:
+                future.cancel()
         return None
     
     def search_educational_concepts(self, query: str) -> Optional[Dict]:
         """
-        Busca conceitos educacionais básicos.
+        Busca conceitos educacionais básicos na base indexada.
         
         Args:
             query: Termo educacional a ser pesquisado
@@ -103,52 +368,27 @@ class ExternalKnowledgeProvider:
         Returns:
             Dicionário com informação conceitual ou None
         """
-        # Base de conhecimento educacional básico
-        educational_concepts = {
-            "renda per capita": {
-                'definition': 'Renda per capita é o valor da renda total de uma família ou grupo dividido pelo número de pessoas. É calculada somando-se todas as rendas e dividindo pelo número de membros.',
-                'calculation': 'Fórmula: Renda Per Capita = Soma de todas as rendas ÷ Número de pessoas',
-                'example': 'Se uma família tem renda total de R$ 3.000 e 4 membros, a renda per capita é R$ 750.',
-                'source': 'Conceito Econômico Básico'
-            },
-            "renda bruta": {
-                'definition': 'Renda bruta é o valor total recebido antes de descontos de impostos, contribuições ou outras deduções.',
-                'difference': 'Diferente da renda líquida, que é o valor após os descontos.',
-                'components': 'Inclui salários, pensões, aluguéis, rendimentos de aplicações, etc.',
-                'source': 'Conceito Econômico Básico'
-            },
-            "salário mínimo": {
-                'definition': 'Salário mínimo é o menor valor de remuneração que um empregador pode pagar legalmente a um trabalhador.',
-                'purpose': 'Estabelece um piso salarial para garantir condições mínimas de subsistência.',
-                'variation': 'O valor pode variar por região ou ser nacional, conforme legislação local.',
-                'source': 'Conceito Trabalhista'
-            },
-            "cotas": {
-                'definition': 'Sistema de cotas é uma política de ação afirmativa que reserva vagas para grupos específicos.',
-                'purpose': 'Busca promover inclusão e reduzir desigualdades no acesso a oportunidades.',
-                'types': 'Podem ser por renda, raça, deficiência, escola pública, etc.',
-                'source': 'Conceito de Política Pública'
-            }
+        entry = self.concept_store.find_in_text(query)
+        if entry is None:
+            return None
+        return {
+            'concept': entry['concept'],
+            'information': entry['information'],
+            'source': 'Base de Conhecimento Educacional'
         }
-        
-        query_lower = query.lower()
-        for concept, info in educational_concepts.items():
-            if concept in query_lower:
-                return {
-                    'concept': concept,
-                    'information': info,
-                    'source': 'Base de Conhecimento Educacional'
-                }
-        
-        return None
     
-    def get_external_knowledge(self, query: str) -> Optional[str]:
+    def get_external_knowledge(self, query: str, allow_remote: bool = True,
+                               cancel_event: Optional[threading.Event] = None,
+                               deadline: Optional[Deadline] = None) -> Optional[str]:
         """
         Busca conhecimento externo para complementar a resposta.
-        
+
         Args:
             query: Pergunta do usuário
-            
+            allow_remote: Se False, consulta apenas a base local (sem Wikipedia)
+            cancel_event: Se sinalizado, abandona as consultas remotas em andamento
+            deadline: Prazo da consulta; limita o tempo das consultas remotas
+
         Returns:
             Texto com conhecimento externo formatado ou None
         """
@@ -166,18 +406,14 @@ class ExternalKnowledgeProvider:
                 
             result += f"\n*Fonte: {info['source']}*"
             return result
-        
-        # Tentar Wikipedia como fallback
-        # Extrair termos principais da query
-        key_terms = []
-        for word in query.split():
-            if len(word) > 3 and word.lower() not in ['como', 'para', 'qual', 'onde', 'quando']:
-                key_terms.append(word)
-        
-        for term in key_terms[:2]:  # Tentar os 2 primeiros termos
-            wiki_info = self.search_wikipedia(term)
-            if wiki_info and len(wiki_info['summary']) > 100:
-                return f"💡 **Contexto geral ({wiki_info['title']}):**\n{wiki_info['summary'][:300]}...\n\n*Fonte: {wiki_info['source']} - {wiki_info['url']}*"
+
+        if not allow_remote or (cancel_event is not None and cancel_event.is_set()):
+            return None
+
+        # Tentar Wikipedia como fallback, consultando os termos principais em paralelo
+        wiki_info = self._lookup_wikipedia_terms(self._candidate_terms(query), cancel_event, deadline)
+        if wiki_info:
+            return f"💡 **Contexto geral ({wiki_info['title']}):**\n{wiki_info['summary'][:300]}...\n\n*Fonte: {wiki_info['source']} - {wiki_info['url']}*"
         
         return None
     
@@ -0,0 +1,119 @@
+# src/rag_app/extraction_cache.py
+"""
+Cache persistente da extração de documentos (texto por página e tabelas).
+
+A extração do PDF (PyMuPDF: texto + find_tables) é a etapa mais lenta da
+ingestão, e o seu resultado não depende do chunker nem do modelo de embedding.
+O cache guarda a extração de cada arquivo, indexada pelo SHA-256 do conteúdo e
+pela versão do extrator: mudar DEFAULT_CHUNK_SIZE, o modelo de embedding ou
+reconstruir um índice (parameter_sweep, rebuild) reaproveita a extração sem
+abrir o PDF de novo. Conteúdo ou extrator diferentes geram outra chave.
+
+Cada entrada é um JSON comprimido com zlib ({"pages": [[página, texto], ...],
+"tables": [...]}); as entradas menos usadas recentemente são descartadas quando
+o arquivo passa de max_size_mb.
+"""
+
+import json
+import logging
+import sqlite3
+import threading
+import time
+import zlib
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class ExtractionCache:
+    """Extrações indexadas por (SHA-256 do arquivo, versão do extrator), em SQLite."""
+
+    def __init__(self, path: str, max_size_mb: Optional[float] = None):
+        self.path = path
+        self.max_size_bytes = int(max_size_mb * 1024 * 1024) if max_size_mb else None
+        self._lock = threading.Lock()
+        # Vários processos (ex.: parameter_sweep) podem compartilhar o mesmo cache
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30.0)
+        self._stats = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0, "extraction_seconds_saved": 0.0}
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS extractions ("
+                "sha256 TEXT NOT NULL, extractor TEXT NOT NULL, payload BLOB NOT NULL, "
+                "size INTEGER NOT NULL, extraction_seconds REAL NOT NULL, "
+                "created_at REAL NOT NULL, last_used_at REAL NOT NULL, "
+                "PRIMARY KEY (sha256, extractor))"
+            )
+
+    def get(self, sha256: str, extractor: str) -> Optional[Dict[str, Any]]:
+        """Retorna a extração guardada ou None."""
+        try:
+            with self._lock, self._conn:
+                row = self._conn.execute(
+                    "SELECT payload, extraction_seconds FROM extractions WHERE sha256 = ? AND extractor = ?",
+                    (sha256, extractor)).fetchone()
+                if row is None:
+                    self._stats["misses"] += 1
+                    return None
+                self._conn.execute(
+                    "UPDATE extractions SET last_used_at = ? WHERE sha256 = ? AND extractor = ?",
+                    (time.time(), sha256, extractor))
+                self._stats["hits"] += 1
+                self._stats["extraction_seconds_saved"] += row[1]
+            return json.loads(zlib.decompress(row[0]).decode("utf-8"))
+        except (sqlite3.Error, zlib.error, ValueError) as e:
+            logger.warning(f"Erro ao ler cache de extração: {e}")
+            return None
+
+    def put(self, sha256: str, extractor: str, extraction: Dict[str, Any], extraction_seconds: float):
+        payload = zlib.compress(json.dumps(extraction, ensure_ascii=False).encode("utf-8"), 6)
+        now = time.time()
+        try:
+            with self._lock, self._conn:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO extractions (sha256, extractor, payload, size, extraction_seconds, "
+                    "created_at, last_used_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (sha256, extractor, payload, len(payload), extraction_seconds, now, now))
+                self._stats["stores"] += 1
+        except sqlite3.Error as e:
+            logger.warning(f"Erro ao gravar cache de extração: {e}")
+
+    def prune(self):
+        """Descarta as entradas usadas há mais tempo até o cache caber em max_size_mb."""
+        if not self.max_size_bytes:
+            return
+        try:
+            with self._lock, self._conn:
+                total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM extractions").fetchone()[0]
+                if total <= self.max_size_bytes:
+                    return
+                evicted = 0
+                for sha256, extractor, size in self._conn.execute(
+                        "SELECT sha256, extractor, size FROM extractions ORDER BY last_used_at").fetchall():
+                    if total <= self.max_size_bytes:
+                        break
+                    self._conn.execute("DELETE FROM extractions WHERE sha256 = ? AND extractor = ?",
+                                       (sha256, extractor))
+                    total -= size
+                    evicted += 1
+                self._stats["evictions"] += evicted
+            logger.info(f"Cache de extração: {evicted} entrada(s) antiga(s) descartada(s).")
+        except sqlite3.Error as e:
+            logger.warning(f"Erro ao limpar cache de extração: {e}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+            try:
+                entries, size = self._conn.execute(
+                    "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM extractions").fetchone()
+            except sqlite3.Error:
+                entries, size = None, None
+        stats["extraction_seconds_saved"] = round(stats["extraction_seconds_saved"], 3)
+        stats["entries"] = entries
+        stats["size_mb"] = round(size / (1024 * 1024), 2) if size is not None else None
+        return stats
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,86 @@
+# src/rag_app/index_admin.py
+"""
+Administração do índice vetorial.
+
+Uso (a partir da raiz do projeto):
+    python -m src.rag_app.index_admin list
+    python -m src.rag_app.index_admin rebuild campus_cuiaba
+    python -m src.rag_app.index_admin status
+    python -m src.rag_app.index_admin migrate --embedding-model paraphrase-multilingual-MiniLM-L12-v2
+    python -m src.rag_app.index_admin export indice.ragsnap
+    python -m src.rag_app.index_admin import indice.ragsnap
+
+"import" grava o snapshot no ChromaDB local (sem recalcular embeddings); para apenas
+consultar, sem importar, use o modo réplica (INDEX_SNAPSHOT_CONFIG["replica_path"]).
+"migrate" reindexa os shards gerados com outro modelo de embedding (ver
+INDEX_MANIFEST_CONFIG) e aguarda o término; o shard segue consultável durante a migração.
+"""
+
+import argparse
+import json
+import logging
+import sys
+
+import chromadb
+
+from . import config
+from .index_manifest import IndexManifest, default_manifest_path
+from .index_snapshot import SnapshotError, restore_snapshot
+from .rag_core import RAGCore, ROOT_SHARD
+
+logger = logging.getLogger(__name__)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Administração do índice vetorial do RAG.")
+    parser.add_argument("--data-folder", default=config.DEFAULT_DATA_FOLDER)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("list", help="Lista os shards e a quantidade de chunks de cada um.")
+    rebuild = subparsers.add_parser("rebuild", help="Reconstrói um shard do zero, sem tocar nos demais.")
+    rebuild.add_argument("shard", help=f"Nome do shard (subpasta; '{ROOT_SHARD}' para a raiz).")
+    subparsers.add_parser("status", help="Mostra o manifesto do índice e as últimas migrações.")
+    migrate = subparsers.add_parser("migrate", help="Migra os shards para o modelo de embedding indicado.")
+    migrate.add_argument("--embedding-model", default=config.DEFAULT_EMBEDDING_MODEL)
+    migrate.add_argument("--shard", help="Migra apenas este shard (padrão: todos).")
+    export = subparsers.add_parser("export", help="Grava o índice num snapshot portátil.")
+    export.add_argument("path")
+    import_ = subparsers.add_parser("import", help="Importa um snapshot para o ChromaDB local.")
+    import_.add_argument("path")
+    args = parser.parse_args()
+
+    if args.command == "import":
+        # Sem RAGCore: a importação não deve disparar a ingestão de data/
+        try:
+            footer = restore_snapshot(
+                args.path, chromadb.PersistentClient(path=config.CHROMA_DB_PATH),
+                IndexManifest(default_manifest_path(config.CHROMA_DB_PATH, config.CHROMA_COLLECTION_NAME)))
+        except (OSError, SnapshotError) as e:
+            print(f"Erro: {e}", file=sys.stderr)
+            sys.exit(1)
+        print(json.dumps({shard: {"collection": info["collection"], "chunks": info["count"],
+                                  "embedding_model": info["embedding_model"]}
+                          for shard, info in footer["shards"].items()}, indent=2, ensure_ascii=False))
+        return
+
+    model_name = args.embedding_model if args.command == "migrate" else config.DEFAULT_EMBEDDING_MODEL
+    rag = RAGCore(data_folder=args.data_folder, model_name=model_name)
+    try:
+        if args.command == "rebuild":
+            rag.rebuild_shard(args.shard)
+        elif args.command == "migrate":
+            for shard in ([args.shard] if args.shard else rag.list_shards()):
+                rag.migrate_embedding_model(shard)
+            rag.wait_for_migrations()
+        elif args.command == "export":
+            rag.export_snapshot(args.path)
+    except ValueError as e:
+        print(f"Erro: {e}", file=sys.stderr)
+        sys.exit(1)
+    if args.command == "status":
+        print(json.dumps(rag.get_manifest_stats(), indent=2, ensure_ascii=False))
+    else:
+        print(json.dumps(rag.get_shard_stats(), indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,445 @@
+# src/rag_app/index_manifest.py
+"""
+Manifesto transacional do índice vetorial (SQLite).
+
+Substitui o antigo processed_files_status.json, que guardava apenas mtime e tamanho
+e era regravado por inteiro a cada execução. O manifesto registra:
+  - por shard: a coleção ativa do ChromaDB e o modelo de embedding que a gerou
+  - por arquivo: mtime, tamanho, SHA-256 do conteúdo, parâmetros do chunker e
+    versão da ingestão
+  - por chunk: hash do texto + metadados (permite regravar só os chunks alterados)
+    e a assinatura MinHash usada na deduplicação (chunk_dedup.py)
+  - as quase duplicatas (não gravadas no ChromaDB), com o chunk canônico, o texto
+    e os metadados de cada uma
+  - a versão do índice e o histórico das migrações de modelo de embedding, com o
+    processo dono (host:pid) e o último sinal de vida de cada migração em andamento
+
+Cada arquivo processado é gravado em sua própria transação: uma ingestão
+interrompida preserva o que já foi concluído e nunca deixa o manifesto pela metade.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+SCHEMA_VERSION = 3
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS shards (
+    shard TEXT PRIMARY KEY,
+    collection TEXT NOT NULL,
+    embedding_model TEXT NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS files (
+    shard TEXT NOT NULL,
+    filename TEXT NOT NULL,
+    mtime REAL NOT NULL,
+    size INTEGER NOT NULL,
+    sha256 TEXT,
+    chunk_size INTEGER NOT NULL,
+    chunk_overlap INTEGER NOT NULL,
+    ingestion_version INTEGER NOT NULL,
+    chunk_count INTEGER NOT NULL,
+    indexed_at REAL NOT NULL,
+    dedup_config TEXT,
+    PRIMARY KEY (shard, filename)
+);
+CREATE TABLE IF NOT EXISTS chunks (
+    shard TEXT NOT NULL,
+    chunk_id TEXT NOT NULL,
+    filename TEXT NOT NULL,
+    sha256 TEXT NOT NULL,
+    signature BLOB,
+    PRIMARY KEY (shard, chunk_id)
+);
+CREATE INDEX IF NOT EXISTS chunks_by_file ON chunks (shard, filename);
+CREATE TABLE IF NOT EXISTS duplicate_chunks (
+    shard TEXT NOT NULL,
+    chunk_id TEXT NOT NULL,
+    filename TEXT NOT NULL,
+    canonical_id TEXT NOT NULL,
+    document TEXT NOT NULL,
+    metadata TEXT NOT NULL,
+    PRIMARY KEY (shard, chunk_id)
+);
+CREATE INDEX IF NOT EXISTS duplicates_by_canonical ON duplicate_chunks (shard, canonical_id);
+CREATE INDEX IF NOT EXISTS duplicates_by_file ON duplicate_chunks (shard, filename);
+CREATE TABLE IF NOT EXISTS migrations (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    shard TEXT NOT NULL,
+    from_model TEXT NOT NULL,
+    to_model TEXT NOT NULL,
+    source_collection TEXT NOT NULL,
+    target_collection TEXT NOT NULL,
+    status TEXT NOT NULL,
+    total INTEGER NOT NULL DEFAULT 0,
+    processed INTEGER NOT NULL DEFAULT 0,
+    started_at REAL NOT NULL,
+    finished_at REAL,
+    error TEXT,
+    owner TEXT,
+    heartbeat_at REAL
+);
+"""
+
+
+def default_manifest_path(chroma_db_path: str, collection_name: str) -> str:
+    return os.path.join(chroma_db_path, f"{collection_name}_manifest.sqlite3")
+
+
+def file_sha256(path: str, block_size: int = 1024 * 1024) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def migration_owner() -> str:
+    """Identificação do processo atual como dono de uma migração ("host:pid")."""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def migration_is_live(migration: Dict[str, Any], stale_seconds: float) -> bool:
+    """
+    Indica se o dono de uma migração "running" ainda está ativo: sinal de vida recente
+    e, quando o dono roda nesta máquina, o processo ainda existe.
+    """
+    heartbeat_at = migration.get("heartbeat_at")
+    if not migration.get("owner") or heartbeat_at is None or time.time() - heartbeat_at > stale_seconds:
+        return False
+    host, _, pid = migration["owner"].rpartition(":")
+    if host == socket.gethostname():
+        try:
+            os.kill(int(pid), 0)
+        except ProcessLookupError:
+            return False
+        except (PermissionError, ValueError):
+            pass  # O processo existe (de outro usuário) ou o pid é ilegível: vale o sinal de vida
+    return True
+
+
+def chunk_hash(text: str, metadata: Optional[Dict[str, Any]]) -> str:
+    """Hash de um chunk (texto + metadados), o mesmo calculado na ingestão e nas migrações."""
+    payload = text + "\0" + json.dumps(metadata or {}, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class IndexManifest:
+    """Manifesto do índice em SQLite (modo WAL), seguro para uso entre threads."""
+
+    def __init__(self, path: str):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.RLock()
+        self._depth = 0
+        # isolation_level=None: as transações são abertas explicitamente em transaction()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(_SCHEMA)
+            self._upgrade_schema()
+            self._conn.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('schema_version', ?)",
+                               (str(SCHEMA_VERSION),))
+            self._conn.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('index_version', '0')")
+
+    def _upgrade_schema(self):
+        """Acrescenta as colunas das versões novas a um manifesto criado por uma versão anterior."""
+        added = [("files", "dedup_config", "TEXT"), ("chunks", "signature", "BLOB"),
+                 ("migrations", "owner", "TEXT"), ("migrations", "heartbeat_at", "REAL")]
+        for table, column, column_type in added:
+            columns = {row["name"] for row in self._conn.execute(f"PRAGMA table_info({table})")}
+            if column not in columns:
+                self._conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {column_type}")
+        self._conn.execute("UPDATE meta SET value = ? WHERE key = 'schema_version'", (str(SCHEMA_VERSION),))
+
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        """Transação (reentrante na mesma thread: só a mais externa faz COMMIT/ROLLBACK)."""
+        with self._lock:
+            outermost = self._depth == 0
+            if outermost:
+                self._conn.execute("BEGIN IMMEDIATE")
+            self._depth += 1
+            try:
+                yield self._conn
+            except BaseException:
+                self._depth -= 1
+                if outermost:
+                    self._conn.execute("ROLLBACK")
+                raise
+            self._depth -= 1
+            if outermost:
+                self._conn.execute("COMMIT")
+
+    def _fetchall(self, sql: str, params: Tuple = ()) -> List[sqlite3.Row]:
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    # --- Versão do índice ---
+
+    def index_version(self) -> int:
+        return int(self._fetchall("SELECT value FROM meta WHERE key = 'index_version'")[0]["value"])
+
+    def bump_index_version(self) -> int:
+        with self.transaction() as conn:
+            conn.execute("UPDATE meta SET value = CAST(value AS INTEGER) + 1 WHERE key = 'index_version'")
+            return self.index_version()
+
+    def is_empty(self) -> bool:
+        return not self._fetchall("SELECT 1 FROM shards LIMIT 1") and \
+            not self._fetchall("SELECT 1 FROM files LIMIT 1")
+
+    # --- Shards ---
+
+    def get_shards(self) -> Dict[str, Dict[str, Any]]:
+        return {row["shard"]: dict(row) for row in self._fetchall("SELECT * FROM shards ORDER BY shard")}
+
+    def get_shard(self, shard: str) -> Optional[Dict[str, Any]]:
+        rows = self._fetchall("SELECT * FROM shards WHERE shard = ?", (shard,))
+        return dict(rows[0]) if rows else None
+
+    def set_shard(self, shard: str, collection: str, embedding_model: str):
+        with self.transaction() as conn:
+            conn.execute("INSERT OR REPLACE INTO shards (shard, collection, embedding_model, updated_at) "
+                         "VALUES (?, ?, ?, ?)", (shard, collection, embedding_model, time.time()))
+
+    def remove_shard(self, shard: str):
+        """Remove o shard, seus arquivos e chunks (a coleção no ChromaDB é responsabilidade do chamador)."""
+        with self.transaction() as conn:
+            conn.execute("DELETE FROM duplicate_chunks WHERE shard = ?", (shard,))
+            conn.execute("DELETE FROM chunks WHERE shard = ?", (shard,))
+            conn.execute("DELETE FROM files WHERE shard = ?", (shard,))
+            conn.execute("DELETE FROM shards WHERE shard = ?", (shard,))
+
+    def clear_shard_files(self, shard: str):
+        with self.transaction() as conn:
+            conn.execute("DELETE FROM duplicate_chunks WHERE shard = ?", (shard,))
+            conn.execute("DELETE FROM chunks WHERE shard = ?", (shard,))
+            conn.execute("DELETE FROM files WHERE shard = ?", (shard,))
+
+    # --- Arquivos e chunks ---
+
+    def get_files(self, shard: Optional[str] = None) -> Dict[Tuple[str, str], Dict[str, Any]]:
+        """{(shard, arquivo): registro} de um shard (ou de todos)."""
+        if shard is None:
+            rows = self._fetchall("SELECT * FROM files")
+        else:
+            rows = self._fetchall("SELECT * FROM files WHERE shard = ?", (shard,))
+        return {(row["shard"], row["filename"]): dict(row) for row in rows}
+
+    def get_chunk_hashes(self, shard: str, filename: str) -> Dict[str, str]:
+        rows = self._fetchall("SELECT chunk_id, sha256 FROM chunks WHERE shard = ? AND filename = ?",
+                              (shard, filename))
+        return {row["chunk_id"]: row["sha256"] for row in rows}
+
+    def record_file(self, shard: str, filename: str, mtime: float, size: int, sha256: Optional[str],
+                    chunk_size: int, chunk_overlap: int, ingestion_version: int,
+                    chunk_hashes: Dict[str, str], signatures: Optional[Dict[str, bytes]] = None,
+                    duplicates: Optional[Dict[str, Tuple[str, str, Dict[str, Any]]]] = None,
+                    dedup_config: Optional[str] = None):
+        """
+        Grava (substituindo) o arquivo e seus chunks numa única transação.
+
+        Args:
+            signatures: {chunk_id: assinatura MinHash}
+            duplicates: {chunk_id: (chunk canônico, texto, metadados)} dos chunks que
+                não estão no ChromaDB por serem quase duplicatas
+        """
+        signatures = signatures or {}
+        with self.transaction() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO files (shard, filename, mtime, size, sha256, chunk_size, "
+                "chunk_overlap, ingestion_version, chunk_count, indexed_at, dedup_config) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (shard, filename, mtime, size, sha256, chunk_size, chunk_overlap, ingestion_version,
+                 len(chunk_hashes), time.time(), dedup_config))
+            conn.execute("DELETE FROM chunks WHERE shard = ? AND filename = ?", (shard, filename))
+            conn.executemany("INSERT OR REPLACE INTO chunks (shard, chunk_id, filename, sha256, signature) "
+                             "VALUES (?, ?, ?, ?, ?)",
+                             [(shard, chunk_id, filename, digest, signatures.get(chunk_id))
+                              for chunk_id, digest in chunk_hashes.items()])
+            conn.execute("DELETE FROM duplicate_chunks WHERE shard = ? AND filename = ?", (shard, filename))
+            conn.executemany("INSERT OR REPLACE INTO duplicate_chunks (shard, chunk_id, filename, canonical_id, "
+                             "document, metadata) VALUES (?, ?, ?, ?, ?, ?)",
+                             [(shard, chunk_id, filename, canonical_id, document,
+                               json.dumps(metadata, ensure_ascii=False))
+                              for chunk_id, (canonical_id, document, metadata) in (duplicates or {}).items()])
+
+    def touch_file(self, shard: str, filename: str, mtime: float, size: int):
+        """Atualiza mtime/tamanho de um arquivo cujo conteúdo (hash) não mudou."""
+        with self.transaction() as conn:
+            conn.execute("UPDATE files SET mtime = ?, size = ? WHERE shard = ? AND filename = ?",
+                         (mtime, size, shard, filename))
+
+    def remove_file(self, shard: str, filename: str):
+        with self.transaction() as conn:
+            conn.execute("DELETE FROM duplicate_chunks WHERE shard = ? AND filename = ?", (shard, filename))
+            conn.execute("DELETE FROM chunks WHERE shard = ? AND filename = ?", (shard, filename))
+            conn.execute("DELETE FROM files WHERE shard = ? AND filename = ?", (shard, filename))
+
+    # --- Quase duplicatas (chunk_dedup.py) ---
+
+    def get_canonical_signatures(self, shard: str) -> Dict[str, bytes]:
+        """Assinaturas dos chunks gravados no ChromaDB (canônicos) de um shard."""
+        rows = self._fetchall(
+            "SELECT c.chunk_id, c.signature FROM chunks c WHERE c.shard = ? AND c.signature IS NOT NULL "
+            "AND NOT EXISTS (SELECT 1 FROM duplicate_chunks d WHERE d.shard = c.shard AND d.chunk_id = c.chunk_id)",
+            (shard,))
+        return {row["chunk_id"]: row["signature"] for row in rows}
+
+    def get_file_duplicates(self, shard: str, filename: str) -> Dict[str, str]:
+        """{chunk_id: chunk canônico} das quase duplicatas de um arquivo."""
+        rows = self._fetchall("SELECT chunk_id, canonical_id FROM duplicate_chunks WHERE shard = ? AND filename = ?",
+                              (shard, filename))
+        return {row["chunk_id"]: row["canonical_id"] for row in rows}
+
+    def get_duplicates_of(self, shard: str, canonical_ids: List[str]) -> List[Dict[str, Any]]:
+        """Quase duplicatas dos chunks canônicos indicados (com texto, metadados e assinatura)."""
+        rows = []
+        for start in range(0, len(canonical_ids), 500):
+            batch = canonical_ids[start:start + 500]
+            rows += self._fetchall(
+                f"SELECT d.chunk_id, d.filename, d.canonical_id, d.document, d.metadata, c.signature "
+                f"FROM duplicate_chunks d LEFT JOIN chunks c ON c.shard = d.shard AND c.chunk_id = d.chunk_id "
+                f"WHERE d.shard = ? AND d.canonical_id IN ({', '.join('?' for _ in batch)}) "
+                f"ORDER BY d.canonical_id, d.filename, d.chunk_id", (shard, *batch))
+        return [dict(row, metadata=json.loads(row["metadata"])) for row in rows]
+
+    def promote_duplicate(self, shard: str, chunk_id: str, repointed_ids: List[str]):
+        """Torna a duplicata `chunk_id` canônica e aponta as duplicatas `repointed_ids` para ela."""
+        with self.transaction() as conn:
+            conn.execute("DELETE FROM duplicate_chunks WHERE shard = ? AND chunk_id = ?", (shard, chunk_id))
+            conn.executemany("UPDATE duplicate_chunks SET canonical_id = ? WHERE shard = ? AND chunk_id = ?",
+                             [(chunk_id, shard, other) for other in repointed_ids])
+
+    def repoint_duplicates(self, shard: str, canonical_map: Dict[str, str]):
+        """Aponta as duplicatas de cada chunk canônico antigo para o novo ({antigo: novo})."""
+        with self.transaction() as conn:
+            conn.executemany("UPDATE duplicate_chunks SET canonical_id = ? WHERE shard = ? AND canonical_id = ?",
+                             [(new, shard, old) for old, new in canonical_map.items()])
+
+    def get_dedup_stats(self) -> Dict[str, Dict[str, Any]]:
+        """Por shard: chunks, quase duplicatas não gravadas no ChromaDB e tamanho do texto delas."""
+        stats = {row["shard"]: {"chunks": row["chunks"], "duplicates": 0, "duplicate_text_bytes": 0}
+                 for row in self._fetchall("SELECT shard, COUNT(*) AS chunks FROM chunks GROUP BY shard")}
+        for row in self._fetchall("SELECT shard, COUNT(*) AS duplicates, "
+                                  "COALESCE(SUM(LENGTH(CAST(document AS BLOB))), 0) AS text_bytes "
+                                  "FROM duplicate_chunks GROUP BY shard"):
+            entry = stats.setdefault(row["shard"], {"chunks": 0, "duplicates": 0, "duplicate_text_bytes": 0})
+            entry["duplicates"] = row["duplicates"]
+            entry["duplicate_text_bytes"] = row["text_bytes"]
+        return stats
+
+    # --- Exportação (snapshots do índice) ---
+
+    def export_state(self) -> Dict[str, Any]:
+        """Shards, arquivos e chunks do manifesto (para snapshots portáteis)."""
+        with self._lock:
+            return {
+                "index_version": self.index_version(),
+                "shards": [dict(row) for row in self._fetchall("SELECT * FROM shards")],
+                "files": [dict(row) for row in self._fetchall("SELECT * FROM files")],
+                "chunks": [(row["shard"], row["chunk_id"], row["filename"], row["sha256"],
+                            row["signature"].hex() if row["signature"] is not None else None)
+                           for row in self._fetchall("SELECT shard, chunk_id, filename, sha256, signature FROM chunks")],
+                "duplicate_chunks": [tuple(row) for row in self._fetchall(
+                    "SELECT shard, chunk_id, filename, canonical_id, document, metadata FROM duplicate_chunks")],
+            }
+
+    def import_state(self, state: Dict[str, Any]):
+        """Substitui shards, arquivos e chunks pelo estado exportado (numa única transação)."""
+        file_columns = ("shard", "filename", "mtime", "size", "sha256", "chunk_size", "chunk_overlap",
+                        "ingestion_version", "chunk_count", "indexed_at", "dedup_config")
+        with self.transaction() as conn:
+            for table in ("duplicate_chunks", "chunks", "files", "shards"):
+                conn.execute(f"DELETE FROM {table}")
+            conn.executemany("INSERT INTO shards (shard, collection, embedding_model, updated_at) VALUES (?, ?, ?, ?)",
+                             [(row["shard"], row["collection"], row["embedding_model"], row["updated_at"])
+                              for row in state["shards"]])
+            conn.executemany(f"INSERT INTO files ({', '.join(file_columns)}) VALUES "
+                             f"({', '.join('?' for _ in file_columns)})",
+                             [tuple(row.get(column) for column in file_columns) for row in state["files"]])
+            # Snapshots anteriores à deduplicação não têm a assinatura (5ª coluna)
+            conn.executemany("INSERT INTO chunks (shard, chunk_id, filename, sha256, signature) VALUES (?, ?, ?, ?, ?)",
+                             [(*row[:4], bytes.fromhex(row[4]) if len(row) > 4 and row[4] else None)
+                              for row in state["chunks"]])
+            conn.executemany("INSERT INTO duplicate_chunks (shard, chunk_id, filename, canonical_id, document, "
+                             "metadata) VALUES (?, ?, ?, ?, ?, ?)",
+                             [tuple(row) for row in state.get("duplicate_chunks", [])])
+            conn.execute("UPDATE meta SET value = ? WHERE key = 'index_version'",
+                         (str(max(self.index_version(), state["index_version"]) + 1),))
+
+    # --- Migrações de modelo de embedding ---
+
+    def start_migration(self, shard: str, from_model: str, to_model: str, source_collection: str,
+                        total: int, stale_seconds: float) -> Optional[int]:
+        """
+        Registra uma migração do shard em nome deste processo.
+
+        Retorna None, sem registrar nada, se outra migração do shard já está em andamento
+        com dono ativo (outro processo ou outra instância neste processo).
+        """
+        owner = migration_owner()
+        with self.transaction() as conn:
+            running = [dict(row) for row in conn.execute(
+                "SELECT * FROM migrations WHERE shard = ? AND status = 'running'", (shard,)).fetchall()]
+            if any(migration_is_live(migration, stale_seconds) for migration in running):
+                return None
+            now = time.time()
+            cursor = conn.execute(
+                "INSERT INTO migrations (shard, from_model, to_model, source_collection, target_collection, "
+                "status, total, started_at, owner, heartbeat_at) VALUES (?, ?, ?, ?, '', 'running', ?, ?, ?, ?)",
+                (shard, from_model, to_model, source_collection, total, now, owner, now))
+            return cursor.lastrowid
+
+    def update_migration(self, migration_id: int, **fields: Any):
+        if fields.get("status") in ("completed", "failed", "interrupted"):
+            fields.setdefault("finished_at", time.time())
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        with self.transaction() as conn:
+            conn.execute(f"UPDATE migrations SET {assignments} WHERE id = ?", (*fields.values(), migration_id))
+
+    def heartbeat_migration(self, migration_id: int):
+        """Renova o sinal de vida de uma migração em andamento."""
+        with self.transaction() as conn:
+            conn.execute("UPDATE migrations SET heartbeat_at = ? WHERE id = ? AND status = 'running'",
+                         (time.time(), migration_id))
+
+    def get_migrations(self, limit: int = 10) -> List[Dict[str, Any]]:
+        return [dict(row) for row in self._fetchall("SELECT * FROM migrations ORDER BY id DESC LIMIT ?", (limit,))]
+
+    def mark_interrupted_migrations(self, stale_seconds: float) -> List[Dict[str, Any]]:
+        """
+        Marca como interrompidas as migrações "running" cujo dono encerrou (processo
+        inexistente ou sem sinal de vida há mais de `stale_seconds`) e as retorna.
+        Migrações com dono ativo não são tocadas.
+        """
+        with self.transaction() as conn:
+            running = [dict(row) for row in conn.execute("SELECT * FROM migrations WHERE status = 'running'")]
+            abandoned = [migration for migration in running if not migration_is_live(migration, stale_seconds)]
+            for migration in abandoned:
+                self.update_migration(migration["id"], status="interrupted")
+        return abandoned
@@ -0,0 +1,306 @@
+# src/rag_app/index_snapshot.py
+"""
+Snapshots portáteis do índice vetorial.
+
+Um snapshot é um único arquivo versionado com os vetores, documentos, metadados
+e o manifesto do índice. Serve para distribuir o índice entre réplicas sem
+reprocessar data/ nem copiar o diretório do ChromaDB:
+
+    [cabeçalho fixo 64 B][vetores float32 de cada shard, alinhados em 64 B]
+    [documentos + metadados de cada shard, JSON comprimido com zlib]
+    [rodapé JSON com offsets, modelos e manifesto][tamanho do rodapé][MAGIC]
+
+Os vetores ficam num bloco binário contíguo (linhas float32), abertos com
+numpy.memmap: a réplica carrega o snapshot em segundos, as páginas são lidas sob
+demanda e compartilhadas pelo cache do sistema entre todos os processos que
+abrem o mesmo arquivo.
+
+Uso:
+  - exportar/importar: python -m src.rag_app.index_admin export|import <arquivo>
+  - réplica somente leitura: RAGCore(snapshot_path=...) ou INDEX_SNAPSHOT_CONFIG
+"""
+
+import hashlib
+import json
+import logging
+import os
+import struct
+import time
+import zlib
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"RAGSNAP\0"
+FORMAT_VERSION = 1
+_ALIGNMENT = 64
+_TRAILER = struct.Struct("<Q8s")  # tamanho do rodapé JSON + MAGIC
+# Limite de itens por chamada add/get do ChromaDB
+_CHROMA_BATCH = 4096
+
+
+class SnapshotError(Exception):
+    """Arquivo de snapshot inválido, corrompido ou de versão incompatível."""
+
+
+def _pad(f, alignment: int = _ALIGNMENT):
+    remainder = f.tell() % alignment
+    if remainder:
+        f.write(b"\0" * (alignment - remainder))
+
+
+def _collection_pages(collection, include: List[str]):
+    offset = 0
+    while True:
+        page = collection.get(limit=_CHROMA_BATCH, offset=offset, include=include)
+        if not page["ids"]:
+            return
+        yield page
+        offset += len(page["ids"])
+
+
+def write_snapshot(path: str, shards: List[Tuple[str, Any, str]], manifest_state: Dict[str, Any],
+                   metadata: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    Grava o snapshot de forma atômica (arquivo temporário + rename).
+
+    Args:
+        shards: [(shard, coleção do ChromaDB, modelo de embedding)]
+        manifest_state: IndexManifest.export_state()
+    """
+    temp_path = f"{path}.tmp-{os.getpid()}"
+    footer: Dict[str, Any] = {
+        "format_version": FORMAT_VERSION,
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "metadata": metadata or {},
+        "manifest": manifest_state,
+        "shards": {},
+    }
+    try:
+        with open(temp_path, "wb") as f:
+            f.write(MAGIC + struct.pack("<I", FORMAT_VERSION))
+            _pad(f)
+            records = {}
+            for shard, collection, embedding_model in shards:
+                vectors_offset = f.tell()
+                digest = hashlib.sha256()
+                ids, documents, metadatas = [], [], []
+                dimension = 0
+                for page in _collection_pages(collection, ["embeddings", "documents", "metadatas"]):
+                    vectors = np.ascontiguousarray(page["embeddings"], dtype=np.float32)
+                    dimension = vectors.shape[1]
+                    block = vectors.tobytes()
+                    digest.update(block)
+                    f.write(block)
+                    ids += page["ids"]
+                    documents += page["documents"]
+                    metadatas += page["metadatas"]
+                _pad(f)
+                records[shard] = (ids, documents, metadatas)
+                footer["shards"][shard] = {
+                    "collection": collection.name, "embedding_model": embedding_model,
+                    "count": len(ids), "dimension": dimension,
+                    "vectors_offset": vectors_offset, "vectors_sha256": digest.hexdigest(),
+                }
+            for shard, (ids, documents, metadatas) in records.items():
+                payload = zlib.compress(json.dumps(
+                    {"ids": ids, "documents": documents, "metadatas": metadatas},
+                    ensure_ascii=False).encode("utf-8"), 6)
+                footer["shards"][shard]["records_offset"] = f.tell()
+                footer["shards"][shard]["records_length"] = len(payload)
+                f.write(payload)
+            footer_bytes = json.dumps(footer, ensure_ascii=False).encode("utf-8")
+            f.write(footer_bytes)
+            f.write(_TRAILER.pack(len(footer_bytes), MAGIC))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    total = sum(info["count"] for info in footer["shards"].values())
+    logger.info(f"Snapshot gravado em '{path}': {total} chunks, {len(footer['shards'])} shard(s), "
+                f"{os.path.getsize(path) / (1024 * 1024):.1f} MB.")
+    return footer
+
+
+def _matches(metadata: Dict[str, Any], where: Dict[str, Any]) -> bool:
+    """Avalia um filtro no formato "where" do ChromaDB (o subconjunto usado por build_metadata_filter)."""
+    for key, condition in where.items():
+        if key == "$and":
+            if not all(_matches(metadata, clause) for clause in condition):
+                return False
+        elif key == "$or":
+            if not any(_matches(metadata, clause) for clause in condition):
+                return False
+        else:
+            value = metadata.get(key)
+            if not isinstance(condition, dict):
+                condition = {"$eq": condition}
+            for operator, operand in condition.items():
+                if operator == "$eq":
+                    ok = value == operand
+                elif operator == "$ne":
+                    ok = value != operand
+                elif operator == "$in":
+                    ok = value in operand
+                elif operator == "$nin":
+                    ok = value not in operand
+                elif operator == "$contains":
+                    ok = isinstance(value, list) and operand in value
+                elif operator in ("$gt", "$gte", "$lt", "$lte"):
+                    if not isinstance(value, (int, float)) or isinstance(value, bool):
+                        return False
+                    ok = {"$gt": value > operand, "$gte": value >= operand,
+                          "$lt": value < operand, "$lte": value <= operand}[operator]
+                else:
+                    raise ValueError(f"Operador de filtro não suportado no snapshot: {operator}")
+                if not ok:
+                    return False
+    return True
+
+
+class SnapshotCollection:
+    """
+    Shard de um snapshot, somente leitura, com a mesma interface de consulta da coleção
+    do ChromaDB usada pelo RAGCore (name, count, query, get). A busca é exata
+    (distância L2 ao quadrado, como o ChromaDB) sobre os vetores mapeados em memória.
+    """
+
+    def __init__(self, name: str, vectors: np.ndarray, ids: List[str], documents: List[str],
+                 metadatas: List[Dict[str, Any]]):
+        self.name = name
+        self.vectors = vectors
+        self.ids = ids
+        self.documents = documents
+        self.metadatas = metadatas
+        self._positions = {chunk_id: i for i, chunk_id in enumerate(ids)}
+        self._norms: Optional[np.ndarray] = None
+
+    def count(self) -> int:
+        return len(self.ids)
+
+    def _squared_norms(self) -> np.ndarray:
+        if self._norms is None:
+            self._norms = np.einsum("ij,ij->i", self.vectors, self.vectors)
+        return self._norms
+
+    def query(self, query_embeddings, n_results: int = 10, where: Optional[Dict[str, Any]] = None,
+              include: Optional[List[str]] = None) -> Dict[str, Any]:
+        query = np.asarray(query_embeddings, dtype=np.float32)
+        if where:
+            candidates = np.array([i for i, metadata in enumerate(self.metadatas)
+                                   if _matches(metadata or {}, where)], dtype=np.int64)
+        else:
+            candidates = None
+        result = {"ids": [], "documents": [], "metadatas": [], "distances": []}
+        for q in query:
+            if candidates is None:
+                distances = self._squared_norms() - 2.0 * (self.vectors @ q) + float(q @ q)
+                rows = np.arange(len(self.ids))
+            else:
+                distances = self._squared_norms()[candidates] - 2.0 * (self.vectors[candidates] @ q) + float(q @ q)
+                rows = candidates
+            top = min(n_results, len(rows))
+            if top == 0:
+                best = np.array([], dtype=np.int64)
+            else:
+                best = np.argpartition(distances, top - 1)[:top]
+                best = best[np.argsort(distances[best])]
+            result["ids"].append([self.ids[rows[i]] for i in best])
+            result["documents"].append([self.documents[rows[i]] for i in best])
+            result["metadatas"].append([self.metadatas[rows[i]] for i in best])
+            result["distances"].append([max(0.0, float(distances[i])) for i in best])
+        return result
+
+    def get(self, ids: Optional[List[str]] = None, limit: Optional[int] = None, offset: int = 0,
+            include: Optional[List[str]] = None) -> Dict[str, Any]:
+        if ids is not None:
+            rows = [self._positions[chunk_id] for chunk_id in ids if chunk_id in self._positions]
+        else:
+            rows = list(range(offset, len(self.ids) if limit is None else min(len(self.ids), offset + limit)))
+        include = include or ["documents", "metadatas"]
+        return {
+            "ids": [self.ids[i] for i in rows],
+            "documents": [self.documents[i] for i in rows] if "documents" in include else None,
+            "metadatas": [self.metadatas[i] for i in rows] if "metadatas" in include else None,
+            "embeddings": np.asarray(self.vectors[rows]) if "embeddings" in include else None,
+        }
+
+
+class IndexSnapshot:
+    """Snapshot aberto para leitura (vetores via numpy.memmap)."""
+
+    def __init__(self, path: str, verify_checksum: bool = False):
+        self.path = path
+        size = os.path.getsize(path)
+        with open(path, "rb") as f:
+            header = f.read(len(MAGIC) + 4)
+            if len(header) < len(MAGIC) + 4 or header[:len(MAGIC)] != MAGIC:
+                raise SnapshotError(f"'{path}' não é um snapshot do índice")
+            version = struct.unpack("<I", header[len(MAGIC):])[0]
+            if version != FORMAT_VERSION:
+                raise SnapshotError(f"Versão de snapshot não suportada: {version} (esperada {FORMAT_VERSION})")
+            if size < _ALIGNMENT + _TRAILER.size:
+                raise SnapshotError(f"Snapshot '{path}' incompleto ou corrompido")
+            f.seek(size - _TRAILER.size)
+            footer_length, trailer_magic = _TRAILER.unpack(f.read(_TRAILER.size))
+            if trailer_magic != MAGIC or footer_length > size - _ALIGNMENT - _TRAILER.size:
+                raise SnapshotError(f"Snapshot '{path}' incompleto ou corrompido")
+            f.seek(size - _TRAILER.size - footer_length)
+            try:
+                self.footer: Dict[str, Any] = json.loads(f.read(footer_length).decode("utf-8"))
+            except (UnicodeDecodeError, json.JSONDecodeError) as e:
+                raise SnapshotError(f"Rodapé do snapshot '{path}' corrompido: {e}") from e
+
+            self.collections: Dict[str, SnapshotCollection] = {}
+            for shard, info in self.footer["shards"].items():
+                if info["vectors_offset"] + info["count"] * info["dimension"] * 4 > size:
+                    raise SnapshotError(f"Vetores do shard '{shard}' além do fim do arquivo '{path}'")
+                f.seek(info["records_offset"])
+                try:
+                    records = json.loads(zlib.decompress(f.read(info["records_length"])).decode("utf-8"))
+                except (zlib.error, UnicodeDecodeError, json.JSONDecodeError) as e:
+                    raise SnapshotError(f"Registros do shard '{shard}' corrompidos: {e}") from e
+                if info["count"]:
+                    vectors = np.memmap(path, dtype=np.float32, mode="r", offset=info["vectors_offset"],
+                                        shape=(info["count"], info["dimension"]))
+                else:
+                    vectors = np.empty((0, 0), dtype=np.float32)
+                if verify_checksum and hashlib.sha256(vectors.tobytes()).hexdigest() != info["vectors_sha256"]:
+                    raise SnapshotError(f"Checksum dos vetores do shard '{shard}' não confere")
+                self.collections[shard] = SnapshotCollection(
+                    info["collection"], vectors, records["ids"], records["documents"], records["metadatas"])
+
+    @property
+    def manifest(self) -> Dict[str, Any]:
+        return self.footer["manifest"]
+
+    def embedding_model(self, shard: str) -> str:
+        return self.footer["shards"][shard]["embedding_model"]
+
+
+def restore_snapshot(path: str, chroma_client, manifest) -> Dict[str, Any]:
+    """
+    Importa o snapshot num ChromaDB persistente (sem recalcular embeddings) e substitui o
+    manifesto. As coleções dos shards do snapshot são recriadas; as demais não são tocadas.
+    """
+    snapshot = IndexSnapshot(path, verify_checksum=True)
+    for shard, collection in snapshot.collections.items():
+        try:
+            chroma_client.delete_collection(collection.name)
+        except Exception:
+            pass
+        target = chroma_client.get_or_create_collection(name=collection.name)
+        for start in range(0, collection.count(), _CHROMA_BATCH):
+            end = min(start + _CHROMA_BATCH, collection.count())
+            target.add(ids=collection.ids[start:end],
+                       embeddings=np.asarray(collection.vectors[start:end]),
+                       documents=collection.documents[start:end],
+                       metadatas=collection.metadatas[start:end])
+        logger.info(f"Shard '{shard}' importado: {collection.count()} chunks na coleção '{collection.name}'.")
+    manifest.import_state(snapshot.manifest)
+    return snapshot.footer
@@ -0,0 +1,123 @@
+# src/rag_app/keyword_matcher.py
+"""
+Casamento de múltiplas palavras-chave em uma única passada (Aho-Corasick).
+
+Todas as listas de palavras-chave (conceituais, de contexto específico,
+indicadores de uso externo, nomes de conceitos...) são compiladas uma única vez
+em um autômato. Classificar um texto custa O(tamanho do texto + ocorrências),
+independentemente de quantas palavras-chave existem nas listas.
+
+A semântica é a mesma da verificação anterior `keyword in texto.lower()`:
+ocorrência como substring, sem diferenciar maiúsculas de minúsculas.
+"""
+
+from collections import deque
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from . import config
+
+
+class KeywordMatcher:
+    """Autômato Aho-Corasick que associa cada palavra-chave a uma categoria."""
+
+    def __init__(self, categories: Optional[Dict[str, Iterable[str]]] = None):
+        """
+        Args:
+            categories: Mapeamento categoria -> palavras-chave. Se fornecido, o
+                autômato é construído imediatamente.
+        """
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        # Palavras-chave que terminam em cada nó; _output soma as herdadas pelos links
+        # de falha e é recalculada do zero a cada build()
+        self._own: List[List[Tuple[str, str]]] = [[]]
+        self._output: List[List[Tuple[str, str]]] = [[]]
+        self._built = True
+        self.keyword_count = 0
+
+        if categories:
+            for category, keywords in categories.items():
+                for keyword in keywords:
+                    self.add(keyword, category)
+            self.build()
+
+    def add(self, keyword: str, category: str):
+        """Adiciona uma palavra-chave. Exige nova chamada a build() antes de buscar."""
+        keyword = keyword.lower()
+        if not keyword:
+            return
+        node = 0
+        for char in keyword:
+            next_node = self._goto[node].get(char)
+            if next_node is None:
+                next_node = len(self._goto)
+                self._goto.append({})
+                self._fail.append(0)
+                self._own.append([])
+                self._output.append([])
+                self._goto[node][char] = next_node
+            node = next_node
+        if (keyword, category) not in self._own[node]:
+            self._own[node].append((keyword, category))
+            self.keyword_count += 1
+        self._built = False
+
+    def build(self):
+        """Calcula os links de falha e as saídas (busca em largura a partir da raiz)."""
+        self._output[0] = list(self._own[0])
+        queue = deque(self._goto[0].values())
+        for child in queue:
+            self._fail[child] = 0
+            self._output[child] = list(self._own[child])
+        while queue:
+            node = queue.popleft()
+            for char, child in self._goto[node].items():
+                queue.append(child)
+                fallback = self._fail[node]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[child] = self._goto[fallback].get(char, 0)
+                # Herdar as saídas do sufixo mais longo que também é palavra-chave
+                self._output[child] = self._own[child] + self._output[self._fail[child]]
+        self._built = True
+
+    def iter_matches(self, text: str) -> Iterator[Tuple[int, str, str]]:
+        """Gera (posição inicial, palavra-chave, categoria) para cada ocorrência em `text`."""
+        if not self._built:
+            self.build()
+        goto, fail, output = self._goto, self._fail, self._output
+        node = 0
+        for index, char in enumerate(text.lower()):
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            if output[node]:
+                for keyword, category in output[node]:
+                    yield index - len(keyword) + 1, keyword, category
+
+    def match(self, text: str) -> Dict[str, List[str]]:
+        """
+        Classifica o texto em uma passada.
+
+        Returns:
+            Mapeamento categoria -> palavras-chave encontradas (ordem de ocorrência)
+        """
+        found: Dict[str, List[str]] = {}
+        for _, keyword, category in self.iter_matches(text):
+            keywords = found.setdefault(category, [])
+            if keyword not in keywords:
+                keywords.append(keyword)
+        return found
+
+
+def build_external_knowledge_matcher(knowledge_config: Optional[Dict] = None) -> KeywordMatcher:
+    """
+    Compila as listas de EXTERNAL_KNOWLEDGE_CONFIG em um único autômato, com as
+    categorias "conceptual", "specific_context" e "external_usage".
+    """
+    knowledge_config = knowledge_config or config.EXTERNAL_KNOWLEDGE_CONFIG
+    return KeywordMatcher({
+        "conceptual": knowledge_config.get("conceptual_keywords", []),
+        "specific_context": knowledge_config.get("specific_context_keywords", []),
+        "external_usage": knowledge_config.get("external_usage_indicators", []),
+    })
@@ -0,0 +1,479 @@
+# src/rag_app/llm_router.py
+"""
+Roteador de múltiplos endpoints LLM com failover e requisições "hedged".
+
+O roteador mantém vários endpoints (ex.: vários hosts Ollama e o Gemini), com
+saúde e latência acompanhadas por endpoint:
+  - Falhas consecutivas acima do limite tiram o endpoint de rotação por um
+    período (cooldown); depois ele volta a receber tráfego.
+  - Em caso de erro, a mesma requisição é repetida no próximo endpoint.
+  - Com hedging habilitado, se a primeira tentativa ultrapassar o percentil de
+    latência configurado (p95) do endpoint, uma segunda é disparada em outro
+    endpoint e vence a que responder primeiro.
+
+Cada tentativa passa pelo escalonador (llm_scheduler), com uma fila por endpoint.
+A vaga é reservada na thread do chamador e só então a tentativa vai para o pool de
+threads do roteador: prioridade, limite da fila e tempo de espera do escalonador
+valem também para as tentativas executadas em paralelo. O hedge só é disparado se
+houver vaga imediata no outro endpoint (não entra na fila).
+
+Com um prazo (deadline.py), a espera na fila e cada tentativa usam apenas o tempo
+restante; quando ele acaba, as tentativas em andamento são canceladas e o texto já
+gerado (se houver) acompanha a exceção DeadlineExceeded. As tentativas perdedoras
+de um hedge também são canceladas.
+"""
+
+import hashlib
+import logging
+from abc import ABC, abstractmethod
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Any, Deque, Dict, List, Optional, Union
+
+from . import config
+from .deadline import Deadline, DeadlineExceeded
+from .llm_scheduler import LLMScheduler, SchedulerRejectedError, _percentile
+
+logger = logging.getLogger(__name__)
+
+# Modelo pedido ao roteador: nome único ou um nome por tipo de provedor
+# ({"ollama": "llama3.2:3b", "gemini": "gemini-2.5-flash-lite"}); provedores
+# ausentes no dicionário usam o modelo do próprio endpoint.
+ModelSelection = Union[str, Dict[str, str]]
+
+
+class LLMEndpointError(Exception):
+    """Falha de um endpoint LLM (erro de comunicação ou resposta inválida)."""
+
+
+class NoHealthyEndpointError(LLMEndpointError):
+    """Todas as tentativas em todos os endpoints falharam."""
+
+
+class LLMCancelledError(LLMEndpointError):
+    """A geração foi cancelada (prazo esgotado ou hedge vencido por outro endpoint)."""
+
+    def __init__(self, message: str, partial: str = ""):
+        super().__init__(message)
+        self.partial = partial
+
+
+class LLMEndpoint(ABC):
+    """
+    Endpoint LLM. Subclasses implementam generate(), levantando exceção em caso de falha.
+
+    `cancel_event` sinalizado interrompe a geração (LLMCancelledError, com o texto
+    parcial quando o provedor gera em streaming); `timeout` é o tempo restante do
+    prazo da consulta.
+    """
+
+    def __init__(self, name: str, provider: str, model: str):
+        self.name = name
+        self.provider = provider
+        self.model = model
+
+    @abstractmethod
+    def generate(self, prompt: str, model: Optional[str] = None,
+                 cancel_event: Optional[threading.Event] = None, timeout: Optional[float] = None) -> str:
+        """Gera a resposta para o prompt (LLMEndpointError em caso de falha)."""
+
+    def describe(self) -> Dict[str, Any]:
+        return {"name": self.name, "provider": self.provider, "model": self.model}
+
+
+class OllamaEndpoint(LLMEndpoint):
+    """Servidor Ollama (local ou remoto)."""
+
+    def __init__(self, name: str, host: str, model: str, request_timeout: Optional[float] = None):
+        super().__init__(name, "ollama", model)
+        import ollama
+        self.host = host
+        self.request_timeout = request_timeout
+        self._client = ollama.Client(host=host, timeout=request_timeout)
+
+    def _client_for(self, timeout: Optional[float]):
+        """
+        Cliente da chamada: com prazo menor que request_timeout, um cliente cujo timeout
+        HTTP é o tempo restante, para que a espera pela conexão ou pelo próximo trecho
+        não passe do prazo. Retorna (cliente, criado só para esta chamada).
+        """
+        if timeout is None or (self.request_timeout is not None and self.request_timeout <= timeout):
+            return self._client, False
+        import ollama
+        return ollama.Client(host=self.host, timeout=max(timeout, 0.001)), True
+
+    def generate(self, prompt: str, model: Optional[str] = None,
+                 cancel_event: Optional[threading.Event] = None, timeout: Optional[float] = None) -> str:
+        import httpx
+        model = model or self.model
+        logger.info(f"Enviando prompt para Ollama (endpoint: {self.name}, modelo: {model})...")
+        messages = [{'role': 'user', 'content': prompt}]
+        client, per_call = self._client_for(timeout)
+        parts: List[str] = []
+        try:
+            if cancel_event is None:
+                response = client.chat(model=model, messages=messages)
+                if response and 'message' in response and 'content' in response['message']:
+                    return response['message']['content'].strip()
+                raise LLMEndpointError(f"O Ollama retornou uma resposta em formato inesperado: {response}")
+
+            # Cancelável: em streaming, o cancelamento é observado a cada trecho e fechar o
+            # stream encerra a conexão (o Ollama interrompe a geração)
+            stream = client.chat(model=model, messages=messages, stream=True)
+            try:
+                for chunk in stream:
+                    if 'message' not in chunk or 'content' not in chunk['message']:
+                        raise LLMEndpointError(f"O Ollama retornou um trecho em formato inesperado: {chunk}")
+                    parts.append(chunk['message']['content'])
+                    if cancel_event.is_set():
+                        raise LLMCancelledError(f"geração cancelada no endpoint '{self.name}'",
+                                                "".join(parts).strip())
+            finally:
+                close = getattr(stream, "close", None)
+                if close is not None:
+                    close()
+            return "".join(parts).strip()
+        except httpx.TimeoutException:
+            if not per_call:
+                raise
+            # Timeout pelo prazo da consulta, não por falha do endpoint
+            raise LLMCancelledError(f"prazo esgotado aguardando o endpoint '{self.name}'", "".join(parts).strip())
+        finally:
+            if per_call:
+                client.close()
+
+    def describe(self) -> Dict[str, Any]:
+        return dict(super().describe(), host=self.host)
+
+
+class GeminiEndpoint(LLMEndpoint):
+    """API do Google Gemini."""
+
+    def __init__(self, name: str, model: str, api_key: str):
+        super().__init__(name, "gemini", model)
+        try:
+            import google.generativeai as genai
+        except ImportError:
+            raise ImportError(
+                "Google Generative AI não está instalado. "
+                "Execute: pip install google-generativeai"
+            )
+        if not api_key:
+            raise ValueError(
+                "Chave da API do Google não encontrada. "
+                "Defina GOOGLE_API_KEY como variável de ambiente ou em config.py"
+            )
+        genai.configure(api_key=api_key)
+        self._genai = genai
+        self._models: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+
+    def _model(self, model: str):
+        with self._lock:
+            if model not in self._models:
+                self._models[model] = self._genai.GenerativeModel(model)
+            return self._models[model]
+
+    def generate(self, prompt: str, model: Optional[str] = None,
+                 cancel_event: Optional[threading.Event] = None, timeout: Optional[float] = None) -> str:
+        model = model or self.model
+        logger.info(f"Enviando prompt para Google Gemini (endpoint: {self.name}, modelo: {model})...")
+        # A API não é interrompível: o prazo restante vira o timeout da requisição
+        request_options = {"timeout": max(timeout, 1.0)} if timeout is not None else None
+        response = self._model(model).generate_content(prompt, request_options=request_options)
+        if response and response.text:
+            return response.text.strip()
+        raise LLMEndpointError(f"O Gemini retornou uma resposta em formato inesperado: {response}")
+
+
+class _EndpointHealth:
+    """Estado de saúde e latências de um endpoint."""
+
+    def __init__(self, window: int):
+        self.latencies: Deque[float] = deque(maxlen=window)
+        self.consecutive_failures = 0
+        self.unhealthy_until = 0.0
+        self.successes = 0
+        self.failures = 0
+        self.hedges_fired = 0
+        self.hedges_won = 0
+        self.last_error: Optional[str] = None
+
+
+class LLMRouter:
+    """Distribui as chamadas entre endpoints com failover e hedging opcionais."""
+
+    def __init__(self, endpoints: List[LLMEndpoint], scheduler: LLMScheduler,
+                 router_config: Optional[Dict[str, Any]] = None):
+        if not endpoints:
+            raise ValueError("O roteador LLM precisa de pelo menos um endpoint")
+        self.endpoints = endpoints
+        self.scheduler = scheduler
+        self.cfg = router_config or config.LLM_ROUTER_CONFIG
+        self._lock = threading.Lock()
+        self._health = {ep.name: _EndpointHealth(self.cfg["latency_window"]) for ep in endpoints}
+        # Duas tentativas por chamada no máximo simultâneas (primária + hedge)
+        self._executor = ThreadPoolExecutor(max_workers=self.cfg["max_parallel_attempts"],
+                                            thread_name_prefix="llm-router")
+
+    # --- Saúde e ordenação ---
+
+    def _ordered_candidates(self) -> List[LLMEndpoint]:
+        """Endpoints saudáveis por latência mediana; os em cooldown vão ao fim (último recurso)."""
+        now = time.monotonic()
+        with self._lock:
+            def latency_key(indexed):
+                index, endpoint = indexed
+                return (_percentile(self._health[endpoint.name].latencies, 50) or 0.0, index)
+
+            indexed = list(enumerate(self.endpoints))
+            healthy = [item for item in indexed if self._health[item[1].name].unhealthy_until <= now]
+            cooling = [item for item in indexed if self._health[item[1].name].unhealthy_until > now]
+            healthy.sort(key=latency_key)
+            cooling.sort(key=lambda item: self._health[item[1].name].unhealthy_until)
+        return [endpoint for _, endpoint in healthy + cooling]
+
+    def _record_success(self, endpoint: LLMEndpoint, latency: float):
+        with self._lock:
+            health = self._health[endpoint.name]
+            health.latencies.append(latency)
+            health.successes += 1
+            health.consecutive_failures = 0
+            health.unhealthy_until = 0.0
+
+    def _record_failure(self, endpoint: LLMEndpoint, error: Exception):
+        with self._lock:
+            health = self._health[endpoint.name]
+            health.failures += 1
+            health.consecutive_failures += 1
+            health.last_error = str(error)
+            if health.consecutive_failures >= self.cfg["failure_threshold"]:
+                health.unhealthy_until = time.monotonic() + self.cfg["cooldown_seconds"]
+                logger.warning(f"Endpoint LLM '{endpoint.name}' fora de rotação por "
+                               f"{self.cfg['cooldown_seconds']}s após {health.consecutive_failures} falhas")
+
+    def _hedge_delay(self, endpoint: LLMEndpoint) -> Optional[float]:
+        """Tempo após o qual uma requisição hedged é disparada (None = sem hedging)."""
+        if not self.cfg.get("hedging_enabled", False) or len(self.endpoints) < 2:
+            return None
+        with self._lock:
+            latencies = list(self._health[endpoint.name].latencies)
+        if len(latencies) < self.cfg["hedge_min_samples"]:
+            return None
+        return max(self.cfg["hedge_min_delay_seconds"], _percentile(latencies, self.cfg["hedge_percentile"]))
+
+    # --- Execução ---
+
+    def _attempt(self, endpoint: LLMEndpoint, prompt: str, model: Optional[ModelSelection],
+                 cancel_event: Optional[threading.Event], deadline: Deadline, release) -> str:
+        """Executa uma tentativa na vaga já reservada no escalonador (liberada ao final)."""
+        if isinstance(model, dict):
+            model = model.get(endpoint.provider)
+        try:
+            if cancel_event is not None and cancel_event.is_set():
+                raise LLMCancelledError(f"geração cancelada antes de iniciar no endpoint '{endpoint.name}'")
+            start = time.monotonic()
+            text = endpoint.generate(prompt, model, cancel_event, deadline.remaining())
+            latency = time.monotonic() - start
+        except LLMCancelledError:
+            raise  # Cancelamento não indica problema de saúde do endpoint
+        except Exception as e:
+            self._record_failure(endpoint, e)
+            raise
+        finally:
+            release()
+        self._record_success(endpoint, latency)
+        return text
+
+    def generate(self, prompt: str, priority: str = "interactive", model: Optional[ModelSelection] = None,
+                 deadline: Optional[Deadline] = None) -> str:
+        """
+        Gera a resposta no melhor endpoint disponível.
+
+        Args:
+            model: Modelo a usar no lugar do modelo do endpoint (ver ModelSelection)
+            deadline: Prazo da consulta; ao esgotar, as tentativas são canceladas
+
+        Raises:
+            SchedulerRejectedError: todas as tentativas foram recusadas pelo escalonador
+            NoHealthyEndpointError: todas as tentativas falharam
+            DeadlineExceeded: o prazo acabou (com o texto parcial, se houver)
+        """
+        deadline = deadline or Deadline.none()
+        deadline.check("generation")
+        candidates = self._ordered_candidates()
+        attempts: Dict[Any, LLMEndpoint] = {}
+        errors: List[Exception] = []
+        next_index = 0
+        # Sinalizado ao final da chamada: cancela as tentativas ainda em andamento
+        # (prazo esgotado ou hedge perdedor)
+        call_cancel = threading.Event()
+
+        def launch(wait: bool = True) -> Optional[LLMEndpoint]:
+            """
+            Reserva a vaga do próximo candidato nesta thread e submete a tentativa ao
+            pool. Sobrecarga local (fila cheia ou espera esgotada) passa ao candidato
+            seguinte; com wait=False (hedge) desiste se não houver vaga imediata.
+            """
+            nonlocal next_index
+            while next_index < len(candidates):
+                endpoint = candidates[next_index]
+                try:
+                    release = self.scheduler.reserve(endpoint.name, priority, provider_type=endpoint.provider,
+                                                     deadline=deadline, wait=wait)
+                except SchedulerRejectedError as e:
+                    next_index += 1
+                    errors.append(e)
+                    logger.warning(f"Endpoint LLM '{endpoint.name}' indisponível no escalonador: {e}")
+                    continue
+                if release is None:
+                    return None
+                next_index += 1
+                attempts[self._executor.submit(self._attempt, endpoint, prompt, model,
+                                               call_cancel, deadline, release)] = endpoint
+                return endpoint
+            return None
+
+        primary = launch()
+        hedge_delay = self._hedge_delay(primary) if primary is not None else None
+        hedged = False
+
+        try:
+            while attempts:
+                can_hedge = not hedged and hedge_delay is not None and next_index < len(candidates)
+                timeout = deadline.budget(hedge_delay if can_hedge else None)
+                done, _ = wait(list(attempts), timeout=timeout, return_when=FIRST_COMPLETED)
+                if not done and deadline.expired():
+                    raise self._cancel_attempts(attempts, call_cancel)
+                if not done:
+                    hedged = True
+                    hedge = launch(wait=False)
+                    if hedge is None:
+                        logger.info(f"Endpoint '{primary.name}' acima de p{self.cfg['hedge_percentile']} "
+                                    f"({hedge_delay:.2f}s), mas sem vaga imediata para o hedge")
+                        continue
+                    with self._lock:
+                        self._health[primary.name].hedges_fired += 1
+                    logger.info(f"Endpoint '{primary.name}' acima de p{self.cfg['hedge_percentile']} "
+                                f"({hedge_delay:.2f}s): requisição hedged disparada em '{hedge.name}'")
+                    continue
+
+                for future in done:
+                    endpoint = attempts.pop(future)
+                    try:
+                        text = future.result()
+                    except Exception as e:
+                        errors.append(e)
+                        logger.error(f"Erro ao comunicar com endpoint LLM '{endpoint.name}': {e}")
+                        if not attempts and not deadline.expired():
+                            failover = launch()
+                            if failover is not None:
+                                logger.info(f"Failover do endpoint '{endpoint.name}' para '{failover.name}'")
+                        continue
+                    if hedged and endpoint is not primary:
+                        with self._lock:
+                            self._health[primary.name].hedges_won += 1
+                    return text
+        finally:
+            call_cancel.set()
+
+        if deadline.expired():
+            partial = max((e.partial for e in errors if isinstance(e, LLMCancelledError)), key=len, default="")
+            raise DeadlineExceeded("generation", partial or None)
+        if errors and all(isinstance(e, SchedulerRejectedError) for e in errors):
+            raise errors[-1]
+        raise NoHealthyEndpointError("; ".join(str(e) for e in errors) or "nenhum endpoint disponível")
+
+    def _cancel_attempts(self, attempts: Dict[Any, LLMEndpoint], call_cancel: threading.Event) -> DeadlineExceeded:
+        """Cancela as tentativas e aguarda brevemente pelo texto parcial gerado até aqui."""
+        call_cancel.set()
+        grace = config.QUERY_DEADLINE_CONFIG.get("cancel_grace_seconds", 0.0)
+        done, _ = wait(list(attempts), timeout=grace) if grace > 0 else (set(), None)
+        partial = ""
+        for future in done:
+            error = future.exception()
+            if isinstance(error, LLMCancelledError) and len(error.partial) > len(partial):
+                partial = error.partial
+        names = ", ".join(endpoint.name for endpoint in attempts.values())
+        logger.warning(f"Prazo da consulta esgotado durante a geração ({names}): tentativa(s) cancelada(s)")
+        return DeadlineExceeded("generation", partial or None)
+
+    def get_stats(self) -> Dict[str, Dict[str, Any]]:
+        now = time.monotonic()
+        with self._lock:
+            return {
+                endpoint.name: dict(
+                    endpoint.describe(),
+                    healthy=self._health[endpoint.name].unhealthy_until <= now,
+                    successes=self._health[endpoint.name].successes,
+                    failures=self._health[endpoint.name].failures,
+                    consecutive_failures=self._health[endpoint.name].consecutive_failures,
+                    latency_p50_seconds=_percentile(self._health[endpoint.name].latencies, 50),
+                    latency_p95_seconds=_percentile(self._health[endpoint.name].latencies, 95),
+                    hedges_fired=self._health[endpoint.name].hedges_fired,
+                    hedges_won=self._health[endpoint.name].hedges_won,
+                    last_error=self._health[endpoint.name].last_error,
+                )
+                for endpoint in self.endpoints
+            }
+
+
+class MockEndpoint(LLMEndpoint):
+    """
+    LLM simulado e determinístico (benchmarks e testes de carga): a resposta depende
+    apenas do prompt, sem acesso à rede. A latência é `latency_seconds` mais uma
+    variação de até `latency_jitter_seconds` derivada do hash do prompt (o mesmo
+    prompt tem sempre a mesma latência).
+    """
+
+    def __init__(self, name: str, latency_seconds: float = 0.0, model: str = "mock",
+                 latency_jitter_seconds: float = 0.0):
+        super().__init__(name, "mock", model)
+        self.latency_seconds = latency_seconds
+        self.latency_jitter_seconds = latency_jitter_seconds
+
+    def generate(self, prompt: str, model: Optional[str] = None,
+                 cancel_event: Optional[threading.Event] = None, timeout: Optional[float] = None) -> str:
+        digest = hashlib.sha1(prompt.encode("utf-8")).hexdigest()[:12]
+        latency = self.latency_seconds + self.latency_jitter_seconds * int(digest[:8], 16) / 0xFFFFFFFF
+        if latency > 0:
+            if cancel_event is None:
+                time.sleep(latency)
+            elif cancel_event.wait(latency):
+                raise LLMCancelledError(f"geração cancelada no endpoint '{self.name}'")
+        return f"Resposta simulada ({digest}) com base nos documentos fornecidos."
+
+    def describe(self) -> Dict[str, Any]:
+        return dict(super().describe(), latency_seconds=self.latency_seconds,
+                    latency_jitter_seconds=self.latency_jitter_seconds)
+
+
+def build_endpoints(endpoint_configs: List[Dict[str, Any]], ollama_model: str) -> List[LLMEndpoint]:
+    """
+    Cria os endpoints a partir de config.LLM_ENDPOINTS. Lista vazia usa apenas
+    config.LLM_PROVIDER (comportamento de provedor único).
+    """
+    if not endpoint_configs:
+        endpoint_configs = [{"name": config.LLM_PROVIDER, "provider": config.LLM_PROVIDER}]
+
+    request_timeout = config.LLM_ROUTER_CONFIG.get("request_timeout_seconds")
+    endpoints: List[LLMEndpoint] = []
+    for endpoint_config in endpoint_configs:
+        provider = endpoint_config.get("provider")
+        name = endpoint_config.get("name", provider)
+        if provider == "ollama":
+            endpoints.append(OllamaEndpoint(
+                name, endpoint_config.get("host", config.OLLAMA_HOST),
+                endpoint_config.get("model", ollama_model), request_timeout))
+        elif provider == "gemini":
+            endpoints.append(GeminiEndpoint(
+                name, endpoint_config.get("model", config.GEMINI_MODEL),
+                endpoint_config.get("api_key") or config.GOOGLE_API_KEY))
+        elif provider == "mock":
+            endpoints.append(MockEndpoint(name, endpoint_config.get("latency_seconds", 0.0),
+                                          latency_jitter_seconds=endpoint_config.get("latency_jitter_seconds", 0.0)))
+        else:
+            raise ValueError(f"Provedor LLM desconhecido: {provider}")
+    return endpoints
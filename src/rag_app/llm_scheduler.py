@@ -0,0 +1,221 @@
+# src/rag_app/llm_scheduler.py
+"""
+Escalonador das chamadas ao LLM.
+
+Todas as chamadas ao LLM passam por aqui. Para cada provedor (ou endpoint) há
+um limite de requisições simultâneas; as excedentes aguardam em uma fila
+limitada, ordenada por classe de prioridade ("interactive" antes de "batch") e
+por ordem de chegada. Fila cheia ou espera esgotada geram exceções explícitas,
+para que o chamador possa degradar a resposta em vez de sobrecarregar o host.
+
+O escalonador é compartilhado por todo o processo (get_llm_scheduler), de modo
+que várias instâncias do RAGCore respeitam o mesmo limite por provedor. Não há
+coordenação entre processos: um rag_batch em outro processo tem as próprias
+vagas e a própria fila e compete com os front-ends diretamente no provedor. Para
+que "interactive" passe à frente de "batch" nesse caso, as duas cargas precisam
+passar pelo mesmo processo (ex.: o lote enviado ao rag_server com "priority": "batch").
+"""
+
+import heapq
+import itertools
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, Optional, TypeVar
+
+from . import config
+from .deadline import Deadline
+
+T = TypeVar("T")
+
+# Classes de prioridade: menor valor é atendido primeiro
+PRIORITY_CLASSES: Dict[str, int] = {"interactive": 0, "batch": 1}
+
+
+class SchedulerRejectedError(Exception):
+    """A requisição não foi aceita (fila cheia)."""
+
+
+class SchedulerTimeoutError(SchedulerRejectedError):
+    """A requisição esperou na fila além do tempo permitido."""
+
+
+def _percentile(values, pct: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))]
+
+
+class _Lane:
+    """Fila e contador de requisições em andamento de um provedor."""
+
+    def __init__(self, name: str, max_in_flight: int, max_queue: int):
+        self.name = name
+        self.max_in_flight = max(1, max_in_flight)
+        self.max_queue = max_queue
+        self._cond = threading.Condition()
+        self._in_flight = 0
+        self._waiting: List[list] = []  # heap de [prioridade, sequência, concedido]
+        self._sequence = itertools.count()
+        self._completed = 0
+        self._rejected = 0
+        self._timed_out = 0
+        self._waits: Dict[str, Deque[float]] = {name: deque(maxlen=1024) for name in PRIORITY_CLASSES}
+
+    def acquire(self, priority: str, timeout: Optional[float]):
+        rank = PRIORITY_CLASSES[priority]
+        start = time.monotonic()
+        with self._cond:
+            if self._in_flight < self.max_in_flight and not self._waiting:
+                self._in_flight += 1
+                self._waits[priority].append(0.0)
+                return
+            if len(self._waiting) >= self.max_queue:
+                self._rejected += 1
+                raise SchedulerRejectedError(
+                    f"fila do provedor '{self.name}' cheia ({self.max_queue} requisições aguardando)")
+
+            entry = [rank, next(self._sequence), False]
+            heapq.heappush(self._waiting, entry)
+            deadline = start + timeout if timeout is not None else None
+            while not entry[2]:
+                remaining = deadline - time.monotonic() if deadline is not None else None
+                if remaining is not None and remaining <= 0:
+                    self._waiting.remove(entry)
+                    heapq.heapify(self._waiting)
+                    self._timed_out += 1
+                    raise SchedulerTimeoutError(
+                        f"espera de {timeout:.1f}s esgotada na fila do provedor '{self.name}'")
+                self._cond.wait(remaining)
+            self._waits[priority].append(time.monotonic() - start)
+
+    def try_acquire(self, priority: str) -> bool:
+        """Ocupa uma vaga apenas se houver uma livre e ninguém aguardando."""
+        with self._cond:
+            if self._in_flight < self.max_in_flight and not self._waiting:
+                self._in_flight += 1
+                self._waits[priority].append(0.0)
+                return True
+            return False
+
+    def release(self):
+        with self._cond:
+            self._in_flight -= 1
+            self._completed += 1
+            # Transfere a vaga diretamente para o próximo da fila (maior prioridade)
+            if self._waiting and self._in_flight < self.max_in_flight:
+                entry = heapq.heappop(self._waiting)
+                entry[2] = True
+                self._in_flight += 1
+                self._cond.notify_all()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                "max_in_flight": self.max_in_flight,
+                "in_flight": self._in_flight,
+                "queued": len(self._waiting),
+                "completed": self._completed,
+                "rejected": self._rejected,
+                "timed_out": self._timed_out,
+                "queue_wait": {
+                    priority: {
+                        "count": len(waits),
+                        "p50_seconds": _percentile(waits, 50),
+                        "p95_seconds": _percentile(waits, 95),
+                        "max_seconds": max(waits) if waits else None,
+                    }
+                    for priority, waits in self._waits.items()
+                },
+            }
+
+
+class LLMScheduler:
+    """Limita a concorrência por provedor e ordena a fila por prioridade."""
+
+    def __init__(self, scheduler_config: Optional[Dict[str, Any]] = None):
+        self.cfg = scheduler_config or config.LLM_SCHEDULER_CONFIG
+        self._lanes: Dict[str, _Lane] = {}
+        self._lock = threading.Lock()
+
+    def _lane(self, provider: str, provider_type: Optional[str] = None) -> _Lane:
+        with self._lock:
+            lane = self._lanes.get(provider)
+            if lane is None:
+                limits = self.cfg["max_in_flight"]
+                limit = limits.get(provider, limits.get(provider_type, limits.get("default", 4)))
+                lane = _Lane(provider, limit, self.cfg["max_queue"])
+                self._lanes[provider] = lane
+            return lane
+
+    def run(self, provider: str, fn: Callable[[], T], priority: str = "interactive",
+            timeout: Optional[float] = None, provider_type: Optional[str] = None,
+            deadline: Optional[Deadline] = None) -> T:
+        """
+        Executa `fn` quando houver vaga no provedor.
+
+        Args:
+            provider: Nome do provedor/endpoint (define o limite de concorrência)
+            fn: Chamada ao LLM (executada na thread do chamador)
+            priority: Classe de prioridade ("interactive" ou "batch")
+            timeout: Espera máxima na fila; padrão em queue_timeout_seconds[priority]
+            provider_type: Tipo do endpoint ("ollama", "gemini"), usado como limite
+                quando `provider` não tem entrada própria em max_in_flight
+            deadline: Prazo da consulta; a espera na fila não passa do tempo restante
+
+        Raises:
+            SchedulerRejectedError: fila cheia
+            SchedulerTimeoutError: espera na fila esgotada
+        """
+        release = self.reserve(provider, priority, timeout, provider_type, deadline)
+        try:
+            return fn()
+        finally:
+            release()
+
+    def reserve(self, provider: str, priority: str = "interactive", timeout: Optional[float] = None,
+                provider_type: Optional[str] = None, deadline: Optional[Deadline] = None,
+                wait: bool = True) -> Optional[Callable[[], None]]:
+        """
+        Reserva uma vaga no provedor na thread do chamador e devolve a função que a
+        libera. Permite executar a chamada em outra thread (ex.: o pool do roteador)
+        sem que a ordem de chegada ao pool passe por cima da prioridade e dos limites
+        da fila. Os argumentos são os de run().
+
+        Args:
+            wait: False devolve None em vez de entrar na fila quando não há vaga imediata
+
+        Raises:
+            SchedulerRejectedError: fila cheia
+            SchedulerTimeoutError: espera na fila esgotada
+        """
+        if priority not in PRIORITY_CLASSES:
+            raise ValueError(f"Classe de prioridade desconhecida: {priority}")
+        if timeout is None:
+            timeout = self.cfg["queue_timeout_seconds"].get(priority)
+        if deadline is not None:
+            timeout = deadline.budget(timeout)
+        lane = self._lane(provider, provider_type)
+        if not wait:
+            return lane.release if lane.try_acquire(priority) else None
+        lane.acquire(priority, timeout)
+        return lane.release
+
+    def get_stats(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            lanes = dict(self._lanes)
+        return {name: lane.stats() for name, lane in lanes.items()}
+
+
+_shared_scheduler: Optional[LLMScheduler] = None
+_shared_scheduler_lock = threading.Lock()
+
+
+def get_llm_scheduler() -> LLMScheduler:
+    """Retorna o escalonador compartilhado pelo processo."""
+    global _shared_scheduler
+    with _shared_scheduler_lock:
+        if _shared_scheduler is None:
+            _shared_scheduler = LLMScheduler()
+        return _shared_scheduler
@@ -0,0 +1,145 @@
+# src/rag_app/model_routing.py
+"""
+Roteamento do modelo de geração pela complexidade da consulta.
+
+Muitas perguntas são factuais e pontuais ("qual o prazo de inscrição?") e o
+contexto recuperado já traz a resposta num único trecho: um modelo pequeno
+responde bem e bem mais rápido. Perguntas longas, comparativas ou que exigem
+síntese de vários documentos continuam no modelo grande.
+
+A classificação roda antes de cada geração e custa microssegundos:
+  - tamanho da pergunta (palavras) e do contexto (caracteres);
+  - classes de palavras-chave ("simple" / "complex"), num único autômato
+    Aho-Corasick (keyword_matcher);
+  - perfil de distâncias: melhor distância e número de documentos distintos
+    entre os chunks próximos do melhor.
+
+As latências de geração são acompanhadas por rota (get_stats), para comparar o
+ganho do modelo pequeno com o custo do grande.
+"""
+
+import logging
+import threading
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional
+
+from . import config
+from .keyword_matcher import KeywordMatcher
+from .llm_router import ModelSelection
+from .llm_scheduler import _percentile
+
+logger = logging.getLogger(__name__)
+
+ROUTES = ("small", "large")
+
+
+class _RouteStats:
+    def __init__(self, window: int):
+        self.requests = 0
+        self.overrides = 0
+        self.errors = 0
+        self.latencies: Deque[float] = deque(maxlen=window)
+
+
+class QueryComplexityRouter:
+    """Escolhe a rota ("small" ou "large") de cada geração e mede a latência por rota."""
+
+    def __init__(self, routing_config: Optional[Dict[str, Any]] = None):
+        self.cfg = routing_config or config.LLM_MODEL_ROUTING_CONFIG
+        self.matcher = KeywordMatcher({
+            "simple": self.cfg.get("simple_keywords", []),
+            "complex": self.cfg.get("complex_keywords", []),
+        })
+        self._lock = threading.Lock()
+        self._stats = {route: _RouteStats(self.cfg.get("latency_window", 200)) for route in ROUTES}
+
+    def classify(self, query: str, context_items: List[Dict[str, Any]],
+                 override: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Classifica a consulta.
+
+        Args:
+            override: Rota forçada ("small" ou "large"); ignora os critérios
+
+        Returns:
+            {"route": "small"|"large", "reasons": [...], "features": {...}}
+        """
+        if override is not None:
+            if override not in ROUTES:
+                raise ValueError(f"Rota de modelo desconhecida: {override} (use {', '.join(ROUTES)})")
+            return {"route": override, "reasons": ["override"], "features": {}}
+        if not self.cfg.get("enabled", False):
+            return {"route": "large", "reasons": ["disabled"], "features": {}}
+
+        keyword_classes = self.matcher.match(query)
+        distances = [item.get('distance', 1.0) for item in context_items]
+        best_distance = min(distances) if distances else None
+        close_sources = set()
+        if distances:
+            margin = self.cfg["close_distance_margin"]
+            for item, distance in zip(context_items, distances):
+                if distance <= best_distance + margin:
+                    close_sources.add((item.get('metadata') or {}).get('source'))
+        features = {
+            "query_words": len(query.split()),
+            "context_chars": sum(len(item.get('document', '')) for item in context_items),
+            "best_distance": best_distance,
+            "close_sources": len(close_sources),
+            "simple_keywords": keyword_classes.get("simple", []),
+            "complex_keywords": keyword_classes.get("complex", []),
+        }
+
+        reasons = []
+        if features["complex_keywords"]:
+            reasons.append("complex_keywords")
+        if features["query_words"] > self.cfg["small_max_query_words"] and not features["simple_keywords"]:
+            reasons.append("long_query")
+        if not context_items:
+            reasons.append("no_context")
+        else:
+            if features["context_chars"] > self.cfg["small_max_context_chars"]:
+                reasons.append("long_context")
+            if best_distance > self.cfg["small_max_best_distance"]:
+                reasons.append("weak_evidence")
+            if features["close_sources"] > self.cfg["small_max_close_sources"]:
+                reasons.append("multiple_sources")
+
+        route = "large" if reasons else "small"
+        if not reasons:
+            reasons = ["simple_keywords"] if features["simple_keywords"] else ["short_query"]
+        if self.cfg.get("log_decisions", False):
+            logger.info(f"Rota de modelo para '{query[:50]}...': {route} ({', '.join(reasons)})")
+        return {"route": route, "reasons": reasons, "features": features}
+
+    def model_for(self, decision: Dict[str, Any]) -> Optional[ModelSelection]:
+        """Modelos da rota por tipo de provedor (None = modelo de cada endpoint)."""
+        if decision["reasons"] == ["disabled"]:
+            return None
+        return self.cfg["models"].get(decision["route"]) or None
+
+    def record(self, decision: Dict[str, Any], latency: float, ok: bool):
+        """Registra a latência de uma geração na rota escolhida."""
+        with self._lock:
+            stats = self._stats[decision["route"]]
+            stats.requests += 1
+            if decision["reasons"] == ["override"]:
+                stats.overrides += 1
+            if ok:
+                stats.latencies.append(latency)
+            else:
+                stats.errors += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            routes = {
+                route: {
+                    "model": self.cfg["models"].get(route) or "padrão do endpoint",
+                    "requests": stats.requests,
+                    "overrides": stats.overrides,
+                    "errors": stats.errors,
+                    "latency_p50_seconds": _percentile(stats.latencies, 50),
+                    "latency_p95_seconds": _percentile(stats.latencies, 95),
+                }
+                for route, stats in self._stats.items()
+            }
+        return {"enabled": bool(self.cfg.get("enabled", False)), "routes": routes}
@@ -0,0 +1,159 @@
+# src/rag_app/profiling.py
+"""
+Perfilamento sob demanda de consultas e de execuções de ingestão.
+
+Uma ProfileSession envolve a execução em cProfile e tracemalloc e grava, por
+execução, um arquivo .prof (abrir com pstats ou snakeviz) e um resumo .txt com
+as funções mais custosas, as maiores alocações e o pico de memória. Durante a
+ingestão também é registrado o pico de memória de cada documento. A codificação
+dos chunks é feita em lotes que misturam vários arquivos e aparece como uma
+etapa à parte ("<codificação shard>"); com o pool de processos de codificação
+(EMBEDDING_ENCODER_CONFIG["workers"] > 1) o tempo dessa etapa inclui os processos
+filhos, mas a memória deles não é rastreada pelo tracemalloc.
+
+Os ganchos só são ativados quando o perfilamento é pedido (PROFILING_CONFIG ou
+parâmetro profile=True); desligados, o custo é apenas um teste booleano.
+
+cProfile mede somente a thread que chamou (buscas externas especulativas e o
+roteador LLM rodam em outras threads e aparecem como espera). Como cProfile e
+tracemalloc são globais ao processo, só uma sessão roda por vez: pedidos
+simultâneos executam sem perfilamento.
+"""
+
+import cProfile
+import io
+import logging
+import os
+import pstats
+import re
+import threading
+import time
+import tracemalloc
+from typing import Any, Dict, List, Optional
+
+from . import config
+
+logger = logging.getLogger(__name__)
+
+_session_lock = threading.Lock()
+
+
+def _slug(text: str, max_length: int = 40) -> str:
+    return re.sub(r"[^\w]+", "_", text.lower()).strip("_")[:max_length] or "execucao"
+
+
+class ProfileSession:
+    """Sessão de perfilamento (CPU + memória) de uma execução."""
+
+    def __init__(self, kind: str, label: str, profiling_config: Optional[Dict[str, Any]] = None):
+        self.kind = kind
+        self.label = label
+        self.cfg = profiling_config or config.PROFILING_CONFIG
+        self.active = False
+        self.summary: Optional[Dict[str, Any]] = None
+        self._profiler: Optional[cProfile.Profile] = None
+        self._started_tracemalloc = False
+        self._start_time = 0.0
+        self._documents: List[Dict[str, Any]] = []
+        self._current_document: Optional[str] = None
+        self._document_start = 0.0
+
+    def __enter__(self) -> "ProfileSession":
+        if not _session_lock.acquire(blocking=False):
+            logger.warning(f"Outra sessão de perfilamento em andamento; '{self.label}' executará sem perfilamento")
+            return self
+        self.active = True
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.cfg["tracemalloc_frames"])
+            self._started_tracemalloc = True
+        tracemalloc.reset_peak()
+        self._profiler = cProfile.Profile()
+        self._start_time = time.perf_counter()
+        self._profiler.enable()
+        return self
+
+    def begin_document(self, document: str):
+        """Marca o início de um documento na ingestão (encerra a medição do anterior)."""
+        if not self.active:
+            return
+        self._end_document()
+        self._current_document = document
+        self._document_start = time.perf_counter()
+        tracemalloc.reset_peak()
+
+    def _end_document(self):
+        if self._current_document is None:
+            return
+        current, peak = tracemalloc.get_traced_memory()
+        self._documents.append({
+            "document": self._current_document,
+            "seconds": round(time.perf_counter() - self._document_start, 4),
+            "peak_memory_mb": round(peak / (1024 * 1024), 3),
+            "retained_memory_mb": round(current / (1024 * 1024), 3),
+        })
+        self._current_document = None
+
+    def __exit__(self, exc_type, exc, tb):
+        if not self.active:
+            return False
+        try:
+            self._profiler.disable()
+            elapsed = time.perf_counter() - self._start_time
+            self._end_document()
+            _, peak = tracemalloc.get_traced_memory()
+            snapshot = tracemalloc.take_snapshot()
+            if self._started_tracemalloc:
+                tracemalloc.stop()
+            self.summary = self._write_reports(elapsed, peak, snapshot)
+            logger.info(f"Perfil de {self.kind} '{self.label}' gravado em {self.summary['profile_path']}")
+        except Exception as e:
+            logger.error(f"Erro ao gravar perfil de {self.kind}: {e}", exc_info=True)
+        finally:
+            self.active = False
+            _session_lock.release()
+        return False
+
+    def _write_reports(self, elapsed: float, peak: int, snapshot) -> Dict[str, Any]:
+        output_dir = self.cfg["output_dir"]
+        os.makedirs(output_dir, exist_ok=True)
+        base = os.path.join(output_dir, f"{self.kind}_{time.strftime('%Y%m%d_%H%M%S')}_"
+                                        f"{int(time.time() * 1000) % 1000:03d}_{_slug(self.label)}")
+        profile_path = base + ".prof"
+        self._profiler.dump_stats(profile_path)
+
+        cpu_report = io.StringIO()
+        pstats.Stats(self._profiler, stream=cpu_report).sort_stats(self.cfg["sort_by"]).print_stats(
+            self.cfg["top_functions"])
+
+        top_n = self.cfg["top_allocations"]
+        allocations = [
+            {"location": str(stat.traceback[0]), "size_kb": round(stat.size / 1024, 1), "count": stat.count}
+            for stat in snapshot.statistics("lineno")[:top_n]
+        ]
+        documents = sorted(self._documents, key=lambda d: d["peak_memory_mb"], reverse=True)
+
+        summary_path = base + ".txt"
+        with open(summary_path, "w", encoding="utf-8") as f:
+            f.write(f"Perfil de {self.kind}: {self.label}\n")
+            f.write(f"Tempo total: {elapsed:.3f}s | Pico de memória (tracemalloc): {peak / (1024 * 1024):.2f} MB\n\n")
+            if documents:
+                f.write("Pico de memória por documento:\n")
+                for doc in documents:
+                    f.write(f"  {doc['peak_memory_mb']:>10.2f} MB  {doc['seconds']:>8.2f}s  {doc['document']}\n")
+                f.write("\n")
+            f.write(f"Maiores alocações (top {top_n}):\n")
+            for alloc in allocations:
+                f.write(f"  {alloc['size_kb']:>10.1f} KB  {alloc['count']:>7} blocos  {alloc['location']}\n")
+            f.write(f"\nFunções (ordenadas por {self.cfg['sort_by']}):\n")
+            f.write(cpu_report.getvalue())
+
+        return {
+            "kind": self.kind,
+            "label": self.label,
+            "seconds": round(elapsed, 4),
+            "peak_memory_mb": round(peak / (1024 * 1024), 3),
+            "profile_path": profile_path,
+            "summary_path": summary_path,
+            "top_allocations": allocations,
+            "documents": documents,
+        }
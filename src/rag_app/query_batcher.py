@@ -0,0 +1,113 @@
+# src/rag_app/query_batcher.py
+"""
+Micro-batching dinâmico das codificações de consultas.
+
+Com várias consultas simultâneas (ex.: um RAGCore compartilhado pelo rag_web ou
+pelo rag_server), cada uma faria sua própria chamada encode([consulta]):
+muitas passadas pequenas disputando as mesmas threads de CPU. O batcher reúne
+as consultas que chegam juntas e as codifica numa única passada.
+
+Funcionamento (líder/seguidores):
+  - quem chega e encontra o modelo livre vira líder e codifica o lote pendente;
+  - quem chega enquanto um lote está sendo codificado espera e entra no lote
+    seguinte (até max_batch_size consultas);
+  - o líder só espera a janela max_wait_ms quando há concorrência (ao chegar,
+    encontrou um lote em codificação ou consultas na fila). Um usuário sozinho
+    é codificado imediatamente, sem latência adicional.
+"""
+
+import logging
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from . import config
+
+logger = logging.getLogger(__name__)
+
+
+class _PendingQuery:
+    __slots__ = ("text", "vector", "error", "done")
+
+    def __init__(self, text: str):
+        self.text = text
+        self.vector: Optional[np.ndarray] = None
+        self.error: Optional[BaseException] = None
+        self.done = False
+
+
+class QueryEmbeddingBatcher:
+    """Agrupa codificações de consultas concorrentes de um mesmo modelo."""
+
+    def __init__(self, model, batch_config: Optional[Dict[str, Any]] = None):
+        self.model = model
+        cfg = batch_config or config.QUERY_EMBEDDING_BATCH_CONFIG
+        self.max_batch_size = cfg["max_batch_size"]
+        self.max_wait = cfg["max_wait_ms"] / 1000.0
+        self._cond = threading.Condition()
+        self._pending: List[_PendingQuery] = []
+        self._busy = False
+        self._stats = {"queries": 0, "batches": 0, "max_batch": 0, "waited_batches": 0}
+
+    def encode(self, text: str) -> np.ndarray:
+        """Codifica uma consulta (possivelmente junto com outras) e retorna seu vetor."""
+        request = _PendingQuery(text)
+        with self._cond:
+            now = time.monotonic()
+            # Concorrência: ao chegar, já havia um lote em codificação ou consultas na fila
+            concurrent = self._busy or bool(self._pending)
+            self._pending.append(request)
+            self._cond.notify_all()
+            while not request.done and self._busy:
+                self._cond.wait()
+            if request.done:
+                return self._result(request)
+
+            # Líder: o modelo está livre e esta consulta ainda não foi codificada
+            self._busy = True
+            if self.max_wait > 0 and concurrent:
+                deadline = now + self.max_wait
+                while len(self._pending) < self.max_batch_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                self._stats["waited_batches"] += 1
+            # O líder sempre entra no próprio lote; as demais seguem a ordem de chegada
+            self._pending.remove(request)
+            batch = [request] + self._pending[:self.max_batch_size - 1]
+            del self._pending[:self.max_batch_size - 1]
+
+        try:
+            vectors = self.model.encode([item.text for item in batch], batch_size=len(batch),
+                                        show_progress_bar=False, convert_to_numpy=True)
+            for item, vector in zip(batch, vectors):
+                item.vector = vector
+        except BaseException as e:
+            for item in batch:
+                item.error = e
+        finally:
+            with self._cond:
+                for item in batch:
+                    item.done = True
+                self._busy = False
+                self._stats["queries"] += len(batch)
+                self._stats["batches"] += 1
+                self._stats["max_batch"] = max(self._stats["max_batch"], len(batch))
+                self._cond.notify_all()
+        return self._result(request)
+
+    @staticmethod
+    def _result(request: _PendingQuery) -> np.ndarray:
+        if request.error is not None:
+            raise request.error
+        return request.vector
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._cond:
+            stats = dict(self._stats)
+            stats["pending"] = len(self._pending)
+        stats["mean_batch"] = round(stats["queries"] / stats["batches"], 2) if stats["batches"] else 0.0
+        return stats
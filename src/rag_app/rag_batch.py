@@ -1,8 +1,11 @@
 # src/rag_app/rag_batch_query.py (ou src/rag_app/rag_batch.py se você renomeou)
 
 import argparse
+import json
 import logging
+import os
 from datetime import datetime
+from typing import Dict, Iterator, Optional, Tuple
 
 # Importações corrigidas para usar referências relativas dentro do pacote 'rag_app'
 from .rag_core import RAGCore
@@ -12,23 +15,191 @@ logger = logging.getLogger(__name__)
 if not logger.handlers: # Evita adicionar handlers múltiplos
     logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 
-def run_batch_queries(input_file_path: str, output_file_path: str = None):
+
+def _iter_questions(input_file_path: str) -> Iterator[Tuple[int, str]]:
+    """Gera (número, pergunta) lendo o arquivo linha a linha (linhas vazias são ignoradas)."""
+    with open(input_file_path, 'r', encoding='utf-8') as f:
+        number = 0
+        for line in f:
+            question = line.strip()
+            if question:
+                number += 1
+                yield number, question
+
+
+def _record_error(record: Dict) -> Optional[str]:
+    """
+    Erro do registro. Só contam como respondidas as perguntas com resposta definitiva
+    (caminho "llm", "fallback:<motivo>" ou "gate:<motivo>"); as respostas degradadas
+    ("error:llm", "deadline:<etapa>") contam como erro e são refeitas com --resume.
+    """
+    if record.get("error"):
+        return record["error"]
+    path = record.get("path") or "llm"
+    if path == "llm" or path.startswith(("fallback:", "gate:")):
+        return None
+    return f"resposta degradada ({path})"
+
+
+def _load_completed(output_file_path: str) -> Dict[int, str]:
+    """
+    Lê um arquivo de saída JSONL existente e retorna {número: pergunta} das perguntas
+    respondidas sem erro nem degradação (ver _record_error). Uma última linha
+    incompleta (execução interrompida durante a gravação) é removida do arquivo.
+    """
+    completed: Dict[int, str] = {}
+    valid_size = 0
+    with open(output_file_path, 'rb') as f:
+        for raw_line in f:
+            try:
+                record = json.loads(raw_line.decode('utf-8'))
+            except (UnicodeDecodeError, json.JSONDecodeError):
+                if raw_line.endswith(b"\n"):
+                    logger.warning(f"Linha inválida ignorada em '{output_file_path}'")
+                    valid_size += len(raw_line)
+                    continue
+                break  # Última linha truncada
+            valid_size += len(raw_line)
+            if _record_error(record) is None:
+                completed[record["question_number"]] = record["question"]
+    if valid_size < os.path.getsize(output_file_path):
+        logger.warning(f"Removendo registro incompleto no final de '{output_file_path}'")
+        with open(output_file_path, 'r+b') as f:
+            f.truncate(valid_size)
+    return completed
+
+
+def _compact_output(output_file_path: str, keep: Dict[int, str]) -> int:
+    """
+    Reescreve o arquivo de saída só com um registro válido por pergunta de `keep`
+    ({número: pergunta}), descartando os que serão refeitos (erros, respostas
+    degradadas, perguntas alteradas) e duplicatas. Retorna quantas linhas saíram.
+    A troca é atômica (arquivo temporário + os.replace).
+    """
+    temp_path = output_file_path + ".tmp"
+    kept = set()
+    dropped = 0
+    with open(output_file_path, 'rb') as source, open(temp_path, 'wb') as target:
+        for raw_line in source:
+            try:
+                record = json.loads(raw_line.decode('utf-8'))
+            except (UnicodeDecodeError, json.JSONDecodeError):
+                dropped += 1
+                continue
+            number = record.get("question_number")
+            if (number in kept or keep.get(number) != record.get("question")
+                    or _record_error(record) is not None):
+                dropped += 1
+                continue
+            kept.add(number)
+            target.write(raw_line if raw_line.endswith(b"\n") else raw_line + b"\n")
+        target.flush()
+        os.fsync(target.fileno())
+    os.replace(temp_path, output_file_path)
+    return dropped
+
+
+def _batch_record(number: int, question: str, details: Dict, started_at: datetime, seconds: float) -> Dict:
+    """Registro JSONL de uma pergunta respondida."""
+    record = {
+        "question_number": number,
+        "question": question,
+        "answer": details["answer"],
+        "path": details.get("path"),
+        "model_route": (details.get("model_route") or {}).get("route"),
+        "used_external": details.get("used_external", False),
+        "coalesced": details.get("coalesced", False),
+        "started_at": started_at.isoformat(timespec="seconds"),
+        "seconds": round(seconds, 4),
+        "timings": {stage: round(value, 4) for stage, value in details.get("timings", {}).items()},
+        "retrieved": [{"id": item.get("id"), "distance": item.get("distance"),
+                       "source": item.get("source"), "page_number": item.get("page_number"),
+                       "shard": item.get("shard")}
+                      for item in details.get("retrieved", [])],
+        "error": None,
+    }
+    record["error"] = _record_error(record)
+    return record
+
+
+def _write_text_record(outfile, record: Dict):
+    """Formato texto legado (config.BATCH_CONFIG["output_format"] = "text")."""
+    outfile.write(f"Pergunta {record['question_number']}:\n")
+    outfile.write(f"P: {record['question']}\n")
+    outfile.write(f"R: {record['answer']}\n")
+    outfile.write("-" * 40 + "\n\n")
+
+
+def run_batch_queries(input_file_path: str, output_file_path: str = None, resume: bool = False,
+                      output_format: Optional[str] = None):
     """
     Lê perguntas de um arquivo, consulta o sistema RAG e opcionalmente salva os resultados.
+
+    As perguntas são lidas e os resultados gravados um a um (memória constante): cada
+    resposta é gravada assim que fica pronta, e uma interrupção perde no máximo a
+    pergunta em andamento. Com resume=True, as perguntas já respondidas no arquivo de
+    saída (JSONL) são puladas: o arquivo é antes compactado (saem os registros com erro,
+    degradados, de perguntas alteradas e duplicados) e os novos registros são
+    acrescentados ao final, de modo que cada pergunta tem um único registro.
     """
+    output_format = output_format or config.BATCH_CONFIG["output_format"]
+    if output_format not in ("jsonl", "text"):
+        logger.error(f"Formato de saída desconhecido: {output_format} (use jsonl ou text)")
+        return
+    if resume and (not output_file_path or output_format != "jsonl"):
+        logger.error("--resume exige um arquivo de saída no formato jsonl.")
+        return
+
     logger.info(f"Iniciando o processamento em lote do arquivo de perguntas: {input_file_path}")
 
+    try:
+        total_questions = sum(1 for _ in _iter_questions(input_file_path))
+        if not total_questions:
+            logger.warning(f"Nenhuma pergunta encontrada no arquivo de entrada: {input_file_path}")
+            return
+        logger.info(f"Encontradas {total_questions} perguntas em '{input_file_path}'.")
+    except FileNotFoundError:
+        logger.error(f"Arquivo de entrada não encontrado: {input_file_path}")
+        return
+    except Exception as e:
+        logger.error(f"Erro ao ler o arquivo de entrada '{input_file_path}': {e}", exc_info=True)
+        return
+
+    completed: Dict[int, str] = {}
+    if resume and os.path.exists(output_file_path):
+        try:
+            completed = _load_completed(output_file_path)
+        except Exception as e:
+            logger.error(f"Erro ao ler o arquivo de saída '{output_file_path}' para retomada: {e}", exc_info=True)
+            return
+        # Só valem as respostas cuja pergunta continua igual na entrada; o arquivo é
+        # compactado para que cada pergunta tenha um único registro ao final
+        completed = {number: question for number, question in _iter_questions(input_file_path)
+                     if completed.get(number) == question}
+        try:
+            dropped = _compact_output(output_file_path, completed)
+        except Exception as e:
+            logger.error(f"Erro ao compactar o arquivo de saída '{output_file_path}': {e}", exc_info=True)
+            return
+        if dropped:
+            logger.info(f"Retomada: {dropped} registro(s) a refazer ou duplicado(s) removido(s) de '{output_file_path}'.")
+        logger.info(f"Retomando: {len(completed)} pergunta(s) já respondida(s) em '{output_file_path}'.")
+        if len(completed) >= total_questions:
+            logger.info("Todas as perguntas já foram respondidas.")
+            return
+
     try:
         logger.info("Inicializando o RAGCore...")
         # RAGCore usará as configurações padrão de config.py se não forem passadas aqui
         rag_system = RAGCore(
             data_folder=config.DEFAULT_DATA_FOLDER,
             model_name=config.DEFAULT_EMBEDDING_MODEL,
-            ollama_model=config.DEFAULT_OLLAMA_MODEL
+            ollama_model=config.DEFAULT_OLLAMA_MODEL,
+            llm_priority="batch"  # Lote cede a vez às consultas interativas no escalonador
         )
         db_count = 0
         if hasattr(rag_system, 'collection') and rag_system.collection:
-            db_count = rag_system.collection.count()
+            db_count = rag_system.count_chunks()
 
         # Verifica se o RAGCore foi inicializado e processou documentos
         if db_count == 0 and \
@@ -41,66 +212,84 @@ def run_batch_queries(input_file_path: str, output_file_path: str = None):
         logger.error(f"Falha ao inicializar o RAGCore: {e}", exc_info=True)
         return
 
-    try:
-        with open(input_file_path, 'r', encoding='utf-8') as f:
-            questions = [line.strip() for line in f if line.strip()]
-        if not questions:
-            logger.warning(f"Nenhuma pergunta encontrada no arquivo de entrada: {input_file_path}")
+    outfile = None
+    if output_file_path:
+        try:
+            output_dir = os.path.dirname(output_file_path)
+            if output_dir:
+                os.makedirs(output_dir, exist_ok=True)
+            outfile = open(output_file_path, 'a' if resume else 'w', encoding='utf-8')
+        except Exception as e:
+            logger.error(f"Erro ao abrir o arquivo de saída '{output_file_path}': {e}", exc_info=True)
+            rag_system.close()
             return
-        logger.info(f"Lidas {len(questions)} perguntas de '{input_file_path}'.")
-    except FileNotFoundError:
-        logger.error(f"Arquivo de entrada não encontrado: {input_file_path}")
-        return
-    except Exception as e:
-        logger.error(f"Erro ao ler o arquivo de entrada '{input_file_path}': {e}", exc_info=True)
-        return
 
-    results_for_file = [] 
-    total_questions = len(questions)
+    fsync_every = max(1, config.BATCH_CONFIG["fsync_every"])
+    written = skipped = errors = 0
+    try:
+        for number, question in _iter_questions(input_file_path):
+            if completed.get(number) == question:
+                skipped += 1
+                continue
 
-    for i, question in enumerate(questions):
-        start_time_query = datetime.now()
-        logger.info(f"Processando pergunta {i+1}/{total_questions}: \"{question}\"")
-        print(f"\n{'-'*10} Pergunta {i+1}/{total_questions} {'-'*10}")
-        
-        timestamp_prefix = ""
-        if config.SHOW_CHAT_TIMESTAMPS:
-            timestamp_prefix = f"[{start_time_query.strftime('%Y-%m-%d %H:%M:%S')}] "
-        print(f"{timestamp_prefix}P: {question}")
+            start_time_query = datetime.now()
+            logger.info(f"Processando pergunta {number}/{total_questions}: \"{question}\"")
+            print(f"\n{'-'*10} Pergunta {number}/{total_questions} {'-'*10}")
 
-        try:
-            answer = rag_system.answer_query(question)
-            answer_timestamp_prefix = ""
-            if config.SHOW_CHAT_TIMESTAMPS:
-                answer_timestamp_prefix = f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] "
-            print(f"{answer_timestamp_prefix}R: {answer}")
-            results_for_file.append({"question_number": i+1, "question": question, "answer": answer})
-        except Exception as e:
-            error_message = f"Erro ao processar a pergunta \"{question}\": {e}"
-            logger.error(error_message, exc_info=True)
-            error_timestamp_prefix = ""
+            timestamp_prefix = ""
             if config.SHOW_CHAT_TIMESTAMPS:
-                error_timestamp_prefix = f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] "
-            print(f"{error_timestamp_prefix}R: ERRO - {e}")
-            results_for_file.append({"question_number": i+1, "question": question, "answer": f"ERRO: {e}"})
-        
-        end_time_query = datetime.now()
-        logger.info(f"Pergunta {i+1} processada em {(end_time_query - start_time_query).total_seconds():.2f} segundos.")
+                timestamp_prefix = f"[{start_time_query.strftime('%Y-%m-%d %H:%M:%S')}] "
+            print(f"{timestamp_prefix}P: {question}")
 
-    if output_file_path:
-        try:
-            with open(output_file_path, 'w', encoding='utf-8') as outfile:
-                for result in results_for_file:
-                    outfile.write(f"Pergunta {result['question_number']}:\n")
-                    outfile.write(f"P: {result['question']}\n")
-                    outfile.write(f"R: {result['answer']}\n")
-                    outfile.write("-" * 40 + "\n\n") 
-            logger.info(f"Resultados salvos em formato texto puro em: {output_file_path}")
-        except Exception as e:
-            logger.error(f"Erro ao salvar os resultados no arquivo '{output_file_path}': {e}", exc_info=True)
-            print(f"\nERRO ao salvar resultados em '{output_file_path}'. Verifique os logs.")
+            try:
+                details = rag_system.answer_query_with_details(question)
+                seconds = (datetime.now() - start_time_query).total_seconds()
+                record = _batch_record(number, question, details, start_time_query, seconds)
+                if record["error"]:
+                    errors += 1
+                answer_timestamp_prefix = ""
+                if config.SHOW_CHAT_TIMESTAMPS:
+                    answer_timestamp_prefix = f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] "
+                print(f"{answer_timestamp_prefix}R: {record['answer']}")
+            except Exception as e:
+                error_message = f"Erro ao processar a pergunta \"{question}\": {e}"
+                logger.error(error_message, exc_info=True)
+                error_timestamp_prefix = ""
+                if config.SHOW_CHAT_TIMESTAMPS:
+                    error_timestamp_prefix = f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] "
+                print(f"{error_timestamp_prefix}R: ERRO - {e}")
+                errors += 1
+                record = {"question_number": number, "question": question, "answer": f"ERRO: {e}",
+                          "started_at": start_time_query.isoformat(timespec="seconds"),
+                          "seconds": round((datetime.now() - start_time_query).total_seconds(), 4),
+                          "error": str(e)}
+
+            if outfile:
+                if output_format == "jsonl":
+                    outfile.write(json.dumps(record, ensure_ascii=False) + "\n")
+                else:
+                    _write_text_record(outfile, record)
+                outfile.flush()
+                written += 1
+                # Checkpoint: garante no disco os registros já gravados
+                if written % fsync_every == 0:
+                    os.fsync(outfile.fileno())
 
-    logger.info("Processamento em lote concluído.")
+            logger.info(f"Pergunta {number} processada em {record['seconds']:.2f} segundos.")
+    except KeyboardInterrupt:
+        logger.warning("Processamento em lote interrompido pelo usuário.")
+        if outfile and output_format == "jsonl":
+            logger.warning(f"Para continuar de onde parou: --resume -o {output_file_path}")
+    finally:
+        if outfile:
+            outfile.flush()
+            os.fsync(outfile.fileno())
+            outfile.close()
+            logger.info(f"Resultados salvos em formato {output_format} em: {output_file_path}")
+        rag_system.close()
+
+    logger.info(f"Processamento em lote concluído: {written} registro(s) gravado(s), "
+                f"{skipped} pulado(s) (já respondidos), {errors} erro(s).")
 
 def main():
     parser = argparse.ArgumentParser(
@@ -115,11 +304,22 @@ def main():
         "-o", "--output_file",
         type=str,
         default=None,
-        help="Caminho opcional para o arquivo de texto de saída onde as perguntas e respostas serão salvas."
+        help="Caminho opcional para o arquivo de saída (JSONL: um registro por pergunta, gravado assim que respondida)."
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Pula as perguntas já respondidas no arquivo de saída e acrescenta as demais."
+    )
+    parser.add_argument(
+        "--format",
+        choices=["jsonl", "text"],
+        default=None,
+        help=f"Formato da saída (padrão: {config.BATCH_CONFIG['output_format']})."
     )
-    
+
     args = parser.parse_args()
-    
+
     if config.PRINT_DEBUG_CHUNKS:
         logger.info("A depuração de chunks está ATIVADA (config.PRINT_DEBUG_CHUNKS=True).")
     else:
@@ -130,10 +330,10 @@ def main():
         logger.info("Timestamps de chat DESATIVADOS (config.SHOW_CHAT_TIMESTAMPS=False).")
 
 
-    run_batch_queries(args.input_file, args.output_file)
+    run_batch_queries(args.input_file, args.output_file, resume=args.resume, output_format=args.format)
 
 if __name__ == "__main__":
     # Para executar este script da raiz do projeto:
     # python -m src.rag_app.rag_batch_query <argumentos>
     # (ou src.rag_app.rag_batch se você renomeou o arquivo)
-    main()
\ No newline at end of file
+    main()
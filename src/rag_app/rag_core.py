@@ -1,16 +1,31 @@
 # src/rag_app/rag_core.py
 
 import os
-from sentence_transformers import SentenceTransformer
+import re
+import hashlib
 import numpy as np
-import ollama
 import logging
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Callable, Optional, Set, Tuple
 import json
 import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError, wait
 
 from . import config
-import chromadb
+from .keyword_matcher import build_external_knowledge_matcher
+from .single_flight import SingleFlight
+from .deadline import Deadline, DeadlineExceeded
+from .llm_scheduler import get_llm_scheduler, SchedulerRejectedError
+from .llm_router import LLMRouter, build_endpoints
+from .model_routing import ROUTES, QueryComplexityRouter
+from .profiling import ProfileSession
+from .index_manifest import IndexManifest, chunk_hash, default_manifest_path, file_sha256
+from .encoding_engine import EncodingEngine
+from .extraction_cache import ExtractionCache
+from .chunk_dedup import MinHasher, NearDuplicateIndex, dedup_config_key
+from .embedding_models import SharedEmbeddingModel, get_embedding_model_registry
+from .index_snapshot import IndexSnapshot, write_snapshot
+from .retrieval_worker import RetrievalWorkerClient, RetrievalWorkerError
 
 # Importação do sistema de conhecimento externo
 try:
@@ -20,20 +35,44 @@ except ImportError:
     ExternalKnowledgeProvider = None
     EXTERNAL_KNOWLEDGE_AVAILABLE = False
 
-# Importações condicionais para Gemini
-try:
-    import google.generativeai as genai
-    from google.generativeai.types import GenerationConfig
-    GEMINI_AVAILABLE = True
-except ImportError:
-    GEMINI_AVAILABLE = False
-    genai = None
-    GenerationConfig = None
+# Versão do formato dos chunks gerados na ingestão. Arquivos indexados com outra versão
+# são reprocessados (2: tabelas como chunks Markdown separados, com content_type;
+# 3: página inicial e final reais de cada chunk de texto, em page_number e page_end).
+INGESTION_VERSION = 3
+
+# Versão do extrator de PDF (texto por página + tabelas). Faz parte da chave do cache de
+# extração: altere-a sempre que _extract_pdf passar a produzir um resultado diferente.
+PDF_EXTRACTOR_VERSION = 1
+
+# Shard dos arquivos na raiz da pasta de dados (coleção CHROMA_COLLECTION_NAME)
+ROOT_SHARD = "_principal"
 
 logger = logging.getLogger(__name__)
 if not logger.handlers:
     logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 
+
+class LLMUnavailableError(Exception):
+    """A chamada ao LLM falhou; `response` é a mensagem de erro exibida ao usuário."""
+
+    def __init__(self, response: str):
+        super().__init__(response)
+        self.response = response
+
+
+class _WorkerShard:
+    """Shard do índice mantido pelo worker de recuperação (nome da coleção e contagem de chunks)."""
+
+    def __init__(self, client: RetrievalWorkerClient, shard: str, name: str):
+        self._client = client
+        self.shard = shard
+        self.name = name
+
+    def count(self) -> int:
+        entry = self._client.info()["shards"].get(self.shard)
+        return entry["chunks"] if entry else 0
+
+
 class RAGCore:
     # ... (__init__ e todos os outros métodos que não _load_or_process_documents
     #      permanecem OS MESMOS da última versão completa que você tem) ...
@@ -41,70 +80,244 @@ class RAGCore:
     def __init__(self,
                  data_folder: str = config.DEFAULT_DATA_FOLDER,
                  model_name: str = config.DEFAULT_EMBEDDING_MODEL,
-                 ollama_model: str = config.DEFAULT_OLLAMA_MODEL):
+                 ollama_model: str = config.DEFAULT_OLLAMA_MODEL,
+                 llm_priority: str = "interactive",
+                 chroma_db_path: str = config.CHROMA_DB_PATH,
+                 collection_name: str = config.CHROMA_COLLECTION_NAME,
+                 manifest_path: Optional[str] = None,
+                 snapshot_path: Optional[str] = None,
+                 chunk_size: int = config.DEFAULT_CHUNK_SIZE,
+                 chunk_overlap: int = config.DEFAULT_CHUNK_OVERLAP,
+                 retrieval_worker: Optional[str] = None):
         self.data_folder = data_folder
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        # Local do índice (padrão: config.py); benchmarks e avaliações usam índices isolados
+        self.chroma_db_path = chroma_db_path
+        self.collection_name = collection_name
+        # Manifesto do índice (padrão: dentro de chroma_db_path, um por coleção)
+        self.manifest_path = manifest_path or config.INDEX_MANIFEST_CONFIG["path"] or \
+            default_manifest_path(chroma_db_path, collection_name)
+        # Modo réplica: índice somente leitura carregado de um snapshot (index_snapshot.py)
+        self.snapshot_path = snapshot_path or config.INDEX_SNAPSHOT_CONFIG["replica_path"]
+        self.snapshot: Optional[IndexSnapshot] = None
+        # Modo cliente: modelo de embedding e índice ficam no worker de recuperação
+        # (retrieval_worker.py); "" força o índice local mesmo com RAG_RETRIEVAL_WORKER
+        self.retrieval_worker_address = (config.RETRIEVAL_WORKER_CONFIG["address"]
+                                         if retrieval_worker is None else retrieval_worker) or None
+        self.retrieval_client: Optional[RetrievalWorkerClient] = None
+        # Classe de prioridade das chamadas ao LLM ("interactive" ou "batch")
+        self.llm_priority = llm_priority
+        self.llm_scheduler = get_llm_scheduler()
         self.configured_ollama_model = ollama_model
         self.configured_embedding_model_name = model_name
         self.processed_pdf_files = []
+
+        # Contadores do portão de relevância (chamadas ao LLM evitadas)
+        self._stats_lock = threading.Lock()
+        self.gate_stats = {"evaluated": 0, "llm_calls_saved": 0,
+                           "low_relevance": 0, "insufficient_context": 0}
+        # Consultas degradadas por prazo esgotado, por etapa (QUERY_DEADLINE_CONFIG)
+        self.deadline_stats = {"retrieval": 0, "generation": 0, "external_wait": 0, "coalesced": 0,
+                               "partial_answers": 0}
+
+        # Versão do índice: incrementada sempre que o conteúdo do ChromaDB muda.
+        # Consultas idênticas simultâneas na mesma versão compartilham uma única execução.
+        self.index_version = 0
+        self._single_flight = SingleFlight()
+        # Resumo da última ingestão perfilada (PROFILING_CONFIG["ingestion"])
+        self.last_ingestion_profile: Optional[Dict[str, Any]] = None
         
         # Inicializa o provedor LLM baseado na configuração
         self._initialize_llm_provider()
+
+        # Compila uma única vez todas as listas de palavras-chave de EXTERNAL_KNOWLEDGE_CONFIG
+        self.keyword_matcher = build_external_knowledge_matcher(config.EXTERNAL_KNOWLEDGE_CONFIG)
         
         # Inicializa o sistema de conhecimento externo
         if config.ALLOW_EXTERNAL_KNOWLEDGE and EXTERNAL_KNOWLEDGE_AVAILABLE:
-            self.external_provider = ExternalKnowledgeProvider()
+            self.external_provider = ExternalKnowledgeProvider(keyword_matcher=self.keyword_matcher)
+            # Buscas externas especulativas rodam em paralelo com a geração do LLM
+            self._external_executor = ThreadPoolExecutor(
+                max_workers=config.EXTERNAL_KNOWLEDGE_CONFIG["speculative_workers"],
+                thread_name_prefix="rag-external")
             logger.info("Sistema de conhecimento externo inicializado")
         else:
             self.external_provider = None
             if config.ALLOW_EXTERNAL_KNOWLEDGE:
                 logger.warning("Conhecimento externo habilitado mas módulo não disponível")
         
-        logger.info(f"Usando modelo de embedding: {self.configured_embedding_model_name}")
+        # Consultas em paralelo nos shards do índice
+        self._shard_executor = ThreadPoolExecutor(
+            max_workers=config.INDEX_SHARDING_CONFIG["max_parallel_queries"],
+            thread_name_prefix="rag-shard")
+
+        # Modelos compartilhados com os demais RAGCore do processo (embedding_models.py)
+        self.embedding_registry = get_embedding_model_registry()
+        # Modelos em uso por nome. Durante uma migração, a coleção antiga continua sendo
+        # consultada com o modelo que a gerou.
+        self._embedding_models: Dict[str, SharedEmbeddingModel] = {}
+        self.embedding_model_st: Optional[SharedEmbeddingModel] = None
+        self._embedding_models_lock = threading.Lock()
+        self._encoding_engines: Dict[str, EncodingEngine] = {}
+        self.chroma_client = None
+        self.index_manifest: Optional[IndexManifest] = None
+        self.extraction_cache: Optional[ExtractionCache] = None
+
+        # Falha a partir daqui (modelo, ChromaDB, manifesto, ingestão): devolve o que já
+        # foi adquirido (modelo no registro, threads, manifesto, cache) antes de propagar
         try:
-            self.embedding_model_st = SentenceTransformer(self.configured_embedding_model_name)
-            logger.info(f"Modelo SentenceTransformer '{self.configured_embedding_model_name}' carregado.")
-        except Exception as e:
-            logger.error(f"Erro crítico ao carregar o modelo SentenceTransformer '{self.configured_embedding_model_name}': {e}", exc_info=True)
+            self._initialize_index()
+        except BaseException:
+            self.close()
             raise
-        logger.info(f"Inicializando ChromaDB em: {config.CHROMA_DB_PATH} com coleção: {config.CHROMA_COLLECTION_NAME}")
+
+    def _initialize_index(self):
+        """Carrega o modelo de embedding e abre o índice (local, réplica ou worker)."""
+        if not self.retrieval_worker_address:
+            logger.info(f"Usando modelo de embedding: {self.configured_embedding_model_name}")
+            try:
+                self.embedding_model_st = self.embedding_registry.acquire(
+                    self.configured_embedding_model_name, config.EMBEDDING_MODEL_BACKEND, config.EMBEDDING_MODEL_DEVICE)
+                logger.info(f"Modelo SentenceTransformer '{self.configured_embedding_model_name}' carregado.")
+            except Exception as e:
+                logger.error(f"Erro crítico ao carregar o modelo SentenceTransformer '{self.configured_embedding_model_name}': {e}", exc_info=True)
+                raise
+            self._embedding_models[self.configured_embedding_model_name] = self.embedding_model_st
+        # Modelo de embedding de cada coleção (nome da coleção -> modelo)
+        self._collection_models: Dict[str, str] = {}
+        # Ingestão, reconstrução e troca de coleção ao fim de uma migração são serializadas
+        self._index_lock = threading.RLock()
+        self._migration_threads: Dict[str, threading.Thread] = {}
+        # Deduplicação de chunks quase idênticos (CHUNK_DEDUP_CONFIG). Os índices LSH de cada
+        # shard são montados a partir do manifesto durante a ingestão e descartados ao final.
+        self._dedup_key = dedup_config_key(config.CHUNK_DEDUP_CONFIG)
+        self._minhasher = MinHasher(config.CHUNK_DEDUP_CONFIG["num_perm"],
+                                    config.CHUNK_DEDUP_CONFIG["shingle_words"]) if self._dedup_key else None
+        self._dedup_indexes: Dict[str, NearDuplicateIndex] = {}
+
+        if self.retrieval_worker_address:
+            self._connect_retrieval_worker()
+            return
+        if self.snapshot_path:
+            self._open_snapshot_replica()
+            return
+
+        logger.info(f"Inicializando ChromaDB em: {self.chroma_db_path} com coleção: {self.collection_name}")
         try:
-            self.chroma_client = chromadb.PersistentClient(path=config.CHROMA_DB_PATH)
-            self.collection = self.chroma_client.get_or_create_collection(name=config.CHROMA_COLLECTION_NAME)
-            logger.info(f"Conectado/Criado coleção ChromaDB: '{config.CHROMA_COLLECTION_NAME}'.")
+            import chromadb
+            self.chroma_client = chromadb.PersistentClient(path=self.chroma_db_path)
+            self.index_manifest = IndexManifest(self.manifest_path)
+            logger.info(f"Manifesto do índice: {self.manifest_path}")
+            if config.EXTRACTION_CACHE_CONFIG["enabled"]:
+                self.extraction_cache = ExtractionCache(config.EXTRACTION_CACHE_CONFIG["path"],
+                                                        config.EXTRACTION_CACHE_CONFIG["max_size_mb"])
+            self._recover_interrupted_migrations()
+            # Coleção por shard; a coleção principal é o shard ROOT_SHARD
+            self.shard_collections: Dict[str, Any] = {}
+            self._import_legacy_status()
+            pending_migrations = self._check_embedding_models()
+            self.collection = self._get_shard_collection(ROOT_SHARD)
+            logger.info(f"Conectado/Criado coleção ChromaDB: '{self.collection.name}'.")
         except Exception as e:
             logger.error(f"Erro ao inicializar ChromaDB: {e}", exc_info=True)
             raise
+        self.index_version = self.index_manifest.index_version()
         self._ensure_data_folder()
         self._load_or_process_documents()
+        for shard in pending_migrations:
+            self.migrate_embedding_model(shard)
+
+    def _open_snapshot_replica(self):
+        """Abre o índice a partir de um snapshot (somente leitura; sem ChromaDB nem ingestão)."""
+        logger.info(f"Modo réplica: carregando snapshot '{self.snapshot_path}'")
+        start = time.perf_counter()
+        self.snapshot = IndexSnapshot(self.snapshot_path, config.INDEX_SNAPSHOT_CONFIG["verify_checksum"])
+        self.chroma_client = None
+        self.index_manifest = None
+        self.shard_collections = dict(self.snapshot.collections)
+        for shard, collection in self.shard_collections.items():
+            self._collection_models[collection.name] = self.snapshot.embedding_model(shard)
+        self.collection = self.shard_collections.get(ROOT_SHARD)
+        self.index_version = self.snapshot.manifest["index_version"]
+        self.processed_pdf_files = sorted(self._status_key(row["shard"], row["filename"])
+                                          for row in self.snapshot.manifest["files"])
+        logger.info(f"Snapshot carregado em {time.perf_counter() - start:.2f}s: {self.count_chunks()} chunks "
+                    f"em {len(self.shard_collections)} shard(s).")
+
+    def _connect_retrieval_worker(self):
+        """Modo cliente: recuperação e embeddings no worker (sem modelo local nem ChromaDB)."""
+        logger.info(f"Modo cliente: usando o worker de recuperação em '{self.retrieval_worker_address}'")
+        start = time.perf_counter()
+        self.retrieval_client = RetrievalWorkerClient(self.retrieval_worker_address)
+        self.chroma_client = None
+        self.index_manifest = None
+        self._worker_info_lock = threading.Lock()
+        try:
+            info = self._refresh_worker_info()
+        except Exception:
+            self.retrieval_client.close()
+            raise
+        if info["embedding_model"] != self.configured_embedding_model_name:
+            logger.info(f"Modelo de embedding do worker: '{info['embedding_model']}' "
+                        f"(ignorando '{self.configured_embedding_model_name}')")
+        self.configured_embedding_model_name = info["embedding_model"]
+        logger.info(f"Conectado ao worker em {time.perf_counter() - start:.2f}s: {self.count_chunks()} chunks "
+                    f"em {len(self.shard_collections)} shard(s).")
+
+    def _refresh_worker_info(self) -> Dict[str, Any]:
+        """Atualiza shards, arquivos e versão do índice a partir do worker."""
+        info = self.retrieval_client.info()
+        with self._worker_info_lock:
+            self.shard_collections = {shard: _WorkerShard(self.retrieval_client, shard, entry["collection"])
+                                      for shard, entry in info["shards"].items()}
+            self._collection_models = {entry["collection"]: entry["embedding_model"]
+                                       for entry in info["shards"].values()}
+            self.collection = self.shard_collections.get(ROOT_SHARD)
+            self.processed_pdf_files = info["processed_files"]
+            self.index_version = info["index_version"]
+        return info
+
+    def _sync_worker_index(self, index_version: int):
+        """O índice do worker mudou (ingestão, migração): recarrega a lista de shards e arquivos."""
+        if index_version != self.index_version:
+            logger.info(f"Índice do worker atualizado (versão {self.index_version} -> {index_version}).")
+            try:
+                self._refresh_worker_info()
+            except RetrievalWorkerError as e:
+                logger.warning(f"Erro ao atualizar informações do worker de recuperação: {e}")
+
+    def _require_writable_index(self):
+        if self.snapshot is not None:
+            raise ValueError(f"Índice somente leitura (réplica do snapshot '{self.snapshot_path}').")
+        if self.retrieval_client is not None:
+            raise ValueError(f"Índice remoto (worker de recuperação em '{self.retrieval_worker_address}'): "
+                             f"ingestão e manutenção são feitas no próprio worker.")
+
+    def export_snapshot(self, path: str) -> Dict[str, Any]:
+        """Grava o índice atual (vetores, documentos, metadados e manifesto) num snapshot portátil."""
+        self._require_writable_index()
+        with self._index_lock:
+            shards = [(shard, collection, self._collection_models[collection.name])
+                      for shard, collection in sorted(self.shard_collections.items())]
+            return write_snapshot(path, shards, self.index_manifest.export_state(), metadata={
+                "collection_name": self.collection_name,
+                "chunk_size": self.chunk_size,
+                "chunk_overlap": self.chunk_overlap,
+                "ingestion_version": INGESTION_VERSION,
+            })
 
     def _initialize_llm_provider(self):
-        """Inicializa o provedor LLM baseado na configuração."""
-        if config.LLM_PROVIDER == "gemini":
-            if not GEMINI_AVAILABLE:
-                raise ImportError(
-                    "Google Generative AI não está instalado. "
-                    "Execute: pip install google-generativeai"
-                )
-            
-            # Configura a API do Google Gemini
-            api_key = config.GOOGLE_API_KEY or os.getenv('GOOGLE_API_KEY')
-            if not api_key:
-                raise ValueError(
-                    "Chave da API do Google não encontrada. "
-                    "Defina GOOGLE_API_KEY como variável de ambiente ou em config.py"
-                )
-            
-            genai.configure(api_key=api_key)
-            self.gemini_model = genai.GenerativeModel(config.GEMINI_MODEL)
-            logger.info(f"Google Gemini inicializado com modelo: {config.GEMINI_MODEL}")
-            
-        elif config.LLM_PROVIDER == "ollama":
-            logger.info(f"Ollama configurado com modelo: {self.configured_ollama_model}")
-            
-        else:
-            raise ValueError(f"Provedor LLM desconhecido: {config.LLM_PROVIDER}")
-            
-        self.llm_provider = config.LLM_PROVIDER
+        """Inicializa o roteador LLM com os endpoints da configuração."""
+        endpoints = build_endpoints(config.LLM_ENDPOINTS, self.configured_ollama_model)
+        self.llm_router = LLMRouter(endpoints, self.llm_scheduler)
+        # Modelo pequeno/grande conforme a complexidade da consulta (LLM_MODEL_ROUTING_CONFIG)
+        self.model_router = QueryComplexityRouter()
+        for endpoint in endpoints:
+            logger.info(f"Endpoint LLM configurado: {endpoint.describe()}")
+
+        # Provedor exibido nos front-ends: o do primeiro endpoint, ou "router" se houver vários
+        self.llm_provider = endpoints[0].provider if len(endpoints) == 1 else "router"
 
     def _ensure_data_folder(self):
         if not os.path.exists(self.data_folder):
@@ -112,29 +325,14 @@ class RAGCore:
             os.makedirs(self.data_folder)
             logger.info(f"Pasta '{self.data_folder}' criada.")
 
-    def _load_processed_files_status(self) -> Dict[str, Dict[str, Any]]:
-        try:
-            if os.path.exists(config.PROCESSED_FILES_STATUS_JSON):
-                with open(config.PROCESSED_FILES_STATUS_JSON, 'r', encoding='utf-8') as f:
-                    return json.load(f)
-            return {}
-        except Exception as e:
-            logger.warning(f"Não foi possível carregar status: {e}. Reprocessando tudo.")
-            return {}
-
-    def _save_processed_files_status(self, status: Dict[str, Dict[str, Any]]):
-        try:
-            with open(config.PROCESSED_FILES_STATUS_JSON, 'w', encoding='utf-8') as f:
-                json.dump(status, f, indent=4)
-            logger.info(f"Status dos arquivos processados salvo.")
-        except Exception as e:
-            logger.error(f"Erro ao salvar status: {e}", exc_info=True)
-
     def _markdown_from_table(self, table_data: List[List[str]]) -> str:
         if not table_data: return ""
-        header = [str(h).replace('\n', ' ').strip() if h is not None else '' for h in table_data[0]]
+        def cell_text(cell):
+            return str(cell).replace('\n', ' ').replace('|', '\\|').strip() if cell is not None else ''
+        header = [cell_text(h) for h in table_data[0]]
         align = [":---" for _ in header]
-        rows = [[str(cell).replace('\n', ' ').strip() if cell is not None else '' for cell in row] for row in table_data]
+        rows = [[cell_text(cell) for cell in row] for row in table_data]
+        if not any(cell for row in rows for cell in row): return ""
         md_lines = ["| " + " | ".join(header) + " |", "| " + " | ".join(align) + " |"]
         for row in rows[1:]:
             if len(row) != len(header): continue
@@ -143,186 +341,915 @@ class RAGCore:
 
     def _chunk_text(self, text: str, chunk_size: int = config.DEFAULT_CHUNK_SIZE, overlap: int = config.DEFAULT_CHUNK_OVERLAP) -> List[str]:
         words = text.split()
-        if not words: return []
-        chunks_list = []
-        current_chunk_words = []
-        current_length = 0
+        return [" ".join(words[start:end]) for start, end in self._chunk_word_spans(words, chunk_size, overlap)]
+
+    @staticmethod
+    def _chunk_word_spans(words: List[str], chunk_size: int, overlap: int) -> List[Tuple[int, int]]:
+        """Intervalos [início, fim) de palavras de cada chunk (com sobreposição aproximada)."""
+        spans = []
+        start, current_length = 0, 0
         approx_overlap_word_count = max(0, int(overlap / 6)) if overlap > 0 else 0
-        idx = 0
-        while idx < len(words):
-            word = words[idx]
-            word_len_to_add = len(word) + (1 if current_chunk_words else 0)
-            if current_length + word_len_to_add > chunk_size and current_chunk_words:
-                chunks_list.append(" ".join(current_chunk_words))
-                if approx_overlap_word_count > 0:
-                    overlap_start_index = max(0, len(current_chunk_words) - approx_overlap_word_count)
-                    current_chunk_words = current_chunk_words[overlap_start_index:]
-                else:
-                    current_chunk_words = []
-                current_length = len(" ".join(current_chunk_words)) if current_chunk_words else 0
-            current_chunk_words.append(word)
+        for idx, word in enumerate(words):
+            word_len_to_add = len(word) + (1 if idx > start else 0)
+            if current_length + word_len_to_add > chunk_size and idx > start:
+                spans.append((start, idx))
+                start = max(start, idx - approx_overlap_word_count) if approx_overlap_word_count > 0 else idx
+                current_length = len(" ".join(words[start:idx]))
             current_length += word_len_to_add
-            idx += 1
-        if current_chunk_words:
-            chunks_list.append(" ".join(current_chunk_words))
-        return [chunk for chunk in chunks_list if chunk.strip()]
+        if start < len(words):
+            spans.append((start, len(words)))
+        return spans
+
+    @staticmethod
+    def _word_pages(words: List[str], page_numbers: List[int]) -> List[int]:
+        """Página de cada palavra, a partir dos marcadores "[Página N]" inseridos na extração do PDF."""
+        known_pages = set(page_numbers)
+        current = page_numbers[0]
+        pages = []
+        for idx, word in enumerate(words):
+            if word == "[Página" and idx + 1 < len(words):
+                match = re.fullmatch(r"(\d+)\]", words[idx + 1])
+                if match and int(match.group(1)) in known_pages:
+                    current = int(match.group(1))
+            pages.append(current)
+        return pages
 
     def _create_chunks(self, text, filename=None, page_numbers=None):
-        """Cria chunks de texto e seus metadados"""
-        chunks = self._chunk_text(text)
+        """
+        Cria chunks de texto e seus metadados. page_number é a página em que o chunk
+        começa e page_end a página em que termina (chunks que cruzam páginas).
+        """
+        words = text.split()
+        spans = self._chunk_word_spans(words, self.chunk_size, self.chunk_overlap)
+        word_pages = self._word_pages(words, page_numbers) if page_numbers else None
         chunks_with_metadata = []
         
-        for i, chunk in enumerate(chunks):
-            # Determinar página para este chunk (distribuição aproximada)
-            chunk_page = "N/A"
-            if page_numbers and len(page_numbers) > 0:
-                # Distribuir chunks pelas páginas proporcionalmente
-                chunk_position = i / len(chunks) if len(chunks) > 1 else 0
-                page_index = min(int(chunk_position * len(page_numbers)), len(page_numbers) - 1)
-                chunk_page = page_numbers[page_index]
+        for i, (start, end) in enumerate(spans):
+            chunk = " ".join(words[start:end])
+            chunk_page, chunk_page_end = "N/A", "N/A"
+            if word_pages:
+                # O marcador no fim do chunk já pertence à próxima página
+                last = end - 1
+                while last > start and (words[last] == "[Página" or
+                                        (words[last - 1] == "[Página" and words[last].endswith("]"))):
+                    last -= 1
+                chunk_page, chunk_page_end = word_pages[start], word_pages[last]
             
             chunk_metadata = {
                 "chunk_index": i,
                 "chunk_length": len(chunk),
                 "source": filename or "processed_document",
-                "page_number": chunk_page
+                "page_number": chunk_page,
+                "page_end": chunk_page_end,
+                "content_type": "text",
             }
             chunks_with_metadata.append({
+                "id": f"{filename}_chunk_{i}",
                 "text": chunk,
                 "metadata": chunk_metadata
             })
         
         return chunks_with_metadata
     
-    def _load_or_process_documents(self):
+    def _load_or_process_documents(self, profile: Optional[bool] = None):
         """
         Processa PDFs, extraindo texto comum e tabelas separadamente,
         e os adiciona ao ChromaDB.
+
+        Com profile=True (padrão em PROFILING_CONFIG["ingestion"]) a execução é perfilada
+        e o resumo, com o pico de memória por documento, fica em self.last_ingestion_profile.
+        """
+        if profile is None:
+            profile = config.PROFILING_CONFIG["ingestion"]
+        if profile:
+            with ProfileSession("ingestion", self.data_folder) as session:
+                self._process_documents(session)
+            self.last_ingestion_profile = session.summary
+        else:
+            self._process_documents(None)
+
+    def _process_documents(self, profile_session: Optional[ProfileSession]):
+        self._require_writable_index()
+        with self._index_lock:
+            self._process_documents_locked(profile_session)
+
+    def _flush_pending_files(self, shard: str, collection, encoder: EncodingEngine,
+                             pending_files: List[Dict[str, Any]]):
         """
-        processed_status = self._load_processed_files_status()
-        new_or_updated_processed_status = processed_status.copy()
+        Codifica de uma vez os chunks alterados dos arquivos pendentes e grava cada arquivo
+        (ChromaDB + manifesto). Uma falha afeta apenas os arquivos deste lote, que continuam
+        marcados como pendentes no manifesto e são reprocessados na próxima execução.
+
+        Com a deduplicação ativa, os chunks quase idênticos a um chunk canônico do shard
+        não são codificados nem gravados no ChromaDB (ver _plan_deduplication).
+        """
+        manifest = self.index_manifest
+        try:
+            promotions, demoted, touched = self._plan_deduplication(shard, pending_files)
+        except Exception as e:
+            self._dedup_indexes.pop(shard, None)
+            logger.error(f"Erro na deduplicação de {len(pending_files)} arquivo(s) do shard '{shard}': {e}",
+                         exc_info=True)
+            return
+        texts = [promoted["document"] for promoted, _ in promotions] + \
+            [item["text"] for pending in pending_files for item in pending["changed"]]
+        try:
+            embeddings = encoder.encode(texts) if texts else None
+        except Exception as e:
+            self._dedup_indexes.pop(shard, None)
+            logger.error(f"Erro ao gerar embeddings de {len(pending_files)} arquivo(s) do shard '{shard}': {e}",
+                         exc_info=True)
+            return
+        offset = 0
+        for promoted, repointed in promotions:
+            try:
+                # A cópia de outro arquivo assume o lugar do chunk canônico que deixou de existir
+                collection.upsert(ids=[promoted["chunk_id"]], embeddings=embeddings[offset:offset + 1].tolist(),
+                                  documents=[promoted["document"]], metadatas=[promoted["metadata"]])
+                manifest.promote_duplicate(shard, promoted["chunk_id"], repointed)
+            except Exception as e:
+                self._dedup_indexes.pop(shard, None)
+                logger.error(f"Erro ao promover a duplicata '{promoted['chunk_id']}': {e}", exc_info=True)
+            offset += 1
+        for pending in pending_files:
+            document_file, changed = pending["document_file"], pending["changed"]
+            try:
+                if pending["previous_hashes"]:
+                    if pending["delete_ids"]:
+                        collection.delete(ids=pending["delete_ids"])
+                else:
+                    collection.delete(where={"source": document_file})
+
+                if changed:
+                    collection.upsert(
+                        ids=[item["id"] for item in changed],
+                        embeddings=embeddings[offset:offset + len(changed)].tolist(),
+                        documents=[item["text"] for item in changed],
+                        metadatas=[item["metadata"] for item in changed]
+                    )
+                if pending["chunks"]:
+                    duplicates_note = f" ({len(pending['duplicates'])} quase duplicatas)" if pending["duplicates"] else ""
+                    logger.info(f"Adicionados/Atualizados {len(changed)} de {len(pending['chunks'])} "
+                                f"chunks de '{pending['status_key']}' no ChromaDB{duplicates_note}.")
+                    manifest.record_file(
+                        shard, document_file, pending["mtime"], pending["size"], pending["sha256"],
+                        self.chunk_size, self.chunk_overlap, INGESTION_VERSION, pending["hashes"],
+                        pending["signatures"], pending["duplicates"], self._dedup_key)
+                else:
+                    if not pending.get("removed"):
+                        logger.warning(f"Nenhum conteúdo extraído de '{pending['status_key']}'.")
+                    manifest.remove_file(shard, document_file)
+            except Exception as e:
+                self._dedup_indexes.pop(shard, None)
+                logger.error(f"Erro ao gravar '{pending['status_key']}' no ChromaDB: {e}", exc_info=True)
+            offset += len(changed)
+        if demoted:
+            manifest.repoint_duplicates(shard, demoted)
+        if touched:
+            self._refresh_duplicate_metadata(shard, collection, touched)
+
+    def _get_dedup_index(self, shard: str) -> Optional[NearDuplicateIndex]:
+        """Índice LSH dos chunks canônicos do shard (montado a partir do manifesto)."""
+        if self._dedup_key is None:
+            return None
+        index = self._dedup_indexes.get(shard)
+        if index is None:
+            dedup_cfg = config.CHUNK_DEDUP_CONFIG
+            index = NearDuplicateIndex(dedup_cfg["num_perm"], dedup_cfg["lsh_bands"], dedup_cfg["threshold"])
+            for chunk_id, signature in self.index_manifest.get_canonical_signatures(shard).items():
+                signature = MinHasher.from_bytes(signature)
+                # Assinaturas de outra configuração são ignoradas (o chunk é reavaliado)
+                if len(signature) == self._minhasher.signature_length:
+                    index.add(chunk_id, signature)
+            self._dedup_indexes[shard] = index
+        return index
+
+    def _plan_deduplication(self, shard: str, pending_files: List[Dict[str, Any]]):
+        """
+        Decide, para cada arquivo pendente, quais chunks são gravados no ChromaDB e quais são
+        quase duplicatas de um chunk canônico. Preenche em cada arquivo "changed" (chunks a
+        codificar), "duplicates", "signatures" e "delete_ids".
+
+        Returns:
+            (promoções [(duplicata promovida a canônica, duplicatas redirecionadas a ela)],
+             {ex-canônico que virou duplicata: novo canônico},
+             chunks canônicos cujos metadados de duplicatas devem ser refeitos)
+        """
+        manifest = self.index_manifest
+        dedup = self._get_dedup_index(shard)
+        batch_files = {pending["document_file"] for pending in pending_files}
+        touched: Set[str] = set()
+        demoted: Dict[str, str] = {}
+
+        # 1. Canônicos removidos ou alterados saem do índice; suas duplicatas em arquivos fora
+        #    deste lote são promovidas (os arquivos do lote são reavaliados a seguir)
+        removed_canonicals = []
+        for pending in pending_files:
+            previous_duplicates = manifest.get_file_duplicates(shard, pending["document_file"])
+            pending["previous_duplicates"] = previous_duplicates
+            for chunk_id, digest in pending["previous_hashes"].items():
+                if chunk_id not in previous_duplicates and pending["hashes"].get(chunk_id) != digest:
+                    removed_canonicals.append(chunk_id)
+                    if dedup is not None:
+                        dedup.remove(chunk_id)
+        orphans: Dict[str, List[Dict[str, Any]]] = {}
+        for row in manifest.get_duplicates_of(shard, removed_canonicals):
+            if row["filename"] not in batch_files:
+                orphans.setdefault(row["canonical_id"], []).append(row)
+        promotions = []
+        for rows in orphans.values():
+            promoted = rows[0]
+            promotions.append((promoted, [row["chunk_id"] for row in rows[1:]]))
+            touched.add(promoted["chunk_id"])
+            if dedup is not None and promoted["signature"] is not None:
+                signature = MinHasher.from_bytes(promoted["signature"])
+                if len(signature) == self._minhasher.signature_length:
+                    dedup.add(promoted["chunk_id"], signature)
+
+        # 2. Decisão em ordem: chunks novos/alterados, ex-duplicatas e canônicos sem assinatura
+        #    são comparados aos canônicos do shard (inclusive os dos arquivos anteriores do lote)
+        for pending in pending_files:
+            hashes, previous = pending["hashes"], pending["previous_hashes"]
+            previous_duplicates = pending["previous_duplicates"]
+            pending["duplicates"], pending["signatures"], pending["changed"] = {}, {}, []
+            for item in pending["chunks"]:
+                chunk_id = item["id"]
+                unchanged = previous.get(chunk_id) == hashes[chunk_id]
+                signature = self._minhasher.signature(item["text"]) if dedup is not None else None
+                if signature is not None:
+                    pending["signatures"][chunk_id] = MinHasher.to_bytes(signature)
+                if unchanged and chunk_id not in previous_duplicates and (dedup is None or chunk_id in dedup):
+                    continue  # Canônico inalterado, já no ChromaDB
+                match = dedup.find(signature) if dedup is not None else None
+                if match is not None:
+                    pending["duplicates"][chunk_id] = (match[0], item["text"], item["metadata"])
+                    touched.add(match[0])
+                    if unchanged and chunk_id not in previous_duplicates:
+                        # Canônico inalterado que virou duplicata (ex.: threshold menor): suas
+                        # duplicatas passam a apontar para o novo canônico
+                        demoted[chunk_id] = match[0]
+                    continue
+                if dedup is not None:
+                    dedup.add(chunk_id, signature)
+                if not unchanged or chunk_id in previous_duplicates:
+                    pending["changed"].append(item)
+                    touched.add(chunk_id)
+            touched.update(previous_duplicates.values())
+            pending["delete_ids"] = [chunk_id for chunk_id in previous
+                                     if chunk_id not in previous_duplicates
+                                     and (chunk_id not in hashes or chunk_id in pending["duplicates"])]
+        return promotions, demoted, touched
+
+    def _refresh_duplicate_metadata(self, shard: str, collection, chunk_ids: Set[str]):
+        """Regrava nos chunks canônicos as fontes e páginas de suas quase duplicatas."""
+        try:
+            existing = collection.get(ids=sorted(chunk_ids), include=[])["ids"]
+            locations: Dict[str, List[Dict[str, Any]]] = {chunk_id: [] for chunk_id in existing}
+            for row in self.index_manifest.get_duplicates_of(shard, existing):
+                locations[row["canonical_id"]].append(row["metadata"])
+            updates = []
+            for chunk_id, duplicates in locations.items():
+                if duplicates:
+                    updates.append({
+                        "duplicate_count": len(duplicates),
+                        "duplicate_sources": sorted({meta.get("source") for meta in duplicates}),
+                        "duplicate_locations": [f"{meta.get('source')} (p. {meta.get('page_number')})"
+                                                for meta in duplicates],
+                    })
+                else:
+                    # None remove a chave dos metadados no ChromaDB
+                    updates.append({"duplicate_count": None, "duplicate_sources": None,
+                                    "duplicate_locations": None})
+            for start in range(0, len(existing), 4096):
+                collection.update(ids=existing[start:start + 4096], metadatas=updates[start:start + 4096])
+        except Exception as e:
+            logger.error(f"Erro ao atualizar as fontes duplicadas no shard '{shard}': {e}", exc_info=True)
+
+    def _file_is_current(self, record: Optional[Dict[str, Any]], mtime: float, size: int) -> bool:
+        return record is not None and record["mtime"] == mtime and record["size"] == size and \
+            self._chunker_params_match(record)
+
+    def _chunker_params_match(self, record: Dict[str, Any]) -> bool:
+        return record["ingestion_version"] == INGESTION_VERSION and \
+            record["chunk_size"] == self.chunk_size and record["chunk_overlap"] == self.chunk_overlap and \
+            record.get("dedup_config") == self._dedup_key
+
+    def _process_documents_locked(self, profile_session: Optional[ProfileSession]):
+        manifest = self.index_manifest
         anything_processed_this_run = False
         files_in_db_this_session = set()
+        files_in_folders = set()
 
         # Suporte para múltiplos tipos de arquivo
         supported_extensions = [".pdf", ".md", ".markdown"]
-        document_files_in_folder = [
-            f for f in os.listdir(self.data_folder) 
-            if any(f.lower().endswith(ext) for ext in supported_extensions)
-        ]
 
-        for document_file in document_files_in_folder:
-            document_path = os.path.join(self.data_folder, document_file)
-            try:
-                file_mtime = os.path.getmtime(document_path)
-                file_size = os.path.getsize(document_path)
-            except FileNotFoundError: continue
-
-            if document_file in processed_status and \
-               processed_status[document_file].get('mtime') == file_mtime and \
-               processed_status[document_file].get('size') == file_size:
-                logger.debug(f"Arquivo '{document_file}' não modificado. Pulando.")
-                files_in_db_this_session.add(document_file)
-                continue
-            
-            logger.info(f"Arquivo '{document_file}' novo ou modificado. Reprocessando...")
-            self.collection.delete(where={"source": document_file})
+        def flush(shard, collection, encoder, pending_files):
+            # A codificação em lote mistura vários arquivos: no perfil ela é uma etapa própria
+            if profile_session is not None:
+                profile_session.begin_document(f"<codificação {shard}>")
+            self._flush_pending_files(shard, collection, encoder, pending_files)
 
-            anything_processed_this_run = True
-            all_chunks_for_file = []
+        for shard, shard_folder in self._discover_shards().items():
+            collection = self._get_shard_collection(shard)
+            encoder = self._get_encoding_engine(self._collection_models[collection.name])
+            # Chunks de vários arquivos são codificados juntos (ver _flush_pending_files)
+            pending_files: List[Dict[str, Any]] = []
+            pending_chunks = 0
+            recorded_files = manifest.get_files(shard)
+            if recorded_files and collection.count() == 0:
+                logger.warning(f"Coleção do shard '{shard}' vazia, mas o manifesto registra "
+                               f"{len(recorded_files)} arquivo(s). Reindexando o shard.")
+                manifest.clear_shard_files(shard)
+                recorded_files = {}
+            document_files_in_folder = [
+                f for f in os.listdir(shard_folder)
+                if any(f.lower().endswith(ext) for ext in supported_extensions)
+            ]
 
-            try:
-                # Processar baseado no tipo de arquivo
-                if document_file.lower().endswith('.pdf'):
-                    text, page_numbers = self._process_pdf_file(document_path)
-                elif document_file.lower().endswith(('.md', '.markdown')):
-                    text, page_numbers = self._process_markdown_file(document_path)
-                else:
-                    continue  # Pula arquivos não suportados
-                
-                
-                # Processa o texto extraído em chunks
-                if text.strip():
+            for document_file in document_files_in_folder:
+                document_path = os.path.join(shard_folder, document_file)
+                status_key = self._status_key(shard, document_file)
+                files_in_folders.add((shard, document_file))
+                try:
+                    file_mtime = os.path.getmtime(document_path)
+                    file_size = os.path.getsize(document_path)
+                except FileNotFoundError: continue
+
+                record = recorded_files.get((shard, document_file))
+                if self._file_is_current(record, file_mtime, file_size):
+                    logger.debug(f"Arquivo '{status_key}' não modificado. Pulando.")
+                    files_in_db_this_session.add(status_key)
+                    continue
+
+                try:
+                    file_hash = file_sha256(document_path)
+                except OSError as e:
+                    logger.error(f"Erro ao ler '{document_path}': {e}")
+                    continue
+                if record is not None and record["sha256"] == file_hash and self._chunker_params_match(record):
+                    # Só o mtime mudou (ex.: cópia ou checkout): nada a reindexar
+                    logger.info(f"Arquivo '{status_key}' com conteúdo inalterado. Atualizando apenas o manifesto.")
+                    manifest.touch_file(shard, document_file, file_mtime, file_size)
+                    files_in_db_this_session.add(status_key)
+                    continue
+
+                logger.info(f"Arquivo '{status_key}' novo ou modificado. Reprocessando...")
+                if profile_session is not None:
+                    profile_session.begin_document(status_key)
+
+                anything_processed_this_run = True
+                all_chunks_for_file = []
+
+                try:
+                    # Processar baseado no tipo de arquivo
+                    if document_file.lower().endswith('.pdf'):
+                        text, page_numbers, tables = self._process_pdf_file(document_path, file_hash)
+                    elif document_file.lower().endswith(('.md', '.markdown')):
+                        text, page_numbers, tables = self._process_markdown_file(document_path)
+                    else:
+                        continue  # Pula arquivos não suportados
+
+
+                    # Processa o texto extraído em chunks; tabelas viram chunks próprios
                     words = text.split()
-                    if not words: 
-                        continue
-                    
-                    all_chunks_for_file = self._create_chunks(text, filename=document_file, page_numbers=page_numbers)
-                    logger.info(f"Processado arquivo {document_file}: {len(words)} palavras, {len(all_chunks_for_file)} chunks")
-                else:
-                    all_chunks_for_file = []
-                    
-                # Processar chunks e adicionar ao ChromaDB
-                if all_chunks_for_file:
-                    texts_to_embed = [item["text"] for item in all_chunks_for_file]
-                    embeddings = self.embedding_model_st.encode(texts_to_embed, show_progress_bar=False)
-                    
-                    ids_to_add = [f"{document_file}_chunk_{i}" for i in range(len(all_chunks_for_file))]
-                    metadatas_to_add = [item["metadata"] for item in all_chunks_for_file]
-
-                    self.collection.add(
-                        ids=ids_to_add,
-                        embeddings=embeddings.tolist(),
-                        documents=texts_to_embed,
-                        metadatas=metadatas_to_add
-                    )
-                    logger.info(f"Adicionados/Atualizados {len(all_chunks_for_file)} chunks de '{document_file}' no ChromaDB.")
-                    new_or_updated_processed_status[document_file] = {"mtime": file_mtime, "size": file_size}
-                else:
-                    logger.warning(f"Nenhum conteúdo extraído de '{document_file}'.")
-                    if document_file in new_or_updated_processed_status:
-                        del new_or_updated_processed_status[document_file]
+                    if words:
+                        all_chunks_for_file = self._create_chunks(text, filename=document_file, page_numbers=page_numbers)
+                    table_chunks = self._create_table_chunks(tables, document_file)
+                    all_chunks_for_file += table_chunks
+                    logger.info(f"Processado arquivo {status_key}: {len(words)} palavras, {len(tables)} tabelas, "
+                                f"{len(all_chunks_for_file)} chunks ({len(table_chunks)} de tabela)")
 
-            except Exception as e_doc:
-                logger.error(f"Erro ao processar o documento '{document_path}': {e_doc}", exc_info=True)
-            
-            files_in_db_this_session.add(document_file)
+                    # Só os chunks novos ou alterados (hash diferente do manifesto) são reembedados
+                    new_hashes = {item["id"]: chunk_hash(item["text"], item["metadata"])
+                                  for item in all_chunks_for_file}
+                    previous_hashes = manifest.get_chunk_hashes(shard, document_file)
+                    pending_files.append({
+                        "status_key": status_key, "document_file": document_file,
+                        "mtime": file_mtime, "size": file_size, "sha256": file_hash,
+                        "chunks": all_chunks_for_file, "hashes": new_hashes, "previous_hashes": previous_hashes,
+                        "changed": [item for item in all_chunks_for_file
+                                    if previous_hashes.get(item["id"]) != new_hashes[item["id"]]],
+                    })
+                    pending_chunks += len(pending_files[-1]["changed"])
+                    if pending_chunks >= config.EMBEDDING_ENCODER_CONFIG["flush_chunks"]:
+                        flush(shard, collection, encoder, pending_files)
+                        pending_files, pending_chunks = [], 0
+
+                except Exception as e_doc:
+                    logger.error(f"Erro ao processar o documento '{document_path}': {e_doc}", exc_info=True)
+
+                files_in_db_this_session.add(status_key)
 
-        stale_files_in_status = [fname for fname in processed_status if fname not in document_files_in_folder]
-        for fname in stale_files_in_status:
-            logger.info(f"Removendo '{fname}' (não mais na pasta de dados) do status e do ChromaDB.")
-            self.collection.delete(where={"source": fname})
-            if fname in new_or_updated_processed_status:
-                del new_or_updated_processed_status[fname]
-            anything_processed_this_run = True 
+            if pending_files:
+                flush(shard, collection, encoder, pending_files)
+
+        stale_files: Dict[str, List[Dict[str, Any]]] = {}
+        for shard, fname in manifest.get_files():
+            if (shard, fname) in files_in_folders:
+                continue
+            logger.info(f"Removendo '{self._status_key(shard, fname)}' (não mais na pasta de dados) "
+                        f"do manifesto e do ChromaDB.")
+            # Arquivo sem chunks: o flush remove os chunks antigos e promove suas quase duplicatas
+            stale_files.setdefault(shard, []).append({
+                "status_key": self._status_key(shard, fname), "document_file": fname, "removed": True,
+                "chunks": [], "hashes": {}, "previous_hashes": manifest.get_chunk_hashes(shard, fname),
+            })
+            anything_processed_this_run = True
+        for shard, pending_files in stale_files.items():
+            collection = self._get_shard_collection(shard)
+            encoder = self._get_encoding_engine(self._collection_models[collection.name])
+            flush(shard, collection, encoder, pending_files)
+        self._dedup_indexes.clear()
 
+        for encoder in self._encoding_engines.values():
+            encoder.close_pool()
+        if self.extraction_cache is not None and anything_processed_this_run:
+            self.extraction_cache.prune()
         if anything_processed_this_run:
-            self._save_processed_files_status(new_or_updated_processed_status)
+            self.index_version = manifest.bump_index_version()
         
         self.processed_pdf_files = sorted(list(files_in_db_this_session))
-        logger.info(f"Carregamento concluído. {self.collection.count()} chunks no total em ChromaDB.")
+        if anything_processed_this_run and self._dedup_key is not None:
+            dedup_stats = self.get_dedup_stats()
+            logger.info(f"Deduplicação: {dedup_stats['duplicates']} quase duplicata(s) fora do ChromaDB "
+                        f"(~{dedup_stats['estimated_mb_saved']} MB economizados).")
+        logger.info(f"Carregamento concluído. {self.count_chunks()} chunks no total em ChromaDB "
+                    f"({len(self.shard_collections)} shard(s)).")
+
+    # --- Shards do índice ---
+
+    def _discover_shards(self) -> Dict[str, str]:
+        """
+        Retorna {shard: pasta}. A raiz de data_folder é sempre o shard principal; no modo
+        "subfolder" cada subpasta imediata é um shard com coleção própria.
+        """
+        shards = {ROOT_SHARD: self.data_folder}
+        if config.INDEX_SHARDING_CONFIG["mode"] == "subfolder":
+            for entry in sorted(os.listdir(self.data_folder)):
+                path = os.path.join(self.data_folder, entry)
+                if not os.path.isdir(path) or entry.startswith("."):
+                    continue
+                if entry == ROOT_SHARD:
+                    logger.warning(f"Subpasta '{entry}' ignorada: nome reservado para o shard principal.")
+                    continue
+                shards[entry] = path
+        return shards
+
+    def _shard_collection_name(self, shard: str) -> str:
+        if shard == ROOT_SHARD:
+            return self.collection_name
+        # Nomes de coleção do ChromaDB: 3-63 caracteres [a-zA-Z0-9._-]
+        slug = re.sub(r"[^A-Za-z0-9_-]", "-", shard)[:40]
+        if slug != shard:
+            slug += "-" + hashlib.sha1(shard.encode("utf-8")).hexdigest()[:6]
+        return f"{self.collection_name}__{slug}"[:63]
+
+    def _get_shard_collection(self, shard: str):
+        """Coleção ativa do shard (a registrada no manifesto; criada se ainda não existir)."""
+        collection = self.shard_collections.get(shard)
+        if collection is None:
+            state = self.index_manifest.get_shard(shard)
+            if state is None:
+                state = {"collection": self._shard_collection_name(shard),
+                         "embedding_model": self.configured_embedding_model_name}
+                self.index_manifest.set_shard(shard, state["collection"], state["embedding_model"])
+            collection = self.chroma_client.get_or_create_collection(name=state["collection"])
+            self._collection_models[collection.name] = state["embedding_model"]
+            self.shard_collections[shard] = collection
+        return collection
+
+    def _get_encoding_engine(self, model_name: str) -> EncodingEngine:
+        """Motor de codificação da ingestão (lotes por comprimento, pool de processos)."""
+        encoder = self._encoding_engines.get(model_name)
+        if encoder is None:
+            encoder = EncodingEngine(self._get_embedding_model(model_name), model_name)
+            self._encoding_engines[model_name] = encoder
+        return encoder
+
+    def _get_embedding_model(self, model_name: str) -> SharedEmbeddingModel:
+        """Modelo de embedding pelo nome (obtido do registro na primeira vez que é pedido)."""
+        with self._embedding_models_lock:
+            model = self._embedding_models.get(model_name)
+            if model is None:
+                logger.info(f"Carregando modelo de embedding '{model_name}' (índice existente)...")
+                model = self.embedding_registry.acquire(model_name, config.EMBEDDING_MODEL_BACKEND,
+                                                        config.EMBEDDING_MODEL_DEVICE)
+                self._embedding_models[model_name] = model
+            return model
+
+    def close(self):
+        """Devolve os modelos ao registro compartilhado e libera manifesto e threads."""
+        with self._embedding_models_lock:
+            models, self._embedding_models = list(self._embedding_models.values()), {}
+        for model in models:
+            self.embedding_registry.release(model)
+        for encoder in self._encoding_engines.values():
+            encoder.close_pool()
+        self._shard_executor.shutdown(wait=False)
+        if self.external_provider is not None:
+            self._external_executor.shutdown(wait=False)
+            self.external_provider.close()
+        if self.index_manifest is not None:
+            self.index_manifest.close()
+        if self.extraction_cache is not None:
+            self.extraction_cache.close()
+        if self.retrieval_client is not None:
+            self.retrieval_client.close()
+
+    @staticmethod
+    def _status_key(shard: str, document_file: str) -> str:
+        """Chave no arquivo de status: o nome do arquivo (shard principal) ou "shard/arquivo"."""
+        return document_file if shard == ROOT_SHARD else f"{shard}/{document_file}"
+
+    @staticmethod
+    def _split_status_key(status_key: str):
+        if "/" in status_key:
+            shard, document_file = status_key.split("/", 1)
+            return shard, document_file
+        return ROOT_SHARD, status_key
+
+    def list_shards(self) -> List[str]:
+        return sorted(self.shard_collections)
+
+    def count_chunks(self, shards: Optional[List[str]] = None) -> int:
+        """Total de chunks indexados nos shards selecionados (padrão: todos)."""
+        if self.retrieval_client is not None:
+            shard_stats = self.get_shard_stats()
+            return sum(shard_stats[shard]["chunks"] for shard in self._select_shards(shards) if shard in shard_stats)
+        return sum(collection.count() for collection in self._select_shards(shards).values())
+
+    def get_shard_stats(self) -> Dict[str, Dict[str, Any]]:
+        if self.retrieval_client is not None:
+            return self.retrieval_client.info()["shards"]
+        return {shard: {"collection": collection.name, "chunks": collection.count(),
+                        "embedding_model": self._collection_models.get(collection.name),
+                        "migrating": self._migration_in_progress(shard)}
+                for shard, collection in sorted(self.shard_collections.items())}
+
+    def _select_shards(self, shards: Optional[List[str]]) -> Dict[str, Any]:
+        if not shards:
+            return dict(self.shard_collections)
+        unknown = [shard for shard in shards if shard not in self.shard_collections]
+        if unknown:
+            raise ValueError(f"Shard(s) desconhecido(s): {', '.join(unknown)}. "
+                             f"Disponíveis: {', '.join(self.list_shards())}")
+        return {shard: self.shard_collections[shard] for shard in shards}
+
+    def rebuild_shard(self, shard: str):
+        """Reconstrói um shard do zero (coleção e manifesto), sem reprocessar os demais."""
+        self._require_writable_index()
+        if shard not in self._discover_shards():
+            raise ValueError(f"Shard desconhecido: {shard}")
+        if self._migration_in_progress(shard):
+            raise ValueError(f"Migração de modelo em andamento no shard '{shard}'; aguarde o término.")
+        with self._index_lock:
+            logger.info(f"Reconstruindo shard '{shard}'...")
+            self._reset_shard(shard)
+            self._load_or_process_documents()
+
+    def _reset_shard(self, shard: str):
+        """Apaga a coleção ativa do shard e o remove do manifesto."""
+        state = self.index_manifest.get_shard(shard)
+        collection_name = state["collection"] if state else self._shard_collection_name(shard)
+        try:
+            self.chroma_client.delete_collection(collection_name)
+        except Exception as e:
+            logger.debug(f"Coleção do shard '{shard}' não existia: {e}")
+        self.index_manifest.remove_shard(shard)
+        self.shard_collections.pop(shard, None)
+        if shard == ROOT_SHARD:
+            self.collection = self._get_shard_collection(shard)
+
+    # --- Manifesto e migração de modelo de embedding ---
+
+    def _import_legacy_status(self):
+        """Importa o processed_files_status.json legado para um manifesto novo (uma única vez)."""
+        legacy_path = config.PROCESSED_FILES_STATUS_JSON
+        if self.collection_name != config.CHROMA_COLLECTION_NAME or not os.path.exists(legacy_path) \
+                or not self.index_manifest.is_empty():
+            return
+        try:
+            with open(legacy_path, 'r', encoding='utf-8') as f:
+                legacy_status = json.load(f)
+        except Exception as e:
+            logger.warning(f"Não foi possível importar o status legado '{legacy_path}': {e}")
+            return
+        # O arquivo legado não registra modelo nem parâmetros do chunker: assume-se a configuração atual
+        with self.index_manifest.transaction():
+            for status_key, entry in legacy_status.items():
+                shard, document_file = self._split_status_key(status_key)
+                self.index_manifest.record_file(
+                    shard, document_file, entry.get("mtime", 0.0), entry.get("size", 0), None,
+                    self.chunk_size, self.chunk_overlap, entry.get("ingestion_version", 1), {})
+        logger.info(f"Status legado '{legacy_path}' importado para o manifesto ({len(legacy_status)} arquivos).")
+
+    def _recover_interrupted_migrations(self):
+        """
+        Descarta as coleções de destino de migrações interrompidas pelo encerramento do
+        processo dono. Migrações de outros processos (ou de outra instância neste processo)
+        que ainda renovam o sinal de vida são mantidas.
+        """
+        active = {state["collection"] for state in self.index_manifest.get_shards().values()}
+        stale_seconds = config.INDEX_MANIFEST_CONFIG["migration_stale_seconds"]
+        for migration in self.index_manifest.mark_interrupted_migrations(stale_seconds):
+            target = migration["target_collection"]
+            logger.warning(f"Migração de modelo do shard '{migration['shard']}' foi interrompida; "
+                           f"será reiniciada se necessário.")
+            if target and target not in active:
+                try:
+                    self.chroma_client.delete_collection(target)
+                except Exception as e:
+                    logger.debug(f"Coleção '{target}' da migração interrompida não existia: {e}")
+
+    def _check_embedding_models(self) -> List[str]:
+        """
+        Compara o modelo de cada shard indexado com o configurado e aplica
+        INDEX_MANIFEST_CONFIG["on_model_change"]. Retorna os shards a migrar.
+        """
+        action = config.INDEX_MANIFEST_CONFIG["on_model_change"]
+        to_migrate = []
+        for shard, state in self.index_manifest.get_shards().items():
+            if state["embedding_model"] == self.configured_embedding_model_name:
+                continue
+            collection = self._get_shard_collection(shard)
+            if collection.count() == 0:
+                self.index_manifest.set_shard(shard, collection.name, self.configured_embedding_model_name)
+                self._collection_models[collection.name] = self.configured_embedding_model_name
+                continue
+            logger.warning(f"Shard '{shard}' indexado com o modelo '{state['embedding_model']}', mas o modelo "
+                           f"configurado é '{self.configured_embedding_model_name}' (ação: {action}).")
+            if action == "rebuild":
+                self._reset_shard(shard)
+            elif action == "migrate":
+                to_migrate.append(shard)
+        return to_migrate
+
+    def _migration_in_progress(self, shard: str) -> bool:
+        thread = self._migration_threads.get(shard)
+        return thread is not None and thread.is_alive()
+
+    def migrate_embedding_model(self, shard: str, background: bool = True) -> Optional[threading.Thread]:
+        """
+        Reindexa o shard com o modelo configurado numa nova coleção e troca a coleção ativa
+        de forma atômica ao final. Até a troca, as consultas usam a coleção e o modelo antigos.
+
+        Retorna a thread da migração (background=True), ou None se o shard já usa o modelo
+        configurado ou se a migração rodou de forma síncrona.
+        """
+        self._require_writable_index()
+        if shard not in self.shard_collections and self.index_manifest.get_shard(shard) is None:
+            raise ValueError(f"Shard desconhecido: {shard}")
+        if self._migration_in_progress(shard):
+            return self._migration_threads[shard]
+        source = self._get_shard_collection(shard)
+        if self._collection_models[source.name] == self.configured_embedding_model_name:
+            return None
+        if not background:
+            self._run_migration(shard)
+            return None
+        thread = threading.Thread(target=self._run_migration, args=(shard,),
+                                  name=f"rag-migration-{shard}", daemon=True)
+        self._migration_threads[shard] = thread
+        thread.start()
+        return thread
+
+    def wait_for_migrations(self, timeout: Optional[float] = None):
+        for thread in list(self._migration_threads.values()):
+            thread.join(timeout)
+
+    def _migration_collection_name(self, shard: str, migration_id: int) -> str:
+        suffix = f"__m{migration_id}"
+        return self._shard_collection_name(shard)[:63 - len(suffix)] + suffix
+
+    def _copy_chunks(self, target, encoder: EncodingEngine, page: Dict[str, Any]):
+        embeddings = encoder.encode(page["documents"])
+        target.upsert(ids=page["ids"], embeddings=embeddings.tolist(),
+                      documents=page["documents"], metadatas=page["metadatas"])
+
+    def _migration_heartbeat(self, migration_id: int, stop_event: threading.Event):
+        """Renova o sinal de vida da migração no manifesto até `stop_event`."""
+        interval = config.INDEX_MANIFEST_CONFIG["migration_heartbeat_seconds"]
+        while not stop_event.wait(interval):
+            try:
+                self.index_manifest.heartbeat_migration(migration_id)
+            except Exception as e:
+                logger.warning(f"Falha ao renovar o sinal de vida da migração {migration_id}: {e}")
+
+    def _run_migration(self, shard: str):
+        migration_cfg = config.INDEX_MANIFEST_CONFIG
+        target_model_name = self.configured_embedding_model_name
+        source = self.shard_collections[shard]
+        source_model_name = self._collection_models[source.name]
+        # Migrações abandonadas por processos encerrados não impedem uma nova
+        self._recover_interrupted_migrations()
+        migration_id = self.index_manifest.start_migration(shard, source_model_name, target_model_name,
+                                                           source.name, source.count(),
+                                                           migration_cfg["migration_stale_seconds"])
+        if migration_id is None:
+            logger.info(f"Migração do shard '{shard}' já em andamento em outro processo ou instância; "
+                        f"nada a fazer aqui.")
+            return
+        heartbeat_stop = threading.Event()
+        threading.Thread(target=self._migration_heartbeat, args=(migration_id, heartbeat_stop),
+                         name=f"rag-migration-heartbeat-{shard}", daemon=True).start()
+        try:
+            self._copy_to_new_model(shard, migration_id, source, source_model_name, target_model_name)
+        finally:
+            heartbeat_stop.set()
+
+    def _copy_to_new_model(self, shard: str, migration_id: int, source, source_model_name: str,
+                           target_model_name: str):
+        migration_cfg = config.INDEX_MANIFEST_CONFIG
+        target_name = self._migration_collection_name(shard, migration_id)
+        self.index_manifest.update_migration(migration_id, target_collection=target_name)
+        encoder: Optional[EncodingEngine] = None
+        logger.info(f"Migração {migration_id}: shard '{shard}' de '{source_model_name}' para "
+                    f"'{target_model_name}' (coleção '{source.name}' -> '{target_name}').")
+        try:
+            encoder = EncodingEngine(self._get_embedding_model(target_model_name), target_model_name)
+            target = self.chroma_client.get_or_create_collection(name=target_name)
+            copied: Dict[str, str] = {}
+            batch_size = migration_cfg["migration_batch_size"]
+            offset = 0
+            # Cópia em lotes sem bloquear a ingestão nem as consultas
+            while True:
+                page = source.get(limit=batch_size, offset=offset, include=["documents", "metadatas"])
+                if not page["ids"]:
+                    break
+                self._copy_chunks(target, encoder, page)
+                for chunk_id, document, metadata in zip(page["ids"], page["documents"], page["metadatas"]):
+                    copied[chunk_id] = chunk_hash(document, metadata)
+                offset += len(page["ids"])
+                self.index_manifest.update_migration(migration_id, processed=offset)
+
+            with self._index_lock:
+                # Alterações feitas pela ingestão durante a cópia são aplicadas antes da troca
+                current = source.get(include=["documents", "metadatas"])
+                current_hashes = {chunk_id: chunk_hash(document, metadata) for chunk_id, document, metadata
+                                  in zip(current["ids"], current["documents"], current["metadatas"])}
+                removed = [chunk_id for chunk_id in copied if chunk_id not in current_hashes]
+                if removed:
+                    target.delete(ids=removed)
+                changed = [i for i, chunk_id in enumerate(current["ids"])
+                           if copied.get(chunk_id) != current_hashes[chunk_id]]
+                if changed:
+                    self._copy_chunks(target, encoder, {
+                        "ids": [current["ids"][i] for i in changed],
+                        "documents": [current["documents"][i] for i in changed],
+                        "metadatas": [current["metadatas"][i] for i in changed]})
+
+                # Troca atômica: manifesto numa transação, depois a referência em memória
+                with self.index_manifest.transaction():
+                    self.index_manifest.set_shard(shard, target_name, target_model_name)
+                    self.index_manifest.update_migration(migration_id, status="completed",
+                                                         processed=len(current_hashes))
+                self._collection_models[target_name] = target_model_name
+                self.shard_collections[shard] = target
+                if shard == ROOT_SHARD:
+                    self.collection = target
+                self.index_version = self.index_manifest.bump_index_version()
+            encoder.close_pool()
+            logger.info(f"Migração {migration_id} concluída: shard '{shard}' agora usa '{target_name}' "
+                        f"({len(current_hashes)} chunks; {len(changed)} atualizados durante a cópia).")
+        except Exception as e:
+            if encoder is not None:
+                encoder.close_pool()
+            logger.error(f"Erro na migração {migration_id} do shard '{shard}': {e}", exc_info=True)
+            self.index_manifest.update_migration(migration_id, status="failed", error=str(e))
+            try:
+                self.chroma_client.delete_collection(target_name)
+            except Exception:
+                pass
+            return
+
+        # A coleção antiga só é apagada após as consultas em curso terminarem
+        time.sleep(migration_cfg["old_collection_grace_seconds"])
+        try:
+            self.chroma_client.delete_collection(source.name)
+        except Exception as e:
+            logger.warning(f"Não foi possível apagar a coleção antiga '{source.name}': {e}")
+        in_use = set(self._collection_models[c.name] for c in self.shard_collections.values())
+        with self._embedding_models_lock:
+            released = None
+            if source_model_name not in in_use and source_model_name != self.configured_embedding_model_name:
+                released = self._embedding_models.pop(source_model_name, None)
+        if released is not None:
+            self.embedding_registry.release(released)
+
+    def get_manifest_stats(self) -> Dict[str, Any]:
+        if self.retrieval_client is not None:
+            return self.retrieval_client.stats()["manifest"]
+        if self.snapshot is not None:
+            return {
+                "snapshot": self.snapshot_path,
+                "created_at": self.snapshot.footer["created_at"],
+                "index_version": self.index_version,
+                "shards": {row["shard"]: row for row in self.snapshot.manifest["shards"]},
+                "migrations": [],
+            }
+        return {
+            "path": self.manifest_path,
+            "index_version": self.index_manifest.index_version(),
+            "shards": self.index_manifest.get_shards(),
+            "migrations": self.index_manifest.get_migrations(limit=5),
+            "dedup": self.get_dedup_stats(),
+        }
+
+    def get_dedup_stats(self) -> Dict[str, Any]:
+        """Quase duplicatas por shard e espaço estimado economizado no ChromaDB."""
+        if self.index_manifest is None:
+            return {}
+        model = self.embedding_model_st
+        # get_sentence_embedding_dimension foi renomeado nas versões recentes do sentence-transformers
+        dimension = getattr(model, "get_embedding_dimension", model.get_sentence_embedding_dimension)()
+        vector_bytes = dimension * 4  # float32
+        shards = self.index_manifest.get_dedup_stats()
+        for entry in shards.values():
+            entry["vector_bytes_saved"] = entry["duplicates"] * vector_bytes
+        return {
+            "enabled": self._dedup_key is not None,
+            "config": self._dedup_key,
+            "duplicates": sum(entry["duplicates"] for entry in shards.values()),
+            # O texto das duplicatas continua no manifesto; economiza-se o vetor (e a entrada no HNSW)
+            "estimated_mb_saved": round(sum(entry["vector_bytes_saved"] for entry in shards.values())
+                                        / (1024 * 1024), 3),
+            "shards": shards,
+        }
     
-    def _process_pdf_file(self, document_path):
-        """Processa arquivo PDF específico"""
+    def _process_pdf_file(self, document_path, file_hash: Optional[str] = None):
+        """
+        Processa arquivo PDF específico. As tabelas são extraídas em Markdown e
+        retornadas à parte; o texto corrido exclui as regiões ocupadas por tabelas.
+
+        Com `file_hash` (SHA-256 do arquivo), a extração vem do cache de extração
+        quando disponível (EXTRACTION_CACHE_CONFIG) e o PDF não é aberto.
+        """
+        extraction = None
+        if self.extraction_cache is not None and file_hash:
+            extractor = self._pdf_extractor_id()
+            extraction = self.extraction_cache.get(file_hash, extractor)
+            if extraction is not None:
+                logger.info(f"Extração de '{os.path.basename(document_path)}' obtida do cache.")
+        if extraction is None:
+            start = time.perf_counter()
+            extraction = self._extract_pdf(document_path)
+            if self.extraction_cache is not None and file_hash:
+                self.extraction_cache.put(file_hash, extractor, extraction, time.perf_counter() - start)
+
+        text = "".join(f"[Página {page_number}]\n{page_text}\n\n" for page_number, page_text in extraction["pages"])
+        page_numbers = [page_number for page_number, _ in extraction["pages"]]
+        return text, page_numbers, extraction["tables"]
+
+    @staticmethod
+    def _pdf_extractor_id() -> str:
+        """Versão do extrator de PDF usada na chave do cache (inclui a versão do PyMuPDF)."""
         import fitz
-        
-        text = ""
-        page_numbers = []
-        
+        return f"pdf-{PDF_EXTRACTOR_VERSION}/pymupdf-{fitz.VersionBind}"
+
+    def _extract_pdf(self, document_path) -> Dict[str, Any]:
+        """Extrai {"pages": [[página, texto], ...], "tables": [{"page_number", "markdown"}, ...]}."""
+        import fitz
+
+        pages = []
+        tables_found = []
+
         # Processa as páginas do PDF
         doc = fitz.open(document_path)
         try:
             for page_num_fitz, page in enumerate(doc):
-                page_text = page.get_text()
-                
-                if page_text.strip():
-                    text += f"[Página {page_num_fitz + 1}]\n{page_text}\n\n"
-                    page_numbers.append(page_num_fitz + 1)
-                    
                 # Processa tabelas se houver
+                table_rects = []
                 tables = page.find_tables()
                 if tables:
                     for table in tables:
-                        table_text = self._extract_table_text(table)
-                        if table_text:
-                            text += f"[Tabela na Página {page_num_fitz + 1}]\n{table_text}\n\n"
+                        table_markdown = self._markdown_from_table(self._extract_table_rows(table))
+                        if table_markdown:
+                            tables_found.append({"page_number": page_num_fitz + 1, "markdown": table_markdown})
+                            table_rects.append(fitz.Rect(table.bbox))
+
+                page_text = self._page_text_outside(page, table_rects)
+                if page_text.strip():
+                    pages.append([page_num_fitz + 1, page_text])
         finally:
             doc.close()
-        
-        return text, page_numbers
+
+        return {"pages": pages, "tables": tables_found}
+
+    @staticmethod
+    def _page_text_outside(page, table_rects) -> str:
+        """Texto da página sem os blocos cujo centro está dentro de uma tabela."""
+        if not table_rects:
+            return page.get_text()
+        import fitz
+        kept = []
+        for x0, y0, x1, y1, block_text, _, block_type in page.get_text("blocks"):
+            center = fitz.Point((x0 + x1) / 2, (y0 + y1) / 2)
+            if block_type == 0 and not any(center in rect for rect in table_rects):
+                kept.append(block_text)
+        return "\n".join(kept)
     
     def _process_markdown_file(self, document_path):
-        """Processa arquivo Markdown específico"""
+        """Processa arquivo Markdown específico (tabelas Markdown retornadas à parte)"""
         text = ""
         page_numbers = [1]  # Markdown é tratado como uma única "página"
         
@@ -331,60 +1258,195 @@ class RAGCore:
         try:
             with open(document_path, 'r', encoding='utf-8') as md_file:
                 text = md_file.read()
-                if text.strip():
-                    text = f"[Arquivo Markdown: {document_file}]\n{text}\n\n"
         except UnicodeDecodeError:
             # Fallback para latin-1 se UTF-8 falhar
             with open(document_path, 'r', encoding='latin-1') as md_file:
                 text = md_file.read()
-                if text.strip():
-                    text = f"[Arquivo Markdown: {document_file}]\n{text}\n\n"
+
+        text, tables = self._split_markdown_tables(text)
+        tables_found = [{"page_number": 1, "markdown": table} for table in tables]
+        if text.strip():
+            text = f"[Arquivo Markdown: {document_file}]\n{text}\n\n"
         
-        return text, page_numbers
+        return text, page_numbers, tables_found
 
-    def _extract_table_text(self, table):
-        """Extrai texto de uma tabela do PDF"""
+    @staticmethod
+    def _split_markdown_tables(text: str):
+        """Separa as tabelas Markdown (linhas "| ... |" com linha de alinhamento) do texto."""
+        lines = text.splitlines()
+        kept, tables = [], []
+        i = 0
+        while i < len(lines):
+            if (lines[i].strip().startswith("|") and i + 1 < len(lines)
+                    and re.match(r"^\s*\|?\s*:?-{3,}", lines[i + 1])):
+                end = i + 2
+                while end < len(lines) and lines[end].strip().startswith("|"):
+                    end += 1
+                tables.append("\n".join(line.strip() for line in lines[i:end]))
+                i = end
+                continue
+            kept.append(lines[i])
+            i += 1
+        return "\n".join(kept), tables
+
+    def _extract_table_rows(self, table) -> List[List[str]]:
+        """Extrai as linhas de uma tabela do PDF"""
         try:
-            table_data = table.extract()
-            if not table_data: 
-                return ""
-            
-            header = table_data[0] if table_data else []
-            text_parts = [" | ".join(str(cell) if cell else "" for cell in header)]
-            
-            for row in table_data[1:]:
-                if len(row) != len(header): 
-                    continue
-                text_parts.append(" | ".join(str(cell) if cell else "" for cell in row))
-            
-            return "\n".join(text_parts)
+            return table.extract() or []
         except Exception as e:
             logger.warning(f"Erro ao processar tabela: {e}")
-            return ""
+            return []
+
+    def _create_table_chunks(self, tables: List[Dict[str, Any]], filename: str) -> List[Dict[str, Any]]:
+        """
+        Cria chunks do tipo "table" (Markdown). Tabelas maiores que chunk_size são
+        divididas por linhas, repetindo o cabeçalho, para que cada parte seja uma tabela válida.
+        """
+        chunks_with_metadata = []
+        for table_index, table in enumerate(tables):
+            lines = table["markdown"].splitlines()
+            header, rows = lines[:2], lines[2:]
+            header_length = len("\n".join(header))
+            parts, current, current_length = [], [], header_length
+            for row in rows:
+                if current and current_length + len(row) + 1 > self.chunk_size:
+                    parts.append("\n".join(header + current))
+                    current, current_length = [], header_length
+                current.append(row)
+                current_length += len(row) + 1
+            if current or not parts:
+                parts.append("\n".join(header + current))
+
+            for part_index, part in enumerate(parts):
+                chunks_with_metadata.append({
+                    "id": f"{filename}_table_{table_index}_{part_index}",
+                    "text": part,
+                    "metadata": {
+                        "chunk_index": len(chunks_with_metadata),
+                        "chunk_length": len(part),
+                        "source": filename,
+                        "page_number": table["page_number"],
+                        "page_end": table["page_number"],
+                        "content_type": "table",
+                        "table_index": table_index,
+                        "table_part": part_index,
+                    },
+                })
+        return chunks_with_metadata
+
+    @staticmethod
+    def build_metadata_filter(filters: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        """
+        Converte filtros de metadados na cláusula `where` do ChromaDB.
+
+        Args:
+            filters: {"source": "edital.pdf" ou [...], "page_from": 10, "page_to": 20,
+                      "content_type": "table" ou "text"} (todas as chaves são opcionais)
+
+        Os filtros de página selecionam os chunks cujo intervalo de páginas
+        (page_number a page_end) tem interseção com o intervalo pedido.
+
+        O filtro por fonte também aceita chunks canônicos que têm quase duplicatas na
+        fonte pedida (metadado duplicate_sources); os filtros de página se aplicam às
+        páginas do chunk canônico.
+
+        Raises:
+            ValueError: chave ou valor inválido
+        """
+        if not filters:
+            return None
+        unknown = set(filters) - {"source", "page_from", "page_to", "content_type"}
+        if unknown:
+            raise ValueError(f"Filtro(s) desconhecido(s): {', '.join(sorted(unknown))}")
 
-    def retrieve_relevant_chunks(self, query: str, k: int = config.DEFAULT_RETRIEVAL_K) -> List[Dict[str, Any]]:
-        """Recupera chunks relevantes do ChromaDB com logging detalhado."""
-        if self.collection.count() == 0:
+        conditions = []
+        source = filters.get("source")
+        if source is not None:
+            sources = [source] if isinstance(source, str) else source
+            if not isinstance(sources, list) or not sources or not all(isinstance(x, str) for x in sources):
+                raise ValueError("Filtro 'source' deve ser um nome de arquivo ou uma lista de nomes")
+            conditions.append({"$or": [{"source": sources[0]} if len(sources) == 1 else {"source": {"$in": sources}}]
+                               + [{"duplicate_sources": {"$contains": s}} for s in sources]})
+        for key, field, operator in (("page_from", "page_end", "$gte"), ("page_to", "page_number", "$lte")):
+            value = filters.get(key)
+            if value is not None:
+                if not isinstance(value, int) or isinstance(value, bool):
+                    raise ValueError(f"Filtro '{key}' deve ser um número de página inteiro")
+                conditions.append({field: {operator: value}})
+        content_type = filters.get("content_type")
+        if content_type is not None:
+            if content_type not in ("text", "table"):
+                raise ValueError("Filtro 'content_type' deve ser 'text' ou 'table'")
+            conditions.append({"content_type": content_type})
+
+        if not conditions:
+            return None
+        return conditions[0] if len(conditions) == 1 else {"$and": conditions}
+
+    def retrieve_relevant_chunks(self, query: str, k: int = config.DEFAULT_RETRIEVAL_K,
+                                 shards: Optional[List[str]] = None,
+                                 filters: Optional[Dict[str, Any]] = None,
+                                 deadline: Optional[Deadline] = None) -> List[Dict[str, Any]]:
+        """
+        Recupera chunks relevantes do ChromaDB com logging detalhado.
+
+        Com vários shards, a busca é feita em paralelo em cada um e os resultados são
+        combinados globalmente por distância (top-k). `shards` restringe a busca
+        (padrão: todos); nomes desconhecidos geram ValueError. `filters` (ver
+        build_metadata_filter) é aplicado dentro da busca vetorial do ChromaDB.
+
+        Com `deadline`, os shards que não responderem no tempo restante ficam de fora
+        (resultado parcial); sem nenhum shard a tempo, levanta DeadlineExceeded.
+        """
+        deadline = deadline or Deadline.none()
+        deadline.check("retrieval")
+        where = self.build_metadata_filter(filters)
+        if self.retrieval_client is not None:
+            self._select_shards(shards)
+            return self._retrieve_from_worker(query, k, shards, filters, deadline)
+        collections = {shard: collection for shard, collection in self._select_shards(shards).items()
+                       if collection.count() > 0}
+        if not collections:
             logger.warning("ChromaDB está vazio - nenhum documento processado")
             return []
         try:
-            logger.debug(f"Buscando chunks para query: '{query[:50]}...' (k={k})")
-            query_embedding = self.embedding_model_st.encode([query]).tolist()
-            results = self.collection.query(
-                query_embeddings=query_embedding, n_results=min(k, self.collection.count()), 
-                include=["documents", "metadatas", "distances"] )
-            retrieved_items = []
-            if results['ids'] and results['ids'][0]: 
-                for i in range(len(results['ids'][0])):
-                    distance = results['distances'][0][i] if results['distances'] and results['distances'][0] else 1.0
-                    retrieved_items.append({
-                        "id": results['ids'][0][i], "document": results['documents'][0][i],
-                        "metadata": results['metadatas'][0][i] if results['metadatas'] and results['metadatas'][0] else None,
-                        "distance": distance })
+            logger.debug(f"Buscando chunks para query: '{query[:50]}...' (k={k}, shards={len(collections)}, filtro={where})")
+            # Uma codificação da consulta por modelo de embedding (durante uma migração,
+            # a coleção antiga é consultada com o modelo que a gerou)
+            query_embeddings = {}
+            for collection in collections.values():
+                model_name = self._collection_models[collection.name]
+                if model_name not in query_embeddings:
+                    query_embeddings[model_name] = [
+                        self._get_embedding_model(model_name).encode_query(query).tolist()]
+            deadline.check("retrieval")
+
+            def query_shard(shard_and_collection):
+                shard, collection = shard_and_collection
+                results = collection.query(
+                    query_embeddings=query_embeddings[self._collection_models[collection.name]], n_results=min(k, collection.count()), where=where,
+                    include=["documents", "metadatas", "distances"] )
+                return self._shard_result_items(results, 0, shard)
+
+            if len(collections) == 1:
+                per_shard = [query_shard(next(iter(collections.items())))]
+            else:
+                futures = {self._shard_executor.submit(query_shard, item): item[0] for item in collections.items()}
+                done, late = wait(futures, timeout=deadline.remaining())
+                if late:
+                    for future in late:
+                        future.cancel()
+                    if not done:
+                        raise DeadlineExceeded("retrieval")
+                    logger.warning(f"Prazo da consulta: shard(s) {', '.join(sorted(futures[f] for f in late))} "
+                                   f"sem resposta a tempo; usando {len(done)} de {len(futures)}")
+                per_shard = [future.result() for future in done]
+            retrieved_items = sorted((item for items in per_shard for item in items),
+                                     key=lambda item: item["distance"])[:k]
             
             # Log de qualidade dos resultados
             chunks_found = len(retrieved_items)
-            logger.info(f"Recuperados {chunks_found} chunks via ChromaDB")
+            logger.info(f"Recuperados {chunks_found} chunks via ChromaDB ({len(collections)} shard(s))")
             
             if chunks_found > 0:
                 avg_distance = sum(item['distance'] for item in retrieved_items) / chunks_found
@@ -394,14 +1456,243 @@ class RAGCore:
                     logger.warning(f"Chunks com baixa relevância (dist. média: {avg_distance:.4f}) - considere reformular a pergunta")
             
             return retrieved_items
+        except DeadlineExceeded:
+            raise
         except Exception as e:
             logger.error(f"Erro ao buscar chunks no ChromaDB: {e}", exc_info=True)
             return []
+
+    @staticmethod
+    def _shard_result_items(results: Dict[str, Any], row: int, shard: str) -> List[Dict[str, Any]]:
+        """Itens da linha `row` (uma consulta) de um collection.query do ChromaDB."""
+        shard_items = []
+        if results['ids'] and results['ids'][row]:
+            for i in range(len(results['ids'][row])):
+                distance = results['distances'][row][i] if results['distances'] and results['distances'][row] else 1.0
+                shard_items.append({
+                    "id": results['ids'][row][i], "document": results['documents'][row][i],
+                    "metadata": results['metadatas'][row][i] if results['metadatas'] and results['metadatas'][row] else None,
+                    "distance": distance, "shard": shard })
+        return shard_items
+
+    def retrieve_relevant_chunks_batch(self, queries: List[str], k: int = config.DEFAULT_RETRIEVAL_K,
+                                       shards: Optional[List[str]] = None,
+                                       filters: Optional[Dict[str, Any]] = None) -> List[List[Dict[str, Any]]]:
+        """
+        Recupera chunks para várias consultas de uma vez (avaliações, lotes).
+
+        As consultas são codificadas num único lote por modelo de embedding e cada shard
+        recebe uma única busca com todos os vetores. Retorna uma lista de resultados por
+        consulta, na mesma ordem e no mesmo formato de retrieve_relevant_chunks.
+        """
+        if not queries:
+            return []
+        where = self.build_metadata_filter(filters)
+        if self.retrieval_client is not None:
+            self._select_shards(shards)
+            try:
+                results, index_version = self.retrieval_client.batch_retrieve(queries, k, shards, filters)
+            except (RetrievalWorkerError, TimeoutError) as e:
+                logger.error(f"Erro ao buscar chunks no worker de recuperação: {e}")
+                return [[] for _ in queries]
+            self._sync_worker_index(index_version)
+            return results
+        collections = {shard: collection for shard, collection in self._select_shards(shards).items()
+                       if collection.count() > 0}
+        if not collections:
+            logger.warning("ChromaDB está vazio - nenhum documento processado")
+            return [[] for _ in queries]
+        try:
+            query_embeddings = {}
+            for collection in collections.values():
+                model_name = self._collection_models[collection.name]
+                if model_name not in query_embeddings:
+                    query_embeddings[model_name] = self._get_embedding_model(model_name).encode(
+                        queries, batch_size=config.EMBEDDING_ENCODER_CONFIG["batch_size"],
+                        show_progress_bar=False, convert_to_numpy=True).tolist()
+
+            def query_shard(shard_and_collection):
+                shard, collection = shard_and_collection
+                results = collection.query(
+                    query_embeddings=query_embeddings[self._collection_models[collection.name]],
+                    n_results=min(k, collection.count()), where=where,
+                    include=["documents", "metadatas", "distances"])
+                return [self._shard_result_items(results, row, shard) for row in range(len(queries))]
+
+            per_shard = list(self._shard_executor.map(query_shard, collections.items()))
+            logger.info(f"Recuperação em lote: {len(queries)} consulta(s) em {len(collections)} shard(s)")
+            return [sorted((item for shard_rows in per_shard for item in shard_rows[row]),
+                           key=lambda item: item["distance"])[:k]
+                    for row in range(len(queries))]
+        except Exception as e:
+            logger.error(f"Erro ao buscar chunks no ChromaDB: {e}", exc_info=True)
+            return [[] for _ in queries]
+
+    def _retrieve_from_worker(self, query: str, k: int, shards: Optional[List[str]],
+                              filters: Optional[Dict[str, Any]], deadline: Deadline) -> List[Dict[str, Any]]:
+        try:
+            items, index_version = self.retrieval_client.retrieve(query, k, shards, filters, deadline.remaining())
+        except TimeoutError as e:
+            if deadline.expired():
+                raise DeadlineExceeded("retrieval")
+            logger.error(f"Erro ao buscar chunks no worker de recuperação: {e}")
+            return []
+        except RetrievalWorkerError as e:
+            logger.error(f"Erro ao buscar chunks no worker de recuperação: {e}")
+            return []
+        self._sync_worker_index(index_version)
+        logger.info(f"Recuperados {len(items)} chunks via worker de recuperação")
+        return items
+
+    def embed_texts(self, texts: List[str]) -> np.ndarray:
+        """Vetores (float32) dos textos no modelo de embedding do índice, local ou no worker."""
+        if self.retrieval_client is not None:
+            return self.retrieval_client.embed(texts)
+        model = self.embedding_model_st
+        if not texts:
+            dimension = getattr(model, "get_embedding_dimension", model.get_sentence_embedding_dimension)()
+            return np.zeros((0, dimension), dtype=np.float32)
+        return model.encode(
+            texts, batch_size=config.EMBEDDING_ENCODER_CONFIG["batch_size"],
+            show_progress_bar=False, convert_to_numpy=True).astype(np.float32)
         
-    def answer_query(self, query: str) -> str:
+    def answer_query(self, query: str, priority: Optional[str] = None, profile: Optional[bool] = None,
+                     shards: Optional[List[str]] = None, filters: Optional[Dict[str, Any]] = None,
+                     model_route: Optional[str] = None, timeout_seconds: Optional[float] = None) -> str:
         """Responde consulta usando documentos locais e opcionalmente conhecimento externo."""
+        return self.answer_query_with_details(query, priority=priority, profile=profile,
+                                              shards=shards, filters=filters, model_route=model_route,
+                                              timeout_seconds=timeout_seconds)["answer"]
+
+    def answer_query_with_details(self, query: str,
+                                  on_event: Optional[Callable[[str, Dict[str, Any]], None]] = None,
+                                  priority: Optional[str] = None,
+                                  profile: Optional[bool] = None,
+                                  shards: Optional[List[str]] = None,
+                                  filters: Optional[Dict[str, Any]] = None,
+                                  model_route: Optional[str] = None,
+                                  timeout_seconds: Optional[float] = None) -> Dict[str, Any]:
+        """
+        Responde a consulta e retorna também os detalhes da execução.
+
+        Chamadas simultâneas com a mesma pergunta normalizada, na mesma versão do
+        índice, compartilham uma única execução (recuperação + LLM); as que apenas
+        aguardaram recebem "coalesced": True.
+
+        Args:
+            query: Pergunta do usuário
+            on_event: Callback opcional chamado a cada etapa concluída
+                (ex.: on_event("retrieved", {...})), usado por front-ends com streaming
+            priority: Classe de prioridade da chamada ao LLM (padrão: self.llm_priority)
+            profile: Perfila a execução (cProfile + tracemalloc); padrão em
+                PROFILING_CONFIG["queries"]. Consultas perfiladas não são coalescidas.
+            shards: Shards consultados (padrão: todos)
+            filters: Filtros de metadados da recuperação (fonte, intervalo de páginas, tipo)
+            model_route: Força o modelo de geração ("small" ou "large"); padrão: classificação
+                da consulta (LLM_MODEL_ROUTING_CONFIG)
+            timeout_seconds: Prazo total da consulta; padrão em
+                QUERY_DEADLINE_CONFIG["default_seconds"][prioridade]
+
+        Returns:
+            Dicionário com "answer", "path" (caminho seguido: "llm", "fallback:<motivo>",
+            "gate:<motivo>", "deadline:<etapa>" ou "error:llm" quando o LLM falhou), "used_external", "retrieved" (ids, fontes
+            e distâncias), "model_route" (rota do modelo e motivos, quando houve geração),
+            "timings" (segundos por etapa), "deadline" (prazo e etapa em que se esgotou)
+            e, se perfilada, "profile" (arquivos gerados)
+        """
+        if model_route is not None and model_route not in ROUTES:
+            raise ValueError(f"Rota de modelo desconhecida: {model_route} (use {', '.join(ROUTES)})")
+        if timeout_seconds is not None and timeout_seconds <= 0:
+            raise ValueError("timeout_seconds deve ser positivo")
+        deadline = self._query_deadline(priority, timeout_seconds)
+        if profile is None:
+            profile = config.PROFILING_CONFIG["queries"]
+        if profile:
+            with ProfileSession("query", query) as session:
+                details = self._answer_query_uncoalesced(query, on_event, priority, shards, filters, model_route,
+                                                         deadline)
+            return dict(details, profile=session.summary)
+
+        if not config.QUERY_COALESCING_ENABLED:
+            return self._answer_query_uncoalesced(query, on_event, priority, shards, filters, model_route, deadline)
+
+        # A prioridade faz parte da chave: uma consulta interativa não espera na fila "batch"
+        key = (self._normalize_query(query), self.index_version, tuple(sorted(shards or ())),
+               json.dumps(filters, sort_keys=True) if filters else None, model_route,
+               priority or self.llm_priority)
+        while True:
+            try:
+                details, shared = self._single_flight.do(
+                    key, lambda: self._answer_query_uncoalesced(query, on_event, priority, shards, filters,
+                                                                model_route, deadline),
+                    timeout=deadline.remaining())
+            except TimeoutError:
+                # A execução compartilhada segue para quem a iniciou; esta consulta degrada
+                logger.warning(f"Prazo esgotado aguardando consulta idêntica em andamento: '{query[:50]}...'")
+                self._record_deadline("coalesced")
+                return {"query": query, "path": "deadline:coalesced", "used_external": False, "coalesced": True,
+                        "retrieved": [], "timings": {},
+                        "deadline": {"seconds": deadline.seconds, "exceeded": "coalesced"},
+                        "answer": self._deadline_response([], None)}
+            if not shared:
+                return details
+            # A execução compartilhada usa o prazo de quem a iniciou: se ele esgotou e o
+            # desta consulta não, a consulta é executada de novo com o próprio prazo
+            if not details["deadline"]["exceeded"] or deadline.expired():
+                break
+            logger.info(f"Consulta idêntica esgotou o próprio prazo; executando novamente: '{query[:50]}...'")
+
+        logger.info(f"Consulta coalescida com execução idêntica em andamento: '{query[:50]}...'")
+        details = dict(details, query=query, coalesced=True)
+        if on_event:
+            on_event("retrieved", {"retrieved": details.get("retrieved", []),
+                                   "seconds": details["timings"].get("retrieval")})
+        return details
+
+    @staticmethod
+    def _normalize_query(query: str) -> str:
+        """Normaliza a pergunta para coalescência (minúsculas, espaços colapsados)."""
+        return " ".join(query.lower().split())
+
+    def _answer_query_uncoalesced(self, query: str,
+                                  on_event: Optional[Callable[[str, Dict[str, Any]], None]] = None,
+                                  priority: Optional[str] = None,
+                                  shards: Optional[List[str]] = None,
+                                  filters: Optional[Dict[str, Any]] = None,
+                                  model_route: Optional[str] = None,
+                                  deadline: Optional[Deadline] = None) -> Dict[str, Any]:
+        """Executa recuperação, portão, geração e conhecimento externo para uma consulta."""
         logger.info(f"Consulta recebida: '{query}'")
-        retrieved_items = self.retrieve_relevant_chunks(query)
+        deadline = deadline or Deadline.none()
+        total_start = time.perf_counter()
+        timings: Dict[str, float] = {}
+        details: Dict[str, Any] = {"query": query, "path": "llm", "used_external": False,
+                                   "coalesced": False, "timings": timings,
+                                   "deadline": {"seconds": deadline.seconds, "exceeded": None}}
+
+        def finish(answer: str) -> Dict[str, Any]:
+            timings["total"] = time.perf_counter() - total_start
+            details["answer"] = answer
+            return details
+
+        def expire(stage: str, items: List[Dict[str, Any]], partial: Optional[str] = None) -> Dict[str, Any]:
+            details["path"] = f"deadline:{stage}"
+            details["deadline"]["exceeded"] = stage
+            self._record_deadline(stage, partial)
+            logger.warning(f"Prazo de {deadline.seconds}s esgotado na etapa '{stage}': '{query[:50]}...'")
+            return finish(self._deadline_response(items, partial))
+
+        stage_start = time.perf_counter()
+        try:
+            retrieved_items = self.retrieve_relevant_chunks(query, shards=shards, filters=filters, deadline=deadline)
+        except DeadlineExceeded:
+            timings["retrieval"] = time.perf_counter() - stage_start
+            details["retrieved"] = []
+            return expire("retrieval", [])
+        timings["retrieval"] = time.perf_counter() - stage_start
+        details["retrieved"] = [self._summarize_chunk(item) for item in retrieved_items]
+        if on_event:
+            on_event("retrieved", {"retrieved": details["retrieved"], "seconds": timings["retrieval"]})
         
         if config.PRINT_DEBUG_CHUNKS:
             print("\n--- CHUNKS RECUPERADOS (DEBUG VIA CHROMA DB) ---")
@@ -420,26 +1711,193 @@ class RAGCore:
                 print("Nenhum chunk relevante encontrado para a consulta.")
             print("--- FIM DOS CHUNKS (DEBUG) ---\n")
         
-        if self.collection.count() == 0 and not retrieved_items:
-            return self._generate_fallback_response(query, "no_documents")
-        
-        # Gerar resposta base com documentos locais
-        base_response = self.query_llm(query, retrieved_items)
+        # Só conta os chunks (uma chamada ao worker no modo cliente) quando nada foi recuperado
+        if not retrieved_items and self.count_chunks(shards) == 0:
+            details["path"] = "fallback:no_documents"
+            return finish(self._generate_fallback_response(query, "no_documents"))
+
+        # Portão de relevância: evita chamar o LLM quando os documentos claramente não respondem
+        gate_reason = self._evaluate_retrieval_gate(query, retrieved_items)
+        if gate_reason:
+            details["path"] = f"gate:{gate_reason}"
+            return finish(self._generate_fallback_response(query, gate_reason, allow_remote_external=False))
         
-        # Verificar se deve usar conhecimento externo para complementar
+        # Sem tempo para gerar: responde com os trechos recuperados, sem chamar o LLM
+        remaining = deadline.remaining()
+        if remaining is not None and remaining < config.QUERY_DEADLINE_CONFIG["min_generation_seconds"]:
+            return expire("generation", retrieved_items)
+
+        # Decide sobre conhecimento externo assim que a recuperação termina e, se for o caso,
+        # inicia a busca especulativamente em paralelo com a geração do LLM
+        external_future = None
+        cancel_event = threading.Event()
         if (self.external_provider and 
             config.ALLOW_EXTERNAL_KNOWLEDGE and 
             self.external_provider.should_use_external_knowledge(query, retrieved_items, [])):
-            
-            external_info = self.external_provider.get_external_knowledge(query)
-            if external_info:
-                logger.info(f"Adicionando conhecimento externo para query: '{query[:50]}...'")
-                return self.external_provider.format_response_with_external(
-                    base_response, external_info, query)
+            external_future = self._external_executor.submit(
+                self.external_provider.get_external_knowledge, query, True, cancel_event, deadline)
+
+        # Gerar resposta base com documentos locais, no modelo escolhido para a consulta
+        route = self.model_router.classify(query, retrieved_items, override=model_route)
+        details["model_route"] = {"route": route["route"], "reasons": route["reasons"]}
+        stage_start = time.perf_counter()
+        try:
+            base_response = self._generate_answer(query, retrieved_items, priority, route, deadline)
+        except DeadlineExceeded as e:
+            cancel_event.set()
+            timings["generation"] = time.perf_counter() - stage_start
+            return expire("generation", retrieved_items, e.partial)
+        except LLMUnavailableError as e:
+            # Falha do LLM: o complemento externo não é mais necessário
+            cancel_event.set()
+            if external_future is not None:
+                external_future.cancel()
+            timings["generation"] = time.perf_counter() - stage_start
+            details["path"] = "error:llm"
+            return finish(e.response)
+        except BaseException:
+            cancel_event.set()
+            raise
+        timings["generation"] = time.perf_counter() - stage_start
+
+        if external_future is None:
+            return finish(base_response)
+
+        stage_start = time.perf_counter()
+        try:
+            external_info = external_future.result(timeout=deadline.remaining())
+        except FutureTimeoutError:
+            # Prazo esgotado: responde só com os documentos locais (resposta já gerada)
+            cancel_event.set()
+            details["deadline"]["exceeded"] = "external_wait"
+            self._record_deadline("external_wait")
+            logger.warning(f"Prazo esgotado aguardando o conhecimento externo: '{query[:50]}...'")
+            external_info = None
+        except Exception as e:
+            logger.error(f"Erro na busca de conhecimento externo: {e}", exc_info=True)
+            external_info = None
+        # Tempo que a busca externa excedeu a geração (0 quando totalmente sobreposta)
+        timings["external_wait"] = time.perf_counter() - stage_start
+        if external_info:
+            logger.info(f"Adicionando conhecimento externo para query: '{query[:50]}...'")
+            details["used_external"] = True
+            return finish(self.external_provider.format_response_with_external(
+                base_response, external_info, query))
         
-        return base_response
+        return finish(base_response)
+
+    @staticmethod
+    def _summarize_chunk(item: Dict[str, Any]) -> Dict[str, Any]:
+        """Resumo serializável de um chunk recuperado (sem o texto)."""
+        meta = item.get('metadata') or {}
+        return {
+            "id": item.get('id'),
+            "source": meta.get('source'),
+            "page_number": meta.get('page_number'),
+            "content_type": meta.get('content_type'),
+            "distance": item.get('distance'),
+            "shard": item.get('shard'),
+            "duplicate_count": meta.get('duplicate_count', 0),
+        }
 
-    def _generate_fallback_response(self, query: str, reason: str) -> str:
+    def get_stats(self) -> Dict[str, Any]:
+        """Contadores operacionais agregados (para logs, métricas e front-ends)."""
+        return {
+            "gate": self.get_gate_stats(),
+            "coalescing": self._single_flight.get_stats(),
+            "llm_scheduler": self.llm_scheduler.get_stats(),
+            "llm_router": self.llm_router.get_stats(),
+            "model_routing": self.model_router.get_stats(),
+            "deadlines": self.get_deadline_stats(),
+            "index_version": self.index_version,
+            "shards": self.get_shard_stats(),
+            "manifest": self.get_manifest_stats(),
+            "extraction_cache": self.extraction_cache.get_stats() if self.extraction_cache else None,
+            "embedding_models": self.embedding_registry.get_stats(),
+            "retrieval_worker": self.retrieval_client.get_stats() if self.retrieval_client else None,
+        }
+
+    def _evaluate_retrieval_gate(self, query: str, retrieved_items: List[Dict[str, Any]]):
+        """
+        Decide, antes da geração, se os chunks recuperados justificam uma chamada ao LLM.
+
+        Retorna o motivo do fallback ("low_relevance" ou "insufficient_context") quando
+        a chamada deve ser evitada, ou None quando a consulta deve seguir para o LLM.
+        """
+        gate_config = config.RETRIEVAL_GATE_CONFIG
+        if not gate_config.get("enabled", False) or not retrieved_items:
+            return None
+
+        distances = [item.get('distance', 1.0) for item in retrieved_items]
+        best_distance = min(distances)
+        is_conceptual, has_specific_context = self._classify_query_keywords(query)
+
+        reason = None
+        if best_distance >= gate_config["low_relevance_distance"]:
+            reason = "low_relevance"
+        elif (is_conceptual and not has_specific_context
+              and best_distance >= gate_config["insufficient_context_distance"]):
+            # Só descarta quando nenhum chunk está próximo: um único trecho muito relevante basta
+            close_chunks = sum(1 for d in distances if d < gate_config["insufficient_context_distance"])
+            if close_chunks < config.EXTERNAL_KNOWLEDGE_CONFIG["min_chunks_threshold"]:
+                reason = "insufficient_context"
+
+        with self._stats_lock:
+            self.gate_stats["evaluated"] += 1
+            if reason:
+                self.gate_stats["llm_calls_saved"] += 1
+                self.gate_stats[reason] += 1
+
+        if gate_config.get("log_decisions", False):
+            logger.debug(f"Portão de relevância para '{query[:50]}...': melhor distância={best_distance:.4f}, "
+                        f"conceitual={is_conceptual}, contexto específico={has_specific_context}, "
+                        f"decisão={reason or 'chamar LLM'}")
+        return reason
+
+    def get_gate_stats(self) -> Dict[str, int]:
+        """Retorna uma cópia dos contadores do portão de relevância."""
+        with self._stats_lock:
+            return dict(self.gate_stats)
+
+    # --- Prazo por consulta ---
+
+    def _query_deadline(self, priority: Optional[str], timeout_seconds: Optional[float]) -> Deadline:
+        """Prazo da consulta: o pedido pelo chamador ou o padrão da classe de prioridade."""
+        deadline_config = config.QUERY_DEADLINE_CONFIG
+        if timeout_seconds is None and deadline_config.get("enabled", False):
+            timeout_seconds = deadline_config["default_seconds"].get(priority or self.llm_priority)
+        return Deadline(timeout_seconds)
+
+    def _record_deadline(self, stage: str, partial: Optional[str] = None):
+        with self._stats_lock:
+            self.deadline_stats[stage] += 1
+            if partial:
+                self.deadline_stats["partial_answers"] += 1
+
+    def get_deadline_stats(self) -> Dict[str, int]:
+        """Consultas degradadas por prazo esgotado, por etapa."""
+        with self._stats_lock:
+            return dict(self.deadline_stats)
+
+    @staticmethod
+    def _deadline_response(items: List[Dict[str, Any]], partial: Optional[str]) -> str:
+        """Resposta degradada quando o prazo acaba: texto parcial do LLM ou trechos recuperados."""
+        if partial:
+            return (f"{partial}\n\n⏱️ **Resposta interrompida:** o tempo limite da consulta foi atingido "
+                    f"antes do fim da geração. Consulte os documentos oficiais para a informação completa.")
+        if items:
+            excerpts = []
+            for item in items[:config.QUERY_DEADLINE_CONFIG["partial_excerpts"]]:
+                meta = item.get('metadata') or {}
+                text = " ".join(item.get('document', '').split())
+                excerpts.append(f"- **{meta.get('source', 'Desconhecida')}, Página {meta.get('page_number', 'N/A')}:** "
+                                f"{text[:300]}{'...' if len(text) > 300 else ''}")
+            return ("⏱️ **Não foi possível gerar a resposta dentro do tempo limite.**\n\n"
+                    "Trechos mais relevantes encontrados nos documentos:\n" + "\n".join(excerpts))
+        return ("⏱️ **Tempo limite da consulta atingido.**\n\n"
+                "O sistema está sobrecarregado ou lento no momento. Tente novamente em instantes.")
+
+    def _generate_fallback_response(self, query: str, reason: str, allow_remote_external: bool = True) -> str:
         """Gera resposta de fallback quando não há informação suficiente."""
         fallback_responses = {
             "no_documents": """
@@ -491,7 +1949,8 @@ Foram encontrados alguns trechos relacionados, mas não há informação suficie
             config.ALLOW_EXTERNAL_KNOWLEDGE and 
             reason in ["low_relevance", "insufficient_context"]):
             
-            external_info = self.external_provider.get_external_knowledge(query)
+            external_info = self.external_provider.get_external_knowledge(
+                query, allow_remote=allow_remote_external)
             if external_info:
                 base_response += f"\n\n{external_info}\n\n⚠️ **IMPORTANTE:** Esta informação complementar não substitui a consulta aos documentos oficiais."
         
@@ -508,18 +1967,7 @@ Foram encontrados alguns trechos relacionados, mas não há informação suficie
         if len(context_items) >= config.EXTERNAL_KNOWLEDGE_CONFIG["min_chunks_threshold"]:
             return False
             
-        # Verificar se é uma pergunta conceitual
-        query_lower = query.lower()
-        is_conceptual = any(
-            keyword in query_lower 
-            for keyword in config.EXTERNAL_KNOWLEDGE_CONFIG["conceptual_keywords"]
-        )
-        
-        # Verificar se menciona contextos específicos que impedem uso externo
-        has_specific_context = any(
-            keyword in query_lower 
-            for keyword in config.EXTERNAL_KNOWLEDGE_CONFIG["specific_context_keywords"]
-        )
+        is_conceptual, has_specific_context = self._classify_query_keywords(query)
         
         # Log da decisão se configurado
         if config.EXTERNAL_KNOWLEDGE_CONFIG.get("log_external_usage", False):
@@ -534,8 +1982,42 @@ Foram encontrados alguns trechos relacionados, mas não há informação suficie
         # Permitir fontes externas apenas para perguntas conceituais SEM contexto específico
         return is_conceptual and not has_specific_context
 
-    def query_llm(self, query: str, context_items: List[Dict[str, Any]]) -> str:
-        """Envia consulta e contexto (com metadados) para o LLM."""
+    def _classify_query_keywords(self, query: str):
+        """Retorna (é conceitual, menciona contexto específico) segundo EXTERNAL_KNOWLEDGE_CONFIG."""
+        keyword_classes = self.keyword_matcher.match(query)
+        return bool(keyword_classes.get("conceptual")), bool(keyword_classes.get("specific_context"))
+
+    def query_llm(self, query: str, context_items: List[Dict[str, Any]], priority: Optional[str] = None,
+                  model_route: Optional[str] = None, route: Optional[Dict[str, Any]] = None,
+                  deadline: Optional[Deadline] = None) -> str:
+        """
+        Envia consulta e contexto (com metadados) para o LLM, via escalonador.
+
+        O modelo vem da classificação da consulta (model_routing.py), da rota forçada
+        em `model_route` ou de uma decisão já tomada pelo chamador (`route`).
+
+        Falhas do LLM (endpoints indisponíveis, escalonador sobrecarregado) são
+        devolvidas como mensagem de erro no próprio texto.
+
+        Raises:
+            DeadlineExceeded: o prazo (`deadline`) acabou durante a geração
+        """
+        if route is None:
+            route = self.model_router.classify(query, context_items, override=model_route)
+        try:
+            return self._generate_answer(query, context_items, priority, route, deadline)
+        except LLMUnavailableError as e:
+            return e.response
+
+    def _generate_answer(self, query: str, context_items: List[Dict[str, Any]], priority: Optional[str],
+                         route: Dict[str, Any], deadline: Optional[Deadline] = None) -> str:
+        """
+        Monta o prompt e gera a resposta (ver query_llm).
+
+        Raises:
+            LLMUnavailableError: a chamada ao LLM falhou
+            DeadlineExceeded: o prazo (`deadline`) acabou durante a geração
+        """
         
         # Verificar se deve permitir conhecimento externo
         allow_external = self._should_use_external_knowledge(query, context_items)
@@ -571,6 +2053,8 @@ Foram encontrados alguns trechos relacionados, mas não há informação suficie
                 meta = item.get('metadata', {})
                 content_type = "Tabela" if meta.get('content_type') == 'table' else "Trecho de Texto"
                 source_info = f"Fonte: {meta.get('source', 'Desconhecida')}, Página: {meta.get('page_number', 'N/A')}"
+                if meta.get('duplicate_locations'):
+                    source_info += f"; também em: {', '.join(meta['duplicate_locations'])}"
                 context_parts.append(f"{source_info} ({content_type}):\n{doc_text}")
             
             context_str = "\n\n---\n\n".join(context_parts)
@@ -602,13 +2086,7 @@ Foram encontrados alguns trechos relacionados, mas não há informação suficie
                 f"Assistente:"
             )
 
-        # Seleciona o provedor LLM baseado na configuração
-        if self.llm_provider == "gemini":
-            response = self._query_gemini(prompt_message)
-        elif self.llm_provider == "ollama":
-            response = self._query_ollama(prompt_message)
-        else:
-            return f"Erro: Provedor LLM desconhecido: {self.llm_provider}"
+        response = self._query_llm(prompt_message, priority or self.llm_priority, route, deadline)
         
         # Adicionar indicador de fonte externa se foi utilizada
         return self._add_external_source_indicator(response, allow_external, context_items)
@@ -628,13 +2106,9 @@ Foram encontrados alguns trechos relacionados, mas não há informação suficie
         if context_items and len(context_items) >= config.EXTERNAL_KNOWLEDGE_CONFIG["min_chunks_threshold"]:
             return response
             
-        # Usar indicadores de conhecimento externo do config
-        external_usage_indicators = config.EXTERNAL_KNOWLEDGE_CONFIG.get("external_usage_indicators", [])
-        
-        response_lower = response.lower()
-        
-        # Verificar se a resposta parece usar conhecimento externo
-        uses_external = any(indicator in response_lower for indicator in external_usage_indicators)
+        # Verificar se a resposta parece usar conhecimento externo (indicadores do config,
+        # compilados no mesmo autômato das demais palavras-chave)
+        uses_external = bool(self.keyword_matcher.match(response).get("external_usage"))
         
         # Se detectou uso de conhecimento externo, adicionar indicador
         if uses_external:
@@ -652,34 +2126,31 @@ Foram encontrados alguns trechos relacionados, mas não há informação suficie
         
         return response
 
-    def _query_gemini(self, prompt_message: str) -> str:
-        """Envia consulta para o Google Gemini."""
-        logger.info(f"Enviando prompt para Google Gemini (modelo: {config.GEMINI_MODEL})...")
-        try:
-            response = self.gemini_model.generate_content(prompt_message)
-            if response and response.text:
-                return response.text.strip()
-            else:
-                logger.error(f"Resposta inesperada do Gemini: {response}")
-                return "Erro: O Gemini retornou uma resposta em formato inesperado."
-        except Exception as e:
-            logger.error(f"Erro ao comunicar com Gemini: {e}", exc_info=True)
-            return f"Erro ao comunicar com o Gemini: {e}"
+    def _query_llm(self, prompt_message: str, priority: str, route: Optional[Dict[str, Any]] = None,
+                   deadline: Optional[Deadline] = None) -> str:
+        """
+        Envia o prompt pelo roteador LLM (failover entre endpoints, escalonador por endpoint).
 
-    def _query_ollama(self, prompt_message: str) -> str:
-        """Envia consulta para o Ollama local."""
-        logger.info(f"Enviando prompt para Ollama (modelo: {self.configured_ollama_model})...")
+        Raises:
+            LLMUnavailableError: nenhum endpoint respondeu ou o escalonador recusou a chamada
+        """
+        route = route or {"route": "large", "reasons": ["disabled"]}
+        start = time.perf_counter()
         try:
-            # Cria cliente Ollama com host personalizado
-            client = ollama.Client(host=config.OLLAMA_HOST)
-            response = client.chat(model=self.configured_ollama_model, messages=[{'role': 'user', 'content': prompt_message}])
-            if response and 'message' in response and 'content' in response['message']:
-                return response['message']['content'].strip()
-            else:
-                logger.error(f"Resposta inesperada do Ollama: {response}")
-                return "Erro: O Ollama retornou uma resposta em formato inesperado."
+            response = self.llm_router.generate(prompt_message, priority, model=self.model_router.model_for(route),
+                                                deadline=deadline)
+        except DeadlineExceeded:
+            self.model_router.record(route, time.perf_counter() - start, ok=False)
+            raise
+        except SchedulerRejectedError as e:
+            self.model_router.record(route, time.perf_counter() - start, ok=False)
+            logger.warning(f"Chamada ao LLM recusada pelo escalonador: {e}")
+            raise LLMUnavailableError(f"Erro: O provedor LLM está sobrecarregado ({e}). Tente novamente em instantes.")
         except Exception as e:
-            logger.error(f"Erro ao comunicar com Ollama: {e}", exc_info=True)
-            return f"Erro ao comunicar com o Ollama: {e}"
+            self.model_router.record(route, time.perf_counter() - start, ok=False)
+            logger.error(f"Erro ao comunicar com o LLM: {e}", exc_info=True)
+            raise LLMUnavailableError(f"Erro ao comunicar com o LLM: {e}")
+        self.model_router.record(route, time.perf_counter() - start, ok=True)
+        return response
 
 # O bloco if __name__ == '__main__' foi removido.
@@ -0,0 +1,470 @@
+# src/rag_app/rag_server.py
+"""
+Serviço HTTP/JSON de consultas sobre um único RAGCore compartilhado.
+
+Construído apenas com asyncio e a biblioteca padrão: o laço de eventos aceita
+muitas conexões simultâneas e as consultas (CPU/LLM) rodam em um pool de threads
+limitado a SERVER_CONFIG["max_concurrency"]. Consultas excedentes aguardam em
+uma fila limitada; com a fila cheia (ou a espera esgotada) o servidor responde
+HTTP 429 com Retry-After.
+
+Endpoints:
+    POST /answer    {"query": "...", "stream": false, "priority": "interactive"}
+                    Com "stream": true a resposta é NDJSON em chunked encoding, com
+                    um evento por etapa ("accepted", "retrieved", "answer").
+                    "profile": true perfila a consulta (arquivos em PROFILING_CONFIG["output_dir"]).
+                    "model_route": "small" | "large" força o modelo de geração
+                    (padrão: classificação da consulta, LLM_MODEL_ROUTING_CONFIG).
+                    "timeout_seconds": 20 define o prazo da consulta, contado desde a
+                    chegada (inclui a espera na fila); esgotado, a resposta degrada
+                    (padrão: QUERY_DEADLINE_CONFIG["default_seconds"][priority]).
+    POST /retrieve  {"query": "...", "k": 5}   Apenas recuperação (sem LLM)
+                    /answer e /retrieve aceitam "shards": ["campus_a", ...] e "filters":
+                    {"source": ..., "page_from": ..., "page_to": ..., "content_type": "table"}
+                    para limitar a busca.
+    GET  /health    Estado do serviço
+    GET  /metrics   Métricas do servidor e contadores do RAGCore
+
+Uso (a partir da raiz do projeto):
+    python -m src.rag_app.rag_server --host 0.0.0.0 --port 8080
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import signal
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager, suppress
+from http import HTTPStatus
+from typing import Any, Deque, Dict, Optional
+
+from .rag_core import RAGCore
+from .llm_scheduler import PRIORITY_CLASSES
+from .model_routing import ROUTES as MODEL_ROUTES
+from . import config
+
+logger = logging.getLogger(__name__)
+if not logger.handlers:
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+
+class HTTPError(Exception):
+    """Erro a ser devolvido ao cliente com o status HTTP indicado."""
+
+    def __init__(self, status: int, message: str, headers: Optional[Dict[str, str]] = None):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+        self.headers = headers or {}
+
+
+def _percentile(values, pct: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100.0 * (len(ordered) - 1)))))
+    return ordered[index]
+
+
+class ServerMetrics:
+    """Contadores e janelas de latência do servidor (acessados apenas pelo laço de eventos)."""
+
+    def __init__(self, window: int = 2048):
+        self.started_at = time.time()
+        self.requests_by_endpoint: Dict[str, int] = {}
+        self.responses_by_status: Dict[str, int] = {}
+        self.rejected = 0
+        self.latencies: Deque[float] = deque(maxlen=window)
+        self.queue_waits: Deque[float] = deque(maxlen=window)
+
+    def record(self, endpoint: str, status: int, seconds: float):
+        self.requests_by_endpoint[endpoint] = self.requests_by_endpoint.get(endpoint, 0) + 1
+        self.responses_by_status[str(status)] = self.responses_by_status.get(str(status), 0) + 1
+        if endpoint in ("/answer", "/retrieve") and status == 200:
+            self.latencies.append(seconds)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "uptime_seconds": round(time.time() - self.started_at, 1),
+            "requests_by_endpoint": dict(self.requests_by_endpoint),
+            "responses_by_status": dict(self.responses_by_status),
+            "rejected": self.rejected,
+            "latency_p50_seconds": _percentile(self.latencies, 50),
+            "latency_p95_seconds": _percentile(self.latencies, 95),
+            "latency_p99_seconds": _percentile(self.latencies, 99),
+            "queue_wait_p95_seconds": _percentile(self.queue_waits, 95),
+        }
+
+
+class RAGHTTPServer:
+    """Servidor HTTP/1.1 assíncrono com limite de concorrência, fila e 429."""
+
+    def __init__(self, rag_core: RAGCore, server_config: Optional[Dict[str, Any]] = None):
+        self.rag_core = rag_core
+        self.cfg = dict(config.SERVER_CONFIG)
+        self.cfg.update(server_config or {})
+        self.metrics = ServerMetrics()
+        self.port: Optional[int] = None
+
+        self._executor = ThreadPoolExecutor(max_workers=self.cfg["max_concurrency"],
+                                            thread_name_prefix="rag-server")
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._connections = set()
+        self._waiting = 0
+        self._in_flight = 0
+        self._shutting_down = False
+        self._routes = {
+            ("GET", "/health"): self._handle_health,
+            ("GET", "/metrics"): self._handle_metrics,
+            ("POST", "/answer"): self._handle_answer,
+            ("POST", "/retrieve"): self._handle_retrieve,
+        }
+
+    # --- Ciclo de vida ---
+
+    async def start(self):
+        self._slots = asyncio.Semaphore(self.cfg["max_concurrency"])
+        self._server = await asyncio.start_server(self._handle_connection, self.cfg["host"], self.cfg["port"])
+        self.port = self._server.sockets[0].getsockname()[1]
+        logger.info(f"Servidor RAG ouvindo em http://{self.cfg['host']}:{self.port} "
+                    f"(concorrência={self.cfg['max_concurrency']}, fila={self.cfg['max_queue']})")
+
+    async def serve_until_signal(self):
+        """Executa até receber SIGINT/SIGTERM e então encerra de forma graciosa."""
+        stop_event = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            with suppress(NotImplementedError, RuntimeError):
+                loop.add_signal_handler(sig, stop_event.set)
+        await stop_event.wait()
+        await self.shutdown()
+
+    async def shutdown(self):
+        """Para de aceitar conexões, aguarda as consultas em andamento e fecha o restante."""
+        if self._shutting_down:
+            return
+        self._shutting_down = True
+        logger.info("Encerrando servidor RAG: novas conexões recusadas, aguardando consultas em andamento...")
+        if self._server:
+            self._server.close()
+
+        deadline = time.monotonic() + self.cfg["shutdown_grace_seconds"]
+        while (self._in_flight or self._waiting) and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        if self._in_flight or self._waiting:
+            logger.warning(f"Prazo de encerramento esgotado com {self._in_flight} consultas em andamento.")
+
+        for writer in list(self._connections):
+            writer.close()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        logger.info("Servidor RAG encerrado.")
+
+    # --- Protocolo HTTP ---
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self._connections.add(writer)
+        try:
+            while not self._shutting_down:
+                try:
+                    request = await asyncio.wait_for(self._read_request(reader),
+                                                     timeout=self.cfg["keep_alive_timeout_seconds"])
+                except HTTPError as e:
+                    await self._send_json(writer, e.status, {"error": e.message}, False, e.headers)
+                    break
+                if request is None:
+                    break
+                method, path, body, keep_alive = request
+                keep_alive = keep_alive and not self._shutting_down
+                await self._dispatch(writer, method, path, body, keep_alive)
+                if not keep_alive:
+                    break
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self._connections.discard(writer)
+            writer.close()
+            with suppress(Exception):
+                await writer.wait_closed()
+
+    async def _read_request(self, reader: asyncio.StreamReader):
+        try:
+            head = await reader.readuntil(b"\r\n\r\n")
+        except asyncio.IncompleteReadError as e:
+            if not e.partial.strip():
+                return None  # Conexão encerrada pelo cliente entre requisições
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "Requisição incompleta")
+        except asyncio.LimitOverrunError:
+            raise HTTPError(HTTPStatus.REQUEST_HEADER_FIELDS_TOO_LARGE, "Cabeçalhos muito grandes")
+
+        lines = head.decode("latin-1").split("\r\n")
+        try:
+            method, target, version = lines[0].split(" ", 2)
+        except ValueError:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "Linha de requisição inválida")
+        headers = {}
+        for line in lines[1:]:
+            if ":" in line:
+                name, value = line.split(":", 1)
+                headers[name.strip().lower()] = value.strip()
+
+        if "chunked" in headers.get("transfer-encoding", "").lower():
+            raise HTTPError(HTTPStatus.LENGTH_REQUIRED, "Envie o corpo com Content-Length")
+        try:
+            length = int(headers.get("content-length", "0"))
+        except ValueError:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "Content-Length inválido")
+        if length > self.cfg["max_body_bytes"]:
+            raise HTTPError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, "Corpo da requisição muito grande")
+        body = await reader.readexactly(length) if length else b""
+
+        connection = headers.get("connection", "").lower()
+        keep_alive = connection != "close" if version == "HTTP/1.1" else connection == "keep-alive"
+        return method.upper(), target.split("?", 1)[0], body, keep_alive
+
+    async def _dispatch(self, writer, method: str, path: str, body: bytes, keep_alive: bool):
+        start = time.perf_counter()
+        handler = self._routes.get((method, path))
+        try:
+            if handler is None:
+                if any(route_path == path for _, route_path in self._routes):
+                    raise HTTPError(HTTPStatus.METHOD_NOT_ALLOWED, f"Método {method} não permitido em {path}")
+                raise HTTPError(HTTPStatus.NOT_FOUND, f"Endpoint não encontrado: {path}")
+            status = await handler(writer, body, keep_alive)
+        except HTTPError as e:
+            status = e.status
+            await self._send_json(writer, e.status, {"error": e.message}, keep_alive, e.headers)
+        except ConnectionError:
+            raise
+        except Exception as e:
+            status = HTTPStatus.INTERNAL_SERVER_ERROR
+            logger.error(f"Erro ao processar {method} {path}: {e}", exc_info=True)
+            await self._send_json(writer, status, {"error": "Erro interno ao processar a consulta."}, keep_alive)
+        known_path = any(route_path == path for _, route_path in self._routes)
+        self.metrics.record(path if known_path else "<desconhecido>", int(status), time.perf_counter() - start)
+
+    async def _send_json(self, writer, status: int, payload: Any, keep_alive: bool,
+                         extra_headers: Optional[Dict[str, str]] = None):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        headers = {"Content-Type": "application/json; charset=utf-8", "Content-Length": str(len(body))}
+        headers.update(extra_headers or {})
+        writer.write(self._response_head(status, headers, keep_alive) + body)
+        await writer.drain()
+
+    def _response_head(self, status: int, headers: Dict[str, str], keep_alive: bool) -> bytes:
+        status = HTTPStatus(status)
+        headers.setdefault("Connection", "keep-alive" if keep_alive else "close")
+        lines = [f"HTTP/1.1 {status.value} {status.phrase}"] + [f"{k}: {v}" for k, v in headers.items()]
+        return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1")
+
+    async def _write_chunk(self, writer, payload: Optional[Dict[str, Any]]):
+        """Escreve um evento NDJSON como chunk; payload None encerra a resposta."""
+        if payload is None:
+            writer.write(b"0\r\n\r\n")
+        else:
+            data = json.dumps(payload, ensure_ascii=False).encode("utf-8") + b"\n"
+            writer.write(f"{len(data):X}\r\n".encode("ascii") + data + b"\r\n")
+        await writer.drain()
+
+    # --- Controle de admissão ---
+
+    @asynccontextmanager
+    async def _admission(self):
+        """Reserva uma vaga de execução, aguardando na fila limitada ou respondendo 429."""
+        if self._shutting_down:
+            raise HTTPError(HTTPStatus.SERVICE_UNAVAILABLE, "Servidor em encerramento", {"Connection": "close"})
+        if self._slots.locked() and self._waiting >= self.cfg["max_queue"]:
+            self.metrics.rejected += 1
+            raise HTTPError(HTTPStatus.TOO_MANY_REQUESTS, "Servidor sobrecarregado; tente novamente.",
+                            {"Retry-After": "1"})
+
+        self._waiting += 1
+        wait_start = time.perf_counter()
+        try:
+            await asyncio.wait_for(self._slots.acquire(), timeout=self.cfg["queue_timeout_seconds"])
+        except asyncio.TimeoutError:
+            self.metrics.rejected += 1
+            raise HTTPError(HTTPStatus.TOO_MANY_REQUESTS, "Tempo de espera na fila esgotado; tente novamente.",
+                            {"Retry-After": "1"})
+        finally:
+            self._waiting -= 1
+
+        queue_wait = time.perf_counter() - wait_start
+        self.metrics.queue_waits.append(queue_wait)
+        self._in_flight += 1
+        try:
+            yield queue_wait
+        finally:
+            self._in_flight -= 1
+            self._slots.release()
+
+    # --- Endpoints ---
+
+    def _parse_query_payload(self, body: bytes) -> Dict[str, Any]:
+        try:
+            payload = json.loads(body.decode("utf-8")) if body else {}
+        except (UnicodeDecodeError, json.JSONDecodeError):
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "Corpo deve ser JSON válido")
+        if not isinstance(payload, dict) or not isinstance(payload.get("query"), str) or not payload["query"].strip():
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "Campo 'query' (texto não vazio) é obrigatório")
+        shards = payload.get("shards")
+        if shards is not None:
+            if not isinstance(shards, list) or not all(isinstance(shard, str) for shard in shards):
+                raise HTTPError(HTTPStatus.BAD_REQUEST, "Campo 'shards' deve ser uma lista de nomes")
+            unknown = [shard for shard in shards if shard not in self.rag_core.list_shards()]
+            if unknown:
+                raise HTTPError(HTTPStatus.BAD_REQUEST, f"Shard(s) desconhecido(s): {', '.join(unknown)}")
+        filters = payload.get("filters")
+        if filters is not None:
+            if not isinstance(filters, dict):
+                raise HTTPError(HTTPStatus.BAD_REQUEST, "Campo 'filters' deve ser um objeto")
+            try:
+                self.rag_core.build_metadata_filter(filters)
+            except ValueError as e:
+                raise HTTPError(HTTPStatus.BAD_REQUEST, str(e))
+        return payload
+
+    async def _handle_health(self, writer, body: bytes, keep_alive: bool) -> int:
+        loop = asyncio.get_running_loop()
+        chunks = await loop.run_in_executor(None, self.rag_core.count_chunks)
+        status = "shutting_down" if self._shutting_down else "ok"
+        await self._send_json(writer, HTTPStatus.OK, {
+            "status": status,
+            "chunks": chunks,
+            "documents": len(self.rag_core.processed_pdf_files),
+            "llm_provider": self.rag_core.llm_provider,
+        }, keep_alive)
+        return HTTPStatus.OK
+
+    async def _handle_metrics(self, writer, body: bytes, keep_alive: bool) -> int:
+        # get_stats lê as coleções e o manifesto (e, no modo cliente, consulta o worker): fora do laço
+        loop = asyncio.get_running_loop()
+        core_stats = await loop.run_in_executor(None, self.rag_core.get_stats)
+        payload = self.metrics.snapshot()
+        payload.update({
+            "in_flight": self._in_flight,
+            "queued": self._waiting,
+            "max_concurrency": self.cfg["max_concurrency"],
+            "max_queue": self.cfg["max_queue"],
+            "rag_core": core_stats,
+        })
+        await self._send_json(writer, HTTPStatus.OK, payload, keep_alive)
+        return HTTPStatus.OK
+
+    async def _handle_retrieve(self, writer, body: bytes, keep_alive: bool) -> int:
+        payload = self._parse_query_payload(body)
+        k = payload.get("k", config.DEFAULT_RETRIEVAL_K)
+        if isinstance(k, bool) or not isinstance(k, int) or not 1 <= k <= 100:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "Campo 'k' deve ser inteiro entre 1 e 100")
+
+        async with self._admission():
+            loop = asyncio.get_running_loop()
+            items = await loop.run_in_executor(self._executor, self.rag_core.retrieve_relevant_chunks,
+                                               payload["query"], k, payload.get("shards"),
+                                               payload.get("filters"))
+        await self._send_json(writer, HTTPStatus.OK, {"query": payload["query"], "chunks": items}, keep_alive)
+        return HTTPStatus.OK
+
+    async def _handle_answer(self, writer, body: bytes, keep_alive: bool) -> int:
+        payload = self._parse_query_payload(body)
+        query = payload["query"]
+        priority = payload.get("priority", "interactive")
+        if priority not in PRIORITY_CLASSES:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, f"Campo 'priority' deve ser um de: {', '.join(PRIORITY_CLASSES)}")
+        profile = payload.get("profile")
+        if profile is not None and not isinstance(profile, bool):
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "Campo 'profile' deve ser booleano")
+        model_route = payload.get("model_route")
+        if model_route is not None and model_route not in MODEL_ROUTES:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, f"Campo 'model_route' deve ser um de: {', '.join(MODEL_ROUTES)}")
+        timeout_seconds = payload.get("timeout_seconds")
+        if timeout_seconds is not None and (isinstance(timeout_seconds, bool)
+                                            or not isinstance(timeout_seconds, (int, float)) or timeout_seconds <= 0):
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "Campo 'timeout_seconds' deve ser um número positivo")
+        loop = asyncio.get_running_loop()
+
+        async with self._admission() as queue_wait:
+            if timeout_seconds is not None:
+                # O prazo conta desde a chegada: desconta a espera na fila de admissão
+                timeout_seconds = max(timeout_seconds - queue_wait, 0.001)
+            if not payload.get("stream"):
+                details = await loop.run_in_executor(self._executor, self.rag_core.answer_query_with_details,
+                                                     query, None, priority, profile, payload.get("shards"),
+                                                     payload.get("filters"), model_route, timeout_seconds)
+                details["queue_wait_seconds"] = queue_wait
+                await self._send_json(writer, HTTPStatus.OK, details, keep_alive)
+                return HTTPStatus.OK
+
+            events: asyncio.Queue = asyncio.Queue()
+
+            def on_event(name: str, data: Dict[str, Any]):
+                loop.call_soon_threadsafe(events.put_nowait, {"event": name, **data})
+
+            future = loop.run_in_executor(self._executor, self.rag_core.answer_query_with_details,
+                                          query, on_event, priority, profile, payload.get("shards"),
+                                          payload.get("filters"), model_route, timeout_seconds)
+            try:
+                writer.write(self._response_head(HTTPStatus.OK, {
+                    "Content-Type": "application/x-ndjson; charset=utf-8",
+                    "Transfer-Encoding": "chunked",
+                    "Cache-Control": "no-cache",
+                }, keep_alive))
+                await self._write_chunk(writer, {"event": "accepted", "queue_wait_seconds": queue_wait})
+
+                while not future.done():
+                    next_event = asyncio.ensure_future(events.get())
+                    await asyncio.wait({next_event, future}, return_when=asyncio.FIRST_COMPLETED)
+                    if next_event.done():
+                        await self._write_chunk(writer, next_event.result())
+                    else:
+                        next_event.cancel()
+                while not events.empty():
+                    await self._write_chunk(writer, events.get_nowait())
+
+                try:
+                    await self._write_chunk(writer, {"event": "answer", **future.result()})
+                except Exception as e:
+                    logger.error(f"Erro ao processar consulta '{query}': {e}", exc_info=True)
+                    await self._write_chunk(writer, {"event": "error", "error": "Erro interno ao processar a consulta."})
+                await self._write_chunk(writer, None)
+            finally:
+                # Mantém a vaga ocupada enquanto a thread de trabalho ainda estiver executando
+                if not future.done():
+                    await asyncio.wait({future})
+        return HTTPStatus.OK
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serviço HTTP/JSON de consultas sobre o sistema RAG.")
+    parser.add_argument("--host", type=str, default=config.SERVER_CONFIG["host"], help="Endereço de escuta.")
+    parser.add_argument("--port", type=int, default=config.SERVER_CONFIG["port"], help="Porta de escuta.")
+    parser.add_argument("--max-concurrency", type=int, default=config.SERVER_CONFIG["max_concurrency"],
+                        help="Consultas executadas simultaneamente.")
+    parser.add_argument("--max-queue", type=int, default=config.SERVER_CONFIG["max_queue"],
+                        help="Consultas aguardando vaga antes de responder 429.")
+    args = parser.parse_args()
+
+    logger.info("Inicializando o RAGCore para o servidor HTTP...")
+    try:
+        rag_system = RAGCore(data_folder=config.DEFAULT_DATA_FOLDER)
+    except Exception as e:
+        logger.error(f"Falha ao inicializar o RAGCore: {e}", exc_info=True)
+        return
+
+    server = RAGHTTPServer(rag_system, {
+        "host": args.host, "port": args.port,
+        "max_concurrency": args.max_concurrency, "max_queue": args.max_queue,
+    })
+
+    async def run():
+        await server.start()
+        await server.serve_until_signal()
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
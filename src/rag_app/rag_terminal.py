@@ -16,7 +16,7 @@ class RAGTerminal:
         self.rag_core = rag_core_instance
         db_count = 0
         if hasattr(self.rag_core, 'collection') and self.rag_core.collection:
-            db_count = self.rag_core.collection.count()
+            db_count = self.rag_core.count_chunks()
 
         if db_count == 0 and \
            (not hasattr(self.rag_core, 'processed_pdf_files') or not self.rag_core.processed_pdf_files):
@@ -76,8 +76,8 @@ if __name__ == '__main__':
 
     try:
         core_system = RAGCore()
-        if core_system.collection and core_system.collection.count() > 0:
-            logger.info(f"{core_system.collection.count()} chunks encontrados no ChromaDB. Iniciando terminal.")
+        if core_system.collection and core_system.count_chunks() > 0:
+            logger.info(f"{core_system.count_chunks()} chunks encontrados no ChromaDB. Iniciando terminal.")
             terminal = RAGTerminal(core_system)
             terminal.start_interactive_session()
         else:
@@ -53,7 +53,7 @@ def load_rag_core_cached():
         core = RAGCore(data_folder=data_folder_path) 
         
         processed_files_exist = hasattr(core, 'processed_pdf_files') and core.processed_pdf_files
-        chunks_in_db = hasattr(core, 'collection') and core.collection and core.collection.count() > 0
+        chunks_in_db = hasattr(core, 'collection') and core.collection and core.count_chunks() > 0
 
         if not chunks_in_db and not processed_files_exist:
             st.warning("Nenhum documento PDF foi encontrado na pasta de dados ou processado com sucesso para o ChromaDB.")
@@ -63,7 +63,7 @@ def load_rag_core_cached():
         elif not processed_files_exist and chunks_in_db:
             st.warning("Foram encontrados chunks no banco de dados, mas a lista de arquivos PDF processados está vazia. "
                        "Isso pode indicar uma inconsistência. Considere forçar um reprocessamento (deletando "
-                       f"'{config.PROCESSED_FILES_STATUS_JSON}' e a pasta '{config.CHROMA_DB_PATH}').")
+                       f"a pasta '{config.CHROMA_DB_PATH}', que também contém o manifesto do índice).")
         
         return core
     except Exception as e:
@@ -191,7 +191,7 @@ if rag_system:
     st.sidebar.markdown("**🧩 Chunks Indexados (ChromaDB):**")
     if hasattr(rag_system, 'collection') and rag_system.collection:
         try:
-            db_count = rag_system.collection.count()
+            db_count = rag_system.count_chunks()
             st.sidebar.markdown(f"  `{db_count}`")
         except Exception as e_chroma_count: # Captura erro se a coleção não estiver acessível
             logger.error(f"Erro ao obter contagem da coleção ChromaDB: {e_chroma_count}")
@@ -0,0 +1,538 @@
+# src/rag_app/retrieval_worker.py
+"""
+Worker de recuperação compartilhado pelos front-ends.
+
+rag_web, rag_terminal, rag_batch e rag_server constroem cada um o seu RAGCore:
+cada processo carrega o modelo de embedding, abre o ChromaDB (disputando os
+arquivos SQLite com os demais) e verifica a pasta de dados ao iniciar. Com o
+worker, um único processo de longa duração mantém o modelo e o índice, e os
+front-ends usam RAGCore em modo cliente (RETRIEVAL_WORKER_CONFIG["address"]):
+não carregam o modelo nem abrem o ChromaDB, e iniciam em instantes. A geração
+(LLM) continua em cada front-end.
+
+Protocolo (socket Unix ou TCP, conexões persistentes, uma requisição por vez
+em cada conexão):
+
+    [cabeçalho 12 B: "RW", versão, operação/status, tamanho do JSON, tamanho do bloco]
+    [JSON compacto UTF-8 com os argumentos ou o resultado]
+    [bloco binário: vetores float32 little-endian, linha a linha]
+
+Operações: info, embed (textos -> matriz float32 no bloco binário, sem passar
+por JSON), retrieve, batch_retrieve (uma codificação em lote e uma busca por
+shard para todas as consultas) e stats. Todas são somente leitura: a ingestão
+e a manutenção do índice acontecem no worker.
+
+Uso (a partir da raiz do projeto):
+    python -m src.rag_app.retrieval_worker --listen unix:./rag_retrieval_worker.sock
+    RAG_RETRIEVAL_WORKER=unix:./rag_retrieval_worker.sock python -m src.rag_app.rag_terminal
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import signal
+import socket
+import stat
+import struct
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import suppress
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from . import config
+from .deadline import Deadline, DeadlineExceeded
+
+logger = logging.getLogger(__name__)
+if not logger.handlers:
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+MAGIC = b"RW"
+PROTOCOL_VERSION = 1
+_HEADER = struct.Struct("<2sBBII")  # MAGIC, versão, operação (ou status), tamanho do JSON, tamanho do bloco
+
+OP_INFO = 1
+OP_EMBED = 2
+OP_RETRIEVE = 3
+OP_BATCH_RETRIEVE = 4
+OP_STATS = 5
+OPERATIONS = {OP_INFO: "info", OP_EMBED: "embed", OP_RETRIEVE: "retrieve",
+              OP_BATCH_RETRIEVE: "batch_retrieve", OP_STATS: "stats"}
+
+STATUS_OK = 0
+STATUS_ERROR = 1
+
+# Folga sobre o prazo da consulta para a resposta (parcial) do worker chegar ao cliente
+_DEADLINE_MARGIN_SECONDS = 0.5
+
+
+class RetrievalWorkerError(Exception):
+    """Falha de comunicação com o worker ou erro interno do worker."""
+
+
+class ProtocolError(RetrievalWorkerError):
+    """Quadro inválido (MAGIC, versão ou tamanho)."""
+
+
+def parse_address(address: str) -> Tuple[str, Any]:
+    """"unix:/caminho.sock" -> ("unix", caminho); "tcp:host:porta" ou "host:porta" -> ("tcp", (host, porta))."""
+    if address.startswith("unix:"):
+        path = address[len("unix:"):]
+        if not path:
+            raise ValueError(f"Endereço do worker sem caminho do socket: {address}")
+        return "unix", path
+    target = address[len("tcp:"):] if address.startswith("tcp:") else address
+    host, sep, port = target.rpartition(":")
+    if not sep or not port.isdigit():
+        raise ValueError(f"Endereço do worker inválido: {address} (use unix:/caminho.sock ou tcp:host:porta)")
+    return "tcp", (host.strip("[]") or "127.0.0.1", int(port))
+
+
+def encode_frame(code: int, payload: Dict[str, Any], blob: bytes = b"") -> bytes:
+    body = json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    return _HEADER.pack(MAGIC, PROTOCOL_VERSION, code, len(body), len(blob)) + body + blob
+
+
+def decode_header(data: bytes, max_frame_bytes: int) -> Tuple[int, int, int]:
+    magic, version, code, body_size, blob_size = _HEADER.unpack(data)
+    if magic != MAGIC:
+        raise ProtocolError("Quadro inválido (MAGIC)")
+    if version != PROTOCOL_VERSION:
+        raise ProtocolError(f"Versão do protocolo incompatível: {version} (esperada {PROTOCOL_VERSION})")
+    if body_size + blob_size > max_frame_bytes:
+        raise ProtocolError(f"Quadro de {body_size + blob_size} bytes excede o limite de {max_frame_bytes}")
+    return code, body_size, blob_size
+
+
+def pack_vectors(vectors: np.ndarray) -> Tuple[Dict[str, Any], bytes]:
+    vectors = np.ascontiguousarray(vectors, dtype="<f4")
+    return {"shape": list(vectors.shape)}, vectors.tobytes()
+
+
+def unpack_vectors(payload: Dict[str, Any], blob: bytes) -> np.ndarray:
+    return np.frombuffer(blob, dtype="<f4").reshape(payload["shape"])
+
+
+# --- Servidor ---
+
+class RetrievalWorker:
+    """Atende as operações de recuperação sobre um RAGCore local (asyncio + pool de threads)."""
+
+    def __init__(self, rag_core, listen: str, worker_config: Optional[Dict[str, Any]] = None):
+        self.rag_core = rag_core
+        self.cfg = dict(config.RETRIEVAL_WORKER_CONFIG)
+        self.cfg.update(worker_config or {})
+        self.listen = listen
+        self.kind, self.target = parse_address(listen)
+        self.port: Optional[int] = None
+        self._executor = ThreadPoolExecutor(max_workers=self.cfg["max_concurrency"],
+                                            thread_name_prefix="rag-retrieval-worker")
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._connections = set()
+        self._in_flight = 0
+        self._shutting_down = False
+        self.started_at = time.time()
+        self.stats = {"connections": 0, "errors": 0,
+                      "requests_by_op": {name: 0 for name in OPERATIONS.values()},
+                      "seconds_by_op": {name: 0.0 for name in OPERATIONS.values()}}
+        self._handlers = {
+            OP_INFO: self._op_info,
+            OP_EMBED: self._op_embed,
+            OP_RETRIEVE: self._op_retrieve,
+            OP_BATCH_RETRIEVE: self._op_batch_retrieve,
+            OP_STATS: self._op_stats,
+        }
+
+    # --- Ciclo de vida ---
+
+    async def start(self):
+        if self.kind == "unix":
+            self._remove_stale_socket(self.target)
+            self._server = await asyncio.start_unix_server(self._handle_connection, self.target)
+            # Apenas o usuário e o grupo do worker podem se conectar
+            os.chmod(self.target, 0o660)
+        else:
+            host, port = self.target
+            self._server = await asyncio.start_server(self._handle_connection, host, port)
+            self.port = self._server.sockets[0].getsockname()[1]
+        logger.info(f"Worker de recuperação ouvindo em {self.address} "
+                    f"(concorrência={self.cfg['max_concurrency']}, {self.rag_core.count_chunks()} chunks)")
+
+    @property
+    def address(self) -> str:
+        if self.kind == "unix":
+            return f"unix:{self.target}"
+        return f"tcp:{self.target[0]}:{self.port or self.target[1]}"
+
+    @staticmethod
+    def _remove_stale_socket(path: str):
+        """Remove o socket deixado por um worker encerrado; recusa se outro worker ainda atende nele."""
+        try:
+            mode = os.stat(path).st_mode
+        except FileNotFoundError:
+            return
+        if not stat.S_ISSOCK(mode):
+            raise RuntimeError(f"'{path}' existe e não é um socket")
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(path)
+        except OSError:
+            os.unlink(path)
+            return
+        finally:
+            probe.close()
+        raise RuntimeError(f"Já existe um worker de recuperação atendendo em '{path}'")
+
+    async def serve_until_signal(self):
+        """Executa até receber SIGINT/SIGTERM e então encerra de forma graciosa."""
+        stop_event = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            with suppress(NotImplementedError, RuntimeError):
+                loop.add_signal_handler(sig, stop_event.set)
+        await stop_event.wait()
+        await self.shutdown()
+
+    async def shutdown(self):
+        """Para de aceitar conexões, aguarda as requisições em andamento e fecha o restante."""
+        if self._shutting_down:
+            return
+        self._shutting_down = True
+        logger.info("Encerrando worker de recuperação...")
+        if self._server:
+            self._server.close()
+        deadline = time.monotonic() + self.cfg["shutdown_grace_seconds"]
+        while self._in_flight and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        for writer in list(self._connections):
+            writer.close()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        if self.kind == "unix":
+            with suppress(OSError):
+                os.unlink(self.target)
+        logger.info("Worker de recuperação encerrado.")
+
+    # --- Protocolo ---
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self._connections.add(writer)
+        self.stats["connections"] += 1
+        if self.kind == "tcp":
+            sock = writer.get_extra_info("socket")
+            if sock is not None:
+                with suppress(OSError):
+                    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        try:
+            while not self._shutting_down:
+                try:
+                    head = await reader.readexactly(_HEADER.size)
+                except asyncio.IncompleteReadError as e:
+                    if e.partial:
+                        logger.warning("Worker de recuperação: conexão encerrada no meio de um quadro.")
+                    break
+                try:
+                    op, body_size, blob_size = decode_header(head, self.cfg["max_frame_bytes"])
+                except ProtocolError as e:
+                    logger.warning(f"Worker de recuperação: {e}; encerrando a conexão.")
+                    writer.write(encode_frame(STATUS_ERROR, {"type": "ProtocolError", "error": str(e)}))
+                    await writer.drain()
+                    break
+                body = await reader.readexactly(body_size)
+                blob = await reader.readexactly(blob_size) if blob_size else b""
+                writer.write(await self._dispatch(op, body, blob))
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self._connections.discard(writer)
+            writer.close()
+            with suppress(Exception):
+                await writer.wait_closed()
+
+    async def _dispatch(self, op: int, body: bytes, blob: bytes) -> bytes:
+        handler = self._handlers.get(op)
+        if handler is None:
+            self.stats["errors"] += 1
+            return encode_frame(STATUS_ERROR, {"type": "ProtocolError", "error": f"Operação desconhecida: {op}"})
+        name = OPERATIONS[op]
+        start = time.perf_counter()
+        self._in_flight += 1
+        try:
+            payload = json.loads(body.decode("utf-8")) if body else {}
+            loop = asyncio.get_running_loop()
+            result, result_blob = await loop.run_in_executor(self._executor, handler, payload, blob)
+            return encode_frame(STATUS_OK, result, result_blob)
+        except (ValueError, TypeError, KeyError) as e:
+            self.stats["errors"] += 1
+            return encode_frame(STATUS_ERROR, {"type": "ValueError", "error": str(e)})
+        except DeadlineExceeded as e:
+            return encode_frame(STATUS_ERROR, {"type": "DeadlineExceeded", "error": str(e)})
+        except Exception as e:
+            self.stats["errors"] += 1
+            logger.error(f"Erro ao processar operação '{name}' no worker de recuperação: {e}", exc_info=True)
+            return encode_frame(STATUS_ERROR, {"type": "RetrievalWorkerError",
+                                               "error": f"Erro interno do worker na operação '{name}'"})
+        finally:
+            self._in_flight -= 1
+            self.stats["requests_by_op"][name] += 1
+            self.stats["seconds_by_op"][name] += time.perf_counter() - start
+
+    # --- Operações (executadas no pool de threads) ---
+
+    def _op_info(self, payload: Dict[str, Any], blob: bytes):
+        core = self.rag_core
+        return {
+            "protocol_version": PROTOCOL_VERSION,
+            "index_version": core.index_version,
+            "embedding_model": core.configured_embedding_model_name,
+            "processed_files": list(core.processed_pdf_files),
+            "shards": core.get_shard_stats(),
+        }, b""
+
+    def _op_embed(self, payload: Dict[str, Any], blob: bytes):
+        texts = payload["texts"]
+        if not isinstance(texts, list) or not all(isinstance(text, str) for text in texts):
+            raise ValueError("Campo 'texts' deve ser uma lista de strings")
+        header, vectors = pack_vectors(self.rag_core.embed_texts(texts))
+        return dict(header, model=self.rag_core.configured_embedding_model_name), vectors
+
+    def _op_retrieve(self, payload: Dict[str, Any], blob: bytes):
+        deadline = Deadline(payload.get("timeout_seconds"))
+        items = self.rag_core.retrieve_relevant_chunks(
+            payload["query"], payload.get("k", config.DEFAULT_RETRIEVAL_K), payload.get("shards"),
+            payload.get("filters"), deadline=deadline)
+        return {"index_version": self.rag_core.index_version, "items": items}, b""
+
+    def _op_batch_retrieve(self, payload: Dict[str, Any], blob: bytes):
+        results = self.rag_core.retrieve_relevant_chunks_batch(
+            payload["queries"], payload.get("k", config.DEFAULT_RETRIEVAL_K), payload.get("shards"),
+            payload.get("filters"))
+        return {"index_version": self.rag_core.index_version, "results": results}, b""
+
+    def _op_stats(self, payload: Dict[str, Any], blob: bytes):
+        core = self.rag_core
+        return {
+            "worker": dict(self.stats, address=self.address, in_flight=self._in_flight,
+                           uptime_seconds=round(time.time() - self.started_at, 1),
+                           seconds_by_op={name: round(seconds, 3)
+                                          for name, seconds in self.stats["seconds_by_op"].items()}),
+            "index_version": core.index_version,
+            "manifest": core.get_manifest_stats(),
+            "extraction_cache": core.extraction_cache.get_stats() if core.extraction_cache else None,
+            "embedding_models": core.embedding_registry.get_stats(),
+        }, b""
+
+
+# --- Cliente ---
+
+class RetrievalWorkerClient:
+    """
+    Cliente síncrono e seguro para várias threads: cada requisição usa uma conexão
+    do pool (ou abre uma nova); as ociosas são reaproveitadas até pool_size.
+    """
+
+    def __init__(self, address: str, client_config: Optional[Dict[str, Any]] = None):
+        self.address = address
+        self.cfg = dict(config.RETRIEVAL_WORKER_CONFIG)
+        self.cfg.update(client_config or {})
+        self.kind, self.target = parse_address(address)
+        self._lock = threading.Lock()
+        self._idle: List[socket.socket] = []
+        self._closed = False
+        self._stats = {"requests": 0, "errors": 0, "timeouts": 0, "connections_opened": 0,
+                       "bytes_sent": 0, "bytes_received": 0, "seconds": 0.0}
+
+    def _connect(self) -> socket.socket:
+        if self.kind == "unix":
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        else:
+            sock = socket.socket(socket.AF_INET6 if ":" in self.target[0] else socket.AF_INET, socket.SOCK_STREAM)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        sock.settimeout(self.cfg["connect_timeout_seconds"])
+        try:
+            sock.connect(self.target)
+        except OSError as e:
+            sock.close()
+            raise RetrievalWorkerError(f"Worker de recuperação indisponível em '{self.address}': {e}") from e
+        with self._lock:
+            self._stats["connections_opened"] += 1
+        return sock
+
+    def _checkout(self) -> Tuple[socket.socket, bool]:
+        with self._lock:
+            if self._closed:
+                raise RetrievalWorkerError("Cliente do worker de recuperação encerrado")
+            if self._idle:
+                return self._idle.pop(), True
+        return self._connect(), False
+
+    def _checkin(self, sock: socket.socket):
+        with self._lock:
+            if not self._closed and len(self._idle) < self.cfg["pool_size"]:
+                self._idle.append(sock)
+                return
+        sock.close()
+
+    @staticmethod
+    def _recv_exact(sock: socket.socket, size: int) -> bytes:
+        buffer = bytearray(size)
+        view = memoryview(buffer)
+        received = 0
+        while received < size:
+            count = sock.recv_into(view[received:], size - received)
+            if count == 0:
+                raise ConnectionError("Conexão encerrada pelo worker de recuperação")
+            received += count
+        return bytes(buffer)
+
+    def _exchange(self, sock: socket.socket, frame: bytes, timeout: float) -> Tuple[int, bytes, bytes]:
+        sock.settimeout(timeout)
+        sock.sendall(frame)
+        status, body_size, blob_size = decode_header(self._recv_exact(sock, _HEADER.size),
+                                                     self.cfg["max_frame_bytes"])
+        body = self._recv_exact(sock, body_size)
+        blob = self._recv_exact(sock, blob_size) if blob_size else b""
+        return status, body, blob
+
+    def call(self, op: int, payload: Dict[str, Any], blob: bytes = b"",
+             timeout: Optional[float] = None) -> Tuple[Dict[str, Any], bytes]:
+        """
+        Envia uma requisição e devolve (resultado, bloco binário).
+
+        Raises:
+            ValueError: argumentos recusados pelo worker (shard desconhecido, filtro inválido...)
+            DeadlineExceeded: o prazo repassado ao worker acabou antes de qualquer resultado
+            TimeoutError: sem resposta dentro de `timeout` (padrão: request_timeout_seconds)
+            RetrievalWorkerError: worker indisponível ou erro interno
+        """
+        frame = encode_frame(op, payload, blob)
+        timeout = self.cfg["request_timeout_seconds"] if timeout is None else timeout
+        start = time.perf_counter()
+        # Todas as operações são somente leitura: uma conexão ociosa que o worker fechou
+        # (reinício, ociosidade) é descartada e a requisição é repetida numa conexão nova
+        for attempt in range(2):
+            sock, reused = self._checkout()
+            try:
+                status, body, result_blob = self._exchange(sock, frame, timeout)
+            except socket.timeout:
+                sock.close()
+                self._record(start, len(frame), 0, error=True, timed_out=True)
+                raise TimeoutError(f"Worker de recuperação sem resposta em {timeout:.1f}s")
+            except (ConnectionError, OSError) as e:
+                sock.close()
+                if reused and attempt == 0:
+                    # As demais conexões ociosas apontam para o mesmo worker: descarta todas
+                    self._discard_idle()
+                    continue
+                self._record(start, len(frame), 0, error=True)
+                raise RetrievalWorkerError(f"Erro ao comunicar com o worker de recuperação: {e}") from e
+            except ProtocolError:
+                sock.close()
+                self._record(start, len(frame), 0, error=True)
+                raise
+            self._checkin(sock)
+            break
+        self._record(start, len(frame), _HEADER.size + len(body) + len(result_blob), error=status != STATUS_OK)
+        result = json.loads(body.decode("utf-8")) if body else {}
+        if status == STATUS_OK:
+            return result, result_blob
+        error_type, message = result.get("type"), result.get("error", "erro desconhecido")
+        if error_type == "ValueError":
+            raise ValueError(message)
+        if error_type == "DeadlineExceeded":
+            raise DeadlineExceeded("retrieval")
+        raise RetrievalWorkerError(message)
+
+    def _record(self, start: float, sent: int, received: int, error: bool = False, timed_out: bool = False):
+        with self._lock:
+            self._stats["requests"] += 1
+            self._stats["errors"] += int(error)
+            self._stats["timeouts"] += int(timed_out)
+            self._stats["bytes_sent"] += sent
+            self._stats["bytes_received"] += received
+            self._stats["seconds"] += time.perf_counter() - start
+
+    # --- Operações ---
+
+    def info(self) -> Dict[str, Any]:
+        return self.call(OP_INFO, {})[0]
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        payload, blob = self.call(OP_EMBED, {"texts": list(texts)})
+        return unpack_vectors(payload, blob)
+
+    def retrieve(self, query: str, k: int, shards: Optional[List[str]] = None,
+                 filters: Optional[Dict[str, Any]] = None,
+                 timeout_seconds: Optional[float] = None) -> Tuple[List[Dict[str, Any]], int]:
+        """Chunks recuperados e versão do índice no worker. `timeout_seconds` é o prazo restante da consulta."""
+        payload = {"query": query, "k": k, "shards": shards, "filters": filters, "timeout_seconds": timeout_seconds}
+        timeout = timeout_seconds + _DEADLINE_MARGIN_SECONDS if timeout_seconds is not None else None
+        result = self.call(OP_RETRIEVE, payload, timeout=timeout)[0]
+        return result["items"], result["index_version"]
+
+    def batch_retrieve(self, queries: List[str], k: int, shards: Optional[List[str]] = None,
+                       filters: Optional[Dict[str, Any]] = None) -> Tuple[List[List[Dict[str, Any]]], int]:
+        result = self.call(OP_BATCH_RETRIEVE, {"queries": list(queries), "k": k, "shards": shards,
+                                               "filters": filters})[0]
+        return result["results"], result["index_version"]
+
+    def stats(self) -> Dict[str, Any]:
+        return self.call(OP_STATS, {})[0]
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Contadores do lado do cliente (requisições, erros, bytes trafegados)."""
+        with self._lock:
+            stats = dict(self._stats, address=self.address, idle_connections=len(self._idle))
+        stats["seconds"] = round(stats["seconds"], 3)
+        return stats
+
+    def _discard_idle(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for sock in idle:
+            sock.close()
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+        self._discard_idle()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Worker de recuperação compartilhado pelos front-ends do sistema RAG.")
+    parser.add_argument("--listen", type=str, default=config.RETRIEVAL_WORKER_CONFIG["listen"],
+                        help="Endereço de escuta: unix:/caminho.sock ou tcp:host:porta.")
+    parser.add_argument("--data-folder", type=str, default=config.DEFAULT_DATA_FOLDER,
+                        help="Pasta de documentos indexada pelo worker.")
+    parser.add_argument("--max-concurrency", type=int, default=config.RETRIEVAL_WORKER_CONFIG["max_concurrency"],
+                        help="Requisições executadas simultaneamente.")
+    args = parser.parse_args()
+
+    from .rag_core import RAGCore
+
+    logger.info("Inicializando o RAGCore para o worker de recuperação...")
+    try:
+        # retrieval_worker="" força o índice local mesmo com RAG_RETRIEVAL_WORKER definido
+        rag_system = RAGCore(data_folder=args.data_folder, retrieval_worker="")
+    except Exception as e:
+        logger.error(f"Falha ao inicializar o RAGCore: {e}", exc_info=True)
+        return
+
+    worker = RetrievalWorker(rag_system, args.listen, {"max_concurrency": args.max_concurrency})
+
+    async def run():
+        await worker.start()
+        await worker.serve_until_signal()
+
+    try:
+        asyncio.run(run())
+    finally:
+        rag_system.close()
+
+
+if __name__ == "__main__":
+    main()
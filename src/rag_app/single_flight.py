@@ -0,0 +1,81 @@
+# src/rag_app/single_flight.py
+"""
+Coalescência de chamadas idênticas em andamento ("single-flight").
+
+Quando várias threads pedem o mesmo resultado ao mesmo tempo, apenas a primeira
+(líder) executa o cálculo; as demais aguardam e recebem o mesmo resultado (ou a
+mesma exceção). Assim que o cálculo termina a chave é liberada: não há cache,
+apenas compartilhamento do trabalho em andamento.
+"""
+
+import threading
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+
+class _Call:
+    __slots__ = ("event", "result", "error", "waiters")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Grupo de chamadas coalescidas por chave."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+        self._stats = {"leaders": 0, "coalesced": 0}
+
+    def do(self, key: Hashable, fn: Callable[[], Any], timeout: Optional[float] = None) -> Tuple[Any, bool]:
+        """
+        Executa `fn` ou aguarda a execução idêntica já em andamento.
+
+        Args:
+            timeout: Espera máxima de quem aguarda a execução de outra thread
+
+        Returns:
+            (resultado, compartilhado) - compartilhado é True para chamadas que
+            receberam o resultado de outra thread
+
+        Raises:
+            TimeoutError: a execução compartilhada não terminou dentro de `timeout`
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                call.waiters += 1
+                self._stats["coalesced"] += 1
+                is_leader = False
+            else:
+                call = _Call()
+                self._calls[key] = call
+                self._stats["leaders"] += 1
+                is_leader = True
+
+        if not is_leader:
+            if not call.event.wait(timeout):
+                raise TimeoutError("execução compartilhada não terminou no prazo")
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+        return call.result, False
+
+    def get_stats(self) -> Dict[str, int]:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["in_flight"] = len(self._calls)
+        return stats
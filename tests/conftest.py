@@ -0,0 +1,54 @@
+import hashlib
+
+import numpy as np
+import pytest
+
+from src.rag_app import config, rag_core
+from src.rag_app.embedding_models import EmbeddingModelRegistry
+
+
+class StubSentenceTransformer:
+    """Codificador determinístico: o vetor depende só do nome do modelo e do texto."""
+
+    dimension = 16
+
+    def __init__(self, model_name, device=None, **kwargs):
+        self.model_name = model_name
+        self.device = "cpu"
+
+    def encode(self, sentences, **kwargs):
+        vectors = []
+        for text in sentences:
+            seed = int(hashlib.sha1(f"{self.model_name}|{text}".encode("utf-8")).hexdigest()[:8], 16)
+            vector = np.random.default_rng(seed).standard_normal(self.dimension).astype(np.float32)
+            vectors.append(vector / np.linalg.norm(vector))
+        return np.array(vectors, dtype=np.float32)
+
+    def get_sentence_embedding_dimension(self):
+        return self.dimension
+
+
+@pytest.fixture
+def stub_rag(tmp_path, monkeypatch):
+    """
+    RAGCore isolado em tmp_path, sem rede e com o codificador simulado no lugar do
+    SentenceTransformer. Retorna (pasta de dados, fábrica make_core(model_name, **opções do RAGCore)).
+    """
+    monkeypatch.setattr("sentence_transformers.SentenceTransformer", StubSentenceTransformer)
+    monkeypatch.setattr(rag_core, "get_embedding_model_registry", EmbeddingModelRegistry)
+    monkeypatch.setattr(config, "LLM_ENDPOINTS", [{"name": "mock", "provider": "mock"}])
+    monkeypatch.setattr(config, "ALLOW_EXTERNAL_KNOWLEDGE", False)
+    monkeypatch.setitem(config.EXTRACTION_CACHE_CONFIG, "enabled", False)
+    monkeypatch.setitem(config.EMBEDDING_ENCODER_CONFIG, "workers", 1)
+    monkeypatch.setitem(config.QUERY_EMBEDDING_BATCH_CONFIG, "enabled", False)
+    monkeypatch.setitem(config.CHUNK_DEDUP_CONFIG, "enabled", False)
+    data = tmp_path / "data"
+    data.mkdir()
+
+    def make_core(model_name="stub-a", **overrides):
+        options = dict(data_folder=str(data), model_name=model_name, chroma_db_path=str(tmp_path / "chroma"),
+                       collection_name="teste", chunk_size=200, chunk_overlap=0)
+        options.update(overrides)
+        return rag_core.RAGCore(**options)
+
+    return data, make_core
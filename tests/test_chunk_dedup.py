@@ -0,0 +1,95 @@
+import pytest
+
+from src.rag_app import config, rag_core
+from src.rag_app.chunk_dedup import MinHasher, NearDuplicateIndex, estimated_similarity
+
+BASE = ("As inscrições para o processo seletivo dos cursos técnicos integrados do campus Cuiabá "
+        "estarão abertas até {data}, mediante pagamento da taxa de inscrição no valor de R$ {valor}, "
+        "conforme o cronograma publicado no edital e as regras de isenção para candidatos de baixa renda "
+        "inscritos no cadastro único do governo federal, com documentação entregue na secretaria do campus.")
+
+
+def _index(hasher, threshold=0.5):
+    return NearDuplicateIndex(hasher.num_perm, 16, threshold)
+
+
+def test_chunks_differing_only_in_numbers_are_not_duplicates():
+    hasher = MinHasher(128, 5)
+    old = hasher.signature(BASE.format(data="10/03/2024", valor="85,00"))
+    new = hasher.signature(BASE.format(data="17/04/2025", valor="95,00"))
+    assert estimated_similarity(old[:hasher.num_perm], new[:hasher.num_perm]) >= 0.5
+    index = _index(hasher)
+    index.add("old", old)
+    assert index.find(new) is None
+
+
+def test_copies_with_the_same_numbers_are_duplicates():
+    hasher = MinHasher(128, 5)
+    index = _index(hasher)
+    index.add("old", hasher.signature("[Página 3] " + BASE.format(data="10/03/2024", valor="85,00")))
+    match = index.find(hasher.signature("[Página 7] " + BASE.format(data="10/03/2024", valor="85,00")))
+    assert match is not None and match[0] == "old"
+
+
+@pytest.fixture
+def dedup_core(stub_rag, monkeypatch):
+    data, make_core = stub_rag
+    monkeypatch.setitem(config.CHUNK_DEDUP_CONFIG, "enabled", True)
+    text = " ".join(BASE.format(data=f"{day:02d}/03/2024", valor=f"{day},00") for day in range(1, 4))
+    for name in ("a.md", "b.md", "c.md"):
+        (data / name).write_text(text, encoding="utf-8")
+    core = make_core()
+    yield data, core
+    core.close()
+
+
+def _state(core):
+    indexed = core.collection.get(include=["metadatas"])
+    return {chunk_id: metadata for chunk_id, metadata in zip(indexed["ids"], indexed["metadatas"])}
+
+
+def _canonical_source(indexed):
+    sources = {metadata["source"] for metadata in indexed.values()}
+    assert len(sources) == 1
+    return sources.pop()
+
+
+def test_duplicate_is_promoted_when_the_canonical_file_is_deleted(dedup_core):
+    data, core = dedup_core
+    manifest = core.index_manifest
+    indexed = _state(core)
+    files = {"a.md", "b.md", "c.md"}
+    canonical = _canonical_source(indexed)
+    assert all(metadata["duplicate_sources"] == sorted(files - {canonical}) for metadata in indexed.values())
+
+    files.discard(canonical)
+    (data / canonical).unlink()
+    core._load_or_process_documents()
+    indexed = _state(core)
+    promoted = _canonical_source(indexed)
+    (remaining,) = files - {promoted}
+    assert all(metadata["duplicate_sources"] == [remaining] for metadata in indexed.values())
+    assert manifest.get_file_duplicates(rag_core.ROOT_SHARD, promoted) == {}
+    assert set(manifest.get_file_duplicates(rag_core.ROOT_SHARD, remaining).values()) == set(indexed)
+
+    (data / promoted).unlink()
+    core._load_or_process_documents()
+    indexed = _state(core)
+    assert _canonical_source(indexed) == remaining
+    assert all("duplicate_sources" not in metadata for metadata in indexed.values())
+    assert manifest.get_dedup_stats()[rag_core.ROOT_SHARD]["duplicates"] == 0
+
+
+def test_duplicate_is_promoted_when_the_canonical_file_changes(dedup_core):
+    data, core = dedup_core
+    canonical = _canonical_source(_state(core))
+    (data / canonical).write_text("Conteúdo totalmente novo sobre a matrícula dos aprovados na chamada pública.",
+                                  encoding="utf-8")
+    core._load_or_process_documents()
+    indexed = _state(core)
+    promoted = {chunk_id: metadata for chunk_id, metadata in indexed.items() if metadata["source"] != canonical}
+    assert promoted and canonical in {metadata["source"] for metadata in indexed.values()}
+    (promoted_source,) = {metadata["source"] for metadata in promoted.values()}
+    (remaining,) = {"a.md", "b.md", "c.md"} - {canonical, promoted_source}
+    assert all(metadata["duplicate_sources"] == [remaining] for metadata in promoted.values())
+    assert set(core.index_manifest.get_file_duplicates(rag_core.ROOT_SHARD, remaining).values()) == set(promoted)
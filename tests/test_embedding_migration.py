@@ -0,0 +1,100 @@
+import threading
+
+import numpy as np
+
+from src.rag_app import config, rag_core
+
+
+def _write(folder, name, words):
+    (folder / name).write_text(" ".join(f"{word}{i}" for i in range(60) for word in words), encoding="utf-8")
+
+
+def test_migration_applies_changes_ingested_during_the_copy(stub_rag, monkeypatch):
+    data, make_core = stub_rag
+    monkeypatch.setitem(config.INDEX_MANIFEST_CONFIG, "on_model_change", "migrate")
+    monkeypatch.setitem(config.INDEX_MANIFEST_CONFIG, "migration_batch_size", 2)
+    monkeypatch.setitem(config.INDEX_MANIFEST_CONFIG, "old_collection_grace_seconds", 0.0)
+    _write(data, "a.md", ["edital", "prazo"])
+    _write(data, "b.md", ["cota", "renda"])
+    core = make_core("stub-a")
+    old_collection = core.collection.name
+    core.close()
+
+    # A cópia para no primeiro lote até a ingestão abaixo terminar
+    copy_started, resume_copy = threading.Event(), threading.Event()
+    copy_chunks = rag_core.RAGCore._copy_chunks
+
+    def gated_copy(self, target, encoder, page):
+        copy_started.set()
+        assert resume_copy.wait(30)
+        copy_chunks(self, target, encoder, page)
+
+    monkeypatch.setattr(rag_core.RAGCore, "_copy_chunks", gated_copy)
+    core = make_core("stub-b")
+    try:
+        assert copy_started.wait(30)
+        assert core.collection.name == old_collection  # consultas seguem na coleção antiga
+
+        _write(data, "a.md", ["edital", "matrícula"])
+        (data / "b.md").unlink()
+        _write(data, "c.md", ["vaga", "campus"])
+        core._load_or_process_documents()
+        resume_copy.set()
+        core.wait_for_migrations(30)
+
+        migration = core.index_manifest.get_migrations(limit=1)[0]
+        assert migration["status"] == "completed"
+        assert core.index_manifest.get_shard(rag_core.ROOT_SHARD)["embedding_model"] == "stub-b"
+        assert core.collection.name != old_collection
+
+        indexed = core.collection.get(include=["documents", "metadatas", "embeddings"])
+        assert {metadata["source"] for metadata in indexed["metadatas"]} == {"a.md", "c.md"}
+        assert not any("prazo" in document for document in indexed["documents"])
+        expected = core.embedding_model_st.encode(indexed["documents"])
+        np.testing.assert_allclose(np.array(indexed["embeddings"]), expected, rtol=1e-5, atol=1e-6)
+        assert sum(core.index_manifest.get_chunk_hashes(rag_core.ROOT_SHARD, name) != {}
+                   for name in ("a.md", "b.md", "c.md")) == 2
+    finally:
+        resume_copy.set()
+        core.close()
+
+
+def test_second_instance_leaves_a_live_migration_alone(stub_rag, monkeypatch):
+    data, make_core = stub_rag
+    monkeypatch.setitem(config.INDEX_MANIFEST_CONFIG, "on_model_change", "migrate")
+    monkeypatch.setitem(config.INDEX_MANIFEST_CONFIG, "migration_batch_size", 2)
+    monkeypatch.setitem(config.INDEX_MANIFEST_CONFIG, "old_collection_grace_seconds", 0.0)
+    monkeypatch.setitem(config.INDEX_MANIFEST_CONFIG, "migration_heartbeat_seconds", 0.05)
+    _write(data, "a.md", ["edital", "prazo"])
+    make_core("stub-a").close()
+
+    copy_started, resume_copy = threading.Event(), threading.Event()
+    copy_chunks = rag_core.RAGCore._copy_chunks
+
+    def gated_copy(self, target, encoder, page):
+        copy_started.set()
+        assert resume_copy.wait(30)
+        copy_chunks(self, target, encoder, page)
+
+    monkeypatch.setattr(rag_core.RAGCore, "_copy_chunks", gated_copy)
+    owner = make_core("stub-b")
+    other = None
+    try:
+        assert copy_started.wait(30)
+        (running,) = owner.index_manifest.get_migrations()
+        other = make_core("stub-b")  # outro front-end abrindo o mesmo índice durante a cópia
+        other.wait_for_migrations(30)
+
+        migrations = owner.index_manifest.get_migrations()
+        assert [(m["id"], m["status"]) for m in migrations] == [(running["id"], "running")]
+        assert running["target_collection"] in {c.name for c in owner.chroma_client.list_collections()}
+
+        resume_copy.set()
+        owner.wait_for_migrations(30)
+        assert owner.index_manifest.get_migrations()[0]["status"] == "completed"
+        assert owner.collection.name == running["target_collection"]
+    finally:
+        resume_copy.set()
+        owner.close()
+        if other is not None:
+            other.close()
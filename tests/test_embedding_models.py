@@ -0,0 +1,48 @@
+import pytest
+
+from src.rag_app import rag_core
+from src.rag_app.embedding_models import EmbeddingModelRegistry
+
+
+@pytest.fixture
+def registry(stub_rag, monkeypatch):
+    shared = EmbeddingModelRegistry()
+    monkeypatch.setattr(rag_core, "get_embedding_model_registry", lambda: shared)
+    return shared
+
+
+def _references(registry):
+    return {name: stats["references"] for name, stats in registry.get_stats().items()}
+
+
+def test_cores_share_one_model_until_the_last_close(stub_rag, registry):
+    data, make_core = stub_rag
+    (data / "a.md").write_text("Calendário de matrículas do campus. " * 10, encoding="utf-8")
+    first, second = make_core(), make_core()
+    assert first.embedding_model_st is second.embedding_model_st
+    assert list(_references(registry).values()) == [2]
+    first.close()
+    assert list(_references(registry).values()) == [1]
+    second.close()
+    assert _references(registry) == {}
+
+
+def test_failed_init_releases_the_model_and_executors(stub_rag, registry, monkeypatch):
+    _, make_core = stub_rag
+    created = []
+    original_init = rag_core.RAGCore.__init__
+
+    def spy_init(self, *args, **kwargs):
+        created.append(self)
+        original_init(self, *args, **kwargs)
+
+    def broken_manifest(path):
+        raise OSError("manifesto indisponível")
+
+    monkeypatch.setattr(rag_core.RAGCore, "__init__", spy_init)
+    monkeypatch.setattr(rag_core, "IndexManifest", broken_manifest)
+    with pytest.raises(OSError):
+        make_core()
+    assert _references(registry) == {}
+    with pytest.raises(RuntimeError):
+        created[0]._shard_executor.submit(print)
@@ -0,0 +1,159 @@
+import json
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote
+
+import pytest
+
+from src.rag_app import config
+from src.rag_app.deadline import Deadline
+from src.rag_app.external_knowledge import ExternalKnowledgeProvider
+
+SUMMARY = "Heteroidentificação é o procedimento complementar à autodeclaração racial " * 3
+
+
+class StubWikipedia(BaseHTTPRequestHandler):
+    """Responde conforme o termo: Lento*, Falha*, Ausente*, Quebrado* ou um resumo válido."""
+
+    requests = Counter()
+
+    def do_GET(self):
+        term = unquote(self.path.rsplit("/", 1)[-1])
+        self.requests[term] += 1
+        if term.startswith("Lento"):
+            time.sleep(2.0)
+        if term.startswith("Falha"):
+            self._reply(503, b"{}")
+        elif term.startswith("Ausente"):
+            self._reply(404, b"{}")
+        elif term.startswith("Quebrado"):
+            self._reply(200, b"<html>")
+        else:
+            body = {"title": term, "extract": f"{term}: {SUMMARY}",
+                    "content_urls": {"desktop": {"page": f"https://wiki/{term}"}}}
+            self._reply(200, json.dumps(body).encode("utf-8"))
+
+    def _reply(self, status, body):
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def wikipedia():
+    StubWikipedia.requests = Counter()
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubWikipedia)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}", StubWikipedia.requests
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def make_provider(wikipedia, monkeypatch):
+    base_url, _ = wikipedia
+    providers = []
+
+    def make(**overrides):
+        for key, value in overrides.items():
+            monkeypatch.setitem(config.EXTERNAL_KNOWLEDGE_CONFIG, key, value)
+        provider = ExternalKnowledgeProvider(cache_path=":memory:", wikipedia_base_url=base_url)
+        providers.append(provider)
+        return provider
+
+    yield make
+    for provider in providers:
+        provider.close()
+
+
+def test_cache_hit_avoids_a_second_request(wikipedia, make_provider):
+    _, requests = wikipedia
+    provider = make_provider()
+    first = provider.search_wikipedia("Heteroidentificação")
+    assert first["title"] == "Heteroidentificação"
+    assert provider.search_wikipedia("heteroidentificação") == first
+    assert requests["Heteroidentificação"] == 1
+
+
+def test_negative_results_are_cached_until_their_ttl(wikipedia, make_provider):
+    _, requests = wikipedia
+    provider = make_provider(negative_cache_ttl_seconds=0.3)
+    assert provider.search_wikipedia("Ausente") is None
+    assert provider.search_wikipedia("Ausente") is None
+    assert requests["Ausente"] == 1
+    time.sleep(0.4)
+    assert provider.search_wikipedia("Ausente") is None
+    assert requests["Ausente"] == 2
+
+
+def test_transient_failures_are_not_cached(wikipedia, make_provider):
+    _, requests = wikipedia
+    provider = make_provider(circuit_breaker_failures=5)
+    provider.search_wikipedia("Falha")
+    provider.search_wikipedia("Falha")
+    assert requests["Falha"] == 2
+
+
+def test_circuit_breaker_opens_and_half_opens(wikipedia, make_provider):
+    _, requests = wikipedia
+    provider = make_provider(circuit_breaker_failures=2, circuit_breaker_cooldown_seconds=0.3)
+    provider.search_wikipedia("Falha1")
+    provider.search_wikipedia("Falha2")
+    assert provider.circuit_breaker.is_open
+
+    # Aberto: nenhuma requisição chega ao servidor
+    assert provider.search_wikipedia("Matrícula") is None
+    assert requests["Matrícula"] == 0
+
+    # Meio-aberto: uma chamada de teste; a falha reabre o circuito
+    time.sleep(0.4)
+    assert provider.search_wikipedia("Falha3") is None
+    assert requests["Falha3"] == 1
+    assert provider.circuit_breaker.is_open
+
+    # Nova chamada de teste bem-sucedida fecha o circuito
+    time.sleep(0.4)
+    assert provider.search_wikipedia("Matrícula")["title"] == "Matrícula"
+    assert not provider.circuit_breaker.is_open
+    assert provider.search_wikipedia("Rematrícula")["title"] == "Rematrícula"
+
+
+def test_invalid_body_is_not_a_breaker_failure(wikipedia, make_provider):
+    _, requests = wikipedia
+    provider = make_provider(circuit_breaker_failures=1)
+    assert provider.search_wikipedia("Quebrado") is None
+    assert not provider.circuit_breaker.is_open
+    assert provider.search_wikipedia("Quebrado") is None
+    assert requests["Quebrado"] == 2  # não vai para o cache
+
+
+def test_terms_are_looked_up_concurrently_under_one_deadline(wikipedia, make_provider):
+    _, requests = wikipedia
+    provider = make_provider(remote_lookup_deadline=0.5, remote_request_timeout=3.0)
+    start = time.monotonic()
+    result = provider._lookup_wikipedia_terms(["Lento", "Cotas"])
+    elapsed = time.monotonic() - start
+
+    # O primeiro termo não termina no prazo: vale o melhor resultado já disponível
+    assert result["title"] == "Cotas"
+    assert 0.4 <= elapsed < 1.5
+    assert requests["Lento"] == 1 and requests["Cotas"] == 1
+
+
+def test_query_deadline_shortens_the_lookup(wikipedia, make_provider):
+    provider = make_provider(remote_lookup_deadline=5.0)
+    start = time.monotonic()
+    assert provider._lookup_wikipedia_terms(["Lento1", "Lento2"], query_deadline=Deadline(0.3)) is None
+    assert time.monotonic() - start < 1.5
+
+    expired = Deadline(0.0)
+    assert provider._lookup_wikipedia_terms(["Cotas"], query_deadline=expired) is None
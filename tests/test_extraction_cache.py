@@ -0,0 +1,100 @@
+import pytest
+
+from src.rag_app import config, rag_core
+from src.rag_app.extraction_cache import ExtractionCache
+
+EXTRACTION = {"pages": [[1, "Inscrições abertas."], [2, "Reserva de vagas."]],
+              "tables": [{"page_number": 2, "markdown": "| a | b |"}]}
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = ExtractionCache(str(tmp_path / "extracoes.sqlite3"))
+    yield cache
+    cache.close()
+
+
+def test_entries_are_keyed_by_content_hash_and_extractor(cache):
+    cache.put("hash-a", "pdf-1", EXTRACTION, 1.5)
+    assert cache.get("hash-a", "pdf-1") == EXTRACTION
+    assert cache.get("hash-b", "pdf-1") is None
+    assert cache.get("hash-a", "pdf-2") is None
+    stats = cache.get_stats()
+    assert (stats["hits"], stats["misses"], stats["stores"], stats["entries"]) == (1, 2, 1, 1)
+    assert stats["extraction_seconds_saved"] == 1.5
+
+
+def test_prune_evicts_least_recently_used_entries(tmp_path, monkeypatch):
+    cache = ExtractionCache(str(tmp_path / "extracoes.sqlite3"))
+    try:
+        clock = iter(range(1000))
+        monkeypatch.setattr("src.rag_app.extraction_cache.time.time", lambda: float(next(clock)))
+        # Texto pouco compressível: cada entrada ocupa alguns KB
+        for name in ("a", "b", "c"):
+            cache.put(name, "pdf-1", {"pages": [[1, "".join(f"{name}{i * 7919 % 10007}" for i in range(1500))]],
+                                      "tables": []}, 0.1)
+        assert cache.get("a", "pdf-1") is not None  # "a" passa a ser a mais recente
+        entry_size = cache._conn.execute("SELECT MAX(size) FROM extractions").fetchone()[0]
+        cache.max_size_bytes = 2 * entry_size
+        cache.prune()
+        assert cache.get("b", "pdf-1") is None
+        assert cache.get("a", "pdf-1") is not None and cache.get("c", "pdf-1") is not None
+        assert cache.get_stats()["evictions"] == 1
+    finally:
+        cache.close()
+
+
+@pytest.fixture
+def cached_pdf_core(stub_rag, tmp_path, monkeypatch):
+    """Fábrica de RAGCore com índice novo a cada chamada, cache de extração ligado e contagem das extrações."""
+    fitz = pytest.importorskip("fitz")
+    data, make_core = stub_rag
+    monkeypatch.setitem(config.EXTRACTION_CACHE_CONFIG, "enabled", True)
+    monkeypatch.setitem(config.EXTRACTION_CACHE_CONFIG, "path", str(tmp_path / "extracoes.sqlite3"))
+    extracted = []
+    original = rag_core.RAGCore._extract_pdf
+
+    def counting_extract(self, document_path):
+        extracted.append(document_path)
+        return original(self, document_path)
+
+    monkeypatch.setattr(rag_core.RAGCore, "_extract_pdf", counting_extract)
+
+    def write_pdf(text):
+        document = fitz.open()
+        document.new_page().insert_textbox(fitz.Rect(50, 50, 550, 800), text * 5, fontsize=11)
+        document.save(str(data / "edital.pdf"))
+        document.close()
+
+    def build(run):
+        core = make_core(chroma_db_path=str(tmp_path / f"chroma_{run}"))
+        core.close()
+
+    return write_pdf, build, extracted
+
+
+def test_rebuild_reuses_the_extraction(cached_pdf_core):
+    write_pdf, build, extracted = cached_pdf_core
+    write_pdf("Inscrições abertas para os cursos técnicos. ")
+    build(1)
+    build(2)
+    assert len(extracted) == 1
+
+
+def test_changed_content_is_extracted_again(cached_pdf_core):
+    write_pdf, build, extracted = cached_pdf_core
+    write_pdf("Inscrições abertas para os cursos técnicos. ")
+    build(1)
+    write_pdf("Inscrições prorrogadas até o fim do mês. ")
+    build(2)
+    assert len(extracted) == 2
+
+
+def test_new_extractor_version_is_extracted_again(cached_pdf_core, monkeypatch):
+    write_pdf, build, extracted = cached_pdf_core
+    write_pdf("Inscrições abertas para os cursos técnicos. ")
+    build(1)
+    monkeypatch.setattr(rag_core, "PDF_EXTRACTOR_VERSION", rag_core.PDF_EXTRACTOR_VERSION + 1)
+    build(2)
+    build(3)
+    assert len(extracted) == 2
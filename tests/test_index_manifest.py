@@ -0,0 +1,113 @@
+import socket
+import time
+
+from src.rag_app.index_manifest import IndexManifest, chunk_hash
+
+
+def _populate(manifest):
+    manifest.set_shard("", "rag_docs", "modelo-a")
+    manifest.set_shard("editais", "rag_docs__editais", "modelo-a")
+    manifest.record_file("", "a.pdf", 1700000000.0, 1234, "hash-a", 1000, 200, 3,
+                         {"a.pdf_chunk_0": chunk_hash("texto 0", {"page_number": 1}),
+                          "a.pdf_chunk_1": chunk_hash("texto 1", {"page_number": 2})},
+                         signatures={"a.pdf_chunk_0": b"\x01\x02", "a.pdf_chunk_1": b"\x03\x04"})
+    manifest.record_file("", "b.pdf", 1700000001.0, 99, "hash-b", 1000, 200, 3,
+                         {"b.pdf_chunk_0": chunk_hash("texto 0", {"page_number": 1})},
+                         signatures={"b.pdf_chunk_0": b"\x01\x02"},
+                         duplicates={"b.pdf_chunk_0": ("a.pdf_chunk_0", "texto 0", {"page_number": 1})},
+                         dedup_config="minhash")
+    manifest.record_file("editais", "c.md", 1700000002.0, 10, "hash-c", 1000, 200, 3,
+                         {"c.md_chunk_0": chunk_hash("texto c", None)})
+    manifest.bump_index_version()
+
+
+def _contents(manifest):
+    return {
+        "shards": {shard: (row["collection"], row["embedding_model"])
+                   for shard, row in manifest.get_shards().items()},
+        "files": {key: {name: value for name, value in row.items() if name != "indexed_at"}
+                  for key, row in manifest.get_files().items()},
+        "chunks": {key: manifest.get_chunk_hashes(*key) for key in manifest.get_files()},
+        "duplicates": {key: manifest.get_file_duplicates(*key) for key in manifest.get_files()},
+        "signatures": {shard: manifest.get_canonical_signatures(shard) for shard in manifest.get_shards()},
+    }
+
+
+def test_manifest_survives_reopen(tmp_path):
+    path = str(tmp_path / "manifest.sqlite3")
+    manifest = IndexManifest(path)
+    _populate(manifest)
+    expected = _contents(manifest)
+    version = manifest.index_version()
+    manifest.close()
+
+    reopened = IndexManifest(path)
+    assert _contents(reopened) == expected
+    assert reopened.index_version() == version
+    assert expected["signatures"][""] == {"a.pdf_chunk_0": b"\x01\x02", "a.pdf_chunk_1": b"\x03\x04"}
+    assert expected["duplicates"][("", "b.pdf")] == {"b.pdf_chunk_0": "a.pdf_chunk_0"}
+    reopened.close()
+
+
+def test_export_import_round_trip(tmp_path):
+    source = IndexManifest(str(tmp_path / "source.sqlite3"))
+    _populate(source)
+    target = IndexManifest(str(tmp_path / "target.sqlite3"))
+    target.set_shard("antigo", "rag_docs__antigo", "modelo-x")
+
+    target.import_state(source.export_state())
+    assert _contents(target) == _contents(source)
+    assert target.index_version() > source.index_version()  # consultas em cache da versão anterior expiram
+    duplicates = target.get_duplicates_of("", ["a.pdf_chunk_0"])
+    assert [(row["chunk_id"], row["metadata"]) for row in duplicates] == [("b.pdf_chunk_0", {"page_number": 1})]
+    source.close()
+    target.close()
+
+
+def test_remove_file_drops_its_chunks_and_duplicates(tmp_path):
+    manifest = IndexManifest(str(tmp_path / "manifest.sqlite3"))
+    _populate(manifest)
+    manifest.remove_file("", "b.pdf")
+    assert ("", "b.pdf") not in manifest.get_files()
+    assert manifest.get_chunk_hashes("", "b.pdf") == {}
+    assert manifest.get_duplicates_of("", ["a.pdf_chunk_0"]) == []
+    manifest.close()
+
+
+def test_live_migration_blocks_a_second_one_and_survives_recovery(tmp_path):
+    manifest = IndexManifest(str(tmp_path / "manifest.sqlite3"))
+    first = manifest.start_migration("", "modelo-a", "modelo-b", "rag_docs", 10, stale_seconds=60)
+    assert first is not None
+    assert manifest.start_migration("", "modelo-a", "modelo-b", "rag_docs", 10, stale_seconds=60) is None
+    assert manifest.start_migration("editais", "modelo-a", "modelo-b", "rag_docs__editais", 1, 60) is not None
+
+    assert manifest.mark_interrupted_migrations(stale_seconds=60) == []
+    assert {m["status"] for m in manifest.get_migrations()} == {"running"}
+    manifest.close()
+
+
+def test_abandoned_migrations_are_recovered(tmp_path):
+    manifest = IndexManifest(str(tmp_path / "manifest.sqlite3"))
+    dead_process = manifest.start_migration("", "modelo-a", "modelo-b", "rag_docs", 10, 60)
+    manifest.update_migration(dead_process, owner=f"{socket.gethostname()}:999999999")
+    silent = manifest.start_migration("editais", "modelo-a", "modelo-b", "rag_docs__editais", 10, 60)
+    manifest.update_migration(silent, owner="outra-maquina:42", heartbeat_at=time.time() - 120)
+    legacy = manifest.start_migration("cotas", "modelo-a", "modelo-b", "rag_docs__cotas", 10, 60)
+    manifest.update_migration(legacy, owner=None, heartbeat_at=None)
+    remote = manifest.start_migration("vagas", "modelo-a", "modelo-b", "rag_docs__vagas", 10, 60)
+    manifest.update_migration(remote, owner="outra-maquina:42")
+
+    # Um dono morto não impede uma nova migração do shard
+    assert manifest.start_migration("", "modelo-a", "modelo-b", "rag_docs", 10, 60) is not None
+
+    recovered = manifest.mark_interrupted_migrations(stale_seconds=60)
+    assert sorted(m["id"] for m in recovered) == [dead_process, silent, legacy]
+    status = {m["id"]: m["status"] for m in manifest.get_migrations()}
+    assert status[remote] == "running"
+    assert all(status[i] == "interrupted" for i in (dead_process, silent, legacy))
+
+    before = manifest.get_migrations()[0]["heartbeat_at"]
+    time.sleep(0.01)
+    manifest.heartbeat_migration(remote)
+    assert {m["id"]: m["heartbeat_at"] for m in manifest.get_migrations()}[remote] > before
+    manifest.close()
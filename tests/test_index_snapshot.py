@@ -0,0 +1,135 @@
+import struct
+
+import numpy as np
+import pytest
+
+from src.rag_app import config, rag_core
+from src.rag_app.index_manifest import IndexManifest
+from src.rag_app.index_snapshot import (MAGIC, SnapshotCollection, SnapshotError, IndexSnapshot, _matches,
+                                        restore_snapshot)
+
+QUERIES = ["prazo de inscrição", "reserva de vagas para escola pública", "matrícula dos aprovados"]
+FILTERS = [None, {"source": "edital.pdf"}, {"source": ["avisos.md", "edital.pdf"]},
+           {"page_from": 2, "page_to": 3}, {"page_to": 1, "content_type": "text"}, {"content_type": "table"}]
+
+
+@pytest.fixture
+def exported(stub_rag, tmp_path, monkeypatch):
+    """Índice com um PDF de várias páginas e um Markdown em dois shards, exportado para um snapshot."""
+    fitz = pytest.importorskip("fitz")
+    data, make_core = stub_rag
+    monkeypatch.setitem(config.INDEX_SHARDING_CONFIG, "mode", "subfolder")
+    document = fitz.open()
+    for text in ("Inscrições e documentos exigidos no prazo do edital.",
+                 "Reserva de vagas para escola pública e renda familiar.",
+                 "Banca de heteroidentificação e recursos contra o resultado.",
+                 "Matrícula dos aprovados nas chamadas públicas."):
+        document.new_page().insert_textbox(fitz.Rect(50, 50, 550, 800), (text + " ") * 4, fontsize=11)
+    document.save(str(data / "edital.pdf"))
+    document.close()
+    (data / "campus").mkdir()
+    (data / "campus" / "avisos.md").write_text("Avisos da secretaria sobre matrícula e atendimento. " * 10,
+                                               encoding="utf-8")
+    core = make_core()
+    path = str(tmp_path / "indice.ragsnap")
+    core.export_snapshot(path)
+    yield core, path, make_core
+    core.close()
+
+
+def test_replica_answers_like_chroma(exported):
+    core, path, make_core = exported
+    replica = make_core(snapshot_path=path)
+    try:
+        assert replica.list_shards() == core.list_shards()
+        assert replica.count_chunks() == core.count_chunks()
+        assert replica.index_version == core.index_version
+        for query in QUERIES:
+            for filters in FILTERS:
+                expected = core.retrieve_relevant_chunks(query, 5, filters=filters)
+                assert expected or filters == {"content_type": "table"}
+                actual = replica.retrieve_relevant_chunks(query, 5, filters=filters)
+                assert [item["id"] for item in actual] == [item["id"] for item in expected], filters
+                np.testing.assert_allclose([item["distance"] for item in actual],
+                                           [item["distance"] for item in expected], atol=1e-5)
+        with pytest.raises(ValueError):
+            replica.rebuild_shard(rag_core.ROOT_SHARD)
+    finally:
+        replica.close()
+
+
+def test_restore_recreates_collections_and_manifest(exported, tmp_path):
+    import chromadb
+    core, path, _ = exported
+    client = chromadb.PersistentClient(path=str(tmp_path / "restaurado"))
+    manifest = IndexManifest(str(tmp_path / "restaurado" / "manifest.sqlite3"))
+    try:
+        restore_snapshot(path, client, manifest)
+        for shard, source in core.shard_collections.items():
+            original = source.get(include=["embeddings", "documents", "metadatas"])
+            restored = client.get_collection(source.name).get(ids=original["ids"],
+                                                              include=["embeddings", "documents", "metadatas"])
+            assert restored["ids"] == original["ids"]
+            assert restored["documents"] == original["documents"]
+            assert restored["metadatas"] == original["metadatas"]
+            np.testing.assert_array_equal(np.array(restored["embeddings"]), np.array(original["embeddings"]))
+        assert manifest.get_files() == core.index_manifest.get_files()
+        assert manifest.get_shards().keys() == core.index_manifest.get_shards().keys()
+        assert manifest.index_version() > core.index_manifest.index_version()
+    finally:
+        manifest.close()
+
+
+def test_checksum_detects_corrupted_vectors(exported):
+    _, path, _ = exported
+    offset = IndexSnapshot(path).footer["shards"][rag_core.ROOT_SHARD]["vectors_offset"]
+    with open(path, "r+b") as f:
+        f.seek(offset)
+        f.write(b"\xff\xff\xff\xff")
+    IndexSnapshot(path)  # sem verificação o arquivo abre
+    with pytest.raises(SnapshotError):
+        IndexSnapshot(path, verify_checksum=True)
+
+
+@pytest.mark.parametrize("damage", ["truncated", "short", "version", "magic"])
+def test_damaged_files_are_rejected(exported, damage):
+    _, path, _ = exported
+    with open(path, "r+b") as f:
+        content = f.read()
+        f.seek(0)
+        f.truncate()
+        if damage == "truncated":
+            f.write(content[:len(content) // 2])
+        elif damage == "short":
+            f.write(content[:20])
+        elif damage == "version":
+            f.write(MAGIC + struct.pack("<I", 99) + content[len(MAGIC) + 4:])
+        else:
+            f.write(b"NOTASNAP" + content[len(MAGIC):])
+    with pytest.raises(SnapshotError):
+        IndexSnapshot(path)
+
+
+def test_where_semantics():
+    metadata = {"source": "a.pdf", "page_number": 3, "page_end": 4, "content_type": "text",
+                "duplicate_sources": ["b.pdf"], "flag": True}
+    assert _matches(metadata, {"source": "a.pdf"})
+    assert _matches(metadata, {"source": {"$in": ["x.pdf", "a.pdf"]}})
+    assert not _matches(metadata, {"source": {"$nin": ["a.pdf"]}})
+    assert _matches(metadata, {"$or": [{"source": "b.pdf"}, {"duplicate_sources": {"$contains": "b.pdf"}}]})
+    assert _matches(metadata, {"$and": [{"page_end": {"$gte": 4}}, {"page_number": {"$lte": 3}}]})
+    assert not _matches(metadata, {"$and": [{"page_end": {"$gte": 5}}, {"page_number": {"$lte": 3}}]})
+    assert not _matches({"page_number": "N/A"}, {"page_number": {"$lte": 3}})
+    assert not _matches(metadata, {"flag": {"$gt": 0}})  # booleanos não são números
+    assert not _matches({"duplicate_sources": "b.pdf"}, {"duplicate_sources": {"$contains": "b.pdf"}})
+    with pytest.raises(ValueError):
+        _matches(metadata, {"source": {"$like": "a%"}})
+
+
+def test_get_by_ids_keeps_the_requested_order():
+    vectors = np.eye(3, dtype=np.float32)
+    collection = SnapshotCollection("c", vectors, ["a", "b", "c"], ["A", "B", "C"], [{}, {}, {}])
+    result = collection.get(ids=["c", "x", "a"], include=["documents", "embeddings"])
+    assert result["ids"] == ["c", "a"] and result["documents"] == ["C", "A"]
+    np.testing.assert_array_equal(result["embeddings"], vectors[[2, 0]])
+    assert collection.get(limit=2, offset=1)["ids"] == ["b", "c"]
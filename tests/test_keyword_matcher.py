@@ -0,0 +1,27 @@
+from src.rag_app.keyword_matcher import KeywordMatcher
+
+
+def _matches(matcher, text):
+    return [(start, keyword, category) for start, keyword, category in matcher.iter_matches(text)]
+
+
+def test_overlapping_keywords_are_all_reported():
+    matcher = KeywordMatcher({"a": ["he", "she", "hers", "his"]})
+    assert sorted(_matches(matcher, "ushers")) == [(1, "she", "a"), (2, "he", "a"), (2, "hers", "a")]
+
+
+def test_rebuild_is_idempotent():
+    matcher = KeywordMatcher({"a": ["he", "she"]})
+    matcher.add("hers", "a")
+    matcher.build()
+    matcher.build()
+    assert [keyword for _, keyword, _ in _matches(matcher, "ushers")].count("he") == 1
+    assert sorted(_matches(matcher, "ushers")) == [(1, "she", "a"), (2, "he", "a"), (2, "hers", "a")]
+
+
+def test_add_after_build_rebuilds_lazily():
+    matcher = KeywordMatcher({"a": ["cota"]})
+    assert matcher.match("Cotas L2") == {"a": ["cota"]}
+    matcher.add("l2", "b")
+    assert matcher.match("Cotas L2") == {"a": ["cota"], "b": ["l2"]}
+    assert matcher.match("Cotas L2") == {"a": ["cota"], "b": ["l2"]}
@@ -0,0 +1,135 @@
+import socket
+import threading
+import time
+
+import pytest
+
+from src.rag_app import config
+from src.rag_app.llm_router import (LLMCancelledError, LLMEndpoint, LLMEndpointError, LLMRouter, MockEndpoint,
+                                    OllamaEndpoint)
+from src.rag_app.llm_scheduler import LLMScheduler
+
+
+class FailingEndpoint(LLMEndpoint):
+    def __init__(self, name):
+        super().__init__(name, "mock", "mock")
+        self.calls = 0
+
+    def generate(self, prompt, model=None, cancel_event=None, timeout=None):
+        self.calls += 1
+        raise LLMEndpointError(f"falha simulada em '{self.name}'")
+
+
+class RecordingEndpoint(MockEndpoint):
+    def __init__(self, name, latency_seconds=0.0):
+        super().__init__(name, latency_seconds)
+        self.prompts = []
+
+    def generate(self, prompt, model=None, cancel_event=None, timeout=None):
+        self.prompts.append(prompt)
+        return super().generate(prompt, model, cancel_event, timeout)
+
+
+def _scheduler(max_in_flight=4):
+    return LLMScheduler({"max_in_flight": {"default": max_in_flight}, "max_queue": 10,
+                         "queue_timeout_seconds": {"interactive": 5.0, "batch": 5.0}})
+
+
+def _router(endpoints, scheduler=None, **overrides):
+    return LLMRouter(endpoints, scheduler or _scheduler(), dict(config.LLM_ROUTER_CONFIG, **overrides))
+
+
+def test_endpoint_base_class_is_abstract():
+    with pytest.raises(TypeError):
+        LLMEndpoint("x", "mock", "mock")
+
+
+def test_failover_to_next_endpoint():
+    failing, healthy = FailingEndpoint("a"), MockEndpoint("b")
+    router = _router([failing, healthy])
+    assert router.generate("pergunta") == healthy.generate("pergunta")
+    stats = router.get_stats()
+    assert failing.calls == 1
+    assert stats["a"]["failures"] == 1 and stats["b"]["successes"] == 1
+
+
+def test_circuit_breaker_takes_failing_endpoint_out_of_rotation():
+    failing, healthy = FailingEndpoint("a"), MockEndpoint("b")
+    router = _router([failing, healthy], failure_threshold=2, cooldown_seconds=60.0)
+    for _ in range(2):
+        router.generate("pergunta")
+    assert failing.calls == 2
+    assert router.get_stats()["a"]["healthy"] is False
+
+    router.generate("pergunta")
+    assert failing.calls == 2  # em cooldown: vai para o fim da lista e não é tentado
+
+
+def test_hedge_wins_when_primary_is_slow():
+    slow, fast = MockEndpoint("a", latency_seconds=5.0), MockEndpoint("b", latency_seconds=0.01)
+    router = _router([slow, fast], hedging_enabled=True, hedge_min_samples=1, hedge_min_delay_seconds=0.05)
+    router._record_success(slow, 0.01)
+    router._record_success(fast, 0.02)
+
+    start = time.monotonic()
+    assert router.generate("pergunta") == fast.generate("pergunta")
+    assert time.monotonic() - start < 2.0  # a tentativa lenta é cancelada
+    stats = router.get_stats()
+    assert stats["a"]["hedges_fired"] == 1 and stats["a"]["hedges_won"] == 1
+
+
+def test_hedge_is_skipped_without_a_free_slot():
+    slow, fast = MockEndpoint("a", latency_seconds=0.3), MockEndpoint("b")
+    scheduler = _scheduler(max_in_flight=1)
+    router = _router([slow, fast], scheduler, hedging_enabled=True, hedge_min_samples=1,
+                     hedge_min_delay_seconds=0.05)
+    router._record_success(slow, 0.01)
+    router._record_success(fast, 0.02)
+
+    release = scheduler.reserve("b")
+    try:
+        assert router.generate("pergunta") == slow.generate("pergunta")
+    finally:
+        release()
+    assert router.get_stats()["a"]["hedges_fired"] == 0
+
+
+def test_scheduler_priority_applies_before_the_router_pool():
+    endpoint = RecordingEndpoint("a")
+    scheduler = _scheduler(max_in_flight=1)
+    router = _router([endpoint], scheduler, max_parallel_attempts=1)
+
+    release = scheduler.reserve("a")
+    threads = []
+    try:
+        for priority in ("batch", "interactive"):
+            thread = threading.Thread(target=router.generate, args=(priority, priority), daemon=True)
+            thread.start()
+            threads.append(thread)
+            limit = time.monotonic() + 2.0
+            while scheduler.get_stats()["a"]["queued"] < len(threads) and time.monotonic() < limit:
+                time.sleep(0.01)
+            assert scheduler.get_stats()["a"]["queued"] == len(threads)
+    finally:
+        release()
+    for thread in threads:
+        thread.join(timeout=5)
+
+    assert endpoint.prompts == ["interactive", "batch"]
+
+
+def test_ollama_request_is_bounded_by_the_remaining_deadline():
+    # Servidor que aceita a conexão e nunca responde
+    server = socket.socket()
+    server.bind(("127.0.0.1", 0))
+    server.listen()
+    host = f"http://127.0.0.1:{server.getsockname()[1]}"
+    try:
+        endpoint = OllamaEndpoint("ollama", host, "modelo", request_timeout=120.0)
+        for cancel_event in (None, threading.Event()):
+            start = time.monotonic()
+            with pytest.raises(LLMCancelledError):
+                endpoint.generate("pergunta", cancel_event=cancel_event, timeout=0.3)
+            assert time.monotonic() - start < 5.0
+    finally:
+        server.close()
@@ -0,0 +1,99 @@
+import pytest
+
+from src.rag_app import config
+from src.rag_app.rag_core import RAGCore
+
+PAGES = [
+    "Capítulo um sobre as inscrições do processo seletivo e os documentos exigidos dos candidatos.",
+    "Capítulo dois sobre a reserva de vagas para escola pública, renda e autodeclaração racial.",
+    "Capítulo três sobre a banca de heteroidentificação e os recursos contra o resultado preliminar.",
+    "Capítulo quatro sobre a matrícula dos aprovados, as chamadas públicas e o início das aulas.",
+]
+
+
+def test_filter_builder():
+    assert RAGCore.build_metadata_filter(None) is None
+    assert RAGCore.build_metadata_filter({}) is None
+    assert RAGCore.build_metadata_filter({"content_type": "table"}) == {"content_type": "table"}
+    assert RAGCore.build_metadata_filter({"page_from": 2, "page_to": 3}) == {
+        "$and": [{"page_end": {"$gte": 2}}, {"page_number": {"$lte": 3}}]}
+    assert RAGCore.build_metadata_filter({"source": ["a.md", "b.md"]}) == {
+        "$or": [{"source": {"$in": ["a.md", "b.md"]}},
+                {"duplicate_sources": {"$contains": "a.md"}}, {"duplicate_sources": {"$contains": "b.md"}}]}
+
+
+@pytest.mark.parametrize("filters", [
+    {"pagina": 1},
+    {"page_from": "2"},
+    {"page_to": True},
+    {"content_type": "imagem"},
+    {"source": []},
+    {"source": ["a.md", 3]},
+])
+def test_invalid_filters_raise(filters):
+    with pytest.raises(ValueError):
+        RAGCore.build_metadata_filter(filters)
+
+
+@pytest.fixture
+def pdf_core(stub_rag):
+    fitz = pytest.importorskip("fitz")
+    data, make_core = stub_rag
+    document = fitz.open()
+    for text in PAGES:
+        document.new_page().insert_textbox(fitz.Rect(50, 50, 550, 800), (text + " ") * 3, fontsize=11)
+    document.save(str(data / "edital.pdf"))
+    document.close()
+    (data / "avisos.md").write_text("Avisos gerais da secretaria sobre atendimento ao público. " * 8,
+                                    encoding="utf-8")
+    core = make_core()
+    yield core
+    core.close()
+
+
+def _pages(item):
+    metadata = item["metadata"]
+    return metadata["page_number"], metadata["page_end"]
+
+
+def test_chunks_record_the_pages_they_span(pdf_core):
+    indexed = pdf_core.collection.get(where={"source": "edital.pdf"}, include=["metadatas"])["metadatas"]
+    spans = sorted((metadata["page_number"], metadata["page_end"]) for metadata in indexed)
+    assert spans[0][0] == 1 and spans[-1][1] == len(PAGES)
+    assert any(start < end for start, end in spans)  # ao menos um chunk cruza páginas
+
+
+def test_page_range_keeps_every_overlapping_chunk(pdf_core):
+    indexed = pdf_core.collection.get(where={"source": "edital.pdf"}, include=["metadatas"])
+    expected = {chunk_id for chunk_id, metadata in zip(indexed["ids"], indexed["metadatas"])
+                if metadata["page_end"] >= 2 and metadata["page_number"] <= 3}
+
+    items = pdf_core.retrieve_relevant_chunks("heteroidentificação", 50, filters={"page_from": 2, "page_to": 3})
+    assert {item["id"] for item in items} == expected
+    assert all(start <= 3 and end >= 2 for start, end in map(_pages, items))
+
+
+def test_source_and_content_type_filters(pdf_core):
+    items = pdf_core.retrieve_relevant_chunks("atendimento", 50, filters={"source": "avisos.md"})
+    assert items and {item["metadata"]["source"] for item in items} == {"avisos.md"}
+    items = pdf_core.retrieve_relevant_chunks("atendimento", 50, filters={"content_type": "text"})
+    assert {item["metadata"]["source"] for item in items} == {"avisos.md", "edital.pdf"}
+    assert pdf_core.retrieve_relevant_chunks("atendimento", 50, filters={"content_type": "table"}) == []
+
+
+def test_source_filter_matches_near_duplicates(stub_rag, monkeypatch):
+    data, make_core = stub_rag
+    monkeypatch.setitem(config.CHUNK_DEDUP_CONFIG, "enabled", True)
+    text = "Calendário de matrículas do campus com documentos e horários de atendimento. " * 6
+    for name in ("a.md", "b.md"):
+        (data / name).write_text(text, encoding="utf-8")
+    core = make_core()
+    try:
+        (canonical,) = {m["source"] for m in core.collection.get(include=["metadatas"])["metadatas"]}
+        (duplicate,) = {"a.md", "b.md"} - {canonical}
+        items = core.retrieve_relevant_chunks("matrículas", 50, filters={"source": duplicate})
+        assert items
+        assert all(item["metadata"]["source"] == canonical
+                   and duplicate in item["metadata"]["duplicate_sources"] for item in items)
+    finally:
+        core.close()
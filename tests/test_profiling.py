@@ -0,0 +1,22 @@
+from src.rag_app import config, rag_core
+
+
+def test_batched_encoding_is_reported_as_its_own_stage(stub_rag, tmp_path, monkeypatch):
+    data, make_core = stub_rag
+    monkeypatch.setitem(config.PROFILING_CONFIG, "output_dir", str(tmp_path / "perfis"))
+    core = make_core()
+    try:
+        for name in ("a.md", "b.md"):
+            (data / name).write_text(f"Texto do arquivo {name} sobre o edital. " * 30, encoding="utf-8")
+        encoded = []
+        flush = rag_core.RAGCore._flush_pending_files
+        monkeypatch.setattr(core, "_flush_pending_files",
+                            lambda *args: encoded.append([f["document_file"] for f in args[3]]) or flush(core, *args))
+        core._load_or_process_documents(profile=True)
+
+        # Os dois arquivos vão num único lote, registrado à parte dos documentos
+        assert len(encoded) == 1 and sorted(encoded[0]) == ["a.md", "b.md"]
+        stages = [entry["document"] for entry in core.last_ingestion_profile["documents"]]
+        assert sorted(stages) == sorted(["a.md", "b.md", f"<codificação {rag_core.ROOT_SHARD}>"])
+    finally:
+        core.close()
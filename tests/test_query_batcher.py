@@ -0,0 +1,106 @@
+import threading
+import time
+
+import numpy as np
+
+from src.rag_app.query_batcher import QueryEmbeddingBatcher
+
+
+class GatedModel:
+    """Modelo que registra cada passada; a primeira fica presa até gate.set(); fail_batch faz uma passada falhar."""
+
+    def __init__(self, fail_batch=None):
+        self.batches = []
+        self.fail_batch = fail_batch
+        self.first_started = threading.Event()
+        self.gate = threading.Event()
+
+    def encode(self, sentences, **kwargs):
+        self.batches.append(list(sentences))
+        if len(self.batches) == 1:
+            self.first_started.set()
+            assert self.gate.wait(5)
+        if len(self.batches) == self.fail_batch:
+            raise ValueError("falha na codificação")
+        return np.array([[float(len(text)), float(sum(map(ord, text)))] for text in sentences], dtype=np.float32)
+
+
+def _vector(text):
+    return np.array([len(text), sum(map(ord, text))], dtype=np.float32)
+
+
+def _run_concurrently(batcher, model, followers):
+    """Prende o líder na primeira passada, enfileira os seguidores e libera o modelo."""
+    results = {}
+
+    def call(text):
+        try:
+            results[text] = batcher.encode(text)
+        except BaseException as e:
+            results[text] = e
+
+    threads = [threading.Thread(target=call, args=("lider",))]
+    threads[0].start()
+    assert model.first_started.wait(5)
+    for text in followers:
+        threads.append(threading.Thread(target=call, args=(text,)))
+        threads[-1].start()
+    deadline = time.monotonic() + 5
+    while batcher.get_stats()["pending"] < len(followers):
+        assert time.monotonic() < deadline
+        time.sleep(0.005)
+    model.gate.set()
+    for thread in threads:
+        thread.join(5)
+    return results
+
+
+def test_single_caller_is_encoded_without_waiting():
+    model = GatedModel()
+    model.gate.set()
+    batcher = QueryEmbeddingBatcher(model, {"max_batch_size": 8, "max_wait_ms": 2000.0})
+    start = time.perf_counter()
+    np.testing.assert_array_equal(batcher.encode("prazo"), _vector("prazo"))
+    assert time.perf_counter() - start < 1.0
+    assert batcher.get_stats()["waited_batches"] == 0
+    assert model.batches == [["prazo"]]
+
+
+def test_followers_are_batched_behind_the_leader():
+    model = GatedModel()
+    followers = [f"consulta {i}" for i in range(5)]
+    batcher = QueryEmbeddingBatcher(model, {"max_batch_size": 5, "max_wait_ms": 50.0})
+    results = _run_concurrently(batcher, model, followers)
+
+    assert model.batches[0] == ["lider"]
+    assert sorted(model.batches[1]) == followers and len(model.batches) == 2
+    for text, vector in results.items():
+        np.testing.assert_array_equal(vector, _vector(text))
+    stats = batcher.get_stats()
+    assert stats["queries"] == 6 and stats["batches"] == 2 and stats["max_batch"] == 5
+    assert stats["pending"] == 0 and stats["waited_batches"] == 1
+
+
+def test_batches_respect_max_batch_size():
+    model = GatedModel()
+    followers = [f"consulta {i}" for i in range(5)]
+    batcher = QueryEmbeddingBatcher(model, {"max_batch_size": 2, "max_wait_ms": 0.0})
+    results = _run_concurrently(batcher, model, followers)
+
+    assert sorted(text for batch in model.batches[1:] for text in batch) == followers
+    assert max(len(batch) for batch in model.batches) == 2
+    for text, vector in results.items():
+        np.testing.assert_array_equal(vector, _vector(text))
+
+
+def test_encode_error_reaches_every_waiter_of_the_batch():
+    model = GatedModel(fail_batch=2)
+    followers = [f"consulta {i}" for i in range(4)]
+    batcher = QueryEmbeddingBatcher(model, {"max_batch_size": 4, "max_wait_ms": 0.0})
+    results = _run_concurrently(batcher, model, followers)
+
+    np.testing.assert_array_equal(results.pop("lider"), _vector("lider"))
+    assert sorted(results) == followers
+    assert all(isinstance(error, ValueError) for error in results.values())
+    # O batcher continua utilizável depois da falha
+    np.testing.assert_array_equal(batcher.encode("depois"), _vector("depois"))
@@ -0,0 +1,94 @@
+import threading
+import time
+
+import pytest
+
+from src.rag_app import config, rag_core
+
+QUERY = "Qual o prazo de inscrição?"
+
+
+@pytest.fixture
+def slow_core(stub_rag, monkeypatch):
+    """RAGCore com um endpoint simulado lento e contagem das chamadas ao LLM."""
+    data, make_core = stub_rag
+    monkeypatch.setattr(config, "LLM_ENDPOINTS", [{"name": "mock", "provider": "mock", "latency_seconds": 0.5}])
+    monkeypatch.setattr(config, "QUERY_COALESCING_ENABLED", True)
+    monkeypatch.setitem(config.RETRIEVAL_GATE_CONFIG, "enabled", False)
+    (data / "edital.md").write_text("O prazo de inscrição do edital termina em março. " * 20, encoding="utf-8")
+    core = make_core()
+    calls = []
+    generate = core._generate_answer
+    monkeypatch.setattr(core, "_generate_answer", lambda query, *args: calls.append(query) or generate(query, *args))
+    yield core, calls
+    core.close()
+
+
+def _start(core, results, name, query=QUERY, **kwargs):
+    thread = threading.Thread(target=lambda: results.setdefault(
+        name, core.answer_query_with_details(query, **kwargs)))
+    thread.start()
+    return thread
+
+
+def _wait_in_flight(core, count=1):
+    limit = time.monotonic() + 5
+    while core._single_flight.get_stats()["in_flight"] < count and time.monotonic() < limit:
+        time.sleep(0.01)
+    assert core._single_flight.get_stats()["in_flight"] >= count
+
+
+def test_identical_concurrent_queries_share_one_execution(slow_core):
+    core, calls = slow_core
+    results = {}
+    threads = [_start(core, results, "leader")]
+    _wait_in_flight(core)
+    variants = ["qual o prazo de inscrição?", "  QUAL O PRAZO   de inscrição?", QUERY]
+    threads += [_start(core, results, f"follower{i}", query) for i, query in enumerate(variants)]
+    for thread in threads:
+        thread.join(10)
+
+    assert len(calls) == 1
+    assert results["leader"]["path"] == "llm" and not results["leader"].get("coalesced")
+    for i, query in enumerate(variants):
+        follower = results[f"follower{i}"]
+        assert follower["coalesced"] is True and follower["query"] == query
+        assert follower["answer"] == results["leader"]["answer"]
+    stats = core.get_stats()["coalescing"]
+    assert stats["leaders"] == 1 and stats["coalesced"] == 3 and stats["in_flight"] == 0
+
+
+@pytest.mark.parametrize("variant", [
+    {"shards": [rag_core.ROOT_SHARD]},
+    {"filters": {"source": "edital.md"}},
+    {"model_route": "small"},
+    {"priority": "batch"},
+    "index_version",
+])
+def test_key_separates_executions(slow_core, variant):
+    core, calls = slow_core
+    results = {}
+    threads = [_start(core, results, "leader")]
+    _wait_in_flight(core)
+    if variant == "index_version":
+        core.index_version += 1  # reindexação concluída durante a execução em andamento
+        variant = {}
+    threads.append(_start(core, results, "other", **variant))
+    for thread in threads:
+        thread.join(10)
+
+    assert len(calls) == 2
+    assert not results["other"].get("coalesced")
+    stats = core.get_stats()["coalescing"]
+    assert stats["leaders"] == 2 and stats["coalesced"] == 0
+
+
+def test_coalescing_disabled_runs_every_query(slow_core, monkeypatch):
+    core, calls = slow_core
+    monkeypatch.setattr(config, "QUERY_COALESCING_ENABLED", False)
+    results = {}
+    threads = [_start(core, results, name) for name in ("a", "b")]
+    for thread in threads:
+        thread.join(10)
+    assert len(calls) == 2
+    assert core.get_stats()["coalescing"]["leaders"] == 0
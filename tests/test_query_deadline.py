@@ -0,0 +1,30 @@
+import threading
+import time
+
+from src.rag_app import config
+
+
+def test_follower_reruns_when_the_shared_execution_ran_out_of_its_deadline(stub_rag, monkeypatch):
+    data, make_core = stub_rag
+    monkeypatch.setattr(config, "LLM_ENDPOINTS", [{"name": "mock", "provider": "mock", "latency_seconds": 1.0}])
+    monkeypatch.setattr(config, "QUERY_COALESCING_ENABLED", True)
+    monkeypatch.setitem(config.RETRIEVAL_GATE_CONFIG, "enabled", False)
+    monkeypatch.setitem(config.QUERY_DEADLINE_CONFIG, "min_generation_seconds", 0.0)
+    monkeypatch.setitem(config.QUERY_DEADLINE_CONFIG, "cancel_grace_seconds", 0.0)
+    (data / "edital.md").write_text("O prazo de inscrição do edital termina em março. " * 20, encoding="utf-8")
+    core = make_core()
+    try:
+        results = {}
+        leader = threading.Thread(target=lambda: results.setdefault(
+            "leader", core.answer_query_with_details("Qual o prazo de inscrição?", timeout_seconds=0.4)))
+        leader.start()
+        while core._single_flight.get_stats()["in_flight"] == 0:
+            time.sleep(0.01)
+        follower = core.answer_query_with_details("qual o prazo de  inscrição?", timeout_seconds=10.0)
+        leader.join(10)
+
+        assert results["leader"]["path"] == "deadline:generation"
+        assert follower["path"] == "llm"
+        assert follower["deadline"]["exceeded"] is None
+    finally:
+        core.close()
@@ -0,0 +1,45 @@
+import json
+
+from src.rag_app import rag_batch
+from src.rag_app.rag_batch import _load_completed
+
+
+def test_resume_reruns_errors_and_degraded_answers(tmp_path):
+    output = tmp_path / "respostas.jsonl"
+    records = [
+        {"question_number": 1, "question": "p1", "path": "llm", "error": None},
+        {"question_number": 2, "question": "p2", "path": "fallback:no_documents", "error": None},
+        {"question_number": 3, "question": "p3", "path": "gate:low_relevance", "error": None},
+        {"question_number": 4, "question": "p4", "path": "error:llm", "error": None},
+        {"question_number": 5, "question": "p5", "path": "deadline:generation", "error": None},
+        {"question_number": 6, "question": "p6", "answer": "ERRO: falha", "error": "falha"},
+    ]
+    output.write_text("".join(json.dumps(record) + "\n" for record in records) + '{"question_number": 7',
+                      encoding="utf-8")
+
+    assert _load_completed(str(output)) == {1: "p1", 2: "p2", 3: "p3"}
+    assert output.read_text(encoding="utf-8").endswith("}\n")  # registro truncado removido
+
+
+def test_resume_leaves_one_record_per_question(stub_rag, tmp_path, monkeypatch):
+    data, make_core = stub_rag
+    (data / "edital.md").write_text("Inscrições abertas para os cursos técnicos do campus. " * 10, encoding="utf-8")
+    monkeypatch.setattr(rag_batch, "RAGCore", lambda **kwargs: make_core())
+    questions = tmp_path / "perguntas.txt"
+    questions.write_text("p1\np2\np3 revisada\n", encoding="utf-8")
+    output = tmp_path / "respostas.jsonl"
+    previous = [
+        {"question_number": 1, "question": "p1", "answer": "antiga", "path": "llm", "error": None},
+        {"question_number": 2, "question": "p2", "answer": "ERRO: falha", "error": "falha"},
+        {"question_number": 3, "question": "p3", "answer": "antiga", "path": "llm", "error": None},
+        {"question_number": 1, "question": "p1", "answer": "duplicada", "path": "llm", "error": None},
+    ]
+    output.write_text("".join(json.dumps(record) + "\n" for record in previous), encoding="utf-8")
+
+    rag_batch.run_batch_queries(str(questions), str(output), resume=True)
+
+    records = [json.loads(line) for line in output.read_text(encoding="utf-8").splitlines()]
+    assert [(r["question_number"], r["question"]) for r in records] == [(1, "p1"), (2, "p2"), (3, "p3 revisada")]
+    assert records[0]["answer"] == "antiga"
+    assert all(r["error"] is None for r in records)
+    assert _load_completed(str(output)) == {1: "p1", 2: "p2", 3: "p3 revisada"}
@@ -0,0 +1,142 @@
+import asyncio
+import http.client
+import json
+import threading
+import time
+
+import pytest
+
+from src.rag_app import config
+from src.rag_app.rag_server import RAGHTTPServer
+
+
+@pytest.fixture
+def serve(stub_rag, monkeypatch):
+    """Inicia o RAGHTTPServer na porta 0 num laço de eventos em outra thread."""
+    data, make_core = stub_rag
+    monkeypatch.setitem(config.RETRIEVAL_GATE_CONFIG, "enabled", False)
+    (data / "edital.md").write_text("O prazo de inscrição do edital termina em março. " * 20, encoding="utf-8")
+    started = []
+
+    def start(**server_config):
+        core = make_core()
+        server = RAGHTTPServer(core, dict({"host": "127.0.0.1", "port": 0}, **server_config))
+        loop = asyncio.new_event_loop()
+        thread = threading.Thread(target=loop.run_forever, daemon=True)
+        thread.start()
+        asyncio.run_coroutine_threadsafe(server.start(), loop).result(10)
+        started.append((core, server, loop, thread))
+        return core, server
+
+    yield start
+    for core, server, loop, thread in started:
+        asyncio.run_coroutine_threadsafe(server.shutdown(), loop).result(30)
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join(10)
+        core.close()
+
+
+def _post(server, path, payload, connection=None):
+    connection = connection or http.client.HTTPConnection("127.0.0.1", server.port, timeout=30)
+    body = payload if isinstance(payload, bytes) else json.dumps(payload).encode("utf-8")
+    connection.request("POST", path, body, {"Content-Type": "application/json"})
+    response = connection.getresponse()
+    return response, response.read()
+
+
+def test_answer_and_retrieve(serve):
+    core, server = serve()
+    response, body = _post(server, "/answer", {"query": "Qual o prazo de inscrição?"})
+    assert response.status == 200
+    details = json.loads(body)
+    assert details["path"] == "llm" and details["answer"]
+    assert details["retrieved"][0]["source"] == "edital.md"
+
+    response, body = _post(server, "/retrieve", {"query": "Qual o prazo de inscrição?", "k": 2})
+    assert response.status == 200
+    chunks = json.loads(body)["chunks"]
+    local = core.retrieve_relevant_chunks("Qual o prazo de inscrição?", 2)
+    assert [chunk["id"] for chunk in chunks] == [item["id"] for item in local]
+
+
+@pytest.mark.parametrize("path, payload", [
+    ("/answer", b"{nao e json"),
+    ("/answer", {"query": "   "}),
+    ("/answer", {"query": "prazo", "shards": ["inexistente"]}),
+    ("/answer", {"query": "prazo", "shards": "root"}),
+    ("/answer", {"query": "prazo", "filters": ["source"]}),
+    ("/answer", {"query": "prazo", "filters": {"page_from": "um"}}),
+    ("/answer", {"query": "prazo", "priority": "urgente"}),
+    ("/retrieve", {"query": "prazo", "k": True}),
+    ("/retrieve", {"query": "prazo", "k": 0}),
+])
+def test_bad_requests_are_rejected_with_400(serve, path, payload):
+    _, server = serve()
+    response, body = _post(server, path, payload)
+    assert response.status == 400
+    assert json.loads(body)["error"]
+
+
+def test_queue_overflow_is_rejected_with_429(serve, monkeypatch):
+    monkeypatch.setattr(config, "LLM_ENDPOINTS", [{"name": "mock", "provider": "mock", "latency_seconds": 1.0}])
+    _, server = serve(max_concurrency=1, max_queue=0)
+    slow = threading.Thread(target=_post, args=(server, "/answer", {"query": "Qual o prazo de inscrição?"}))
+    slow.start()
+    limit = time.monotonic() + 5
+    while server._in_flight == 0 and time.monotonic() < limit:
+        time.sleep(0.01)
+
+    response, _ = _post(server, "/answer", {"query": "Outra pergunta sobre o edital?"})
+    slow.join(10)
+    assert response.status == 429
+    assert response.getheader("Retry-After") == "1"
+    assert server.metrics.rejected == 1
+
+
+def test_streaming_events_arrive_in_order(serve):
+    _, server = serve()
+    response, body = _post(server, "/answer", {"query": "Qual o prazo de inscrição?", "stream": True})
+    assert response.status == 200
+    assert response.getheader("Transfer-Encoding") == "chunked"
+    events = [json.loads(line) for line in body.decode("utf-8").splitlines()]
+    assert [event["event"] for event in events] == ["accepted", "retrieved", "answer"]
+    assert events[-1]["path"] == "llm"
+
+
+def test_keep_alive_reuses_the_connection(serve):
+    _, server = serve()
+    connection = http.client.HTTPConnection("127.0.0.1", server.port, timeout=30)
+    _post(server, "/retrieve", {"query": "prazo"}, connection)
+    sock = connection.sock
+    response, _ = _post(server, "/answer", {"query": "prazo", "stream": True}, connection)
+    assert response.status == 200
+    connection.request("GET", "/health")
+    health = connection.getresponse()
+    assert json.loads(health.read())["status"] == "ok"
+    assert connection.sock is sock
+    connection.close()
+
+
+def test_metrics_do_not_block_the_event_loop(serve, monkeypatch):
+    core, server = serve()
+    get_stats = core.get_stats
+    monkeypatch.setattr(core, "get_stats", lambda: time.sleep(1.0) or get_stats())
+
+    results = {}
+    metrics = threading.Thread(target=lambda: results.setdefault(
+        "metrics", _get(server, "/metrics")))
+    metrics.start()
+    time.sleep(0.1)
+    start = time.monotonic()
+    assert _get(server, "/health")["status"] == "ok"
+    assert time.monotonic() - start < 0.8
+    metrics.join(10)
+    assert "gate" in results["metrics"]["rag_core"]
+
+
+def _get(server, path):
+    connection = http.client.HTTPConnection("127.0.0.1", server.port, timeout=30)
+    connection.request("GET", path)
+    payload = json.loads(connection.getresponse().read())
+    connection.close()
+    return payload
@@ -0,0 +1,58 @@
+import pytest
+
+from src.rag_app import config
+
+
+@pytest.fixture
+def gate_core(stub_rag, monkeypatch):
+    data, make_core = stub_rag
+    monkeypatch.setitem(config.RETRIEVAL_GATE_CONFIG, "enabled", True)
+    (data / "glossario.md").write_text("Heteroidentificação é a verificação da autodeclaração racial.",
+                                       encoding="utf-8")
+    core = make_core()
+    yield core
+    core.close()
+
+
+def _items(*distances):
+    return [{"id": f"c{i}", "document": "", "metadata": {}, "distance": d} for i, d in enumerate(distances)]
+
+
+def test_low_relevance_when_even_the_best_chunk_is_far(gate_core):
+    assert gate_core._evaluate_retrieval_gate("Qual o prazo do edital?", _items(1.5, 1.7)) == "low_relevance"
+
+
+def test_insufficient_context_only_when_no_chunk_is_close(gate_core):
+    query = "O que é heteroidentificação?"
+    assert gate_core._evaluate_retrieval_gate(query, _items(1.25, 1.3, 1.4)) == "insufficient_context"
+    assert gate_core._evaluate_retrieval_gate(query, _items(0.15, 1.3, 1.4)) is None
+
+
+def test_specific_questions_pass_through(gate_core):
+    assert gate_core._evaluate_retrieval_gate("O que é o prazo do edital?", _items(1.25, 1.3)) is None
+    assert gate_core._evaluate_retrieval_gate("Qual o prazo do edital?", _items(0.4, 1.3)) is None
+
+
+def test_disabled_gate_never_decides(gate_core, monkeypatch):
+    monkeypatch.setitem(config.RETRIEVAL_GATE_CONFIG, "enabled", False)
+    assert gate_core._evaluate_retrieval_gate("Qual o prazo?", _items(3.0)) is None
+
+
+def test_gated_query_skips_the_llm_and_counts_the_saved_call(gate_core, monkeypatch):
+    calls = []
+    generate = gate_core._generate_answer
+    monkeypatch.setattr(gate_core, "_generate_answer", lambda *args: calls.append(args) or generate(*args))
+    chunk = gate_core.collection.get(include=["documents"])["documents"][0]
+
+    # O codificador simulado dá vetores aleatórios: só o texto idêntico fica próximo
+    far = gate_core.answer_query_with_details("Qual o horário da biblioteca do campus?")
+    assert far["path"] == "gate:low_relevance"
+    assert calls == []
+
+    near = gate_core.answer_query_with_details(chunk)
+    assert near["path"] == "llm"
+    assert len(calls) == 1
+
+    stats = gate_core.get_gate_stats()
+    assert stats["evaluated"] == 2
+    assert stats["llm_calls_saved"] == 1 and stats["low_relevance"] == 1
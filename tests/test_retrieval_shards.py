@@ -0,0 +1,61 @@
+import pytest
+
+from src.rag_app import config, rag_core
+
+
+@pytest.fixture
+def sharded_core(stub_rag, monkeypatch):
+    data, make_core = stub_rag
+    monkeypatch.setitem(config.INDEX_SHARDING_CONFIG, "mode", "subfolder")
+    texts = {
+        "geral.md": "Calendário acadêmico geral com feriados e recessos do instituto. ",
+        "campus_a/edital.md": "Edital do campus A com vagas para cursos técnicos integrados. ",
+        "campus_b/cotas.md": "Cotas do campus B para candidatos de escola pública e baixa renda. ",
+    }
+    for name, text in texts.items():
+        (data / name).parent.mkdir(exist_ok=True)
+        (data / name).write_text(text * 12, encoding="utf-8")
+    core = make_core()
+    yield core
+    core.close()
+
+
+def test_each_subfolder_is_a_shard_with_its_own_collection(sharded_core):
+    assert sharded_core.list_shards() == [rag_core.ROOT_SHARD, "campus_a", "campus_b"]
+    for shard, source in ((rag_core.ROOT_SHARD, "geral.md"), ("campus_a", "edital.md"),
+                          ("campus_b", "cotas.md")):
+        collection = sharded_core.shard_collections[shard]
+        assert collection.count() > 0
+        sources = {metadata["source"] for metadata in collection.get(include=["metadatas"])["metadatas"]}
+        assert sources == {source}
+    assert sharded_core.shard_collections["campus_a"].name == "teste__campus_a"
+    assert sharded_core.count_chunks() == sum(c.count() for c in sharded_core.shard_collections.values())
+
+
+def test_fan_out_merges_a_global_top_k(sharded_core):
+    query = "vagas para cursos técnicos"
+    k = 4
+    per_shard = [item for shard in sharded_core.list_shards()
+                 for item in sharded_core.retrieve_relevant_chunks(query, k, shards=[shard])]
+    expected = sorted(per_shard, key=lambda item: item["distance"])[:k]
+
+    merged = sharded_core.retrieve_relevant_chunks(query, k)
+    assert [(item["id"], item["shard"]) for item in merged] == [(item["id"], item["shard"]) for item in expected]
+    assert [item["distance"] for item in merged] == sorted(item["distance"] for item in merged)
+
+
+def test_exact_chunk_text_ranks_first_across_shards(sharded_core):
+    chunk = sharded_core.shard_collections["campus_b"].get(include=["documents"])["documents"][0]
+    top = sharded_core.retrieve_relevant_chunks(chunk, 3)[0]
+    assert top["shard"] == "campus_b" and top["distance"] == pytest.approx(0.0, abs=1e-5)
+
+
+def test_shards_argument_restricts_the_search(sharded_core):
+    items = sharded_core.retrieve_relevant_chunks("vagas", 10, shards=["campus_a", "campus_b"])
+    assert items and {item["shard"] for item in items} <= {"campus_a", "campus_b"}
+    assert {item["metadata"]["source"] for item in items} <= {"edital.md", "cotas.md"}
+
+
+def test_unknown_shard_is_rejected(sharded_core):
+    with pytest.raises(ValueError):
+        sharded_core.retrieve_relevant_chunks("vagas", 3, shards=["campus_z"])
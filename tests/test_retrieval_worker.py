@@ -0,0 +1,163 @@
+import asyncio
+import json
+import socket
+import threading
+
+import numpy as np
+import pytest
+
+from src.rag_app import config
+from src.rag_app.retrieval_worker import (_HEADER, MAGIC, OP_EMBED, OP_INFO, PROTOCOL_VERSION, STATUS_ERROR,
+                                          ProtocolError, RetrievalWorker, RetrievalWorkerClient, RetrievalWorkerError,
+                                          decode_header, encode_frame)
+
+
+@pytest.fixture
+def worker(stub_rag, monkeypatch):
+    """RetrievalWorker em tcp:127.0.0.1:0 sobre o índice do stub_rag, num laço de eventos em outra thread."""
+    data, make_core = stub_rag
+    monkeypatch.setattr(config, "RETRIEVAL_WORKER_CONFIG", dict(config.RETRIEVAL_WORKER_CONFIG, address=None))
+    (data / "edital.md").write_text("O prazo de inscrição do edital termina em março. " * 20, encoding="utf-8")
+    (data / "cotas.md").write_text("Reserva de vagas para candidatos de escola pública. " * 20, encoding="utf-8")
+    core = make_core()
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    running = []
+
+    def start(listen="tcp:127.0.0.1:0"):
+        server = RetrievalWorker(core, listen)
+        asyncio.run_coroutine_threadsafe(server.start(), loop).result(10)
+        running.append(server)
+        return server
+
+    def stop(server):
+        asyncio.run_coroutine_threadsafe(server.shutdown(), loop).result(30)
+        running.remove(server)
+
+    yield core, make_core, start, stop
+    for server in list(running):
+        stop(server)
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join(10)
+    core.close()
+
+
+@pytest.fixture
+def client(worker):
+    core, _, start, _ = worker
+    server = start()
+    client = RetrievalWorkerClient(server.address)
+    yield core, client
+    client.close()
+
+
+def _raw_exchange(server, frame):
+    """Envia um quadro por um socket cru e lê até o worker encerrar a conexão; devolve (status, resposta)."""
+    with socket.create_connection(("127.0.0.1", server.port), timeout=10) as sock:
+        sock.sendall(frame)
+        data = b""
+        while True:
+            chunk = sock.recv(65536)
+            if not chunk:
+                break
+            data += chunk
+    status, body_size, _ = decode_header(data[:_HEADER.size], 1 << 20)
+    return status, json.loads(data[_HEADER.size:_HEADER.size + body_size])
+
+
+def test_embed_round_trips_float32_vectors(client):
+    core, client = client
+    texts = ["prazo de inscrição", "reserva de vagas", "ç ã é — 漢字"]
+    vectors = client.embed(texts)
+    assert vectors.dtype == np.float32 and vectors.shape == (3, 16)
+    np.testing.assert_array_equal(vectors, core.embed_texts(texts))
+    assert client.embed([]).shape == (0, 16)
+
+
+def test_retrieve_matches_the_local_index(client):
+    core, client = client
+    for query in ("prazo de inscrição", "escola pública"):
+        items, index_version = client.retrieve(query, 3)
+        local = core.retrieve_relevant_chunks(query, 3)
+        assert [item["id"] for item in items] == [item["id"] for item in local]
+        np.testing.assert_allclose([item["distance"] for item in items], [item["distance"] for item in local])
+        assert index_version == core.index_version
+    results, _ = client.batch_retrieve(["prazo de inscrição", "escola pública"], 2, filters={"source": "cotas.md"})
+    assert [[item["id"] for item in items] for items in results] == [
+        [item["id"] for item in core.retrieve_relevant_chunks(query, 2, filters={"source": "cotas.md"})]
+        for query in ("prazo de inscrição", "escola pública")]
+
+
+def test_client_mode_core_uses_the_worker(worker):
+    core, make_core, start, _ = worker
+    server = start()
+    remote = make_core(retrieval_worker=server.address)
+    try:
+        assert remote.embedding_model_st is None and remote.chroma_client is None
+        assert remote.list_shards() == core.list_shards() and remote.count_chunks() == core.count_chunks()
+        query = "prazo de inscrição"
+        assert ([item["id"] for item in remote.retrieve_relevant_chunks(query, 3)]
+                == [item["id"] for item in core.retrieve_relevant_chunks(query, 3)])
+    finally:
+        remote.close()
+
+
+def test_value_errors_cross_the_wire(client):
+    _, client = client
+    with pytest.raises(ValueError):
+        client.retrieve("prazo", 3, shards=["inexistente"])
+    with pytest.raises(ValueError):
+        client.retrieve("prazo", 3, filters={"page_from": "um"})
+    with pytest.raises(ValueError):
+        client.call(OP_EMBED, {"texts": [1, 2]})
+    # A conexão continua utilizável depois de um erro de argumento
+    assert client.info()["protocol_version"] == PROTOCOL_VERSION
+    assert client.get_stats()["connections_opened"] == 1
+
+
+@pytest.mark.parametrize("frame", [
+    b"XX" + encode_frame(OP_INFO, {})[2:],
+    _HEADER.pack(MAGIC, PROTOCOL_VERSION + 1, OP_INFO, 2, 0) + b"{}",
+    _HEADER.pack(MAGIC, PROTOCOL_VERSION, OP_INFO, config.RETRIEVAL_WORKER_CONFIG["max_frame_bytes"], 1),
+], ids=["magic", "version", "oversize"])
+def test_invalid_frames_are_rejected_and_the_connection_closed(worker, frame):
+    _, _, start, _ = worker
+    server = start()
+    status, result = _raw_exchange(server, frame)
+    assert status == STATUS_ERROR and result["type"] == "ProtocolError"
+
+
+def test_client_rejects_oversize_responses(worker):
+    _, _, start, _ = worker
+    server = start()
+    client = RetrievalWorkerClient(server.address, {"max_frame_bytes": 64})
+    try:
+        with pytest.raises(ProtocolError):
+            client.info()
+    finally:
+        client.close()
+    with pytest.raises(ProtocolError):
+        decode_header(_HEADER.pack(b"ZZ", PROTOCOL_VERSION, 0, 0, 0), 64)
+
+
+def test_restarted_worker_is_reconnected_transparently(worker):
+    core, _, start, stop = worker
+    server = start()
+    client = RetrievalWorkerClient(server.address)
+    try:
+        assert client.info()["index_version"] == core.index_version
+        assert client.get_stats()["idle_connections"] == 1
+        stop(server)
+        server = start(server.address)
+        # A conexão ociosa do worker anterior é descartada e a requisição repetida numa nova
+        items, _ = client.retrieve("prazo de inscrição", 2)
+        assert [item["id"] for item in items] == [item["id"] for item in core.retrieve_relevant_chunks(
+            "prazo de inscrição", 2)]
+        stats = client.get_stats()
+        assert stats["errors"] == 0 and stats["connections_opened"] == 2
+        stop(server)
+        with pytest.raises(RetrievalWorkerError):
+            client.info()
+    finally:
+        client.close()